@@ -1,12 +1,14 @@
 from __future__ import print_function
 import ESMF
-import netCDF4
 import numpy
+import os
 import sys
 import argparse
 from functools import reduce
 import time
 from mpi4py import MPI
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import timing, ncio, grids, decomposition, diagnostics, hybrid, esmf_weights
 
 # turn on logging
 esmpy = ESMF.Manager(debug=True)
@@ -17,6 +19,9 @@ pe = MPI.COMM_WORLD.Get_rank()
 # number of processes
 nprocs = MPI.COMM_WORLD.Get_size()
 
+# per rank phase times
+timer = timing.PhaseTimer(MPI.COMM_WORLD)
+
 LAT_INDEX, LON_INDEX = 1, 0
 
 parser = argparse.ArgumentParser(description='Conservatively interpolate using ESMF')
@@ -33,10 +38,27 @@ parser.add_argument('--src_lon_bounds', type=str, dest='src_lon_bounds',
                     help='Source longitude cell boundary array')
 parser.add_argument('--dst_file', type=str, dest='dst_file', default='dst.nc',
                     help='Destination data file name')
+parser.add_argument('--out_file', type=str, dest='out_file', default='dst_regridded.nc',
+                    help='Destination file with regridded field')
+parser.add_argument('--stitch', dest='stitch', action='store_true',
+                    help='Without parallel netCDF, assemble the rank tiles into --out_file on rank 0 '
+                         '(by default they are left for python -m pyterp.ncio)')
+parser.add_argument('--decomp', type=str, dest='decomp', default='block',
+                    choices=['block', 'balanced'],
+                    help='ESMF default block decomposition or cost balanced row blocks')
+parser.add_argument('--num_threads', type=int, dest='num_threads', default=1,
+                    help='Number of threads per rank for the field fill and error computation (0: share the node cores)')
+parser.add_argument('--timing_file', type=str, dest='timing_file', default='',
+                    help='CSV file for the per rank phase times (not saved if empty)')
+parser.add_argument('--periodic', type=str, dest='periodic', default='auto', choices=['auto', 'none'],
+                    help='Detect periodic longitude seams and north folds (auto) or treat the grids as bounded (none)')
 parser.add_argument('--plot', dest='plot', action='store_true', help='Plot')
 
 args = parser.parse_args()
 
+# threads per rank, for hybrid MPI + threads runs
+numThreads = hybrid.getNumThreads(args.num_threads, MPI.COMM_WORLD)
+
 if args.src_file is '':
     print('ERROR: must provide source data file name')
     parser.print_help()
@@ -51,16 +73,114 @@ src_file = args.src_file.encode('UTF-8') # python3
 dst_file = args.dst_file.encode('UTF-8') # python3
 ndims = 2
 
+def getCornerPoints(boundLats, boundLons):
+
+    pointSizes = (boundLats.shape[0] + 1, boundLats.shape[1] + 1)
+
+    # fill in the lat-lon ar the cell corner points
+    lats = numpy.zeros(pointSizes, numpy.float64)
+    lons = numpy.zeros(pointSizes, numpy.float64)
+
+    lats[:-1, :-1] = boundLats[..., 0]
+    lats[-1, :-1] = boundLats[-1, :, 1]
+    lats[-1, -1]  = boundLats[-1, -1, 2]
+    lats[:-1, -1]  = boundLats[:, -1, 3]
+
+    lons[:-1, :-1] = boundLons[..., 0]
+    lons[-1, :-1] = boundLons[-1, :, 1]
+    lons[-1, -1]  = boundLons[-1, -1, 2]
+    lons[:-1, -1]  = boundLons[:, -1, 3]
+
+    return lats, lons
+
+def getCellTopology(filename, coord_names):
+    # detect a periodic seam and a north fold from the edge cells, the 
+    # duplicated cells are left out of the distinct cell dims
+    nc = ncio.openDataset(filename)
+    boundLatVar = nc.variables[coord_names['lat_bounds']]
+    boundLonVar = nc.variables[coord_names['lon_bounds']]
+    topology = grids.NO_TOPOLOGY
+    if args.periodic == 'auto':
+        topology = grids.getTopologyFromBounds(boundLatVar, boundLonVar,
+                                               getCorners=lambda bounds: getCornerPoints(bounds, bounds)[0])
+    cellDims = grids.getPeriodicCellDims(topology, (boundLatVar.shape[0] + 1, boundLatVar.shape[1] + 1))
+    nc.close()
+    return topology, cellDims
+
+def getRowReader(filename, coord_names, numCols):
+    # read the bound coordinates of a block of cell rows, first numCols columns
+    def reader(rowBeg, rowEnd):
+        nc = ncio.openDataset(filename)
+        boundLats = nc.variables[coord_names['lat_bounds']][rowBeg:rowEnd, :numCols, :]
+        boundLons = nc.variables[coord_names['lon_bounds']][rowBeg:rowEnd, :numCols, :]
+        nc.close()
+        return boundLats, boundLons
+    return reader
+
+def createMeshData(filename, fieldname, coord_names, rowBlocks, topology, cellDims):
+
+    # this rank owns the cell rows rowBeg:rowEnd, ESMF grids cannot be given 
+    # an arbitrary distribution so the cells are passed as a mesh. Like the 
+    # grids, the mesh only has the distinct cells: the fold rows are not in 
+    # the row blocks and the seam columns are not read
+    rowBeg, rowEnd = rowBlocks[pe], rowBlocks[pe + 1]
+    numCols = cellDims[1]
+    periodic = topology['seamNodes'] is not None
+    tic = time.time()
+    boundLats, boundLons = getRowReader(filename, coord_names, numCols)(rowBeg, rowEnd)
+    timer.add('read', time.time() - tic)
+    numLocalRows = boundLats.shape[0]
+
+    # nodes and quadrilateral cells, none if this rank has no rows. The last row
+    # of nodes belongs to the rank owning the next cell row. Across a seam the
+    # last cells close onto the nodes of the first column
+    tic = time.time()
+    nodeIds, nodeOwners, cellIds, cellConn = decomposition.getMeshRows(rowBlocks, pe, numCols, periodic=periodic)
+    nodeCoords = numpy.zeros((len(nodeIds), 2), numpy.float64)
+    if numLocalRows > 0:
+        lats, lons = getCornerPoints(boundLats, boundLons)
+        if periodic:
+            lats, lons = lats[:, :numCols], lons[:, :numCols]
+        nodeCoords[:, 0] = lons.ravel()
+        nodeCoords[:, 1] = lats.ravel()
+
+    mesh = ESMF.Mesh(parametric_dim=2, spatial_dim=2, coord_sys=ESMF.api.constants.CoordSys.SPH_DEG)
+    mesh.add_nodes(len(nodeIds), nodeIds, nodeCoords.ravel(), nodeOwners)
+    mesh.add_elements(len(cellIds), cellIds,
+                      numpy.full(cellIds.shape, ESMF.MeshElemType.QUAD, numpy.int32),
+                      cellConn)
+    timer.add('grid', time.time() - tic)
+
+    # create and set the field on the cells
+    tic = time.time()
+    cellSlices = (slice(rowBeg, rowEnd), slice(0, numCols))
+    nc = ncio.openDataset(filename)
+    data = ncio.readSlab(nc.variables[fieldname], (), cellSlices).ravel()
+    nc.close()
+    timer.add('read', time.time() - tic)
+
+    tic = time.time()
+    field = ESMF.Field(mesh, meshloc=ESMF.MeshLoc.ELEMENT)
+    hybrid.copyRows(field.data, data, numThreads)
+    timer.add('field', time.time() - tic)
+
+    return mesh, field, cellSlices, topology
+
 def createData(filename, fieldname, coord_names):
 
     # read the netcdf file header
-    nc = netCDF4.Dataset(filename)
+    tic = time.time()
+    nc = ncio.openDataset(filename)
 
-    # get the local cell array sizes
-    cellDims = numpy.array(nc.variables[coord_names['lat_bounds']].shape[:2], numpy.int32)
+    # get the cell array sizes, the duplicated seam and fold cells are left out
+    topology, cellDims = getCellTopology(filename, coord_names)
+    cellDims = numpy.array(cellDims, numpy.int32)
+    timer.add('read', time.time() - tic)
 
     # create the ESMF grid
-    grid = ESMF.Grid(max_index=cellDims, coord_sys=ESMF.api.constants.CoordSys.SPH_DEG) #, num_peri_dims=1, periodic_dim=1)
+    tic = time.time()
+    grid = ESMF.Grid(max_index=cellDims, coord_sys=ESMF.api.constants.CoordSys.SPH_DEG,
+                     **esmf_weights.getPeriodicOptions(topology))
 
     # create coordinates
     grid.add_coords(staggerloc=ESMF.StaggerLoc.CORNER, coord_dim=LAT_INDEX)
@@ -71,26 +191,16 @@ def createData(filename, fieldname, coord_names):
     iEnd0 = grid.upper_bounds[ESMF.StaggerLoc.CORNER][LON_INDEX]
     iBeg1 = grid.lower_bounds[ESMF.StaggerLoc.CORNER][LAT_INDEX]
     iEnd1 = grid.upper_bounds[ESMF.StaggerLoc.CORNER][LAT_INDEX]
+    timer.add('grid', time.time() - tic)
 
     # read the bound coordinates
+    tic = time.time()
     boundLats = nc.variables[coord_names['lat_bounds']][iBeg0:iEnd0 - 1, iBeg1:iEnd1 - 1, :]
     boundLons = nc.variables[coord_names['lon_bounds']][iBeg0:iEnd0 - 1, iBeg1:iEnd1 - 1, :]
+    timer.add('read', time.time() - tic)
 
-    pointSizes = (boundLats.shape[0] + 1, boundLats.shape[1] + 1)
-
-    # fill in the lat-lon ar the cell corner points
-    lats = numpy.zeros(pointSizes, numpy.float64)
-    lons = numpy.zeros(pointSizes, numpy.float64)
-
-    lats[:-1, :-1] = boundLats[..., 0]
-    lats[-1, :-1] = boundLats[-1, :, 1]
-    lats[-1, -1]  = boundLats[-1, -1, 2]
-    lats[:-1, -1]  = boundLats[:, -1, 3]
-
-    lons[:-1, :-1] = boundLons[..., 0]
-    lons[-1, :-1] = boundLons[-1, :, 1]
-    lons[-1, -1]  = boundLons[-1, -1, 2]
-    lons[:-1, -1]  = boundLons[:, -1, 3]
+    tic = time.time()
+    lats, lons = getCornerPoints(boundLats, boundLons)
     
     coordLatsPoint = grid.get_coords(coord_dim=LAT_INDEX, staggerloc=ESMF.StaggerLoc.CORNER)
     coordLonsPoint = grid.get_coords(coord_dim=LON_INDEX, staggerloc=ESMF.StaggerLoc.CORNER)
@@ -98,73 +208,113 @@ def createData(filename, fieldname, coord_names):
     # set the ESMF coordinates
     coordLatsPoint[:] = lats
     coordLonsPoint[:] = lons
+    timer.add('grid', time.time() - tic)
+
+    # read the cell centred data, the cells have their own index sets
+    tic = time.time()
+    cellSlices = tuple(slice(b, e) for b, e in zip(grid.lower_bounds[ESMF.StaggerLoc.CENTER],
+                                                   grid.upper_bounds[ESMF.StaggerLoc.CENTER]))
+    data = ncio.readSlab(nc.variables[fieldname], (), cellSlices)
+    nc.close()
+    timer.add('read', time.time() - tic)
 
     # create and set the field, cell centred
+    tic = time.time()
     field = ESMF.Field(grid, staggerloc=ESMF.StaggerLoc.CENTER)
-
-    # read the cell centred data and set the field. Note that we need to use the point dims
-    field.data[...] = nc.variables[fieldname][iBeg0:iEnd0, iBeg1:iEnd1]
-
-    return grid, field
-
-timeStats = {
-    'weights': float('nan'),
-    'evaluation': float('nan'),
-}
-
-srcGrid, srcData = createData(src_file, args.src_field, {'lat_bounds': args.src_lat_bounds,
-                                                                     'lon_bounds': args.src_lon_bounds,})
-dstGrid, dstData = createData(dst_file, 'cellData', {'lat_bounds': 'latMid_bnds',
-                                                                   'lon_bounds': 'lonMid_bnds',})
+    hybrid.copyRows(field.data, data, numThreads)
+    timer.add('field', time.time() - tic)
+
+    return grid, field, cellSlices, topology
+
+srcCoordNames = {'lat_bounds': args.src_lat_bounds, 'lon_bounds': args.src_lon_bounds,}
+dstCoordNames = {'lat_bounds': 'latMid_bnds', 'lon_bounds': 'lonMid_bnds',}
+
+if args.decomp == 'balanced':
+    # estimate the per row costs and plan balanced row blocks, ESMF's block 
+    # decomposition needs no plan. Only the distinct cells are planned
+    tic = time.time()
+    srcTopology, srcCellDims = getCellTopology(src_file, srcCoordNames)
+    dstTopology, dstCellDims = getCellTopology(dst_file, dstCoordNames)
+    (srcRowBlocks, srcRowCosts), (dstRowBlocks, dstRowCosts) = \
+        decomposition.planGrids([getRowReader(src_file, srcCoordNames, srcCellDims[1]),
+                                 getRowReader(dst_file, dstCoordNames, dstCellDims[1])],
+                                [srcCellDims[0], dstCellDims[0]],
+                                comm=MPI.COMM_WORLD)
+    timer.add('plan', time.time() - tic)
+    srcGrid, srcData, srcSlices, srcTopology = createMeshData(src_file, args.src_field, srcCoordNames, srcRowBlocks,
+                                                              srcTopology, srcCellDims)
+    dstGrid, dstData, dstSlices, dstTopology = createMeshData(dst_file, 'cellData', dstCoordNames, dstRowBlocks,
+                                                              dstTopology, dstCellDims)
+else:
+    srcGrid, srcData, srcSlices, srcTopology = createData(src_file, args.src_field, srcCoordNames)
+    dstGrid, dstData, dstSlices, dstTopology = createData(dst_file, 'cellData', dstCoordNames)
 
 # save the reference (exact) field data
 dstDataRef = dstData.data.copy()
 dstData.data[...] = -1
 
+# fraction of each destination cell covered by the source grid, 0 if unmapped
+if args.decomp == 'balanced':
+    dstFrac = ESMF.Field(dstGrid, meshloc=ESMF.MeshLoc.ELEMENT)
+else:
+    dstFrac = ESMF.Field(dstGrid, staggerloc=ESMF.StaggerLoc.CENTER)
+
 # compute the interpolation weights
 tic = time.time()
 regrid = ESMF.Regrid(srcfield=srcData, dstfield=dstData,
                      regrid_method=ESMF.api.constants.RegridMethod.CONSERVE,
                      unmapped_action=ESMF.api.constants.UnmappedAction.IGNORE,
+                     dst_frac_field=dstFrac,
                      ignore_degenerate=True)
-timeStats['weights'] = time.time() - tic
+timer.add('weights', time.time() - tic)
 
 # interpolate
 tic = time.time()
 regrid(srcData, dstData)
-timeStats['evaluation'] = time.time() - tic
+timer.add('evaluation', time.time() - tic)
+
+# write the regridded field, each rank writes its own window
+tic = time.time()
+outFile = ncio.writeField(args.out_file, dst_file, 'cellData', 
+                          dstData.data.reshape([sl.stop - sl.start for sl in dstSlices]), slices=dstSlices)
+outFile = ncio.gatherTiles(args.out_file, outFile, stitch=args.stitch)
+# the duplicated seam and fold cells are not in the ESMF grid
+ncio.fillPeriodic(args.out_file, outFile, 'cellData', dstTopology, cells=True)
+timer.add('write', time.time() - tic)
 
 # compute error
-srcNtot = len(srcData.data.flat)
-dstNtot = len(dstData.data.flat)
-localSumError = numpy.sum(abs(dstData.data - dstDataRef))
-globalSumError = numpy.sum(MPI.COMM_WORLD.gather(localSumError, root=0))
-globalSrcNtot = numpy.sum(MPI.COMM_WORLD.gather(srcNtot, root=0))
-globalDstNtot = numpy.sum(MPI.COMM_WORLD.gather(dstNtot, root=0))
-
-globalTimeStats = {}
-for k, v in timeStats.items():
-    # max value
-    ts = MPI.COMM_WORLD.gather(v, root=0)
-    if ts is not None:
-        globalTimeStats[k] = max(ts)
+tic = time.time()
+if args.decomp == 'balanced':
+    srcAreas = ESMF.Field(srcGrid, meshloc=ESMF.MeshLoc.ELEMENT)
+    dstAreas = ESMF.Field(dstGrid, meshloc=ESMF.MeshLoc.ELEMENT)
+else:
+    srcAreas = ESMF.Field(srcGrid, staggerloc=ESMF.StaggerLoc.CENTER)
+    dstAreas = ESMF.Field(dstGrid, staggerloc=ESMF.StaggerLoc.CENTER)
+srcAreas.get_area()
+dstAreas.get_area()
+stats = diagnostics.ErrorStats(MPI.COMM_WORLD, numThreads=numThreads)
+stats.addSource(srcData.data, areas=srcAreas.data)
+stats.update(dstData.data, dstDataRef, areas=dstAreas.data, mask=(dstFrac.data <= 0.))
+stats.reduce()
+timer.add('error', time.time() - tic)
+
+# observed regridding time of each rank
+observed = MPI.COMM_WORLD.gather(timer.times.get('weights', 0.0) + timer.times.get('evaluation', 0.0), root=0)
+
+stats.report('esmf interpolation:')
+
+timer.report(args.timing_file)
 
 if pe == 0:
-    error = globalSumError / float(globalDstNtot)
-    print('esmf interpolation:')
-    print('\tsrc: ntot: {}'.format(globalSrcNtot))
-    print('\tdst: ntot: {}'.format(globalDstNtot))
-    print('interpolation error: {:.3g}'.format(error))
-
-    totTime = 0.0
-    print('time stats:')
-    for k, v in globalTimeStats.items():
-        print('\t{0:<32} {1:>.3g} sec'.format(k, v))
-        totTime += v
-    print('\t{0:<32} {1:>.3g} sec'.format('total', totTime))
+    print('{} decomposition, per rank load (weights + evaluation):'.format(args.decomp))
+    if args.decomp == 'balanced':
+        decomposition.printReport([srcRowCosts, dstRowCosts], [srcRowBlocks, dstRowBlocks], observed)
+    else:
+        # the predicted block loads are given by python -m pyterp.decomposition
+        print('observed imbalance (max/mean): {:.3f}'.format(decomposition.getImbalance(observed)))
 
 # plot
-if args.plot and nprocs == 1:
+if args.plot and nprocs == 1 and args.decomp == 'block':
     xPoint = dstGrid.get_coords(coord_dim=LON_INDEX, staggerloc=ESMF.StaggerLoc.CORNER)
     yPoint = dstGrid.get_coords(coord_dim=LAT_INDEX, staggerloc=ESMF.StaggerLoc.CORNER)
     xxCell = 0.25 * (xPoint[0:-1, 0:-1] + xPoint[1:, 0:-1] + xPoint[1:, 1:] + xPoint[0:-1, 1:])
@@ -1,11 +1,13 @@
 from __future__ import print_function
 import ESMF
-import iris
 import numpy
+import os
 import sys
 import argparse
 from functools import reduce
 import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import ncio, grids, diagnostics, esmf_weights
 
 LAT_INDEX, LON_INDEX = 1, 0
 
@@ -20,6 +22,13 @@ parser.add_argument('--src_field', type=str, dest='src_field',
                     help='Source data field name')
 parser.add_argument('--dst_file', type=str, dest='dst_file', default='dst.nc',
                     help='Destination data file name')
+parser.add_argument('--out_file', type=str, dest='out_file', default='esmfDst.nc',
+                    help='Destination file with regridded field')
+parser.add_argument('--stitch', dest='stitch', action='store_true',
+                    help='Without parallel netCDF, assemble the rank tiles into --out_file on rank 0 '
+                         '(by default they are left for python -m pyterp.ncio)')
+parser.add_argument('--periodic', type=str, dest='periodic', default='auto', choices=['auto', 'none'],
+                    help='Detect periodic longitude seams and north folds (auto) or treat the grids as bounded (none)')
 parser.add_argument('--plot', dest='plot', action='store_true', help='Plot')
 
 args = parser.parse_args()
@@ -39,17 +48,19 @@ dst_file = args.dst_file.encode('UTF-8') # python3
 ndims = 2
 
 def createData(filename, prefix, fieldname):
-    # use iris to read in the data
-    # then pass the array to the ESMF API
-    cube = iris.load(filename, iris.Constraint(cube_func = lambda c: c.var_name == fieldname))[0]
-    coords = cube.coords()
-    lats = coords[0].points
-    lons = coords[1].points
+    # read the netcdf header, then only the local hyperslab of the
+    # coordinates and data on this rank
+    nc = ncio.openDataset(filename)
+    var = nc.variables[fieldname]
+    latVar, lonVar = grids.getLatLonVariables(nc, var)
     
     # create the ESMF grid object
 
-    cellDims = numpy.array([lats.shape[0] - 1, lats.shape[1] - 1])
-    grid = ESMF.Grid(max_index=cellDims, coord_sys=ESMF.api.constants.CoordSys.SPH_DEG) #, num_peri_dims=1, periodic_dim=1)
+    # detect a periodic seam and a north fold, the duplicated nodes are left out
+    topology = grids.getTopology(latVar, lonVar) if args.periodic == 'auto' else grids.NO_TOPOLOGY
+    cellDims = numpy.array(grids.getPeriodicCellDims(topology, latVar.shape), numpy.int32)
+    grid = ESMF.Grid(max_index=cellDims, coord_sys=ESMF.api.constants.CoordSys.SPH_DEG,
+                     **esmf_weights.getPeriodicOptions(topology))
 
     grid.add_coords(staggerloc=ESMF.StaggerLoc.CORNER, coord_dim=LAT_INDEX)
     grid.add_coords(staggerloc=ESMF.StaggerLoc.CORNER, coord_dim=LON_INDEX)
@@ -64,30 +75,36 @@ def createData(filename, prefix, fieldname):
     iEndLon = grid.upper_bounds[ESMF.StaggerLoc.CORNER][LON_INDEX]
 
     # set the coordinates
-    coordLat[...] = lats[iBegLon:iEndLon, iBegLat:iEndLat]
-    coordLon[...] = lons[iBegLon:iEndLon, iBegLat:iEndLat]
+    localSlices = (slice(iBegLon, iEndLon), slice(iBegLat, iEndLat))
+    coordLat[...] = latVar[localSlices]
+    coordLon[...] = lonVar[localSlices]
 
     # create field
     field = ESMF.Field(grid, name=fieldname, 
                    staggerloc=ESMF.StaggerLoc.CORNER)
-    field.data[...] = cube.data[:]
+    field.data[...] = ncio.readSlab(var, (), localSlices)
 
     nodeDims = (iEndLat - iBegLat, iEndLon - iBegLon)
 
-    return grid, field, nodeDims, cube
+    nc.close()
+    return grid, field, nodeDims, localSlices, topology
 
 timeStats = {
     'weights': float('nan'),
     'evaluation': float('nan'),
+    'write': float('nan'),
 }
 
-srcGrid, srcData, srcNodeDims, srcCube = createData(src_file, b"src", args.src_field)
-dstGrid, dstData, dstNodeDims, dstCube = createData(dst_file, b"dst", b"pointData")
+srcGrid, srcData, srcNodeDims, srcSlices, srcTopology = createData(src_file, b"src", args.src_field)
+dstGrid, dstData, dstNodeDims, dstSlices, dstTopology = createData(dst_file, b"dst", 'pointData')
 
 # save the reference (exact) field data
 dstDataRef = dstData.data.copy()
 dstData.data[...] = 0.0
 
+# fraction of each destination point covered by the source grid, 0 if unmapped
+dstFrac = ESMF.Field(dstGrid, staggerloc=ESMF.StaggerLoc.CORNER)
+
 # compute the interpolation weights
 tic = time.time()
 regrid = ESMF.api.regrid.Regrid(srcData, dstData,
@@ -99,7 +116,7 @@ regrid = ESMF.api.regrid.Regrid(srcData, dstData,
                                 norm_type=None, # only for conservative regridding
                                 unmapped_action=ESMF.api.constants.UnmappedAction.IGNORE, 
                                 ignore_degenerate=True, # produce an error if two points are degenerate and if set to False
-                                src_frac_field=None, dst_frac_field=None)
+                                src_frac_field=None, dst_frac_field=dstFrac)
 timeStats['weights'] = time.time() - tic
 
 # interpolate
@@ -107,14 +124,19 @@ tic = time.time()
 regrid(srcData, dstData)
 timeStats['evaluation'] = time.time() - tic
 
+# write the regridded field, each rank writes its own window
+tic = time.time()
+outFile = ncio.writeField(args.out_file, dst_file, 'pointData', dstData.data, slices=dstSlices)
+outFile = ncio.gatherTiles(args.out_file, outFile, stitch=args.stitch)
+# the duplicated seam and fold nodes are not in the ESMF grid
+ncio.fillPeriodic(args.out_file, outFile, 'pointData', dstTopology)
+timeStats['write'] = time.time() - tic
+
 # compute error
-srcNtot = len(srcData.data.flat)
-dstNtot = len(dstData.data.flat)
-error =  numpy.sum(abs(dstData.data - dstDataRef)) / float(dstNtot)
-print('esmf interpolation:')
-print('\tsrc: {} ntot: {}'.format(srcNodeDims, srcNtot))
-print('\tdst: {} ntot: {}'.format(dstNodeDims, dstNtot))
-print('interpolation error: {:.3g}'.format(error))
+stats = diagnostics.ErrorStats(ncio.getComm())
+stats.addSource(srcData.data)
+stats.update(dstData.data, dstDataRef, mask=(dstFrac.data <= 0.))
+stats.report('esmf interpolation:')
 totTime = 0.0
 print('time stats:')
 for k, v in timeStats.items():
@@ -122,11 +144,6 @@ for k, v in timeStats.items():
     totTime += v
 print('\t{0:<32} {1:>.3g} sec'.format('total', totTime))
 
-# write interpolated data
-dstCube.data = dstData.data
-iris.save([dstCube], 'esmfDst.nc')
-    
-
 # plot
 if args.plot:
     LAT_INDEX, LON_INDEX = 0, 1
@@ -1,14 +1,27 @@
+import argparse
+import csv
 from matplotlib import pylab
 
+parser = argparse.ArgumentParser(description='Plot the parallel speedup')
+parser.add_argument('--csv', type=str, dest='csv', default='',
+                    help='CSV file written by python -m pyterp.scaling (the timings below are used if empty)')
+args = parser.parse_args()
+
 # tripolar to uniform 2560 x 5120 
 
 nprocs = [1, 2, 4, 8, 16,]
 times = [2.12e3, 1.18e3, 637, 368, 203]
+title = 'ESMF conserve tripolar to uniform 2560x5120'
+
+if args.csv:
+    rows = list(csv.DictReader(open(args.csv)))
+    nprocs = [int(row['nprocs']) for row in rows]
+    times = [float(row['total']) for row in rows]
+    title = args.csv
 
 pylab.plot(nprocs, [times[0]/t for t in times], 'ko', nprocs, [times[0]/t for t in times], 'b-')
-pylab.title('ESMF conserve tripolar to uniform 2560x5120')
-pylab.plot(nprocs, nprocs, 'k--')
+pylab.title(title)
+pylab.plot(nprocs, [float(p)/nprocs[0] for p in nprocs], 'k--')
 pylab.xlabel('number of procs')
 pylab.ylabel('speedup')
 pylab.show()
-
@@ -1,12 +1,14 @@
 from __future__ import print_function
 import ESMF
-import netCDF4
 import numpy
+import os
 import sys
 import argparse
 from functools import reduce
 import time
 from mpi4py import MPI
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import timing, ncio, grids, hybrid, esmf_weights
 from mpl_toolkits.basemap import Basemap
 
 # turn on logging
@@ -18,6 +20,9 @@ pe = MPI.COMM_WORLD.Get_rank()
 # number of processes
 nprocs = MPI.COMM_WORLD.Get_size()
 
+# per rank phase times
+timer = timing.PhaseTimer(MPI.COMM_WORLD)
+
 LAT_INDEX, LON_INDEX = 1, 0
 
 parser = argparse.ArgumentParser(description='Conservatively interpolate using ESMF')
@@ -32,10 +37,24 @@ parser.add_argument('--time', type=int, dest='time', default=0,
                     help='Time index')
 parser.add_argument('--level', type=int, dest='level', default=0,
                     help='Level index')
+parser.add_argument('--out_file', type=str, dest='out_file', default='dst_regridded.nc',
+                    help='Destination file with regridded field')
+parser.add_argument('--stitch', dest='stitch', action='store_true',
+                    help='Without parallel netCDF, assemble the rank tiles into --out_file on rank 0 '
+                         '(by default they are left for python -m pyterp.ncio)')
+parser.add_argument('--num_threads', type=int, dest='num_threads', default=1,
+                    help='Number of threads per rank for the field fill (0: share the node cores)')
+parser.add_argument('--timing_file', type=str, dest='timing_file', default='',
+                    help='Save the per rank phase times to this CSV file')
+parser.add_argument('--periodic', type=str, dest='periodic', default='auto', choices=['auto', 'none'],
+                    help='Detect periodic longitude seams and north folds (auto) or treat the grids as bounded (none)')
 parser.add_argument('--plot', dest='plot', action='store_true', help='Plot')
 
 args = parser.parse_args()
 
+# threads per rank, for hybrid MPI + threads runs
+numThreads = hybrid.getNumThreads(args.num_threads, MPI.COMM_WORLD)
+
 if args.src_file is '':
     print('ERROR: must provide source data file name')
     parser.print_help()
@@ -52,65 +71,60 @@ ndims = 2
 
 def createData(filename, fieldname):
 
-    # read the netcdf file header
-    nc = netCDF4.Dataset(filename)
-
+    # read the netcdf file header and find the curvilinear lat and lon coords
+    tic = time.time()
+    nc = ncio.openDataset(filename)
     var = nc.variables[fieldname]
-    coordNames = var.coordinates.split(' ')
-
-    # find the name of the curvilinear lat and lon coords
-    latName, lonName = '', ''
-    for c in coordNames:
-        coord = nc.variables[c]
-        if coord.standard_name == b'latitude':
-            latName = c
-        if coord.standard_name == b'longitude':
-            lonName = c
-    lats = nc.variables[latName][:]
-    lons = nc.variables[lonName][:]
+    latVar, lonVar = grids.getLatLonVariables(nc, var)
+    timer.add('read', time.time() - tic)
 
     # create the ESMF grid
-    cellDims = numpy.array(lats.shape, numpy.int32) - 1
-    grid = ESMF.Grid(max_index=cellDims, coord_sys=ESMF.api.constants.CoordSys.SPH_DEG) #, num_peri_dims=1, periodic_dim=1)
+    tic = time.time()
+    # detect a periodic seam and a north fold, the duplicated nodes are left out
+    topology = grids.getTopology(latVar, lonVar) if args.periodic == 'auto' else grids.NO_TOPOLOGY
+    cellDims = numpy.array(grids.getPeriodicCellDims(topology, latVar.shape), numpy.int32)
+    grid = ESMF.Grid(max_index=cellDims, coord_sys=ESMF.api.constants.CoordSys.SPH_DEG,
+                     **esmf_weights.getPeriodicOptions(topology))
 
     # create coordinates
     grid.add_coords(staggerloc=ESMF.StaggerLoc.CORNER, coord_dim=LAT_INDEX)
     grid.add_coords(staggerloc=ESMF.StaggerLoc.CORNER, coord_dim=LON_INDEX)
     
-    # get the local start/end index sets and set the point coordinates
+    coordLatsPoint = grid.get_coords(coord_dim=LAT_INDEX, staggerloc=ESMF.StaggerLoc.CORNER)
+    coordLonsPoint = grid.get_coords(coord_dim=LON_INDEX, staggerloc=ESMF.StaggerLoc.CORNER)
+    timer.add('grid', time.time() - tic)
+
+    # get the local start/end index sets
     iBeg0 = grid.lower_bounds[ESMF.StaggerLoc.CORNER][LON_INDEX]
     iEnd0 = grid.upper_bounds[ESMF.StaggerLoc.CORNER][LON_INDEX]
     iBeg1 = grid.lower_bounds[ESMF.StaggerLoc.CORNER][LAT_INDEX]
     iEnd1 = grid.upper_bounds[ESMF.StaggerLoc.CORNER][LAT_INDEX]
-    
-    coordLatsPoint = grid.get_coords(coord_dim=LAT_INDEX, staggerloc=ESMF.StaggerLoc.CORNER)
-    coordLonsPoint = grid.get_coords(coord_dim=LON_INDEX, staggerloc=ESMF.StaggerLoc.CORNER)
+    localSlices = (slice(iBeg0, iEnd0), slice(iBeg1, iEnd1))
+
+    # read the local part of the coordinates and of the time/level slice
+    tic = time.time()
+    lats = latVar[localSlices]
+    lons = lonVar[localSlices]
+    data = ncio.readSlab(var, (args.time, args.level), localSlices)
+    nc.close()
+    timer.add('read', time.time() - tic)
 
     # set the ESMF coordinates
+    tic = time.time()
     coordLatsPoint[:] = lats
     coordLonsPoint[:] = lons
+    timer.add('grid', time.time() - tic)
 
     # create and set the field, cell centred
+    tic = time.time()
     field = ESMF.Field(grid, staggerloc=ESMF.StaggerLoc.CORNER)
+    hybrid.copyRows(field.data, data, numThreads)
+    timer.add('field', time.time() - tic)
 
-    # read the cell centred data and set the field. Note that we need to use the point dims
-    data = var[:]
-    if len(data.shape) == 2:
-        field.data[...] = data[iBeg0:iEnd0, iBeg1:iEnd1]
-    elif len(data.shape) == 3:
-        field.data[...] = data[args.time, iBeg0:iEnd0, iBeg1:iEnd1]
-    else:
-        field.data[...] = data[args.time, args.level, iBeg0:iEnd0, iBeg1:iEnd1]
-
-    return grid, field
-
-timeStats = {
-    'weights': float('nan'),
-    'evaluation': float('nan'),
-}
+    return grid, field, localSlices, topology
 
-srcGrid, srcData = createData(src_file, args.src_field)
-dstGrid, dstData = createData(dst_file, 'pointData')
+srcGrid, srcData, srcSlices, srcTopology = createData(src_file, args.src_field)
+dstGrid, dstData, dstSlices, dstTopology = createData(dst_file, 'pointData')
 
 # initialize the dst data
 dstData.data[...] = 0
@@ -121,12 +135,21 @@ regrid = ESMF.Regrid(srcfield=srcData, dstfield=dstData,
                      regrid_method=ESMF.api.constants.RegridMethod.BILINEAR,
                      unmapped_action=ESMF.api.constants.UnmappedAction.IGNORE,
                      ignore_degenerate=True)
-timeStats['weights'] = time.time() - tic
+timer.add('weights', time.time() - tic)
 
 # interpolate
 tic = time.time()
 regrid(srcData, dstData)
-timeStats['evaluation'] = time.time() - tic
+timer.add('evaluation', time.time() - tic)
+
+# write the regridded time/level slice, each rank writes its own window
+tic = time.time()
+outFile = ncio.writeField(args.out_file, dst_file, 'pointData', dstData.data, slices=dstSlices,
+                          index=(args.time, args.level))
+outFile = ncio.gatherTiles(args.out_file, outFile, stitch=args.stitch)
+# the duplicated seam and fold nodes are not in the ESMF grid
+ncio.fillPeriodic(args.out_file, outFile, 'pointData', dstTopology)
+timer.add('write', time.time() - tic)
 
 # plot
 if args.plot and nprocs == 1:
@@ -144,3 +167,5 @@ if args.plot and nprocs == 1:
     mp.drawcoastlines(linewidth=0.25)
     pylab.title(args.src_field)
     pylab.show()
+
+timer.report(args.timing_file)
@@ -0,0 +1,168 @@
+from __future__ import print_function
+import ESMF
+import numpy
+import os
+import sys
+import argparse
+import time
+from mpi4py import MPI
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import timing, ncio, grids, diagnostics, vertical
+
+# rank of this processor
+pe = MPI.COMM_WORLD.Get_rank()
+
+# number of processes
+nprocs = MPI.COMM_WORLD.Get_size()
+
+# per rank phase times
+timer = timing.PhaseTimer(MPI.COMM_WORLD)
+
+LAT_INDEX, LON_INDEX, HEIGHT_INDEX = 1, 0, 2
+
+# ESMF takes the third spherical coordinate as a height, in Earth radii
+EARTH_RADIUS = 6371.e3
+
+parser = argparse.ArgumentParser(description='Interpolate layered grids using ESMF')
+parser.add_argument('--src_file', type=str, dest='src_file', default='src.nc',
+                    help='Source data file name')
+parser.add_argument('--src_field', type=str, dest='src_field', default='pointData',
+                    help='Source data field name, dimensions (level, y, x)')
+parser.add_argument('--dst_file', type=str, dest='dst_file', default='dst.nc',
+                    help='Destination data file name')
+parser.add_argument('--mode', type=str, dest='mode', default='3d', choices=['3d', '2d'],
+                    help='3d: regrid between the 3D grids, 2d: 2D regrid of all the levels at once then '
+                         'vertical interpolation')
+parser.add_argument('--timing_file', type=str, dest='timing_file', default='',
+                    help='Save the per rank phase times to this CSV file')
+
+args = parser.parse_args()
+
+if args.src_file == '':
+    print('ERROR: must provide source data file name')
+    parser.print_help()
+    sys.exit(1)
+
+if args.dst_file == '':
+    print('ERROR: must provide destination data file name')
+    parser.print_help()
+    sys.exit(1)
+
+def createData(filename, fieldname, mode):
+    # read the netcdf header, then only the local hyperslab of the
+    # coordinates and data on this rank
+    tic = time.time()
+    nc = ncio.openDataset(filename)
+    var = nc.variables[fieldname]
+    latVar, lonVar = grids.getLatLonVariables(nc, var)
+    levels = vertical.getLevels(nc, var)
+    timer.add('read', time.time() - tic)
+
+    # create the ESMF grid, the levels are the last grid dimension in 3d
+    tic = time.time()
+    cellDims = [n - 1 for n in latVar.shape]
+    stagger = ESMF.StaggerLoc.CORNER
+    coordDims = [LON_INDEX, LAT_INDEX]
+    if mode == '3d':
+        cellDims.append(len(levels) - 1)
+        stagger = ESMF.StaggerLoc.CORNER_VFACE
+        coordDims.append(HEIGHT_INDEX)
+    grid = ESMF.Grid(max_index=numpy.array(cellDims, numpy.int32),
+                     coord_sys=ESMF.api.constants.CoordSys.SPH_DEG)
+    for coordDim in coordDims:
+        grid.add_coords(staggerloc=stagger, coord_dim=coordDim)
+    timer.add('grid', time.time() - tic)
+
+    # get the local start/end index sets
+    lower, upper = grid.lower_bounds[stagger], grid.upper_bounds[stagger]
+    localSlices = (slice(lower[0], upper[0]), slice(lower[1], upper[1]))
+
+    tic = time.time()
+    lats = latVar[localSlices]
+    lons = lonVar[localSlices]
+    # levels first, as the ungridded dimension of the 2d fields
+    data = var[(slice(None),) + localSlices]
+    nc.close()
+    timer.add('read', time.time() - tic)
+
+    # set the coordinates
+    tic = time.time()
+    if mode == '3d':
+        levelSlice = slice(lower[2], upper[2])
+        shape = lats.shape + (upper[2] - lower[2],)
+        grid.get_coords(coord_dim=LAT_INDEX, staggerloc=stagger)[...] = \
+            numpy.broadcast_to(lats[..., None], shape)
+        grid.get_coords(coord_dim=LON_INDEX, staggerloc=stagger)[...] = \
+            numpy.broadcast_to(lons[..., None], shape)
+        grid.get_coords(coord_dim=HEIGHT_INDEX, staggerloc=stagger)[...] = \
+            numpy.broadcast_to(-levels[levelSlice]/EARTH_RADIUS, shape)
+        # the levels are the last grid dimension
+        data = numpy.moveaxis(data[levelSlice], 0, -1)
+    else:
+        grid.get_coords(coord_dim=LAT_INDEX, staggerloc=stagger)[...] = lats
+        grid.get_coords(coord_dim=LON_INDEX, staggerloc=stagger)[...] = lons
+    timer.add('grid', time.time() - tic)
+
+    # create the field, the levels are an ungridded dimension in 2d, which
+    # ESMF puts first in the field data
+    tic = time.time()
+    if mode == '3d':
+        field = ESMF.Field(grid, name='sea_water_potential_temperature', staggerloc=stagger)
+    else:
+        field = ESMF.Field(grid, name='sea_water_potential_temperature', staggerloc=stagger,
+                           ndbounds=[len(levels)])
+    field.data[...] = data
+    timer.add('field', time.time() - tic)
+
+    return grid, field, levels, data
+
+srcGrid, srcData, srcLevels, srcValues = createData(args.src_file, args.src_field, args.mode)
+dstGrid, dstData, dstLevels, dstDataRef = createData(args.dst_file, 'pointData', args.mode)
+
+stagger = ESMF.StaggerLoc.CORNER_VFACE if args.mode == '3d' else ESMF.StaggerLoc.CORNER
+
+# fraction of each destination point covered by the source grid, 0 if unmapped
+dstFrac = ESMF.Field(dstGrid, staggerloc=stagger)
+
+if args.mode == '2d':
+    # the 2d weights act on the source levels, the destination field holds
+    # the source levels until the vertical interpolation
+    dstData = ESMF.Field(dstGrid, name='sea_water_potential_temperature', staggerloc=stagger,
+                         ndbounds=[len(srcLevels)])
+dstData.data[...] = -1
+
+# compute the interpolation weights
+tic = time.time()
+regrid = ESMF.api.regrid.Regrid(srcData, dstData,
+                                regrid_method=ESMF.api.constants.RegridMethod.BILINEAR,
+                                unmapped_action=ESMF.api.constants.UnmappedAction.IGNORE,
+                                ignore_degenerate=True,
+                                dst_frac_field=dstFrac)
+timer.add('weights', time.time() - tic)
+
+# interpolate
+tic = time.time()
+regrid(srcData, dstData)
+timer.add('evaluation', time.time() - tic)
+
+if args.mode == '3d':
+    values = dstData.data
+    mask = (dstFrac.data <= 0.)
+else:
+    tic = time.time()
+    k, w, validLevels = vertical.getLevelWeights(srcLevels, dstLevels)
+    values = vertical.interpolate(dstData.data, k, w, validLevels)
+    timer.add('vertical', time.time() - tic)
+    mask = (dstFrac.data <= 0.) | ~validLevels[:, None, None]
+
+# compute error
+tic = time.time()
+stats = diagnostics.ErrorStats(MPI.COMM_WORLD)
+stats.addSource(srcValues)
+stats.update(values, dstDataRef, mask=numpy.broadcast_to(mask, values.shape))
+stats.reduce()
+timer.add('error', time.time() - tic)
+
+stats.report('esmf {} interpolation:'.format(args.mode))
+
+timer.report(args.timing_file)
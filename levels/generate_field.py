@@ -0,0 +1,134 @@
+from __future__ import print_function
+import argparse
+import numpy
+import netCDF4
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import grids
+
+
+def createLevels(nk, maxDepth, stretch):
+    """
+    Create depth levels, finer near the surface
+    @param nk number of levels
+    @param maxDepth depth of the last level (m)
+    @param stretch stretching factor, uniform levels if 0
+    @return 1D array of depths, from 0 to maxDepth
+    """
+    t = numpy.linspace(0., 1., nk)
+    if stretch == 0.:
+        return maxDepth * t
+    return maxDepth * (numpy.exp(stretch*t) - 1.) / (numpy.exp(stretch) - 1.)
+
+
+def createPointData(lats, lons, depths, expr='sin(2*pi*lons/180.)*cos(pi*lats/180.)*exp(-depths/1000.)'):
+    """
+    Create nodal data on a layered grid
+    @param lats 2D latitudes
+    @param lons 2D longitudes
+    @param depths 1D depths
+    @return 3D data, dimensions (level, y, x)
+    """
+    from math import pi
+    from numpy import cos, sin, exp
+    depths = depths[:, None, None]
+    return eval(expr) + 0.*lats
+
+
+def saveLayeredGrid(filename, nk, nj, ni, deltaLat, deltaLon, poleLat, poleLon, maxDepth, stretch):
+    """
+    Save a rotated pole grid with depth levels and its nodal data
+    @param filename netCDF file name
+    @param nk number of levels
+    @param nj number of rotated latitudes
+    @param ni number of rotated longitudes
+    @param deltaLat rotated latitudes range from -deltaLat to deltaLat
+    @param deltaLon rotated longitudes range from -deltaLon to deltaLon
+    @param poleLat geographic latitude of the rotated pole
+    @param poleLon geographic longitude of the rotated pole
+    @param maxDepth depth of the last level (m)
+    @param stretch level stretching factor
+    """
+    rlats, rlons = numpy.meshgrid(numpy.linspace(-deltaLat, deltaLat, nj),
+                                  numpy.linspace(-deltaLon, deltaLon, ni), indexing='ij')
+    lats, lons = grids.rotatedToGeographic(rlats, rlons, poleLat, poleLon)
+    depths = createLevels(nk, maxDepth, stretch)
+
+    nc = netCDF4.Dataset(filename, 'w')
+    nc.createDimension('depth', nk)
+    nc.createDimension('y', nj)
+    nc.createDimension('x', ni)
+    depthVar = nc.createVariable('depth', 'f8', ('depth',))
+    depthVar.standard_name = 'depth'
+    depthVar.units = 'm'
+    depthVar.positive = 'down'
+    depthVar.axis = 'Z'
+    depthVar[:] = depths
+    latVar = nc.createVariable('lat', 'f8', ('y', 'x'))
+    latVar.standard_name = 'latitude'
+    latVar.units = 'degrees_north'
+    latVar[:] = lats
+    lonVar = nc.createVariable('lon', 'f8', ('y', 'x'))
+    lonVar.standard_name = 'longitude'
+    lonVar.units = 'degrees_east'
+    lonVar[:] = lons
+    pointVar = nc.createVariable('pointData', 'f8', ('depth', 'y', 'x'))
+    pointVar.standard_name = 'sea_water_potential_temperature'
+    pointVar.coordinates = 'lat lon'
+    pointVar[:] = createPointData(lats, lons, depths)
+    nc.close()
+
+
+parser = argparse.ArgumentParser(description='Generate layered rotated pole grids and data in 3d')
+parser.add_argument('--src_nk', type=int, dest='src_nk', default=31,
+                    help='Source number of levels')
+parser.add_argument('--src_nj', type=int, dest='src_nj', default=101,
+                    help='Source latitude axis dimension')
+parser.add_argument('--src_ni', type=int, dest='src_ni', default=201,
+                    help='Source longitude axis dimension')
+parser.add_argument('--dst_nk', type=int, dest='dst_nk', default=21,
+                    help='Destination number of levels')
+parser.add_argument('--dst_nj', type=int, dest='dst_nj', default=21,
+                    help='Destination latitude axis dimension')
+parser.add_argument('--dst_ni', type=int, dest='dst_ni', default=41,
+                    help='Destination longitude axis dimension')
+parser.add_argument('--delta_lat', type=float, dest='delta_lat', default=60.0,
+                    help='Source rotated latitude half range')
+parser.add_argument('--delta_lon', type=float, dest='delta_lon', default=120.0,
+                    help='Source rotated longitude half range')
+parser.add_argument('--dst_fraction', type=float, dest='dst_fraction', default=0.9,
+                    help='Destination range as a fraction of the source range')
+parser.add_argument('--pole_lat', type=float, dest='pole_lat', default=40.0,
+                    help='Latitude of the rotated pole')
+parser.add_argument('--pole_lon', type=float, dest='pole_lon', default=-160.0,
+                    help='Longitude of the rotated pole')
+parser.add_argument('--max_depth', type=float, dest='max_depth', default=5000.0,
+                    help='Depth of the bottom level (m)')
+parser.add_argument('--src_stretch', type=float, dest='src_stretch', default=2.0,
+                    help='Source level stretching, levels are uniform if 0')
+parser.add_argument('--src_file', type=str, dest='src_file', default='src.nc',
+                    help='Source data file name')
+parser.add_argument('--dst_file', type=str, dest='dst_file', default='dst.nc',
+                    help='Destination data file name')
+
+args = parser.parse_args()
+
+if args.src_file == '':
+    print('ERROR: must provide source data file name')
+    parser.print_help()
+    sys.exit(1)
+
+if args.dst_file == '':
+    print('ERROR: must provide destination data file name')
+    parser.print_help()
+    sys.exit(1)
+
+print('src grid: {} x {} x {}'.format(args.src_nk, args.src_nj, args.src_ni))
+print('dst grid: {} x {} x {}'.format(args.dst_nk, args.dst_nj, args.dst_ni))
+
+# the destination grid is inside the source grid, with uniform levels
+saveLayeredGrid(args.src_file, args.src_nk, args.src_nj, args.src_ni, args.delta_lat, args.delta_lon,
+                args.pole_lat, args.pole_lon, args.max_depth, args.src_stretch)
+saveLayeredGrid(args.dst_file, args.dst_nk, args.dst_nj, args.dst_ni, args.dst_fraction*args.delta_lat,
+                args.dst_fraction*args.delta_lon, args.pole_lat, args.pole_lon, args.max_depth, 0.)
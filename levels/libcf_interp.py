@@ -0,0 +1,138 @@
+from __future__ import print_function
+import pycf
+import netCDF4
+import numpy
+import sys
+from ctypes import byref, c_int, c_double
+import argparse
+import time
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import libcf, grids, vertical
+
+parser = argparse.ArgumentParser(description='Interpolate layered grids using libcf')
+parser.add_argument('--src_field', type=str, dest='src_field', default='pointData',
+                    help='Name of the source field, dimensions (level, y, x)')
+parser.add_argument('--src_file', type=str, dest='src_file', default='src.nc',
+                    help='Source data file name')
+parser.add_argument('--dst_file', type=str, dest='dst_file', default='dst.nc',
+                    help='Destination data file name')
+parser.add_argument('--mode', type=str, dest='mode', default='3d', choices=['3d', '2d'],
+                    help='3d: regrid between the 3D grids, 2d: 2D regrid applied level by level then '
+                         'vertical interpolation')
+parser.add_argument('--tolpos', type=float, dest='tolpos', default=1.e-6,
+                    help='Tolerance in target space')
+parser.add_argument('--nitermax', type=int, dest='nitermax', default=1000,
+                    help='Max number of iterations')
+
+args = parser.parse_args()
+
+if args.src_file == '':
+    print('ERROR: must provide source data file name')
+    parser.print_help()
+    sys.exit(1)
+
+if args.dst_file == '':
+    print('ERROR: must provide destination data file name')
+    parser.print_help()
+    sys.exit(1)
+
+FILL_VALUE = -2.0
+
+def createData(filename, prefix, fieldname, mode):
+    # read the layered grid, the libcf objects then use the numpy arrays
+    # without copying them
+    nc = netCDF4.Dataset(filename, 'r')
+    var = nc.variables[fieldname]
+    coords = grids.getCoordinates(nc, var)
+    levels = vertical.getLevels(nc, var)
+    data = numpy.ascontiguousarray(var[:], numpy.float64)
+    nc.close()
+
+    if mode == '3d':
+        obj = libcf.LibcfData(coords['lats'], coords['lons'], data, prefix, fieldname,
+                              standardName='sea_water_potential_temperature', units='K', levels=levels)
+    else:
+        # a single 2D data object, the levels are copied in and out of its buffer
+        obj = libcf.LibcfData(coords['lats'], coords['lons'], data[0].copy(), prefix, fieldname,
+                              standardName='sea_water_potential_temperature', units='K')
+
+    return {'gridId': obj.gridId, 'dataId': obj.dataId, 'dataArray': obj.data, 'levels': levels,
+            'data': data, 'libcf': obj}
+
+
+timeStats = {
+    'weights': float('nan'),
+    'evaluation': float('nan'),
+}
+
+src = createData(args.src_file, b"src", args.src_field, args.mode)
+dst = createData(args.dst_file, b"dst", args.src_field, args.mode)
+
+# compute the interpolation weights
+regridId = c_int()
+ier = pycf.nccf.nccf_def_regrid(src['gridId'], dst['gridId'], byref(regridId))
+assert(ier == pycf.NC_NOERR)
+
+tic = time.time()
+ier = pycf.nccf.nccf_compute_regrid_weights(regridId, c_int(args.nitermax), c_double(args.tolpos))
+timeStats['weights'] = time.time() - tic
+assert(ier == pycf.NC_NOERR)
+
+# get the the number of valid target points
+nvalid = c_int()
+ier = pycf.nccf.nccf_inq_regrid_nvalid(regridId, byref(nvalid))
+assert(ier == pycf.NC_NOERR)
+
+# store the reference data values
+dstDataRef = dst['data'].copy()
+
+if args.mode == '3d':
+    dst['dataArray'][...] = FILL_VALUE
+    tic = time.time()
+    ier = pycf.nccf.nccf_apply_regrid(regridId, src['dataId'], dst['dataId'])
+    timeStats['evaluation'] = time.time() - tic
+    assert(ier == pycf.NC_NOERR)
+    dstData = dst['dataArray']
+    ninvalid = dstData.size - nvalid.value
+else:
+    # the weights are computed once, then applied to every source level
+    numSrcLevels = len(src['levels'])
+    levelData = numpy.empty((numSrcLevels,) + dst['dataArray'].shape, numpy.float64)
+    tic = time.time()
+    for k in range(numSrcLevels):
+        src['dataArray'][...] = src['data'][k]
+        dst['dataArray'][...] = FILL_VALUE
+        ier = pycf.nccf.nccf_apply_regrid(regridId, src['dataId'], dst['dataId'])
+        assert(ier == pycf.NC_NOERR)
+        levelData[k] = dst['dataArray']
+    timeStats['evaluation'] = time.time() - tic
+
+    tic = time.time()
+    k, w, validLevels = vertical.getLevelWeights(src['levels'], dst['levels'])
+    dstData = vertical.interpolate(levelData, k, w, validLevels, fillValue=FILL_VALUE)
+    # the columns not found horizontally stay invalid
+    dstData[:, levelData[0] == FILL_VALUE] = FILL_VALUE
+    timeStats['vertical'] = time.time() - tic
+    ninvalid = numpy.count_nonzero(dstData == FILL_VALUE)
+
+# compute error
+valid = (dstData != FILL_VALUE)
+dstNtot = dstData.size
+error = numpy.sum(abs(dstData - dstDataRef)[valid]) / float(max(1, numpy.count_nonzero(valid)))
+print('libcf {} interpolation:'.format(args.mode))
+print('\tsrc: {} ntot: {}'.format(src['data'].shape, src['data'].size))
+print('\tdst: {} ntot: {}'.format(dstData.shape, dstNtot))
+print('\t     # invalid points: {} ({:.3f}%)'.format(ninvalid,
+                                               100*ninvalid/float(dstNtot)))
+print('interpolation error: {:.3g}'.format(error))
+print('time stats:')
+totTime = 0.0
+for key, v in timeStats.items():
+    print('\t{0:<32} {1:>.3g} sec'.format(key, v))
+    totTime += v
+print('\t{0:<32} {1:>.3g} sec'.format('total', totTime))
+
+# clean up
+src['libcf'].free()
+dst['libcf'].free()
@@ -0,0 +1,104 @@
+from subprocess import call
+import os
+import re
+import sys
+import argparse
+
+parser = argparse.ArgumentParser(description='Compare 3D regridding with 2D regridding followed by a vertical interpolation')
+parser.add_argument('--nprocs', type=int, dest='nprocs', default=1,
+                    help='Number of procs (for programs supporting MPI execution)')
+parser.add_argument('--src_nk', type=int, dest='src_nk', default=75,
+                    help='Number of source levels')
+parser.add_argument('--dst_nk', type=int, dest='dst_nk', default=50,
+                    help='Number of destination levels')
+parser.add_argument('--backends', type=str, dest='backends', default='numpy,libcf,esmf',
+                    help='Comma separated list of backends to run')
+
+args = parser.parse_args()
+
+def getPhaseTime(filename, phase):
+	m = re.search(r'^\s*' + phase + r'\s+([\d\.e\-\+]+)', open(filename, 'r').read(), re.MULTILINE)
+	if m:
+		return float(m.group(1))
+	return 0.0
+
+def getError(filename):
+	m = re.search(r'interpolation error:\s+([\d\.e\-\+na]+)', open(filename, 'r').read())
+	if m:
+		return float(m.group(1))
+	return None
+
+
+src_celldims = [(10, 20),
+                (20, 40),
+                (40, 80),
+                (80, 160),
+                (160, 320),
+                (320, 640),
+                (640, 1280),]
+
+# the pyterp package is in the parent directory
+env = dict(os.environ)
+env['PYTHONPATH'] = os.pathsep.join([os.path.abspath('..'), env.get('PYTHONPATH', '')])
+
+commands = {
+	'numpy': [sys.executable, '-m', 'pyterp.vertical'],
+	'libcf': [sys.executable, 'libcf_interp.py'],
+	'esmf': [sys.executable, 'esmf_interp.py'],
+}
+if args.nprocs > 1:
+	commands['esmf'] = ['mpiexec', '-n', str(args.nprocs)] + commands['esmf']
+
+runs = [(backend, mode) for backend in args.backends.split(',') for mode in ('3d', '2d')]
+
+ns = []
+results = dict([(run, []) for run in runs])
+
+for srcDims in src_celldims:
+	# generate the grids
+	dstDims = (srcDims[0]//2, srcDims[1]//2)
+	call([sys.executable, 'generate_field.py', \
+		'--src_nk', '{}'.format(args.src_nk), \
+		'--src_nj', '{}'.format(srcDims[0] + 1), \
+		'--src_ni', '{}'.format(srcDims[1] + 1), \
+		'--dst_nk', '{}'.format(args.dst_nk), \
+		'--dst_nj', '{}'.format(dstDims[0] + 1), \
+		'--dst_ni', '{}'.format(dstDims[1] + 1), \
+		])
+
+	srcN = srcDims[0] * srcDims[1] * (args.src_nk - 1)
+	dstN = dstDims[0] * dstDims[1] * (args.dst_nk - 1)
+	ns.append(srcN * dstN)
+	print('number of src * dst cells is {}'.format(srcN * dstN))
+
+	for backend, mode in runs:
+		err = open('log.err', 'w')
+		out = open('log.txt', 'w')
+		call(commands[backend] + ['--mode', mode], stdout=out, stderr=err, env=env)
+		out.close()
+		res = [getPhaseTime('log.txt', phase) for phase in ('weights', 'evaluation', 'vertical')]
+		results[(backend, mode)].append(res + [getError('log.txt')])
+		print('{} {}: weights {} evaluation {} vertical {} error {}'.format(backend, mode, *results[(backend, mode)][-1]))
+
+# write to file
+import time
+ta = re.sub(' ', '_', time.asctime())
+f = open('run_levels-{}.csv'.format(ta), 'w')
+f.write('src_num_cells*dst_num_cells,backend,mode,weights,evaluation,vertical,error\n')
+for backend, mode in runs:
+	for i in range(len(ns)):
+		f.write('{},{},{},{},{},{},{}\n'.format(ns[i], backend, mode, *results[(backend, mode)][i]))
+f.close()
+
+from matplotlib import pylab
+
+legend = []
+for backend, mode in runs:
+	totals = [sum(r[:3]) for r in results[(backend, mode)]]
+	pylab.loglog(ns, totals, '-' if mode == '3d' else '--')
+	legend.append('{} {}'.format(backend, mode))
+pylab.legend(legend, loc=2)
+pylab.xlabel('num src cells * num dst cells')
+pylab.ylabel('weights + evaluation + vertical time [sec]')
+pylab.title('{} to {} levels, 3d regrid vs 2d regrid + vertical'.format(args.src_nk, args.dst_nk))
+pylab.savefig('run_levels.png')
@@ -1,11 +1,13 @@
 from __future__ import print_function
 import ESMF
-import iris
 import numpy
+import os
 import sys
 import argparse
 from functools import reduce
 import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import ncio, grids, diagnostics
 
 # turn on logging
 esmpy = ESMF.Manager(debug=True)
@@ -19,6 +21,9 @@ parser.add_argument('--dst_file', type=str, dest='dst_file', default='dst.nc',
                     help='Destination data file name')
 parser.add_argument('--out_file', type=str, dest='out_file', default='dst_regridded.nc',
                     help='Destination file with regridded field')
+parser.add_argument('--stitch', dest='stitch', action='store_true',
+                    help='Without parallel netCDF, assemble the rank tiles into --out_file on rank 0 '
+                         '(by default they are left for python -m pyterp.ncio)')
 parser.add_argument('--plot', dest='plot', action='store_true', help='Plot')
 
 args = parser.parse_args()
@@ -38,17 +43,15 @@ dst_file = args.dst_file.encode('UTF-8') # python3
 ndims = 2
 
 def createData(filename, prefix, set_mask=False):
-    # use iris to read in the data
-    # then pass the array to the ESMF API
-    cubes = iris.load(filename)
-    cube = iris.load(filename, iris.Constraint(cube_func = lambda c: c.var_name == 'pointData'))[0]
-    coords = cube.coords()
-    lats = coords[0].points
-    lons = coords[1].points
+    # read the netcdf header, then only the local hyperslab of the
+    # coordinates and data on this rank
+    nc = ncio.openDataset(filename)
+    var = nc.variables['pointData']
+    latVar, lonVar = grids.getLatLonVariables(nc, var)
     
     # create the ESMF grid object
 
-    cellDims = numpy.array([lats.shape[0] - 1, lats.shape[1] - 1])
+    cellDims = numpy.array([latVar.shape[0] - 1, latVar.shape[1] - 1])
     grid = ESMF.Grid(max_index=cellDims) #, num_peri_dims=1, periodic_dim=1)
 
     grid.add_coords(staggerloc=ESMF.StaggerLoc.CORNER, coord_dim=LAT_INDEX)
@@ -64,32 +67,36 @@ def createData(filename, prefix, set_mask=False):
     iEndLon = grid.upper_bounds[ESMF.StaggerLoc.CORNER][LON_INDEX]
 
     # set the coordinates
-    coordLat[...] = lats[iBegLon:iEndLon, iBegLat:iEndLat]
-    coordLon[...] = lons[iBegLon:iEndLon, iBegLat:iEndLat]
+    localSlices = (slice(iBegLon, iEndLon), slice(iBegLat, iEndLat))
+    coordLat[...] = latVar[localSlices]
+    coordLon[...] = lonVar[localSlices]
 
     # create field
     field = ESMF.Field(grid, name="air_temperature", 
                    staggerloc=ESMF.StaggerLoc.CORNER)
-    field.data[...] = cube.data # cube.data is either a masked array or a ndarray (if no _FillValue)
+    data = ncio.readSlab(var, (), localSlices) # either a masked array or a ndarray (if no _FillValue)
+    field.data[...] = data
     
     # add the masking
     fillValue = 1e20
-    if set_mask and numpy.ma.is_masked(cube.data):
+    if set_mask and numpy.ma.is_masked(data):
         mask = grid.add_item(ESMF.GridItem.MASK, staggerloc=ESMF.StaggerLoc.CORNER)
-        mask[...] = numpy.ma.getmaskarray(cube.data).astype(numpy.int)[...]
-        fillValue = cube.data.fill_value
+        mask[...] = numpy.ma.getmaskarray(data).astype(numpy.int32)[...]
+        fillValue = data.fill_value
 
     nodeDims = (iEndLat - iBegLat, iEndLon - iBegLon)
 
-    return grid, field, nodeDims, fillValue, cubes
+    nc.close()
+    return grid, field, nodeDims, fillValue, localSlices
 
 timeStats = {
     'weights': float('nan'),
     'evaluation': float('nan'),
+    'write': float('nan'),
 }
 
-srcGrid, srcData, srcNodeDims, srcFillValue, srcCubes = createData(src_file, b"src", set_mask=True)
-dstGrid, dstData, dstNodeDims, dstFillValue, dstCubes = createData(dst_file, b"dst")
+srcGrid, srcData, srcNodeDims, srcFillValue, srcSlices = createData(src_file, b"src", set_mask=True)
+dstGrid, dstData, dstNodeDims, dstFillValue, dstSlices = createData(dst_file, b"dst")
 
 # save the reference (exact) field data
 dstDataRef = dstData.data.copy()
@@ -114,20 +121,18 @@ tic = time.time()
 regrid(srcData, dstData, zero_region=ESMF.Region.SELECT)
 timeStats['evaluation'] = time.time() - tic
 
-# compute error
-srcNtot = len(srcData.data.flat)
-dstNtot = len(dstData.data.flat)
+# write the regridded field, each rank writes its own window
+tic = time.time()
+outFile = ncio.writeField(args.out_file, dst_file, 'pointData', numpy.ma.masked_values(dstData.data, srcFillValue),
+                          slices=dstSlices)
+outFile = ncio.gatherTiles(args.out_file, outFile, stitch=args.stitch)
+timeStats['write'] = time.time() - tic
 
 # compute error
-# could be using dstDataRef for the masking?
-errorSum = numpy.sum((dstData.data != srcFillValue) * abs(dstData.data - dstDataRef))
-numValidDstNodes = numpy.sum(dstData.data != srcFillValue)
-error = errorSum / numValidDstNodes
-
-print('emsf interpolation:')
-print('\tsrc: {} ntot: {}'.format(srcNodeDims, srcNtot))
-print('\tdst: {} ntot: {}'.format(dstNodeDims, dstNtot))
-print('interpolation error: {:.3g}'.format(error))
+stats = diagnostics.ErrorStats(ncio.getComm())
+stats.addSource(srcData.data)
+stats.update(dstData.data, dstDataRef, mask=(dstData.data == srcFillValue))
+stats.report('emsf interpolation:')
 totTime = 0.0
 print('time stats:')
 for k, v in timeStats.items():
@@ -145,13 +150,5 @@ if args.plot:
     pylab.colorbar(p)
     pylab.show()
 
-# write interpolated data
-cube = None
-for cb in dstCubes:
-    if cb.var_name == 'pointData':
-        cube = cb
-cube.data = numpy.ma.masked_values(dstData.data, srcFillValue)
-iris.save(dstCubes, args.out_file)
-
 # clean up
 # nothing to do
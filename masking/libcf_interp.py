@@ -3,10 +3,13 @@ import pycf
 import iris
 import numpy
 import sys
-from ctypes import byref, c_int, c_double, c_float, POINTER, c_char_p, c_void_p
+from ctypes import byref, c_int, c_double, c_float
 import argparse
 from functools import reduce
 import time
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import libcf
 
 # it would be nice to get this from the file (can Iris provide  the fill value?)
 FILL_VALUE = 1.e20
@@ -41,7 +44,6 @@ if args.dst_file is '':
 src_file = args.src_file.encode('UTF-8') # python3
 dst_file = args.dst_file.encode('UTF-8') # python3
 src_field = args.src_field.encode('UTF-8') # python3
-ndims = 2
 
 def createData(filename, prefix, fieldname, maskFlag=False):
     # use iris to read in the data
@@ -55,67 +57,23 @@ def createData(filename, prefix, fieldname, maskFlag=False):
     lats = coords[0].points
     lons = coords[1].points
     
-    # create coordinates
-    save = 1 # copy and save
-    latId, lonId = c_int(), c_int()
-    dims = (c_int * 2)(lats.shape[0], lats.shape[1])
-    dimNames = (c_char_p * 2)("y", "x")
-    ier = pycf.nccf.nccf_def_lat_coord(ndims, dims, dimNames, lats.ctypes.data_as(POINTER(c_double)), save, byref(latId))
-    assert(ier == pycf.NC_NOERR)
-    ier = pycf.nccf.nccf_def_lon_coord(ndims, dims, dimNames, lons.ctypes.data_as(POINTER(c_double)), save, byref(lonId))
-    assert(ier == pycf.NC_NOERR)
-
-    # create the grid
-    gridId = c_int()
-    coordIds = (c_int * 2)(latId.value, lonId.value)
-    gridname = prefix + 'grid'
-    ier = pycf.nccf.nccf_def_grid(coordIds, gridname, byref(gridId))
-    assert(ier == pycf.NC_NOERR)
-
-    # create the data
-    dataId = c_int()
-    dataname = fieldname
-    ier = pycf.nccf.nccf_def_data(gridId, dataname, cube.standard_name, str(cube.units),
-                                  None, byref(dataId))
-    assert(ier == pycf.NC_NOERR)
-
-    # set the data
-    save = 0 # python holds the data and will take care of releasing the memory
-    fillValue = c_double(FILL_VALUE) # pycf.NC_FILL_DOUBLE)
-    ier = pycf.nccf.nccf_set_data_double(dataId, cube.data.ctypes.data_as(POINTER(c_double)),
-                                         save, fillValue)
-    assert(ier == pycf.NC_NOERR)
-
-    # create a numpy array from that pointer
-    array = cube.data # numpy.ctypeslib.as_array(dataPtr, shape=cube.data.shape)
-
     # apply the mask to the src grid
+    validmask = None
     if maskFlag:
-        validmask = numpy.array(array < FILL_VALUE, numpy.int32)
+        validmask = numpy.array(cube.data < FILL_VALUE, numpy.int32)
         print(validmask.sum())
-        ier = pycf.nccf.nccf_set_grid_validmask(gridId,
-                                                validmask.ctypes.data_as(POINTER(c_int)))
-        assert(ier == pycf.NC_NOERR)
-
-    return {'gridId': gridId, 'dataId': dataId, 'data': array, 
-            'lats': lats, 'lons': lons, 'cube': cube}
-
-
-def destroyData(dataId):
-    gridId = c_int()
-    ier = pycf.nccf.nccf_inq_data_gridid(dataId, byref(gridId))
-    assert(ier == pycf.NC_NOERR)
-    coordIds = (c_int * ndims)()
-    ier = pycf.nccf.nccf_inq_grid_coordids(gridId, coordIds)
-    assert(ier == pycf.NC_NOERR)
-
-    ier = pycf.nccf.nccf_free_data(dataId)
-    assert(ier == pycf.NC_NOERR)
-    ier = pycf.nccf.nccf_free_grid(gridId)
-    assert(ier == pycf.NC_NOERR)
-    for i in range(ndims):
-        ier = pycf.nccf.nccf_free_coord(coordIds[i])
-        assert(ier == pycf.NC_NOERR)
+
+    # the libcf objects use the numpy arrays without copying them
+    data = libcf.LibcfData(lats, lons, cube.data, prefix, fieldname,
+                           standardName=cube.standard_name or '', units=str(cube.units),
+                           fillValue=FILL_VALUE, validMask=validmask)
+
+    # the cube refers to the array libcf writes the regridded values to
+    cube.data = data.data
+
+    return {'gridId': data.gridId, 'dataId': data.dataId, 'data': data.data,
+            'lats': lats, 'lons': lons, 'cube': cube, 'libcf': data}
+
 
 def printInvalidDataPoints(lats, lons, data, fillValue):
     badLats = lats[data == fillValue]
@@ -212,5 +170,5 @@ if args.out_file:
     iris.save([dst['cube']], args.out_file)
 
 # clean up
-destroyData(src['dataId'])
-destroyData(dst['dataId'])
+src['libcf'].free()
+dst['libcf'].free()
@@ -1,11 +1,13 @@
 from __future__ import print_function
 import ESMF
-import iris
 import numpy
+import os
 import sys
 import argparse
 from functools import reduce
 import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import ncio, diagnostics
 
 # turn on logging
 esmpy = ESMF.Manager(debug=True)
@@ -15,6 +17,11 @@ parser.add_argument('--src_file', type=str, dest='src_file', default='src.nc',
                     help='Source data file name')
 parser.add_argument('--dst_file', type=str, dest='dst_file', default='dst.nc',
                     help='Destination data file name')
+parser.add_argument('--out_file', type=str, dest='out_file', default='dst_regridded.nc',
+                    help='Destination file with regridded field')
+parser.add_argument('--stitch', dest='stitch', action='store_true',
+                    help='Without parallel netCDF, assemble the rank tiles into --out_file on rank 0 '
+                         '(by default they are left for python -m pyterp.ncio)')
 parser.add_argument('--plot', dest='plot', action='store_true', help='Plot')
 
 args = parser.parse_args()
@@ -34,23 +41,16 @@ dst_file = args.dst_file.encode('UTF-8') # python3
 ndims = 2
 
 def createData(filename, prefix):
-    # use iris to read in the data
-    # then pass the array to the ESMF API
-    cubes = iris.load(filename)
-    cubePoint, cubeCell = None, None
-    # find the point and cell cubes
-    for cb in cubes:
-        if cb.var_name == 'pointData':
-            cubePoint = cb
-        if cb.var_name == 'cellData':
-            cubeCell = cb
-    coordsPoint = cubePoint.coords()
-    xPoint = coordsPoint[0].points
-    yPoint = coordsPoint[1].points
+    # read the netcdf header, then only the local hyperslab of the
+    # coordinates and data on this rank
+    nc = ncio.openDataset(filename)
+    xVar = nc.variables['xx']
+    yVar = nc.variables['yy']
+    varCell = nc.variables['cellData']
     
     # create the ESMF grid object
     xIndex, yIndex = 0, 1
-    cellDims = numpy.array([xPoint.shape[0] - 1, xPoint.shape[1] - 1])
+    cellDims = numpy.array([xVar.shape[0] - 1, xVar.shape[1] - 1])
     grid = ESMF.Grid(max_index=cellDims, coord_sys=ESMF.api.constants.CoordSys.CART) #SPH_DEG) #, num_peri_dims=1, periodic_dim=1)
     grid.add_coords(staggerloc=ESMF.StaggerLoc.CORNER, coord_dim=xIndex)
     grid.add_coords(staggerloc=ESMF.StaggerLoc.CORNER, coord_dim=yIndex)
@@ -64,25 +64,29 @@ def createData(filename, prefix):
     iBegY = grid.lower_bounds[ESMF.StaggerLoc.CORNER][yIndex]
     iEndY = grid.upper_bounds[ESMF.StaggerLoc.CORNER][yIndex]
     # NEED TO CHECK ORDERING!!!
-    coordXPoint[...] = xPoint[iBegX:iEndX, iBegY:iEndY]
-    coordYPoint[...] = yPoint[iBegX:iEndX, iBegY:iEndY]
+    coordXPoint[...] = xVar[iBegX:iEndX, iBegY:iEndY]
+    coordYPoint[...] = yVar[iBegX:iEndX, iBegY:iEndY]
 
     # local sizes
     nodeDims = (iEndX - iBegX, iEndY - iBegY)
 
-    # create and set the field
+    # create and set the field, the cells have their own index sets
     field = ESMF.Field(grid, staggerloc=ESMF.StaggerLoc.CENTER)
-    field.data[...] = cubeCell.data[:]
+    cellSlices = tuple(slice(b, e) for b, e in zip(grid.lower_bounds[ESMF.StaggerLoc.CENTER],
+                                                   grid.upper_bounds[ESMF.StaggerLoc.CENTER]))
+    field.data[...] = ncio.readSlab(varCell, (), cellSlices)
 
-    return grid, field, nodeDims
+    nc.close()
+    return grid, field, nodeDims, cellSlices
 
 timeStats = {
     'weights': float('nan'),
     'evaluation': float('nan'),
+    'write': float('nan'),
 }
 
-srcGrid, srcData, srcNodeDims = createData(src_file, b"src")
-dstGrid, dstData, dstNodeDims = createData(dst_file, b"dst")
+srcGrid, srcData, srcNodeDims, srcSlices = createData(src_file, b"src")
+dstGrid, dstData, dstNodeDims, dstSlices = createData(dst_file, b"dst")
 
 # save the reference (exact) field data
 dstDataRef = dstData.data.copy()
@@ -108,14 +112,21 @@ regrid(srcData, dstData)
 
 timeStats['evaluation'] = time.time() - tic
 
+# write the regridded field, each rank writes its own window
+tic = time.time()
+outFile = ncio.writeField(args.out_file, dst_file, 'cellData', dstData.data, slices=dstSlices)
+outFile = ncio.gatherTiles(args.out_file, outFile, stitch=args.stitch)
+timeStats['write'] = time.time() - tic
+
 # compute error
-srcNtot = len(srcData.data.flat)
-dstNtot = len(dstData.data.flat)
-error =  numpy.sum(abs(dstData.data - dstDataRef)) / float(dstNtot)
-print('emsf interpolation:')
-print('\tsrc: {} ntot: {}'.format(srcNodeDims, srcNtot))
-print('\tdst: {} ntot: {}'.format(dstNodeDims, dstNtot))
-print('interpolation error: {:.3g}'.format(error))
+srcAreas = ESMF.Field(srcGrid, staggerloc=ESMF.StaggerLoc.CENTER)
+dstAreas = ESMF.Field(dstGrid, staggerloc=ESMF.StaggerLoc.CENTER)
+srcAreas.get_area()
+dstAreas.get_area()
+stats = diagnostics.ErrorStats(ncio.getComm())
+stats.addSource(srcData.data, areas=srcAreas.data)
+stats.update(dstData.data, dstDataRef, areas=dstAreas.data)
+stats.report('emsf interpolation:')
 totTime = 0.0
 print('time stats:')
 for k, v in timeStats.items():
@@ -1,5 +1,7 @@
 from subprocess import call
+import os
 import re
+import sys
 
 def getEvaluationTime(filename):
 	m = re.search(r'evaluation\s+([\d\.e\-]+)', open(filename, 'r').read())
@@ -28,11 +30,17 @@ src_celldims = [(10, 20),
                 ]
 
 
+# the pyterp package is in the parent directory
+env = dict(os.environ)
+env['PYTHONPATH'] = os.pathsep.join([os.path.abspath('..'), env.get('PYTHONPATH', '')])
+
 ns = []
 sigrid_eval = []
 sigrid_weights = []
 esmf_eval = []
 esmf_weights = []
+numpy_eval = []
+numpy_weights = []
 for srcDims in src_celldims:
 	# generate the grids
 	dstDims = (srcDims[0]//2, srcDims[1]//2)
@@ -64,18 +72,29 @@ for srcDims in src_celldims:
 	sigrid_eval.append(getEvaluationTime('log.txt'))
 	sigrid_weights.append(getWeightsTime('log.txt'))
 
+	# run the numpy polygon clipping backend
+	err = open('log.err', 'w')
+	out = open('log.txt', 'w')
+	call([sys.executable, '-m', 'pyterp.conserve', '--x', 'xx', '--y', 'yy'], stdout=out, stderr=err, env=env)
+	out.close()
+	numpy_eval.append(getEvaluationTime('log.txt'))
+	numpy_weights.append(getWeightsTime('log.txt'))
+
 print(ns)
 print(esmf_eval)
 print(esmf_weights)
 print(sigrid_eval)
 print(sigrid_weights)
+print(numpy_eval)
+print(numpy_weights)
 # write to file
 import re, time
 ta = re.sub(' ', '_', time.asctime())
 f = open('run_node_interp-{}.csv'.format(ta), 'w')
-f.write('src_num_cells*dst_num_cells,esmf_eval,esmf_weights,sigrid_eval,sigrid_weights\n')
+f.write('src_num_cells*dst_num_cells,esmf_eval,esmf_weights,sigrid_eval,sigrid_weights,numpy_eval,numpy_weights\n')
 for i in range(len(ns)):
-	f.write('{},{},{},{},{}\n'.format(ns[i], esmf_eval[i], esmf_weights[i], sigrid_eval[i], sigrid_weights[i]))
+	f.write('{},{},{},{},{},{},{}\n'.format(ns[i], esmf_eval[i], esmf_weights[i], sigrid_eval[i], sigrid_weights[i],
+	                                     numpy_eval[i], numpy_weights[i]))
 f.close()
 
 from matplotlib import pylab
@@ -84,9 +103,12 @@ pylab.loglog(ns, esmf_eval, 'ro', markersize=8)
 pylab.loglog(ns, esmf_weights, 'rs', markersize=8)
 pylab.loglog(ns, sigrid_eval, 'bo', markersize=8) 
 pylab.loglog(ns, sigrid_weights, 'bs', markersize=8)
-pylab.legend(['esmf eval', 'esmf wgts', 'sigrid eval', 'sigrid wgts'], loc=2)
+pylab.loglog(ns, numpy_eval, 'go', markersize=8)
+pylab.loglog(ns, numpy_weights, 'gs', markersize=8)
+pylab.legend(['esmf eval', 'esmf wgts', 'sigrid eval', 'sigrid wgts', 'numpy eval', 'numpy wgts'], loc=2)
 pylab.plot(ns, sigrid_eval, 'b--', ns, sigrid_weights, 'b--', \
-	       ns, esmf_eval, 'r--', ns, esmf_weights, 'r--')
+	       ns, esmf_eval, 'r--', ns, esmf_weights, 'r--', \
+	       ns, numpy_eval, 'g--', ns, numpy_weights, 'g--')
 pylab.xlabel('num src cells * num dst cells')
 pylab.ylabel('time [sec]')
 pylab.title('conservative interpolation')
@@ -0,0 +1,4 @@
+"""
+Reusable pieces of the regridding tests: sparse interpolation weights
+computed once (by ESMF, libcf, ...) and applied many times
+"""
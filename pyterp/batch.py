@@ -0,0 +1,224 @@
+from __future__ import print_function, division
+import os
+import time
+import hashlib
+import threading
+import argparse
+import numpy
+from collections import OrderedDict
+
+
+def groupVariables(nc, gridRank=2):
+    """
+    Group the data variables of a file by horizontal grid and staggering.
+    Variables whose trailing dimensions are not those of their latitude and
+    longitude coordinates (e.g. time bounds) are left out
+    @param nc netCDF dataset
+    @param gridRank number of trailing horizontal dimensions
+    @return ordered dictionary (horizontal dims, coordinates, grid mapping): [variable names]
+    """
+    from pyterp import grids
+
+    # variables that describe other variables
+    auxNames = set(nc.dimensions.keys())
+    for var in nc.variables.values():
+        for attName in 'coordinates', 'bounds', 'grid_mapping':
+            auxNames.update(getattr(var, attName, '').split())
+
+    groups = OrderedDict()
+    for name, var in nc.variables.items():
+        if name in auxNames or var.ndim < gridRank:
+            continue
+        if grids.getHorizontalDimensions(nc, var) != set(var.dimensions[-gridRank:]):
+            continue
+        key = (tuple(var.dimensions[-gridRank:]),
+               getattr(var, 'coordinates', ''),
+               getattr(var, 'grid_mapping', ''))
+        groups.setdefault(key, []).append(name)
+    return groups
+
+
+def isCategorical(var):
+    """
+    Tell whether a variable holds classes or flags (land/sea mask, soil or
+    vegetation type) rather than a continuous quantity
+    @param var netCDF variable
+    @return True for integer variables and variables with flag values or meanings
+    """
+    return numpy.dtype(var.dtype).kind in 'iu' or \
+        'flag_values' in var.ncattrs() or 'flag_meanings' in var.ncattrs()
+
+
+def regridCategoricalSlab(weights, slab):
+    """
+    Regrid a slab of classes to the class with the largest weight in every
+    destination cell
+    @param weights SparseWeights instance
+    @param slab source classes, may be a masked array
+    @return masked array of classes on the destination grid, masked where the
+            destination cell gets no weight from a valid source cell
+    """
+    from pyterp import categorical
+    classes, fractions, dominant = categorical.regridCategories(weights, slab)
+    if len(classes) == 0:
+        # every source cell is masked, e.g. a land only time step
+        return numpy.ma.masked_all(weights.dstShape, numpy.asarray(slab).dtype)
+    return numpy.ma.masked_where(dominant < 0, classes[numpy.maximum(dominant, 0)])
+
+
+def getWeightsFileName(weightsDir, key, srcCoords, dstCoords, dstName, method):
+    """
+    Get the name of the file caching the weights of a group, derived from a
+    hash of the group key and of the source and destination coordinates
+    @param weightsDir directory holding the weights files
+    @param key group key as returned by groupVariables
+    @param srcCoords source coordinates as returned by grids.getCoordinates
+    @param dstCoords destination coordinates as returned by grids.getCoordinates
+    @param dstName name identifying the destination grid
+    @param method interpolation method
+    @return file name
+    """
+    digest = hashlib.sha1()
+    digest.update(repr((key, method)).encode('utf-8'))
+    for coords in srcCoords, dstCoords:
+        for name in 'lats', 'lons':
+            values = numpy.ascontiguousarray(coords[name], numpy.float64)
+            digest.update(str(values.shape).encode('utf-8'))
+            digest.update(values.tobytes())
+    return os.path.join(weightsDir, 'weights_{}_{}_{}.nc'.format(method, dstName, digest.hexdigest()[:16]))
+
+
+def loadOrComputeWeights(filename, srcCoords, dstCoords, method):
+    """
+    Load the weights from a file, computing and saving them first if needed
+    @param filename weights file name
+    @param srcCoords source coordinates as returned by grids.getCoordinates
+    @param dstCoords destination coordinates as returned by grids.getCoordinates
+    @param method 'bilinear' or 'conserve'
+    @return SparseWeights instance
+    """
+    from pyterp import weights
+    if not os.path.exists(filename):
+        from pyterp import esmf_weights
+        esmf_weights.computeWeights(srcCoords, dstCoords, filename, method=method)
+    return weights.load(filename)
+
+
+def main():
+    import netCDF4
+    from pyterp import grids, ncio, pipeline
+
+    parser = argparse.ArgumentParser(description='Regrid all the fields of a file, computing the weights once per grid')
+    parser.add_argument('--src_file', type=str, dest='src_file', default='qrparm.nc',
+                        help='Source data file name')
+    parser.add_argument('--dst_file', type=str, dest='dst_file', default='dst.nc',
+                        help='Destination grid file name')
+    parser.add_argument('--dst_field', type=str, dest='dst_field', default='pointData',
+                        help='Destination field whose grid is used')
+    parser.add_argument('--method', type=str, dest='method', default='bilinear',
+                        help='Interpolation method: bilinear or conserve')
+    parser.add_argument('--weights_dir', type=str, dest='weights_dir', default='.',
+                        help='Directory where the weights are cached')
+    parser.add_argument('--out_file', type=str, dest='out_file', default='regridded.nc',
+                        help='Output file name')
+    parser.add_argument('--queue_depth', type=int, dest='queue_depth', default=4,
+                        help='Max number of slabs waiting between two stages')
+    parser.add_argument('--num_threads', type=int, dest='num_threads', default=2,
+                        help='Number of threads applying the weights')
+
+    args = parser.parse_args()
+
+    timeStats = {
+        'weights': 0.0,
+        'regrid': 0.0,
+    }
+
+    ncDst = netCDF4.Dataset(args.dst_file, 'r')
+    dstCoords = grids.getCoordinates(ncDst, ncDst.variables[args.dst_field])
+    ncDst.close()
+    dstName = os.path.splitext(os.path.basename(args.dst_file))[0]
+
+    ncIn = netCDF4.Dataset(args.src_file, 'r')
+    ncOut = netCDF4.Dataset(args.out_file, 'w')
+
+    # destination coordinates, shared by all the output fields
+    dimNames = ('dst_n0', 'dst_n1')
+    for dimName, n in zip(dimNames, dstCoords['lats'].shape):
+        ncOut.createDimension(dimName, n)
+    latVar = ncOut.createVariable('lat', 'f8', dimNames)
+    latVar.standard_name, latVar.units = 'latitude', 'degrees_north'
+    latVar[:] = dstCoords['lats']
+    lonVar = ncOut.createVariable('lon', 'f8', dimNames)
+    lonVar.standard_name, lonVar.units = 'longitude', 'degrees_east'
+    lonVar[:] = dstCoords['lons']
+
+    # the netCDF library is not thread safe, reads and writes are serialized
+    ioLock = threading.Lock()
+
+    groups = groupVariables(ncIn)
+    for key, varNames in groups.items():
+        print('grid {}: {}'.format(key[0], ' '.join(varNames)))
+        srcCoords = grids.getCoordinates(ncIn, ncIn.variables[varNames[0]])
+
+        tic = time.time()
+        filename = getWeightsFileName(args.weights_dir, key, srcCoords, dstCoords, dstName, args.method)
+        wgts = loadOrComputeWeights(filename, srcCoords, dstCoords, args.method)
+        timeStats['weights'] += time.time() - tic
+
+        srcVars, dstVars, slabIndices, categoricalIndices = {}, {}, [], []
+        for name in varNames:
+            srcVar = ncIn.variables[name]
+            dstVar = ncio.createOutputVariable(ncOut, srcVar, wgts.dstShape, dimNames=dimNames)
+            # the source grid mapping does not apply to the destination grid
+            if 'grid_mapping' in dstVar.ncattrs():
+                dstVar.delncattr('grid_mapping')
+            dstVar.coordinates = 'lat lon'
+            srcVars[name], dstVars[name] = srcVar, dstVar
+            # interpolated classes are meaningless, the dominant class is kept instead
+            indices = categoricalIndices if isCategorical(srcVar) else slabIndices
+            indices += [(name, index) for index in ncio.getSlabIndices(srcVar)]
+
+            # copy the leading coordinate (time, level...) values
+            for dimName in srcVar.dimensions[:-2]:
+                if dimName in ncIn.variables and dimName not in ncOut.variables:
+                    coordVar = ncIn.variables[dimName]
+                    outVar = ncOut.createVariable(dimName, coordVar.dtype, (dimName,))
+                    outVar.setncatts(dict([(a, coordVar.getncattr(a)) for a in coordVar.ncattrs()]))
+                    outVar[:] = coordVar[:]
+
+        def reader(item):
+            name, index = item
+            with ioLock:
+                return srcVars[name][index]
+
+        def writer(item, result):
+            name, index = item
+            # masked points are written with the variable's fill value
+            with ioLock:
+                dstVars[name][index] = numpy.ma.masked_invalid(result)
+
+        tic = time.time()
+        if slabIndices:
+            pipe = pipeline.Pipeline(wgts, reader, writer, queueDepth=args.queue_depth,
+                                     numThreads=args.num_threads, fillValue=numpy.nan)
+            pipe.run(slabIndices)
+            pipe.printStats()
+        for name, index in categoricalIndices:
+            dstVars[name][index] = regridCategoricalSlab(wgts, srcVars[name][index])
+        timeStats['regrid'] += time.time() - tic
+
+    ncOut.close()
+    ncIn.close()
+
+    print('number of grids: {} number of fields: {}'.format(len(groups),
+                                                           sum([len(v) for v in groups.values()])))
+    totTime = 0.0
+    print('time stats:')
+    for k, v in timeStats.items():
+        print('\t{0:<32} {1:>.3g} sec'.format(k, v))
+        totTime += v
+    print('\t{0:<32} {1:>.3g} sec'.format('total', totTime))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,495 @@
+from __future__ import print_function, division
+import re
+import sys
+import time
+import argparse
+import subprocess
+import numpy
+
+
+def _wrap(dLons):
+    # longitude differences in [-180, 180)
+    return (dLons + 180.) % 360. - 180.
+
+
+def _evaluate(srcLats, srcLons, pj, pi):
+    """
+    Evaluate the bilinear mapping from index space to lat-lon and its Jacobian
+    @param srcLats source node latitudes (2D)
+    @param srcLons source node longitudes (2D)
+    @param pj fractional row positions
+    @param pi fractional column positions
+    @return lats, lons, Jacobian entries dlat/dj, dlat/di, dlon/dj, dlon/di
+    """
+    nj, ni = srcLats.shape
+    j = numpy.minimum(pj.astype(numpy.int64), nj - 2)
+    i = numpy.minimum(pi.astype(numpy.int64), ni - 2)
+    eta, xi = pj - j, pi - i
+
+    lat00, lat01 = srcLats[j, i], srcLats[j, i + 1]
+    lat10, lat11 = srcLats[j + 1, i], srcLats[j + 1, i + 1]
+    lon00 = srcLons[j, i]
+    # longitudes relative to the first node of the cell
+    lon01 = _wrap(srcLons[j, i + 1] - lon00)
+    lon10 = _wrap(srcLons[j + 1, i] - lon00)
+    lon11 = _wrap(srcLons[j + 1, i + 1] - lon00)
+
+    lats = lat00 + (lat01 - lat00)*xi + (lat10 - lat00)*eta + (lat11 - lat10 - lat01 + lat00)*xi*eta
+    lons = lon00 + lon01*xi + lon10*eta + (lon11 - lon10 - lon01)*xi*eta
+    dLatDj = (lat10 - lat00)*(1. - xi) + (lat11 - lat01)*xi
+    dLatDi = (lat01 - lat00)*(1. - eta) + (lat11 - lat10)*eta
+    dLonDj = lon10*(1. - xi) + (lon11 - lon01)*xi
+    dLonDi = lon01*(1. - eta) + (lon11 - lon10)*eta
+    return lats, lons, dLatDj, dLatDi, dLonDj, dLonDi
+
+
+def solve(srcLats, srcLons, dstLats, dstLons, pj, pi, nitermax=1000, tolpos=1.e-6):
+    """
+    Find the index space positions of target points with Newton iterations,
+    all the points being updated at once. Each step uses the bilinear mapping
+    of the cell holding the current position, so points walk across cells
+    @param srcLats source node latitudes (2D)
+    @param srcLons source node longitudes (2D)
+    @param dstLats target latitudes (1D)
+    @param dstLons target longitudes (1D)
+    @param pj initial fractional row positions (1D), modified in place
+    @param pi initial fractional column positions (1D), modified in place
+    @param nitermax max number of iterations
+    @param tolpos tolerance in target (lat-lon) space, degrees
+    @return boolean array, True where the position was found, and the number
+            of iterations of each point
+    """
+    nj, ni = srcLats.shape
+    n = len(dstLats)
+    valid = numpy.zeros((n,), bool)
+    numIters = numpy.zeros((n,), numpy.int64)
+    active = numpy.arange(n)
+    for it in range(nitermax + 1):
+        if len(active) == 0:
+            break
+        lats, lons, a, b, c, d = _evaluate(srcLats, srcLons, pj[active], pi[active])
+        rLat = lats - dstLats[active]
+        rLon = _wrap(lons - dstLons[active])
+        converged = (rLat**2 + rLon**2 < tolpos**2)
+        valid[active[converged]] = True
+        numIters[active] = it
+
+        det = a*d - b*c
+        keep = ~converged & (det != 0.)
+        if it == nitermax:
+            break
+        active, rLat, rLon, a, b, c, d, det = [x[keep] for x in (active, rLat, rLon, a, b, c, d, det)]
+        # Newton step, solving the 2x2 system J dp = -r
+        newPj = numpy.clip(pj[active] - (d*rLat - b*rLon)/det, 0., nj - 1.)
+        newPi = numpy.clip(pi[active] - (a*rLon - c*rLat)/det, 0., ni - 1.)
+        # points pushed against the boundary of the grid are outside
+        moved = (newPj != pj[active]) | (newPi != pi[active])
+        pj[active], pi[active] = newPj, newPi
+        active = active[moved]
+    return valid, numIters
+
+
+def getSnakeOrder(shape):
+    """
+    Get the flat indices of a grid visited in snake (boustrophedon) order,
+    every other line being traversed backwards so that consecutive points
+    are always neighbours
+    @param shape grid dimensions
+    @return array of flat indices
+    """
+    order = numpy.arange(shape[-1], dtype=numpy.int64)
+    for n in reversed(shape[:-1]):
+        m = len(order)
+        lines = numpy.empty((n, m), numpy.int64)
+        lines[0::2] = order
+        lines[1::2] = order[::-1]
+        order = (numpy.arange(n, dtype=numpy.int64)[:, numpy.newaxis]*m + lines).ravel()
+    return order
+
+
+def locate(srcLats, srcLons, dstLats, dstLons, nitermax=1000, tolpos=1.e-6,
+           batchSize=65536, numThreads=1, index=None, warmStart=False, chainLength=64, warmNitermax=8):
+    """
+    Locate the destination points in the source grid
+    @param srcLats source node latitudes (2D)
+    @param srcLons source node longitudes (2D)
+    @param dstLats destination latitudes
+    @param dstLons destination longitudes
+    @param nitermax max number of Newton iterations
+    @param tolpos tolerance in target (lat-lon) space, degrees
+    @param batchSize number of destination points solved together
+    @param numThreads number of threads working on the batches
+    @param index spatial_index.SpatialIndex of the source nodes giving the
+                 starting cells (built if None)
+    @param warmStart visit the destination points in snake order, each search
+                     starting from the position found for the last point of
+                     the path that was found. The path is cut into chains of
+                     chainLength points that are walked together, the index
+                     is only used for the first point of a chain and for the
+                     points whose warm search fails
+    @param chainLength number of consecutive points of a chain
+    @param warmNitermax max number of iterations of a warm search. A point not
+                        found is outside if the search ended on the boundary
+                        of the grid, it is searched again from the index
+                        otherwise
+    @return fractional row and column positions, valid flags (flat arrays of
+            the size of the destination grid) and the number of iterations
+    """
+    from pyterp import hybrid, spatial_index
+
+    srcLats = numpy.ascontiguousarray(srcLats, numpy.float64)
+    srcLons = numpy.ascontiguousarray(srcLons, numpy.float64)
+    dstShape = numpy.shape(dstLats)
+    dstLats = numpy.ravel(numpy.asarray(dstLats, numpy.float64))
+    dstLons = numpy.ravel(numpy.asarray(dstLons, numpy.float64))
+    nj, ni = srcLats.shape
+
+    if index is None:
+        index = spatial_index.SpatialIndex(srcLats, srcLons)
+    n = len(dstLats)
+    pj = numpy.empty((n,), numpy.float64)
+    pi = numpy.empty((n,), numpy.float64)
+    valid = numpy.zeros((n,), bool)
+    numIters = numpy.zeros((n,), numpy.int64)
+
+    def solvePoints(points, startJ, startI, maxIters=nitermax):
+        posJ, posI = startJ.copy(), startI.copy()
+        v, it = solve(srcLats, srcLons, dstLats[points], dstLons[points], posJ, posI, maxIters, tolpos)
+        pj[points], pi[points] = posJ, posI
+        valid[points] = v
+        numIters[points] += it
+        return v, it
+
+    def solveCold(points):
+        cj, ci = index.getCandidateCells(dstLats[points], dstLons[points])
+        # start from the centre of the grid when no node is nearby
+        solvePoints(points, numpy.where(cj >= 0, cj, (nj - 1)//2) + 0.5,
+                    numpy.where(ci >= 0, ci, (ni - 1)//2) + 0.5)
+
+    def solveBatch(sl):
+        solveCold(numpy.arange(sl.start, sl.stop))
+
+    def solveChains(sl):
+        path = order[sl]
+        numChains = (len(path) + chainLength - 1) // chainLength
+        chains = numpy.full((numChains*chainLength,), -1, numpy.int64)
+        chains[:len(path)] = path
+        chains = chains.reshape((numChains, chainLength))
+        heads = chains[:, 0]
+        solveCold(heads[heads >= 0])
+
+        def isOutside(points, ok):
+            # a search ending on the boundary of the grid has been pushed out of it
+            posJ, posI = pj[points], pi[points]
+            return ~ok & ((posJ == 0.) | (posJ == nj - 1.) | (posI == 0.) | (posI == ni - 1.))
+
+        # last point of each chain found, or known to be outside, the next
+        # search starts from its position
+        last = numpy.where(heads >= 0, heads, -1)
+        last[last >= 0] = numpy.where(valid[last[last >= 0]] | isOutside(last[last >= 0], valid[last[last >= 0]]),
+                                      last[last >= 0], -1)
+        # the cold searches are done together at the end, a few long searches
+        # per step of the chains would cost more than all the warm ones
+        retry = []
+        for t in range(1, chainLength):
+            points = chains[:, t]
+            warm = (points >= 0) & (last >= 0)
+            retry.append(points[(points >= 0) & (last < 0)])
+            if not warm.any():
+                continue
+            ok, it = solvePoints(points[warm], pj[last[warm]], pi[last[warm]], warmNitermax)
+            settled = ok | isOutside(points[warm], ok)
+            retry.append(points[warm][~settled])
+            last[warm] = numpy.where(settled, points[warm], last[warm])
+        retry = numpy.concatenate(retry) if retry else numpy.zeros((0,), numpy.int64)
+        if len(retry):
+            solveCold(retry)
+
+    blocks = [slice(i, min(i + batchSize, n)) for i in range(0, n, batchSize)]
+    if warmStart:
+        order = getSnakeOrder(dstShape)
+        hybrid.mapBlocks(solveChains, blocks, numThreads)
+    else:
+        hybrid.mapBlocks(solveBatch, blocks, numThreads)
+    return pj, pi, valid, numIters
+
+
+def getIterationHistogram(numIters, nitermax):
+    """
+    Get the distribution of the number of iterations
+    @param numIters number of iterations of each point
+    @param nitermax max number of iterations of a search (restarted points
+                    may take more)
+    @return bin edges (0, 1, 2, 4, 8, ...) and number of points in each bin
+    """
+    top = max(nitermax, int(numpy.max(numIters))) if len(numIters) > 0 else nitermax
+    edges = [0, 1]
+    while edges[-1] <= top:
+        edges.append(2*edges[-1])
+    edges[-1] = top + 1
+    counts, edges = numpy.histogram(numIters, bins=edges)
+    return edges.astype(numpy.int64), counts
+
+
+# nitermax and tolpos multipliers of the successive recovery passes
+ESCALATION = ((4, 1.), (16, 10.))
+
+
+def recover(srcLats, srcLons, dstLats, dstLons, pj, pi, valid, numIters, nitermax=1000, tolpos=1.e-6,
+            escalation=ESCALATION, index=None):
+    """
+    Re-solve the points that were not found, and only those. Each pass
+    escalates nitermax and tolpos and starts from a different cell next to
+    the one given by the spatial index
+    @param srcLats source node latitudes (2D)
+    @param srcLons source node longitudes (2D)
+    @param dstLats destination latitudes
+    @param dstLons destination longitudes
+    @param pj fractional row positions (flat), updated in place
+    @param pi fractional column positions (flat), updated in place
+    @param valid flags (flat), updated in place
+    @param numIters number of iterations (flat), updated in place
+    @param nitermax max number of iterations of the first search
+    @param tolpos tolerance of the first search
+    @param escalation list of (nitermax factor, tolpos factor), one per pass
+    @param index spatial_index.SpatialIndex of the source nodes (built if None)
+    @return boolean array, True for the recovered points
+    """
+    from pyterp import spatial_index
+
+    srcLats = numpy.ascontiguousarray(srcLats, numpy.float64)
+    srcLons = numpy.ascontiguousarray(srcLons, numpy.float64)
+    dstLats = numpy.ravel(numpy.asarray(dstLats, numpy.float64))
+    dstLons = numpy.ravel(numpy.asarray(dstLons, numpy.float64))
+    nj, ni = srcLats.shape
+
+    recovered = numpy.zeros(valid.shape, bool)
+    failed = numpy.nonzero(~valid)[0]
+    if len(failed) == 0:
+        return recovered
+    if index is None:
+        index = spatial_index.SpatialIndex(srcLats, srcLons)
+    cj, ci = index.getCandidateCells(dstLats[failed], dstLons[failed])
+    cj = numpy.where(cj >= 0, cj, (nj - 1)//2)
+    ci = numpy.where(ci >= 0, ci, (ni - 1)//2)
+
+    offsets = ((0, 0), (1, 1), (-1, -1), (1, -1), (-1, 1))
+    for k, (iterFactor, tolFactor) in enumerate(escalation):
+        todo = numpy.nonzero(~valid[failed])[0]
+        if len(todo) == 0:
+            break
+        dj, di = offsets[k % len(offsets)]
+        posJ = numpy.clip(cj[todo] + dj, 0, nj - 2) + 0.5
+        posI = numpy.clip(ci[todo] + di, 0, ni - 2) + 0.5
+        points = failed[todo]
+        ok, it = solve(srcLats, srcLons, dstLats[points], dstLons[points], posJ, posI,
+                       nitermax*iterFactor, tolpos*tolFactor)
+        pj[points[ok]], pi[points[ok]] = posJ[ok], posI[ok]
+        valid[points] = ok
+        recovered[points] = ok
+        numIters[points] += it
+    return recovered
+
+
+def getWeights(srcShape, dstShape, pj, pi, valid):
+    """
+    Get the bilinear interpolation weights of located points
+    @param srcShape source node dimensions
+    @param dstShape destination grid dimensions
+    @param pj fractional row positions
+    @param pi fractional column positions
+    @param valid flags, points that were not found get no weights
+    @return SparseWeights instance
+    """
+    from pyterp import weights
+
+    nj, ni = srcShape
+    rows = numpy.nonzero(valid)[0]
+    j = numpy.minimum(pj[rows].astype(numpy.int64), nj - 2)
+    i = numpy.minimum(pi[rows].astype(numpy.int64), ni - 2)
+    eta, xi = pj[rows] - j, pi[rows] - i
+    cols = [j*ni + i, j*ni + i + 1, (j + 1)*ni + i, (j + 1)*ni + i + 1]
+    wgts = [(1. - xi)*(1. - eta), xi*(1. - eta), (1. - xi)*eta, xi*eta]
+    return weights.SparseWeights(numpy.repeat(rows, 4), numpy.array(cols).T.ravel(),
+                                 numpy.array(wgts).T.ravel(), srcShape, dstShape)
+
+
+def computeWeights(srcLats, srcLons, dstLats, dstLons, nitermax=1000, tolpos=1.e-6,
+                   batchSize=65536, numThreads=1, index=None, warmStart=False, warmNitermax=8):
+    """
+    Compute the bilinear interpolation weights from the nodes of a
+    curvilinear source grid, see locate
+    @return SparseWeights instance, points outside the source grid have no weights
+    """
+    pj, pi, valid, numIters = locate(srcLats, srcLons, dstLats, dstLons, nitermax=nitermax,
+                                     tolpos=tolpos, batchSize=batchSize, numThreads=numThreads,
+                                     index=index, warmStart=warmStart, warmNitermax=warmNitermax)
+    return getWeights(numpy.shape(srcLats), numpy.shape(dstLats), pj, pi, valid)
+
+
+def runLibcf(driver, args):
+    """
+    Run a libcf driver and extract its weight time and number of invalid points
+    @param driver libcf_interp.py script
+    @param args list of arguments
+    @return weights time (sec), number of invalid points
+    """
+    output = subprocess.check_output([sys.executable, driver] + args).decode('utf-8', 'replace')
+    weights = re.search(r'^\s*weights\s+([\d\.eE\+\-]+)', output, re.MULTILINE)
+    invalid = re.search(r'# invalid points: (\d+)', output)
+    return float(weights.group(1)) if weights else float('nan'), int(invalid.group(1)) if invalid else None
+
+
+def main():
+    import netCDF4
+    from pyterp import grids, diagnostics, spatial_index, weights, iterations
+
+    parser = argparse.ArgumentParser(description='Bilinear interpolation with the numpy locator')
+    parser.add_argument('--src_file', type=str, dest='src_file', default='coords_CF_ORCA12_GO6-2.nc',
+                        help='Source data file name')
+    parser.add_argument('--src_field', type=str, dest='src_field', default='ocndept',
+                        help='Source data field name')
+    parser.add_argument('--dst_file', type=str, dest='dst_file', default='dst.nc',
+                        help='Destination data file name')
+    parser.add_argument('--dst_field', type=str, dest='dst_field', default='pointData',
+                        help='Destination (reference) field name')
+    parser.add_argument('--tolpos', type=float, dest='tolpos', default=1.e-6,
+                        help='Tolerance in target space')
+    parser.add_argument('--nitermax', type=int, dest='nitermax', default=1000,
+                        help='Max number of iterations')
+    parser.add_argument('--batch_size', type=int, dest='batch_size', default=65536,
+                        help='Number of destination points solved together')
+    parser.add_argument('--num_threads', type=int, dest='num_threads', default=1,
+                        help='Number of threads working on the batches')
+    parser.add_argument('--warm_start', dest='warm_start', action='store_true',
+                        help='Visit the destination points in snake order, starting from the previous point')
+    parser.add_argument('--chain_length', type=int, dest='chain_length', default=64,
+                        help='Number of consecutive snake ordered points walked by one chain (with --warm_start)')
+    parser.add_argument('--warm_nitermax', type=int, dest='warm_nitermax', default=8,
+                        help='Max number of iterations of a warm search before searching from the index')
+    parser.add_argument('--recover', dest='recover', action='store_true',
+                        help='Re-solve the points that were not found with escalated nitermax/tolpos')
+    parser.add_argument('--index_dir', type=str, dest='index_dir', default='',
+                        help='Directory where the spatial index of the source grid is cached (not cached if empty)')
+    parser.add_argument('--weights', type=str, dest='weights', default='',
+                        help='Save the weights to this file')
+    parser.add_argument('--libcf', type=str, dest='libcf', default='',
+                        help='libcf_interp.py driver to compare with, e.g. big/libcf_interp.py')
+    parser.add_argument('--results_dir', type=str, dest='results_dir', default='',
+                        help='Directory where the iteration analytics (and tuning) are saved (not saved if empty)')
+    parser.add_argument('--run_name', type=str, dest='run_name', default='bilinear',
+                        help='Prefix of the files saved in --results_dir')
+    parser.add_argument('--tune', dest='tune', action='store_true',
+                        help='Pick tolpos and nitermax on a subsampled destination grid before the full run')
+    parser.add_argument('--tune_tolpos', type=str, dest='tune_tolpos', default='1.e-8,1.e-6,1.e-4',
+                        help='Comma separated tolpos values tried by --tune')
+    parser.add_argument('--tune_nitermax', type=str, dest='tune_nitermax', default='10,100,1000',
+                        help='Comma separated nitermax values tried by --tune')
+    parser.add_argument('--tune_stride', type=int, dest='tune_stride', default=4,
+                        help='Destination grid subsampling used by --tune')
+    parser.add_argument('--max_error', type=float, dest='max_error', default=1.e-6,
+                        help='Max mean absolute difference with the tightest settings accepted by --tune')
+    parser.add_argument('--max_invalid', type=float, dest='max_invalid', default=0.,
+                        help='Max fraction of extra invalid points accepted by --tune')
+
+    args = parser.parse_args()
+
+    timeStats = {
+        'index': 0.0,
+        'weights': float('nan'),
+        'evaluation': float('nan'),
+    }
+
+    nc = netCDF4.Dataset(args.src_file, 'r')
+    srcVar = nc.variables[args.src_field]
+    srcCoords = grids.getCoordinates(nc, srcVar)
+    srcData = srcVar[:]
+    nc.close()
+    nc = netCDF4.Dataset(args.dst_file, 'r')
+    dstVar = nc.variables[args.dst_field]
+    dstCoords = grids.getCoordinates(nc, dstVar)
+    dstDataRef = dstVar[:]
+    nc.close()
+
+    tic = time.time()
+    if args.index_dir:
+        index = spatial_index.loadOrBuild(args.index_dir, srcCoords['lats'], srcCoords['lons'])
+    else:
+        index = spatial_index.SpatialIndex(srcCoords['lats'], srcCoords['lons'])
+    timeStats['index'] = time.time() - tic
+
+    if args.tune:
+        tic = time.time()
+        solve = iterations.getBilinearSolver(srcCoords['lats'], srcCoords['lons'], dstCoords['lats'],
+                                             dstCoords['lons'], stride=args.tune_stride, srcData=srcData,
+                                             index=index)
+        best, results = iterations.tune(solve, iterations.parseValues(args.tune_tolpos, float),
+                                        iterations.parseValues(args.tune_nitermax, int),
+                                        maxError=args.max_error, maxInvalidFraction=args.max_invalid)
+        timeStats['tuning'] = time.time() - tic
+        iterations.printTuning(best, results)
+        if args.results_dir:
+            iterations.writeTuning(args.results_dir, args.run_name, best, results)
+        args.tolpos, args.nitermax = best
+        print('tuned settings: tolpos {:g} nitermax {}'.format(args.tolpos, args.nitermax))
+
+    tic = time.time()
+    pj, pi, valid, numIters = locate(srcCoords['lats'], srcCoords['lons'], dstCoords['lats'], dstCoords['lons'],
+                                     nitermax=args.nitermax, tolpos=args.tolpos,
+                                     batchSize=args.batch_size, numThreads=args.num_threads, index=index,
+                                     warmStart=args.warm_start, chainLength=args.chain_length,
+                                     warmNitermax=args.warm_nitermax)
+    wgts = getWeights(srcCoords['lats'].shape, dstCoords['lats'].shape, pj, pi, valid)
+    timeStats['weights'] = time.time() - tic
+
+    numRecovered = 0
+    if args.recover:
+        # retry the points that were not found, merging their weights in
+        tic = time.time()
+        recovered = recover(srcCoords['lats'], srcCoords['lons'], dstCoords['lats'], dstCoords['lons'],
+                            pj, pi, valid, numIters, nitermax=args.nitermax, tolpos=args.tolpos, index=index)
+        numRecovered = numpy.count_nonzero(recovered)
+        if numRecovered > 0:
+            wgts = weights.merge(wgts, getWeights(srcCoords['lats'].shape, dstCoords['lats'].shape,
+                                                  pj, pi, recovered))
+        timeStats['recovery'] = time.time() - tic
+    if args.weights:
+        wgts.save(args.weights)
+
+    tic = time.time()
+    dstData = wgts.apply(srcData)
+    timeStats['evaluation'] = time.time() - tic
+
+    stats = diagnostics.ErrorStats()
+    stats.addSource(srcData)
+    stats.update(dstData, dstDataRef, mask=~valid.reshape(dstData.shape))
+    res = stats.report('numpy bilinear interpolation:')
+    ninvalid = res['numDst'] - res['numValid']
+    print('\t     # invalid points: {} ({:.3f}%)'.format(ninvalid, 100*ninvalid/float(res['numDst'])))
+    if args.recover:
+        print('\t     # recovered points: {}'.format(numRecovered))
+    print('\t     # iterations: mean {:.3g} max {}'.format(numIters.mean(), numIters.max()))
+    edges, counts = getIterationHistogram(numIters, args.nitermax)
+    for beg, end, count in zip(edges[:-1], edges[1:], counts):
+        print('\t     iterations {0:>6}-{1:<6} {2:>10}'.format(beg, end - 1, count))
+    if args.results_dir:
+        iterations.writeResults(args.results_dir, args.run_name, numIters, dstCoords['lats'].shape,
+                                args.nitermax, lats=dstCoords['lats'], lons=dstCoords['lons'])
+    print('time stats:')
+    totTime = 0.0
+    for k, v in timeStats.items():
+        print('\t{0:<32} {1:>.3g} sec'.format(k, v))
+        totTime += v
+    print('\t{0:<32} {1:>.3g} sec'.format('total', totTime))
+
+    if args.libcf:
+        libcfWeights, libcfInvalid = runLibcf(args.libcf, ['--src_file', args.src_file, '--src_field', args.src_field,
+                                                           '--dst_file', args.dst_file, '--tolpos', str(args.tolpos),
+                                                           '--nitermax', str(args.nitermax)])
+        print('{0:<8} {1:>12} {2:>16}'.format('backend', 'weights sec', '# invalid points'))
+        print('{0:<8} {1:>12.3g} {2:>16}'.format('numpy', timeStats['weights'], ninvalid))
+        print('{0:<8} {1:>12.3g} {2:>16}'.format('libcf', libcfWeights, libcfInvalid))
+
+
+if __name__ == '__main__':
+    main()
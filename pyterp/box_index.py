@@ -0,0 +1,189 @@
+from __future__ import print_function, division
+import os
+import hashlib
+import numpy
+
+
+class BoxIndex(object):
+
+    def __init__(self, boxes, binSize=None, period=None, origin=None, numBins=None, order=None, starts=None):
+        """
+        Constructor, sort bounding boxes (typically of the destination cells)
+        into the bins of a uniform grid
+        @param boxes bounding boxes, shape (n, 4): xmin, ymin, xmax, ymax
+        @param binSize bin size, defaults to the median box size
+        @param period period of the x axis, e.g. 2*pi for longitudes in
+                      radians (None if x is not periodic). The boxes must then
+                      be narrower than half a period
+        @param origin lower left corner of the bins (from a saved index)
+        @param numBins number of bins along x and y (from a saved index)
+        @param order box indices sorted by bin (from a saved index)
+        @param starts start of each bin in order, plus the end (from a saved index)
+        """
+        self.boxes = numpy.asarray(boxes, numpy.float64)
+        self.period = period
+        if order is not None:
+            self.origin = numpy.asarray(origin, numpy.float64)
+            self.binSize = numpy.asarray(binSize, numpy.float64)
+            self.numBins = numpy.asarray(numBins, numpy.int64)
+            self.order, self.starts = order, starts
+            return
+
+        if binSize is None:
+            sizes = numpy.maximum(self.boxes[:, 2] - self.boxes[:, 0], self.boxes[:, 3] - self.boxes[:, 1])
+            binSize = numpy.median(sizes) if len(sizes) else 1.
+            binSize = binSize if binSize > 0 else 1.
+        self.origin = self.boxes[:, :2].min(axis=0)
+        self.binSize = numpy.array([binSize, binSize], numpy.float64)
+        self.numBins = numpy.floor((self.boxes[:, 2:].max(axis=0) - self.origin)/binSize).astype(numpy.int64) + 1
+        if period is not None:
+            # the bins along x tile exactly one period
+            self.numBins[0] = max(1, int(period // binSize))
+            self.binSize[0] = period / self.numBins[0]
+
+        boxIds, bins = self._getBins(self.boxes)
+        order = numpy.argsort(bins, kind='mergesort')
+        self.order = boxIds[order]
+        self.starts = numpy.searchsorted(bins[order], numpy.arange(self.numBins[0]*self.numBins[1] + 1))
+
+    def _getBinIndices(self, points):
+        # x bin indices are not wrapped, so that bins of periodic boxes remain ordered
+        indices = numpy.floor((points - self.origin)/self.binSize).astype(numpy.int64)
+        if self.period is None:
+            return numpy.clip(indices, 0, self.numBins - 1)
+        indices[:, 1] = numpy.clip(indices[:, 1], 0, self.numBins[1] - 1)
+        return indices
+
+    def _getFlatBins(self, indices):
+        return indices[:, 1]*self.numBins[0] + indices[:, 0] % self.numBins[0]
+
+    def _getBins(self, boxes):
+        # bins covered by each box, expanded into (box, bin) pairs
+        lo, hi = self._getBinIndices(boxes[:, :2]), self._getBinIndices(boxes[:, 2:])
+        top = self.origin + self.numBins*self.binSize
+        if self.period is None:
+            outside = numpy.any((boxes[:, 2:] < self.origin) | (boxes[:, :2] > top), axis=1)
+        else:
+            outside = (boxes[:, 3] < self.origin[1]) | (boxes[:, 1] > top[1])
+        width = numpy.minimum(hi[:, 0] - lo[:, 0] + 1, self.numBins[0])
+        sizes = numpy.where(outside, 0, width*(hi[:, 1] - lo[:, 1] + 1))
+        boxIds = numpy.repeat(numpy.arange(len(boxes)), sizes)
+        k = numpy.arange(len(boxIds)) - numpy.repeat(numpy.cumsum(sizes) - sizes, sizes)
+        indices = numpy.empty((len(boxIds), 2), numpy.int64)
+        indices[:, 0] = lo[boxIds, 0] + k % width[boxIds]
+        indices[:, 1] = lo[boxIds, 1] + k // width[boxIds]
+        return boxIds, self._getFlatBins(indices)
+
+    def query(self, boxes):
+        """
+        Find the indexed boxes overlapping a set of boxes, all at once
+        @param boxes query bounding boxes (typically of the source cells),
+                     shape (m, 4): xmin, ymin, xmax, ymax
+        @return query box indices, indexed box indices and x shifts of the
+                candidate pairs. The shifts are multiples of the period to add
+                to the x coordinates of the query boxes (zeros if x is not
+                periodic)
+        """
+        boxes = numpy.asarray(boxes, numpy.float64)
+        queryIds, queryBins = self._getBins(boxes)
+        sizes = self.starts[queryBins + 1] - self.starts[queryBins]
+        cells = numpy.repeat(queryIds, sizes)
+        k = numpy.arange(len(cells)) - numpy.repeat(numpy.cumsum(sizes) - sizes, sizes)
+        others = self.order[numpy.repeat(self.starts[queryBins], sizes) + k]
+
+        queryBoxes, otherBoxes = boxes[cells], self.boxes[others]
+        numShifts = numpy.zeros((len(cells),), numpy.int64)
+        if self.period is not None:
+            # the copy of the query box closest to the indexed box
+            numShifts = numpy.round((otherBoxes[:, 0] + otherBoxes[:, 2] - queryBoxes[:, 0] - queryBoxes[:, 2]) /
+                                    (2.*self.period)).astype(numpy.int64)
+            shifts = numShifts*self.period
+            queryBoxes[:, 0] += shifts
+            queryBoxes[:, 2] += shifts
+        overlap = numpy.all(queryBoxes[:, :2] <= otherBoxes[:, 2:], axis=1) & \
+                  numpy.all(otherBoxes[:, :2] <= queryBoxes[:, 2:], axis=1)
+
+        # a pair can share several bins, it is only kept in the bin holding the
+        # lower left corner of the intersection of the boxes. The corner bin
+        # is the max of the bins of the lower left corners, computed in the
+        # frame of the query box
+        queryLo = self._getBinIndices(boxes[cells, :2])
+        otherLo = self._getBinIndices(otherBoxes[:, :2])
+        otherLo[:, 0] -= numShifts*self.numBins[0]
+        first = (self._getFlatBins(numpy.maximum(queryLo, otherLo)) == numpy.repeat(queryBins, sizes))
+        keep = overlap & first
+        shifts = numShifts[keep]*(self.period if self.period is not None else 0.)
+        return cells[keep], others[keep], shifts
+
+    def save(self, filename):
+        """
+        Save the bins in a netCDF file
+        @param filename file name
+        """
+        import netCDF4
+        nc = netCDF4.Dataset(filename, 'w')
+        nc.createDimension('n_boxes', len(self.order))
+        nc.createDimension('n_bins_plus_one', len(self.starts))
+        nc.createVariable('order', 'i8', ('n_boxes',))[:] = self.order
+        nc.createVariable('starts', 'i8', ('n_bins_plus_one',))[:] = self.starts
+        nc.origin = self.origin
+        nc.bin_size = self.binSize
+        nc.num_bins = self.numBins
+        nc.num_indexed_boxes = len(self.boxes)
+        if self.period is not None:
+            nc.period = self.period
+        nc.close()
+
+
+def load(filename, boxes):
+    """
+    Load the bins saved by BoxIndex.save
+    @param filename file name
+    @param boxes bounding boxes the index was built on
+    @return BoxIndex instance
+    """
+    import netCDF4
+    nc = netCDF4.Dataset(filename, 'r')
+    order = numpy.asarray(nc.variables['order'][:], numpy.int64)
+    starts = numpy.asarray(nc.variables['starts'][:], numpy.int64)
+    origin, binSize, numBins = nc.origin, nc.bin_size, nc.num_bins
+    numBoxes = int(nc.num_indexed_boxes)
+    period = float(nc.period) if 'period' in nc.ncattrs() else None
+    nc.close()
+    if numBoxes != len(boxes):
+        raise ValueError('{} does not match the grid: {} boxes instead of {}'.format(filename, numBoxes, len(boxes)))
+    return BoxIndex(boxes, binSize=binSize, period=period, origin=origin, numBins=numBins, order=order,
+                    starts=starts)
+
+
+def getIndexFileName(cacheDir, boxes, period=None):
+    """
+    Get the name of the file caching the index of a grid, derived from a hash
+    of its cell bounding boxes
+    @param cacheDir directory holding the cached files (e.g. the weights)
+    @param boxes bounding boxes, shape (n, 4)
+    @param period period of the x axis (None if not periodic)
+    @return file name
+    """
+    digest = hashlib.sha1()
+    boxes = numpy.ascontiguousarray(boxes, numpy.float64)
+    digest.update(str(boxes.shape).encode('utf-8'))
+    digest.update(boxes.tobytes())
+    digest.update(str(period).encode('utf-8'))
+    return os.path.join(cacheDir, 'box_index_{}.nc'.format(digest.hexdigest()[:16]))
+
+
+def loadOrBuild(cacheDir, boxes, period=None):
+    """
+    Load the index of a grid, building and saving it first if needed
+    @param cacheDir directory holding the cached files
+    @param boxes bounding boxes, shape (n, 4)
+    @param period period of the x axis (None if not periodic)
+    @return BoxIndex instance
+    """
+    filename = getIndexFileName(cacheDir, boxes, period)
+    if os.path.exists(filename):
+        return load(filename, boxes)
+    index = BoxIndex(boxes, period=period)
+    index.save(filename)
+    return index
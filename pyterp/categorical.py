@@ -0,0 +1,122 @@
+from __future__ import print_function, division
+import time
+import argparse
+import numpy
+
+
+def regridCategories(weights, srcData, classes=None):
+    """
+    Compute the fraction of each class and the dominant class in every
+    destination cell, in one pass over the (conservative) weights
+    @param weights SparseWeights instance
+    @param srcData integer class values on the source grid, may be a masked array
+    @param classes class values, in any order (defaults to all the values found
+                   in srcData)
+    @return sorted class values, fractions of shape (numClasses,) + dstShape and
+            dominant class index (-1 where the destination cell gets no weight)
+    """
+    src = numpy.ma.asarray(srcData).ravel()
+    valid = ~numpy.ma.getmaskarray(src)
+    values = numpy.asarray(src.data)
+    if classes is None:
+        classes = values[valid]
+    # the class lookup below needs sorted, distinct values
+    classes = numpy.unique(numpy.asarray(classes))
+    numClasses = len(classes)
+    if numClasses == 0:
+        # e.g. all the source cells are masked
+        return classes, numpy.zeros((0,) + weights.dstShape), \
+               numpy.full(weights.dstShape, -1, numpy.int64)
+
+    # class index of every source cell, -1 for masked or unknown classes
+    classIndex = numpy.searchsorted(classes, values)
+    classIndex[classIndex == numClasses] = 0
+    valid &= classes[classIndex] == values
+    classIndex[~valid] = -1
+
+    # accumulate the weights into (destination cell, class) bins
+    entryClass = classIndex[weights.cols]
+    ok = entryClass >= 0
+    bins = weights.rows[ok] * numClasses + entryClass[ok]
+    sums = numpy.bincount(bins, weights=weights.weights[ok],
+                          minlength=weights.numDst * numClasses)
+    sums = sums.reshape(weights.numDst, numClasses)
+
+    total = sums.sum(axis=1)
+    fractions = numpy.zeros_like(sums)
+    hasData = total > 0
+    fractions[hasData] = sums[hasData] / total[hasData, numpy.newaxis]
+    dominant = numpy.where(hasData, sums.argmax(axis=1), -1)
+
+    return classes, fractions.T.reshape((numClasses,) + weights.dstShape), \
+           dominant.reshape(weights.dstShape)
+
+
+def main():
+    import netCDF4
+    from pyterp import weights, ncio
+
+    parser = argparse.ArgumentParser(description='Regrid a categorical (class) field')
+    parser.add_argument('--weights', type=str, dest='weights', default='weights.nc',
+                        help='Conservative weights file name')
+    parser.add_argument('--src_file', type=str, dest='src_file', default='qrparm.nc',
+                        help='Source data file name')
+    parser.add_argument('--src_field', type=str, dest='src_field', default='soil_type',
+                        help='Source class field name')
+    parser.add_argument('--out_file', type=str, dest='out_file', default='categories.nc',
+                        help='Output file name')
+
+    args = parser.parse_args()
+
+    timeStats = {
+        'categories': float('nan'),
+        'evaluation (one scalar)': float('nan'),
+    }
+
+    wgts = weights.load(args.weights)
+
+    nc = netCDF4.Dataset(args.src_file, 'r')
+    srcVar = nc.variables[args.src_field]
+    srcData = srcVar[:]
+    # drop the leading degenerate (time, level) dimensions
+    srcData = srcData.reshape(srcData.shape[-len(wgts.srcShape):])
+
+    tic = time.time()
+    classes, fractions, dominant = regridCategories(wgts, srcData)
+    timeStats['categories'] = time.time() - tic
+
+    # reference cost
+    tic = time.time()
+    wgts.apply(numpy.asarray(srcData, numpy.float64))
+    timeStats['evaluation (one scalar)'] = time.time() - tic
+
+    ncOut = netCDF4.Dataset(args.out_file, 'w')
+    dimNames = ['dst_n{}'.format(i) for i in range(len(wgts.dstShape))]
+    ncOut.createDimension('class', len(classes))
+    for dimName, n in zip(dimNames, wgts.dstShape):
+        ncOut.createDimension(dimName, n)
+    classVar = ncOut.createVariable('class', classes.dtype, ('class',))
+    classVar[:] = classes
+
+    fillValue = ncio.getFillValue(srcVar, default=-1)
+    domVar = ncOut.createVariable(args.src_field, srcVar.dtype, dimNames, fill_value=fillValue)
+    for attName in srcVar.ncattrs():
+        if attName not in ('_FillValue', 'missing_value', 'grid_mapping'):
+            domVar.setncattr(attName, srcVar.getncattr(attName))
+    domVar.cell_methods = 'area: mode'
+    domVar[:] = numpy.ma.masked_where(dominant < 0, classes[numpy.maximum(dominant, 0)])
+
+    fracVar = ncOut.createVariable(args.src_field + '_fraction', 'f8', ['class'] + dimNames)
+    fracVar.long_name = 'area fraction of each class'
+    fracVar[:] = fractions
+    ncOut.close()
+    nc.close()
+
+    print('number of classes: {}'.format(len(classes)))
+    print('time stats:')
+    for k, v in timeStats.items():
+        print('\t{0:<32} {1:>.3g} sec'.format(k, v))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+from __future__ import print_function, division
+import time
+import argparse
+import numpy
+from pyterp.timing import getPeakMemory
+
+
+def _findFirst(var, value, lo, hi):
+    """
+    Binary search in a sorted netCDF variable, reading one element at a time
+    @param var sorted 1D netCDF variable
+    @param value value to look for
+    @param lo start of the search range
+    @param hi end of the search range
+    @return first index k in [lo, hi) with var[k] >= value (hi if none)
+    """
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if var[mid] < value:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class ChunkedRegridder(object):
+
+    def __init__(self, weightsFile, blockRows=64):
+        """
+        Constructor
+        @param weightsFile weights file sorted by destination index (see SparseWeights.save)
+        @param blockRows number of destination grid rows regridded together
+        """
+        import netCDF4
+        self.nc = netCDF4.Dataset(weightsFile, 'r')
+        if getattr(self.nc, 'row_sorted', 0) != 1:
+            raise ValueError('{} is not sorted by row, re-save it with SparseWeights.save'.format(weightsFile))
+        self.srcShape = tuple(int(n) for n in self.nc.variables['src_grid_dims'][:][::-1])
+        self.dstShape = tuple(int(n) for n in self.nc.variables['dst_grid_dims'][:][::-1])
+        self.blockRows = blockRows
+        self.numEntries = len(self.nc.dimensions['n_s'])
+
+    def close(self):
+        self.nc.close()
+
+    def getBlockWeights(self, jBeg, jEnd):
+        """
+        Read the weights of a block of destination rows, remapped onto the
+        smallest source window containing all the source points they use
+        @param jBeg first destination grid row
+        @param jEnd one past the last destination grid row
+        @return SparseWeights instance (or None if the block has no weights),
+                source window (slice, slice)
+        """
+        from pyterp import weights
+
+        ni = self.dstShape[-1]
+        rowVar = self.nc.variables['row']
+        # 1-based indices in the file
+        k0 = _findFirst(rowVar, jBeg*ni + 1, 0, self.numEntries)
+        k1 = _findFirst(rowVar, jEnd*ni + 1, k0, self.numEntries)
+        if k1 == k0:
+            return None, None
+
+        rows = numpy.asarray(rowVar[k0:k1]) - 1 - jBeg*ni
+        cols = numpy.asarray(self.nc.variables['col'][k0:k1]) - 1
+        srcJs, srcIs = numpy.divmod(cols, self.srcShape[-1])
+        j0, j1 = srcJs.min(), srcJs.max() + 1
+        i0, i1 = srcIs.min(), srcIs.max() + 1
+        localCols = (srcJs - j0)*(i1 - i0) + (srcIs - i0)
+
+        blockWeights = weights.SparseWeights(rows, localCols, numpy.asarray(self.nc.variables['S'][k0:k1]),
+                                             (j1 - j0, i1 - i0), (jEnd - jBeg, ni))
+        return blockWeights, (slice(j0, j1), slice(i0, i1))
+
+    def run(self, srcData, dstData, slabIndices=((),), fillValue=0.0):
+        """
+        Regrid block by block. Only the source window of the current block is
+        read and each block result is written out immediately. The weights of
+        a block are read once and applied to all the slabs
+        @param srcData source array or netCDF variable (or memory map)
+        @param dstData destination array or netCDF variable
+        @param slabIndices index tuples of the slabs into the leading dimensions
+        @param fillValue value set on destination points that have no weights
+        """
+        nj = self.dstShape[0]
+        for jBeg in range(0, nj, self.blockRows):
+            jEnd = min(jBeg + self.blockRows, nj)
+            blockWeights, window = self.getBlockWeights(jBeg, jEnd)
+            for index in slabIndices:
+                if blockWeights is None:
+                    dstData[index + (slice(jBeg, jEnd),)] = fillValue
+                    continue
+                srcWindow = srcData[index + window]
+                dstData[index + (slice(jBeg, jEnd),)] = blockWeights.apply(srcWindow, fillValue=fillValue)
+
+
+def main():
+    import netCDF4
+    from pyterp import ncio
+
+    parser = argparse.ArgumentParser(description='Regrid by blocks of destination rows to bound the memory')
+    parser.add_argument('--weights', type=str, dest='weights', default='weights.nc',
+                        help='Weights file name (sorted by row)')
+    parser.add_argument('--src_file', type=str, dest='src_file', default='src.nc',
+                        help='Source data file name')
+    parser.add_argument('--src_field', type=str, dest='src_field', default='cellData',
+                        help='Source data field name')
+    parser.add_argument('--dst_file', type=str, dest='dst_file', default='regridded.nc',
+                        help='Output file name')
+    parser.add_argument('--block_rows', type=int, dest='block_rows', default=64,
+                        help='Number of destination rows per block')
+
+    args = parser.parse_args()
+
+    regridder = ChunkedRegridder(args.weights, blockRows=args.block_rows)
+
+    ncIn = netCDF4.Dataset(args.src_file, 'r')
+    ncOut = netCDF4.Dataset(args.dst_file, 'w')
+    srcVar = ncIn.variables[args.src_field]
+    fillValue = ncio.getFillValue(srcVar, default=0.0)
+    dstVar = ncio.createOutputVariable(ncOut, srcVar, regridder.dstShape, fillValue=fillValue)
+
+    tic = time.time()
+    regridder.run(srcVar, dstVar, ncio.getSlabIndices(srcVar, gridRank=len(regridder.srcShape)),
+                  fillValue=fillValue)
+    toc = time.time()
+
+    ncOut.close()
+    ncIn.close()
+    regridder.close()
+
+    print('chunked regrid ({} rows per block):'.format(args.block_rows))
+    print('\tdst: {}'.format(regridder.dstShape))
+    print('\t{0:<32} {1:>.3g} sec'.format('evaluation', toc - tic))
+    print('\t{0:<32} {1:>.3g} GB'.format('peak memory', getPeakMemory()/1.e9))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+from __future__ import print_function, division
+import time
+import argparse
+import numpy
+
+# a convex quadrilateral clipped by another one has at most eight vertices
+MAX_VERTICES = 8
+
+
+def getCellCorners(xx, yy, lonLat=False):
+    """
+    Get the four corners of the cells of a structured grid, counterclockwise
+    in index space
+    @param xx node x coordinates (2D), longitudes in degrees if lonLat
+    @param yy node y coordinates (2D), latitudes in degrees if lonLat
+    @param lonLat project the nodes on the (longitude, sin(latitude)) plane,
+                  where the areas are spherical areas of the unit sphere
+    @return array of shape (numCells, 4, 2)
+    """
+    xx = numpy.asarray(xx, numpy.float64)
+    yy = numpy.asarray(yy, numpy.float64)
+    corners = []
+    for x, y in (xx[:-1, :-1], yy[:-1, :-1]), (xx[:-1, 1:], yy[:-1, 1:]), \
+                (xx[1:, 1:], yy[1:, 1:]), (xx[1:, :-1], yy[1:, :-1]):
+        corners.append((x.ravel(), y.ravel()))
+    corners = numpy.array(corners).transpose((2, 0, 1))
+    if lonLat:
+        lons = corners[..., 0]
+        # longitudes relative to the first corner, then the cell centred in [-180, 180)
+        lons[:, 1:] = lons[:, :1] + (lons[:, 1:] - lons[:, :1] + 180.) % 360. - 180.
+        lons -= numpy.floor((lons.mean(axis=1) + 180.)/360.)[:, None]*360.
+        corners[..., 0] = numpy.radians(lons)
+        corners[..., 1] = numpy.sin(numpy.radians(corners[..., 1]))
+    return corners
+
+
+def getPolygonAreas(poly, counts):
+    """
+    Get the areas of polygons (shoelace formula)
+    @param poly vertices, shape (n, maxVertices, 2)
+    @param counts number of vertices of each polygon
+    @return signed areas, positive for counterclockwise polygons
+    """
+    n, maxVertices = poly.shape[:2]
+    rows = numpy.arange(n)
+    areas = numpy.zeros((n,), numpy.float64)
+    for i in range(maxVertices):
+        has = (i < counts)
+        nxt = poly[rows, (i + 1) % numpy.maximum(counts, 1)]
+        cross = poly[:, i, 0]*nxt[:, 1] - poly[:, i, 1]*nxt[:, 0]
+        areas += numpy.where(has, cross, 0.)
+    return 0.5*areas
+
+
+def clip(subject, clipPoly):
+    """
+    Clip quadrilaterals by convex quadrilaterals, pair by pair, with the
+    Sutherland-Hodgman algorithm. All the pairs are processed together, one
+    clip edge and one subject vertex at a time
+    @param subject subject vertices, shape (n, 4, 2)
+    @param clipPoly convex clip vertices, counterclockwise, shape (n, 4, 2)
+    @return clipped polygon vertices, shape (n, MAX_VERTICES, 2), and number
+            of vertices of each polygon (less than 3 if the pair does not overlap)
+    """
+    n = subject.shape[0]
+    rows = numpy.arange(n)
+    poly = numpy.zeros((n, MAX_VERTICES, 2), numpy.float64)
+    poly[:, :4] = subject
+    counts = numpy.full((n,), 4, numpy.int64)
+
+    for e in range(4):
+        a = clipPoly[:, e]
+        edge = clipPoly[:, (e + 1) % 4] - a
+        out = numpy.zeros_like(poly)
+        outCounts = numpy.zeros((n,), numpy.int64)
+
+        def getSide(p):
+            # positive on the inner (left) side of the clip edge
+            return edge[:, 0]*(p[:, 1] - a[:, 1]) - edge[:, 1]*(p[:, 0] - a[:, 0])
+
+        def emit(mask, points):
+            idx = numpy.nonzero(mask)[0]
+            out[idx, outCounts[idx]] = points[idx]
+            outCounts[idx] += 1
+
+        for i in range(MAX_VERTICES - 1):
+            has = (i < counts)
+            if not has.any():
+                break
+            cur = poly[:, i]
+            prev = poly[rows, (i - 1) % numpy.maximum(counts, 1)]
+            sCur, sPrev = getSide(cur), getSide(prev)
+            curIn, prevIn = (sCur >= 0.), (sPrev >= 0.)
+            crossing = has & (curIn != prevIn)
+            denom = numpy.where(crossing, sPrev - sCur, 1.)
+            t = (sPrev/denom)[:, None]
+            emit(crossing, prev + t*(cur - prev))
+            emit(has & curIn, cur)
+        poly, counts = out, outCounts
+    return poly, counts
+
+
+def getBoxes(corners):
+    """
+    Get the bounding boxes of cells
+    @param corners cell corners, shape (n, 4, 2)
+    @return array of shape (n, 4): xmin, ymin, xmax, ymax
+    """
+    return numpy.concatenate((corners.min(axis=1), corners.max(axis=1)), axis=1)
+
+
+def getPeriod(lonLat):
+    """
+    Get the period of the x coordinate of the cell corners
+    @param lonLat coordinates are longitudes/latitudes, see getCellCorners
+    @return 2*pi for longitudes (in radians), None otherwise
+    """
+    return 2.*numpy.pi if lonLat else None
+
+
+def getIndex(xx, yy, lonLat=False, cacheDir=''):
+    """
+    Get the bounding box index of the cells of a (destination) grid
+    @param xx node x coordinates or longitudes (2D)
+    @param yy node y coordinates or latitudes (2D)
+    @param lonLat coordinates are longitudes/latitudes in degrees
+    @param cacheDir directory caching the index of each grid (no cache if empty)
+    @return box_index.BoxIndex instance
+    """
+    from pyterp import box_index
+
+    boxes = getBoxes(getCellCorners(xx, yy, lonLat))
+    if cacheDir:
+        return box_index.loadOrBuild(cacheDir, boxes, getPeriod(lonLat))
+    return box_index.BoxIndex(boxes, period=getPeriod(lonLat))
+
+
+def computeWeights(srcXx, srcYy, dstXx, dstYy, lonLat=False, batchSize=65536, numThreads=1, index=None):
+    """
+    Compute first order conservative weights between two structured grids,
+    from the overlap areas of their cells
+    @param srcXx source node x coordinates or longitudes (2D)
+    @param srcYy source node y coordinates or latitudes (2D)
+    @param dstXx destination node x coordinates or longitudes (2D)
+    @param dstYy destination node y coordinates or latitudes (2D)
+    @param lonLat coordinates are longitudes/latitudes in degrees, see getCellCorners
+    @param batchSize number of candidate pairs clipped together
+    @param numThreads number of threads working on the batches
+    @param index box_index.BoxIndex of the destination cell boxes, see
+                 getIndex (built if None)
+    @return SparseWeights instance between the cells (weights are the overlap
+            areas divided by the destination cell areas), with the extras
+            frac_a, frac_b, area_a and area_b
+    """
+    from pyterp import hybrid, weights, box_index
+
+    srcCorners = getCellCorners(srcXx, srcYy, lonLat)
+    dstCorners = getCellCorners(dstXx, dstYy, lonLat)
+    counts = numpy.full((len(dstCorners),), 4, numpy.int64)
+    dstAreas = getPolygonAreas(dstCorners, counts)
+    srcAreas = numpy.abs(getPolygonAreas(srcCorners, numpy.full((len(srcCorners),), 4, numpy.int64)))
+    # the clip polygons must be counterclockwise
+    dstCorners[dstAreas < 0] = dstCorners[dstAreas < 0, ::-1]
+    dstAreas = numpy.abs(dstAreas)
+
+    if index is None:
+        index = box_index.BoxIndex(getBoxes(dstCorners), period=getPeriod(lonLat))
+    srcCells, dstCells, shifts = index.query(getBoxes(srcCorners))
+    areas = numpy.zeros((len(srcCells),), numpy.float64)
+
+    def clipBatch(sl):
+        subject = srcCorners[srcCells[sl]]
+        # source cells are moved by whole periods next to the destination cells
+        subject[..., 0] += shifts[sl, None]
+        poly, n = clip(subject, dstCorners[dstCells[sl]])
+        areas[sl] = numpy.where(n >= 3, numpy.abs(getPolygonAreas(poly, n)), 0.)
+
+    numPairs = len(srcCells)
+    hybrid.mapBlocks(clipBatch, [slice(i, min(i + batchSize, numPairs)) for i in range(0, numPairs, batchSize)],
+                     numThreads)
+
+    keep = (areas > 0.) & (dstAreas[dstCells] > 0.)
+    srcCells, dstCells, areas = srcCells[keep], dstCells[keep], areas[keep]
+    srcShape = (numpy.shape(srcXx)[0] - 1, numpy.shape(srcXx)[1] - 1)
+    dstShape = (numpy.shape(dstXx)[0] - 1, numpy.shape(dstXx)[1] - 1)
+    # fractions of the cells covered by the other grid
+    fracA = numpy.bincount(srcCells, weights=areas, minlength=len(srcAreas)) / numpy.where(srcAreas > 0, srcAreas, 1.)
+    fracB = numpy.bincount(dstCells, weights=areas, minlength=len(dstAreas)) / numpy.where(dstAreas > 0, dstAreas, 1.)
+    return weights.SparseWeights(dstCells, srcCells, areas/dstAreas[dstCells], srcShape, dstShape,
+                                 frac_a=fracA, frac_b=fracB, area_a=srcAreas, area_b=dstAreas)
+
+
+def main():
+    import netCDF4
+    from pyterp import grids, diagnostics
+
+    parser = argparse.ArgumentParser(description='Conservatively interpolate with vectorized polygon clipping')
+    parser.add_argument('--src_file', type=str, dest='src_file', default='src.nc',
+                        help='Source data file name')
+    parser.add_argument('--dst_file', type=str, dest='dst_file', default='dst.nc',
+                        help='Destination data file name')
+    parser.add_argument('--node_field', type=str, dest='node_field', default='pointData',
+                        help='Nodal field whose coordinates are the cell corners')
+    parser.add_argument('--cell_field', type=str, dest='cell_field', default='cellData',
+                        help='Cell field to regrid (and reference field on the destination grid)')
+    parser.add_argument('--x', type=str, dest='x', default='',
+                        help='Node x coordinate variable of a Cartesian grid (lat-lon coordinates if empty)')
+    parser.add_argument('--y', type=str, dest='y', default='',
+                        help='Node y coordinate variable of a Cartesian grid')
+    parser.add_argument('--batch_size', type=int, dest='batch_size', default=65536,
+                        help='Number of candidate cell pairs clipped together')
+    parser.add_argument('--num_threads', type=int, dest='num_threads', default=1,
+                        help='Number of threads working on the batches')
+    parser.add_argument('--index_dir', type=str, dest='index_dir', default='',
+                        help='Directory caching the bounding box index of the destination grid')
+    parser.add_argument('--weights', type=str, dest='weights', default='',
+                        help='Save the weights to this file')
+
+    args = parser.parse_args()
+
+    timeStats = {
+        'index': float('nan'),
+        'weights': float('nan'),
+        'evaluation': float('nan'),
+    }
+
+    def readGrid(filename):
+        nc = netCDF4.Dataset(filename, 'r')
+        if args.x:
+            xx, yy = nc.variables[args.x][:], nc.variables[args.y][:]
+        else:
+            coords = grids.getCoordinates(nc, nc.variables[args.node_field])
+            xx, yy = coords['lons'], coords['lats']
+        data = nc.variables[args.cell_field][:]
+        nc.close()
+        return xx, yy, data
+
+    srcXx, srcYy, srcData = readGrid(args.src_file)
+    dstXx, dstYy, dstDataRef = readGrid(args.dst_file)
+
+    tic = time.time()
+    index = getIndex(dstXx, dstYy, lonLat=not args.x, cacheDir=args.index_dir)
+    timeStats['index'] = time.time() - tic
+    tic = time.time()
+    wgts = computeWeights(srcXx, srcYy, dstXx, dstYy, lonLat=not args.x, batchSize=args.batch_size,
+                          numThreads=args.num_threads, index=index)
+    timeStats['weights'] = time.time() - tic
+    if args.weights:
+        wgts.save(args.weights)
+
+    wgts.setNumThreads(args.num_threads)
+    tic = time.time()
+    dstData = wgts.apply(srcData)
+    timeStats['evaluation'] = time.time() - tic
+
+    # only the part of the source grid covered by the destination grid is conserved
+    srcAreas = (wgts.extras['area_a']*wgts.extras['frac_a']).reshape(wgts.srcShape)
+    dstAreas = wgts.extras['area_b'].reshape(wgts.dstShape)
+    stats = diagnostics.ErrorStats()
+    stats.addSource(srcData, areas=srcAreas)
+    stats.update(dstData, dstDataRef, areas=dstAreas,
+                 mask=(wgts.extras['frac_b'].reshape(wgts.dstShape) <= 0.))
+    stats.report('numpy conservative interpolation:')
+    print('\t     # weights: {}'.format(wgts.getNumberOfEntries()))
+    print('time stats:')
+    totTime = 0.0
+    for k, v in timeStats.items():
+        print('\t{0:<32} {1:>.3g} sec'.format(k, v))
+        totTime += v
+    print('\t{0:<32} {1:>.3g} sec'.format('total', totTime))
+
+    # check sum
+    checksum = numpy.sum(dstData, axis=None)
+    print('check sum: {:.15g}'.format(checksum))
+
+
+if __name__ == '__main__':
+    main()
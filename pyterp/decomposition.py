@@ -0,0 +1,282 @@
+from __future__ import print_function, division
+import time
+import argparse
+import numpy
+
+
+def getEqualRowBlocks(numRows, numParts):
+    """
+    Get the row blocks of a block decomposition with equal numbers of rows
+    (what ESMF does by default)
+    @param numRows number of grid rows
+    @param numParts number of blocks
+    @return array of numParts + 1 row boundaries
+    """
+    sizes = numpy.full((numParts,), numRows // numParts, numpy.int64)
+    sizes[:numRows % numParts] += 1
+    return numpy.concatenate(([0], numpy.cumsum(sizes)))
+
+
+def getCellBoxes(boundLats, boundLons):
+    """
+    Get the centres and lat-lon extents of cells
+    @param boundLats latitudes of the cell vertices, shape (..., numVertices)
+    @param boundLons longitudes of the cell vertices, shape (..., numVertices)
+    @return centre latitudes, centre longitudes, latitude extents, longitude
+            extents (degrees, periodicity taken into account)
+    """
+    boundLats = numpy.asarray(boundLats, numpy.float64)
+    boundLons = numpy.asarray(boundLons, numpy.float64)
+    # unwrap the longitudes relative to the first vertex
+    dLons = (boundLons - boundLons[..., :1] + 180.) % 360. - 180.
+    centerLats = boundLats.mean(axis=-1)
+    centerLons = boundLons[..., 0] + dLons.mean(axis=-1)
+    latExtents = boundLats.max(axis=-1) - boundLats.min(axis=-1)
+    lonExtents = dLons.max(axis=-1) - dLons.min(axis=-1)
+    return centerLats, centerLons, latExtents, lonExtents
+
+
+def _getBinIndices(lats, lons, numBins):
+    jb = numpy.clip(((lats + 90.)*numBins[0]/180.).astype(numpy.int64), 0, numBins[0] - 1)
+    ib = numpy.clip(((lons % 360.)*numBins[1]/360.).astype(numpy.int64), 0, numBins[1] - 1)
+    return jb, ib
+
+
+def getCountHistogram(centerLats, centerLons, numBins=(90, 180)):
+    """
+    Count the cells falling in each lat-lon bin
+    @param centerLats cell centre latitudes
+    @param centerLons cell centre longitudes
+    @param numBins number of latitude and longitude bins
+    @return array of counts of shape numBins
+    """
+    jb, ib = _getBinIndices(numpy.ravel(centerLats), numpy.ravel(centerLons), numBins)
+    counts = numpy.bincount(jb*numBins[1] + ib, minlength=numBins[0]*numBins[1])
+    return counts.reshape(numBins).astype(numpy.float64)
+
+
+def estimateCellCosts(boxes, otherCounts):
+    """
+    Estimate the regridding cost of each cell as one plus the number of cells
+    of the other grid it overlaps. The other grid is taken to be locally
+    uniform, with a spacing given by its cell density around the cell centre
+    @param boxes cell boxes as returned by getCellBoxes
+    @param otherCounts cell count histogram of the other grid
+    @return array of costs
+    """
+    centerLats, centerLons, latExtents, lonExtents = boxes
+    numBins = otherCounts.shape
+    binArea = (180./numBins[0]) * (360./numBins[1])
+    jb, ib = _getBinIndices(centerLats, centerLons, numBins)
+    counts = otherCounts[jb, ib]
+    spacing = numpy.sqrt(binArea / numpy.maximum(counts, 1.))
+    overlaps = (latExtents/spacing + 1.) * (lonExtents/spacing + 1.)
+    return 1. + numpy.where(counts > 0, overlaps, 0.)
+
+
+def planRowBlocks(rowCosts, numParts):
+    """
+    Split the rows into contiguous blocks of about equal cost
+    @param rowCosts cost of each row
+    @param numParts number of blocks
+    @return array of numParts + 1 row boundaries, every block has at least one
+            row if there are enough rows
+    """
+    rowCosts = numpy.asarray(rowCosts, numpy.float64)
+    numRows = len(rowCosts)
+    cumCosts = numpy.concatenate(([0.], numpy.cumsum(rowCosts)))
+    targets = cumCosts[-1] * numpy.arange(1, numParts) / numParts
+    bounds = numpy.searchsorted(cumCosts, targets)
+    # pick the closer of the two boundaries around each target
+    lower = numpy.maximum(bounds - 1, 0)
+    bounds = numpy.where(targets - cumCosts[lower] < cumCosts[bounds] - targets, lower, bounds)
+    bounds = numpy.concatenate(([0], bounds, [numRows])).astype(numpy.int64)
+    if numRows >= numParts:
+        for k in range(1, numParts):
+            bounds[k] = min(max(bounds[k], bounds[k - 1] + 1), numRows - (numParts - k))
+    return bounds
+
+
+def getMeshRows(rowBlocks, rank, numCols, periodic=False):
+    """
+    Get the nodes and quadrilateral cells of a block of cell rows, to pass a
+    row decomposition to ESMF as a mesh. The last row of nodes of a block
+    belongs to the rank owning the next cell row, so every node has a single
+    owner. A rank with an empty block (more ranks than rows) gets no nodes
+    and no cells
+    @param rowBlocks row boundaries, one block per rank
+    @param rank block index
+    @param numCols number of cell columns (distinct columns if periodic)
+    @param periodic whether the last cell column connects to the first one, the
+                    east nodes of the last column are then those of column 0
+    @return node ids (1-based, node row j, column i has id j*numNodeCols + i + 1
+            with numNodeCols = numCols if periodic else numCols + 1),
+            node owners, cell ids (1-based) and cell connectivity (4 local node
+            indices per cell)
+    """
+    rowBeg, rowEnd = rowBlocks[rank], rowBlocks[rank + 1]
+    if rowEnd == rowBeg:
+        empty = numpy.zeros((0,), numpy.int64)
+        return empty, empty.astype(numpy.int32), empty, empty.astype(numpy.int32)
+    numLocalRows = rowEnd - rowBeg
+    numNodeCols = numCols if periodic else numCols + 1
+
+    nodeJs, nodeIs = numpy.meshgrid(numpy.arange(rowBeg, rowEnd + 1), numpy.arange(numNodeCols), indexing='ij')
+    nodeIds = (nodeJs*numNodeCols + nodeIs + 1).ravel()
+    nodeOwners = numpy.full(nodeIds.shape, rank, numpy.int32)
+    if rowEnd < rowBlocks[-1]:
+        # the last of the blocks starting at rowEnd, the others are empty
+        nodeOwners[-numNodeCols:] = numpy.searchsorted(rowBlocks, rowEnd, side='right') - 1
+
+    cellJs, cellIs = numpy.meshgrid(numpy.arange(numLocalRows), numpy.arange(numCols), indexing='ij')
+    cellIds = ((rowBeg + cellJs)*numCols + cellIs + 1).ravel()
+    sw = (cellJs*numNodeCols + cellIs).ravel()
+    se = (cellJs*numNodeCols + (cellIs + 1) % numNodeCols).ravel()
+    cellConn = numpy.array([sw, se, se + numNodeCols, sw + numNodeCols]).transpose().ravel()
+    return nodeIds, nodeOwners, cellIds, cellConn.astype(numpy.int32)
+
+
+def getLoads(rowCosts, rowBlocks):
+    """
+    Get the cost of each block
+    @param rowCosts cost of each row
+    @param rowBlocks row boundaries
+    @return array of block costs
+    """
+    cumCosts = numpy.concatenate(([0.], numpy.cumsum(rowCosts)))
+    return cumCosts[rowBlocks[1:]] - cumCosts[rowBlocks[:-1]]
+
+
+def getImbalance(loads):
+    """
+    @param loads per rank loads (costs or times)
+    @return max over mean ratio (1 is perfect balance)
+    """
+    loads = numpy.asarray(loads, numpy.float64)
+    return loads.max() / loads.mean() if loads.mean() > 0 else 1.0
+
+
+def getNumberOfBins(numCells, cellsPerBin=8, maxLatBins=90):
+    """
+    Choose the resolution of the density histograms so that the coarser grid
+    has a few cells per bin on average
+    @param numCells number of cells of the coarser grid
+    @param cellsPerBin target average number of cells per bin
+    @param maxLatBins max number of latitude bins
+    @return number of latitude and longitude bins
+    """
+    numLatBins = int(max(1, min(maxLatBins, numpy.sqrt(numCells / (2.*cellsPerBin)))))
+    return numLatBins, 2*numLatBins
+
+
+def planGrids(readers, numRows, comm=None, numBins=None):
+    """
+    Plan balanced row blocks for a source and a destination grid. Every rank
+    estimates the costs of an equal block of rows, only reading those rows,
+    and the per-row costs are then shared so that all ranks compute the same
+    plan
+    @param readers for each grid, function (rowBeg, rowEnd) returning the
+                   vertex latitudes and longitudes of these cell rows,
+                   arrays of shape (rowEnd - rowBeg, numCols, numVertices)
+    @param numRows for each grid, number of cell rows
+    @param comm MPI communicator (None for serial)
+    @param numBins number of latitude and longitude bins of the density histograms
+                   (see getNumberOfBins by default)
+    @return for each grid, row boundaries (one block per rank) and row costs
+    """
+    rank = comm.Get_rank() if comm is not None else 0
+    numProcs = comm.Get_size() if comm is not None else 1
+
+    boxes = []
+    for reader, n in zip(readers, numRows):
+        blocks = getEqualRowBlocks(n, numProcs)
+        boundLats, boundLons = reader(blocks[rank], blocks[rank + 1])
+        boxes.append(getCellBoxes(boundLats, boundLons))
+    if numBins is None:
+        numBins = getNumberOfBins(min([n * b[0].shape[1] for n, b in zip(numRows, boxes)]))
+
+    counts = []
+    for b in boxes:
+        c = getCountHistogram(b[0], b[1], numBins)
+        if comm is not None:
+            c = comm.allreduce(c)
+        counts.append(c)
+
+    res = []
+    for k in range(len(readers)):
+        localRowCosts = estimateCellCosts(boxes[k], counts[1 - k]).sum(axis=1)
+        if comm is not None:
+            rowCosts = numpy.concatenate(comm.allgather(localRowCosts))
+        else:
+            rowCosts = localRowCosts
+        res.append((planRowBlocks(rowCosts, numProcs), rowCosts))
+    return res
+
+
+def printReport(rowCosts, rowBlocks, observed=None):
+    """
+    Print the predicted (and observed) per rank loads of a decomposition
+    @param rowCosts list of row costs, one per grid
+    @param rowBlocks list of row boundaries, one per grid
+    @param observed observed per rank times (optional)
+    """
+    loads = sum([getLoads(c, b) for c, b in zip(rowCosts, rowBlocks)])
+    predicted = loads / loads.mean()
+    header = '{0:>6} {1:>18} {2:>10}'.format('rank', 'rows', 'predicted')
+    if observed is not None:
+        observed = numpy.asarray(observed, numpy.float64)
+        header += ' {0:>10} {1:>12}'.format('observed', 'time sec')
+    print(header)
+    for rank in range(len(predicted)):
+        rows = ' '.join(['{}:{}'.format(b[rank], b[rank + 1]) for b in rowBlocks])
+        line = '{0:>6} {1:>18} {2:>10.3f}'.format(rank, rows, predicted[rank])
+        if observed is not None:
+            line += ' {0:>10.3f} {1:>12.3g}'.format(observed[rank]/observed.mean(), observed[rank])
+        print(line)
+    print('predicted imbalance (max/mean): {:.3f}'.format(getImbalance(loads)))
+    if observed is not None:
+        print('observed imbalance (max/mean):  {:.3f}'.format(getImbalance(observed)))
+
+
+def main():
+    import netCDF4
+
+    parser = argparse.ArgumentParser(description='Plan a cost balanced row decomposition of two grids')
+    parser.add_argument('--src_file', type=str, dest='src_file', default='coords_CF_ORCA12_GO6-2.nc',
+                        help='Source grid file name')
+    parser.add_argument('--src_lat_bounds', type=str, dest='src_lat_bounds', default='latw_bounds',
+                        help='Source latitude cell boundary array')
+    parser.add_argument('--src_lon_bounds', type=str, dest='src_lon_bounds', default='lonw_bounds',
+                        help='Source longitude cell boundary array')
+    parser.add_argument('--dst_file', type=str, dest='dst_file', default='dst.nc',
+                        help='Destination grid file name')
+    parser.add_argument('--dst_lat_bounds', type=str, dest='dst_lat_bounds', default='latMid_bnds',
+                        help='Destination latitude cell boundary array')
+    parser.add_argument('--dst_lon_bounds', type=str, dest='dst_lon_bounds', default='lonMid_bnds',
+                        help='Destination longitude cell boundary array')
+    parser.add_argument('--nprocs', type=int, dest='nprocs', default=16,
+                        help='Number of ranks')
+
+    args = parser.parse_args()
+
+    ncs = [netCDF4.Dataset(args.src_file, 'r'), netCDF4.Dataset(args.dst_file, 'r')]
+    names = [(args.src_lat_bounds, args.src_lon_bounds), (args.dst_lat_bounds, args.dst_lon_bounds)]
+    tic = time.time()
+    boxes = [getCellBoxes(nc.variables[latName][:], nc.variables[lonName][:])
+             for nc, (latName, lonName) in zip(ncs, names)]
+    numBins = getNumberOfBins(min([b[0].size for b in boxes]))
+    counts = [getCountHistogram(b[0], b[1], numBins) for b in boxes]
+    rowCosts = [estimateCellCosts(boxes[k], counts[1 - k]).sum(axis=1) for k in range(2)]
+    for nc in ncs:
+        nc.close()
+    toc = time.time()
+
+    print('default (equal rows) decomposition on {} ranks:'.format(args.nprocs))
+    printReport(rowCosts, [getEqualRowBlocks(len(c), args.nprocs) for c in rowCosts])
+    print('balanced decomposition on {} ranks:'.format(args.nprocs))
+    printReport(rowCosts, [planRowBlocks(c, args.nprocs) for c in rowCosts])
+    print('\t{0:<32} {1:>.3g} sec'.format('cost estimate', toc - tic))
+
+
+if __name__ == '__main__':
+    main()
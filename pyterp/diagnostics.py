@@ -0,0 +1,195 @@
+from __future__ import print_function, division
+from collections import OrderedDict
+import numpy
+
+# layout of the statistics vector, accumulated sums followed by maxima (the
+# min value is stored as a max of the negated values)
+SUM_NAMES = ('numSrc', 'numSrcWeighted', 'srcIntegral',
+             'numDst', 'numValid', 'numDstWeighted',
+             'sumAbsError', 'sumSquareError', 'dstIntegral', 'refIntegral')
+MAX_NAMES = ('maxAbsError', 'maxValue', 'minusMinValue')
+NUM_SUMS = len(SUM_NAMES)
+INDEX = dict((name, i) for i, name in enumerate(SUM_NAMES + MAX_NAMES))
+
+
+def combine(a, b):
+    """
+    Combine two statistics vectors, in place
+    @param a statistics vector
+    @param b statistics vector, set to the combination of a and b
+    """
+    b[:NUM_SUMS] += a[:NUM_SUMS]
+    numpy.maximum(b[NUM_SUMS:], a[NUM_SUMS:], out=b[NUM_SUMS:])
+
+
+def _combineBuffers(inmem, inoutmem, datatype):
+    combine(numpy.frombuffer(inmem, numpy.float64), numpy.frombuffer(inoutmem, numpy.float64))
+
+
+_reduceOp = None
+
+def _getReduceOp():
+    global _reduceOp
+    if _reduceOp is None:
+        from mpi4py import MPI
+        _reduceOp = MPI.Op.Create(_combineBuffers, commute=True)
+    return _reduceOp
+
+
+def _getValid(block, maskBlock):
+    data = numpy.ma.getdata(block)
+    valid = ~numpy.ma.getmaskarray(block) & numpy.isfinite(data)
+    if maskBlock is not None:
+        valid &= ~numpy.asarray(maskBlock, bool)
+    return data, valid
+
+
+class ErrorStats(object):
+
+    def __init__(self, comm=None, blockSize=1048576, numThreads=1):
+        """
+        Constructor
+        @param comm MPI communicator (None for serial)
+        @param blockSize approximate number of elements processed at once,
+                         bounds the size of the temporaries
+        @param numThreads number of threads processing the blocks
+        """
+        self.comm = comm
+        self.blockSize = blockSize
+        self.numThreads = numThreads
+        self.local = self._getEmpty()
+        self.totals = None
+
+    def _getBlocks(self, shape):
+        # blocks of rows along the leading axis
+        rowSize = int(numpy.prod(shape[1:]))
+        step = max(1, self.blockSize // max(rowSize, 1))
+        for i in range(0, shape[0], step):
+            yield slice(i, i + step)
+
+    def _accumulate(self, func, shape):
+        # blocks are processed concurrently but combined in order, so the
+        # results do not depend on the number of threads
+        from pyterp import hybrid
+        for vec in hybrid.mapBlocks(func, list(self._getBlocks(shape)), self.numThreads):
+            combine(vec, self.local)
+
+    def _getEmpty(self):
+        vec = numpy.zeros((len(INDEX),), numpy.float64)
+        vec[NUM_SUMS:] = -numpy.inf
+        return vec
+
+    def addSource(self, values, areas=None, mask=None):
+        """
+        Accumulate the local source points, and their integral if the areas are given
+        @param values source field values, masked or non-finite values are left out
+        @param areas source cell areas (optional)
+        @param mask array, True where the values should be left out (optional)
+        """
+        values = numpy.atleast_1d(values)
+
+        def getBlockStats(sl):
+            vec = self._getEmpty()
+            v, valid = _getValid(values[sl], mask[sl] if mask is not None else None)
+            vec[INDEX['numSrc']] = valid.size
+            if areas is not None:
+                vec[INDEX['numSrcWeighted']] = numpy.count_nonzero(valid)
+                vec[INDEX['srcIntegral']] = numpy.vdot(numpy.where(valid, v, 0.), areas[sl])
+            return vec
+
+        self._accumulate(getBlockStats, values.shape)
+
+    def update(self, values, reference, areas=None, mask=None):
+        """
+        Accumulate the local errors of the destination field
+        @param values regridded field values, masked or non-finite values are left out
+        @param reference exact field values
+        @param areas destination cell areas (optional)
+        @param mask array, True where the values should be left out (optional)
+        """
+        values = numpy.atleast_1d(values)
+
+        def getBlockStats(sl):
+            vec = self._getEmpty()
+            v, valid = _getValid(values[sl], mask[sl] if mask is not None else None)
+            v = numpy.where(valid, v, 0.)
+            r = numpy.where(valid, numpy.ma.getdata(reference[sl]), 0.)
+            err = numpy.abs(v - r)
+            vec[INDEX['numDst']] = valid.size
+            vec[INDEX['numValid']] = numpy.count_nonzero(valid)
+            vec[INDEX['sumAbsError']] = err.sum()
+            vec[INDEX['sumSquareError']] = numpy.vdot(err, err)
+            if valid.any():
+                vec[INDEX['maxAbsError']] = err.max()
+                vec[INDEX['maxValue']] = v[valid].max()
+                vec[INDEX['minusMinValue']] = -v[valid].min()
+            if areas is not None:
+                a = areas[sl]
+                vec[INDEX['numDstWeighted']] = numpy.count_nonzero(valid)
+                vec[INDEX['dstIntegral']] = numpy.vdot(v, a)
+                vec[INDEX['refIntegral']] = numpy.vdot(r, a)
+            return vec
+
+        self._accumulate(getBlockStats, values.shape)
+
+    def reduce(self):
+        """
+        Combine the statistics of all the ranks, with a single reduction.
+        Must be called by all the ranks
+        @return dictionary of errors, see getErrors
+        """
+        if self.comm is None:
+            self.totals = self.local.copy()
+        else:
+            self.totals = numpy.empty_like(self.local)
+            self.comm.Allreduce(self.local, self.totals, op=_getReduceOp())
+        return self.getErrors()
+
+    def getErrors(self):
+        """
+        Get the global errors (after reduce)
+        @return dictionary with the number of source, destination and valid
+                destination points, the L1 (mean), L2 (root mean square) and
+                Linf errors, the min/max values and the relative conservation
+                error (nan if no areas were given)
+        """
+        t = dict((name, self.totals[i]) for name, i in INDEX.items())
+        numValid = t['numValid']
+        res = OrderedDict()
+        res['numSrc'] = int(t['numSrc'])
+        res['numDst'] = int(t['numDst'])
+        res['numValid'] = int(numValid)
+        res['l1'] = t['sumAbsError'] / numValid if numValid > 0 else float('nan')
+        res['l2'] = numpy.sqrt(t['sumSquareError'] / numValid) if numValid > 0 else float('nan')
+        res['linf'] = t['maxAbsError'] if numValid > 0 else float('nan')
+        res['min'] = -t['minusMinValue'] if numValid > 0 else float('nan')
+        res['max'] = t['maxValue'] if numValid > 0 else float('nan')
+        # compare with the source integral when available, with the
+        # integral of the exact field otherwise
+        res['conservation'] = float('nan')
+        if t['numDstWeighted'] > 0:
+            expected = t['srcIntegral'] if t['numSrcWeighted'] > 0 else t['refIntegral']
+            diff = t['dstIntegral'] - expected
+            res['conservation'] = diff / abs(expected) if expected != 0 else diff
+        return res
+
+    def report(self, title='interpolation:'):
+        """
+        Print the global errors on rank 0, reducing first if needed. Must be
+        called by all the ranks
+        @param title first line
+        @return dictionary of errors, see getErrors
+        """
+        if self.totals is None:
+            self.reduce()
+        res = self.getErrors()
+        if self.comm is not None and self.comm.Get_rank() != 0:
+            return res
+        print(title)
+        print('\tsrc: ntot: {}'.format(res['numSrc']))
+        print('\tdst: ntot: {} valid: {}'.format(res['numDst'], res['numValid']))
+        print('interpolation error: {:.3g}'.format(res['l1']))
+        for name, key in ('L1 error', 'l1'), ('L2 error', 'l2'), ('Linf error', 'linf'), \
+                         ('min value', 'min'), ('max value', 'max'), ('conservation error', 'conservation'):
+            print('\t{0:<32} {1:>.3g}'.format(name, res[key]))
+        return res
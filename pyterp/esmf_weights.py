@@ -0,0 +1,81 @@
+from __future__ import print_function, division
+import numpy
+import ESMF
+
+# ESMF expects the longitudes first
+LAT_INDEX, LON_INDEX = 1, 0
+
+METHODS = {
+    'bilinear': ESMF.api.constants.RegridMethod.BILINEAR,
+    'conserve': ESMF.api.constants.RegridMethod.CONSERVE,
+}
+
+
+def getPeriodicOptions(topology, periodicDim=1, poleDim=0):
+    """
+    Get the ESMF.Grid arguments setting up the periodicity of a grid
+    @param topology dictionary returned by grids.getTopology
+    @param periodicDim ESMF dimension along the seam (grid columns)
+    @param poleDim ESMF dimension going pole to pole (grid rows)
+    @return dictionary of keyword arguments (empty for bounded grids)
+    """
+    if topology['seamNodes'] is None:
+        return {}
+    PoleKind = ESMF.api.constants.PoleKind
+    northPole = PoleKind.BIPOLE if topology['foldRows'] is not None else PoleKind.MONOPOLE
+    return {'num_peri_dims': 1, 'periodic_dim': periodicDim, 'pole_dim': poleDim,
+            'pole_kind': numpy.array([PoleKind.MONOPOLE, northPole], numpy.int32)}
+
+
+def createGrid(lats, lons):
+    """
+    Create an ESMF grid from corner point coordinates. The numpy (j, i) arrays
+    are passed transposed so that ESMF's sequence index i + ni*j matches the
+    numpy (C order) flat index
+    @param lats 2D latitudes of the grid nodes, degrees
+    @param lons 2D longitudes of the grid nodes, degrees
+    @return ESMF Grid
+    """
+    cellDims = numpy.array(lats.shape[::-1], numpy.int32) - 1
+    grid = ESMF.Grid(max_index=cellDims, coord_sys=ESMF.api.constants.CoordSys.SPH_DEG)
+    grid.add_coords(staggerloc=ESMF.StaggerLoc.CORNER, coord_dim=LAT_INDEX)
+    grid.add_coords(staggerloc=ESMF.StaggerLoc.CORNER, coord_dim=LON_INDEX)
+
+    iBeg0 = grid.lower_bounds[ESMF.StaggerLoc.CORNER][0]
+    iEnd0 = grid.upper_bounds[ESMF.StaggerLoc.CORNER][0]
+    iBeg1 = grid.lower_bounds[ESMF.StaggerLoc.CORNER][1]
+    iEnd1 = grid.upper_bounds[ESMF.StaggerLoc.CORNER][1]
+
+    coordLats = grid.get_coords(coord_dim=LAT_INDEX, staggerloc=ESMF.StaggerLoc.CORNER)
+    coordLons = grid.get_coords(coord_dim=LON_INDEX, staggerloc=ESMF.StaggerLoc.CORNER)
+    coordLats[...] = lats.T[iBeg0:iEnd0, iBeg1:iEnd1]
+    coordLons[...] = lons.T[iBeg0:iEnd0, iBeg1:iEnd1]
+
+    return grid
+
+
+def computeWeights(srcCoords, dstCoords, filename, method='bilinear'):
+    """
+    Compute the interpolation weights with ESMF and store them in a file
+    @param srcCoords source coordinates as returned by grids.getCoordinates
+    @param dstCoords destination coordinates as returned by grids.getCoordinates
+    @param filename weights file name
+    @param method 'bilinear' (nodal data) or 'conserve' (cell data)
+    """
+    if method == 'bilinear':
+        # the data points are the grid nodes
+        staggerloc = ESMF.StaggerLoc.CORNER
+        srcGrid = createGrid(srcCoords['lats'], srcCoords['lons'])
+        dstGrid = createGrid(dstCoords['lats'], dstCoords['lons'])
+    else:
+        staggerloc = ESMF.StaggerLoc.CENTER
+        srcGrid = createGrid(srcCoords['latCorners'], srcCoords['lonCorners'])
+        dstGrid = createGrid(dstCoords['latCorners'], dstCoords['lonCorners'])
+
+    srcField = ESMF.Field(srcGrid, staggerloc=staggerloc)
+    dstField = ESMF.Field(dstGrid, staggerloc=staggerloc)
+    ESMF.Regrid(srcfield=srcField, dstfield=dstField,
+                filename=filename,
+                regrid_method=METHODS[method],
+                unmapped_action=ESMF.api.constants.UnmappedAction.IGNORE,
+                ignore_degenerate=True)
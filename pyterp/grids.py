@@ -0,0 +1,306 @@
+from __future__ import print_function, division
+import numpy
+
+
+def getCornersFromAxis(axis):
+    """
+    Get the cell boundaries of a 1D axis, half way between the points
+    @param axis 1D array of point values
+    @return 1D array of size len(axis) + 1
+    """
+    axis = numpy.asarray(axis, numpy.float64)
+    corners = numpy.empty((len(axis) + 1,), numpy.float64)
+    corners[1:-1] = 0.5*(axis[:-1] + axis[1:])
+    corners[0] = axis[0] - 0.5*(axis[1] - axis[0])
+    corners[-1] = axis[-1] + 0.5*(axis[-1] - axis[-2])
+    return corners
+
+
+def getCornersFromBounds(bounds):
+    """
+    Get the corner point coordinates from CF cell bounds
+    @param bounds array of shape (nj, ni, 4), vertices ordered counterclockwise
+                  starting at (j, i)
+    @return array of shape (nj + 1, ni + 1)
+    """
+    nj, ni = bounds.shape[:2]
+    corners = numpy.empty((nj + 1, ni + 1), numpy.float64)
+    corners[:-1, :-1] = bounds[..., 0]
+    corners[:-1, -1] = bounds[:, -1, 1]
+    corners[-1, -1] = bounds[-1, -1, 2]
+    corners[-1, :-1] = bounds[-1, :, 3]
+    return corners
+
+
+def rotatedToGeographic(rlats, rlons, poleLat, poleLon):
+    """
+    Convert rotated pole coordinates to geographic latitudes and longitudes
+    @param rlats latitudes in the rotated frame, degrees
+    @param rlons longitudes in the rotated frame, degrees
+    @param poleLat geographic latitude of the rotated north pole
+    @param poleLon geographic longitude of the rotated north pole
+    @return lats, lons in degrees
+    """
+    the = numpy.radians(rlats)
+    lam = numpy.radians(rlons)
+    xyzRot = numpy.array([numpy.cos(the)*numpy.cos(lam),
+                          numpy.cos(the)*numpy.sin(lam),
+                          numpy.sin(the)])
+
+    # the rotated frame's z axis points to the pole and its x axis to the point
+    # (90 - poleLat, poleLon + 180) on the other side of the pole
+    def unitVector(lat, lon):
+        lat, lon = numpy.radians(lat), numpy.radians(lon)
+        return numpy.array([numpy.cos(lat)*numpy.cos(lon),
+                            numpy.cos(lat)*numpy.sin(lon),
+                            numpy.sin(lat)])
+    ez = unitVector(poleLat, poleLon)
+    ex = unitVector(90. - poleLat, poleLon + 180.)
+    ey = numpy.cross(ez, ex)
+    transfMatrix = numpy.array([ex, ey, ez]).T
+
+    xyz = numpy.tensordot(transfMatrix, xyzRot, axes=(1, 0))
+    lats = numpy.degrees(numpy.arcsin(numpy.clip(xyz[2], -1., 1.)))
+    lons = numpy.degrees(numpy.arctan2(xyz[1], xyz[0]))
+    return lats, lons
+
+
+def _findCoord(nc, var, standardNames):
+    for name in getattr(var, 'coordinates', '').split() + list(var.dimensions):
+        if name in nc.variables and \
+           getattr(nc.variables[name], 'standard_name', None) in standardNames:
+            return nc.variables[name]
+    return None
+
+
+def getLatLonVariables(nc, var):
+    """
+    Find the latitude and longitude coordinate variables of a field without
+    reading them
+    @param nc netCDF dataset
+    @param var netCDF variable
+    @return latitude and longitude netCDF variables (1D or 2D)
+    """
+    latVar = _findCoord(nc, var, ('latitude',))
+    lonVar = _findCoord(nc, var, ('longitude',))
+    if latVar is None or lonVar is None:
+        raise ValueError('cannot find the latitudes/longitudes of {}'.format(var.name))
+    return latVar, lonVar
+
+
+def getHorizontalDimensions(nc, var):
+    """
+    Get the dimensions spanned by the latitude and longitude (or rotated
+    latitude and longitude) coordinates of a field, without reading them
+    @param nc netCDF dataset
+    @param var netCDF variable
+    @return set of dimension names, None if the field has no such coordinates
+    """
+    for standardNames in ('latitude', 'longitude'), ('grid_latitude', 'grid_longitude'):
+        coords = [_findCoord(nc, var, (name,)) for name in standardNames]
+        if None not in coords:
+            return set(coords[0].dimensions) | set(coords[1].dimensions)
+    return None
+
+
+def getCoordinates(nc, var):
+    """
+    Get the 2D latitudes and longitudes of a field, at the data points and at
+    the cell corners. Curvilinear (CF coordinates attribute), rectilinear and
+    rotated pole grids are supported
+    @param nc netCDF dataset
+    @param var netCDF variable, the last two dimensions are horizontal
+    @return dictionary with entries lats, lons, latCorners, lonCorners
+    """
+    latVar = _findCoord(nc, var, ('latitude',))
+    lonVar = _findCoord(nc, var, ('longitude',))
+    rlatVar = _findCoord(nc, var, ('grid_latitude',))
+    rlonVar = _findCoord(nc, var, ('grid_longitude',))
+
+    def getCorners(coordVar, axis=None):
+        if 'bounds' in coordVar.ncattrs():
+            bounds = nc.variables[coordVar.bounds][:]
+            if bounds.ndim == 3:
+                return getCornersFromBounds(bounds)
+            return numpy.append(bounds[:, 0], bounds[-1, 1])
+        return getCornersFromAxis(coordVar[:]) if coordVar.ndim == 1 else None
+
+    res = {}
+    if latVar is not None and lonVar is not None:
+        lats, lons = latVar[:], lonVar[:]
+        latCorners, lonCorners = getCorners(latVar), getCorners(lonVar)
+        if lats.ndim == 1:
+            lats, lons = numpy.meshgrid(lats, lons, indexing='ij')
+            latCorners, lonCorners = numpy.meshgrid(latCorners, lonCorners, indexing='ij')
+        res = {'lats': lats, 'lons': lons, 'latCorners': latCorners, 'lonCorners': lonCorners}
+    elif rlatVar is not None and rlonVar is not None:
+        mapping = nc.variables[var.grid_mapping]
+        poleLat = mapping.grid_north_pole_latitude
+        poleLon = mapping.grid_north_pole_longitude
+        rlats, rlons = numpy.meshgrid(rlatVar[:], rlonVar[:], indexing='ij')
+        res['lats'], res['lons'] = rotatedToGeographic(rlats, rlons, poleLat, poleLon)
+        rlats, rlons = numpy.meshgrid(getCorners(rlatVar), getCorners(rlonVar), indexing='ij')
+        res['latCorners'], res['lonCorners'] = rotatedToGeographic(rlats, rlons, poleLat, poleLon)
+    else:
+        raise ValueError('cannot find the latitudes/longitudes of {}'.format(var.name))
+
+    for k in res:
+        if res[k] is not None:
+            res[k] = numpy.asarray(res[k], numpy.float64)
+    return res
+
+
+def _getXyz(lats, lons):
+    lats = numpy.radians(numpy.asarray(lats, numpy.float64))
+    lons = numpy.radians(numpy.asarray(lons, numpy.float64))
+    return numpy.array([numpy.cos(lats)*numpy.cos(lons),
+                        numpy.cos(lats)*numpy.sin(lons),
+                        numpy.sin(lats)])
+
+
+def _getDistance(xyz0, xyz1):
+    return numpy.sqrt(((xyz0 - xyz1)**2).sum(axis=0))
+
+
+def _detectTopology(first, last, top, tol, requireDuplicate):
+    # first/last: xyz of the first/last node columns, top: xyz of the top node rows
+    numEdge = first.shape[2]
+    ni = top.shape[2]
+    res = {'seamNodes': None, 'foldRows': None, 'foldShift': None}
+
+    # duplicated seam columns: the last o columns are the first o ones
+    for o in range(1, numEdge + 1):
+        if _getDistance(last[:, :, numEdge - o:], first[:, :, :o]).max() < tol:
+            res['seamNodes'] = o
+            break
+    else:
+        if requireDuplicate:
+            return res
+        # closed without duplicate: the gap between the last and the first
+        # columns is an ordinary step, and the rows go once around the sphere
+        gap = _getDistance(last[:, :, -1], first[:, :, 0])
+        step = _getDistance(first[:, :, 1], first[:, :, 0])
+        lonRow = numpy.degrees(numpy.arctan2(top[1, 0, :], top[0, 0, :]))
+        dLons = (numpy.diff(numpy.append(lonRow, lonRow[0])) + 180.) % 360. - 180.
+        if numpy.all(gap < 1.5*step + tol) and abs(abs(dLons.sum()) - 360.) < 1.:
+            res['seamNodes'] = 0
+    if res['seamNodes'] is None:
+        return res
+
+    # north fold: the top row is the mirror image of the row k below, about a
+    # pivot column. A top row collapsed into a single point is a plain pole
+    n = ni - res['seamNodes']
+    row = top[:, -1, :n]
+    if _getDistance(row, row[:, :1]).max() < tol:
+        return res
+    for k in range(0, top.shape[1], 2):
+        other = top[:, -1 - k, :n]
+        for s in numpy.nonzero(_getDistance(other, row[:, :1]) < tol)[0]:
+            if _getDistance(row, other[:, (s - numpy.arange(n)) % n]).max() < tol:
+                res['foldRows'] = k // 2
+                res['foldShift'] = int(s)
+                return res
+    return res
+
+
+def getTopology(lats, lons, numEdge=3, tol=1.e-6, requireDuplicate=False):
+    """
+    Detect a periodic longitude seam and a tripolar north fold from the node
+    coordinates of a curvilinear grid. Only the edge columns and rows are read
+    @param lats 2D latitudes of the nodes (array or netCDF variable), degrees
+    @param lons 2D longitudes of the nodes (array or netCDF variable), degrees
+    @param numEdge max number of duplicated seam columns
+    @param tol distance below which two nodes coincide (unit sphere)
+    @param requireDuplicate only consider the grid periodic if the seam nodes
+                            are duplicated (cell data, the closing cells of a
+                            seam without duplicates would have no data)
+    @return dictionary with entries seamNodes (None if the grid is not periodic,
+            otherwise the number of trailing node columns duplicating the first
+            ones) and foldRows (None if there is no north fold, otherwise the
+            number of trailing node rows duplicated across the fold) and
+            foldShift (None if there is no north fold, otherwise s such that
+            node column i is mirrored onto column (s - i) modulo the number of
+            distinct columns across the fold)
+    """
+    nj, ni = lats.shape
+    w = min(numEdge, ni)
+    h = min(2*numEdge + 1, nj)
+    first = _getXyz(lats[:, 0:w], lons[:, 0:w])
+    last = _getXyz(lats[:, ni - w:ni], lons[:, ni - w:ni])
+    top = _getXyz(lats[nj - h:nj, :], lons[nj - h:nj, :])
+    return _detectTopology(first, last, top, tol, requireDuplicate)
+
+
+def getTopologyFromBounds(boundLats, boundLons, numEdge=3, tol=1.e-6, requireDuplicate=True,
+                          getCorners=getCornersFromBounds):
+    """
+    Same as getTopology, from CF cell bounds
+    @param boundLats latitude bounds (array or netCDF variable), shape (nj, ni, 4)
+    @param boundLons longitude bounds (array or netCDF variable), shape (nj, ni, 4)
+    @param numEdge max number of duplicated seam columns
+    @param tol distance below which two nodes coincide (unit sphere)
+    @param requireDuplicate see getTopology
+    @param getCorners function returning the corner points of bounds (vertex ordering)
+    @return dictionary, see getTopology. Counts refer to the nodes, i.e. the
+            corners of the cells
+    """
+    nj, ni = boundLats.shape[:2]
+    w = min(numEdge, ni)
+    h = min(2*numEdge, nj)
+    def getNodes(sj, si):
+        return _getXyz(getCorners(numpy.asarray(boundLats[sj, si, :])),
+                       getCorners(numpy.asarray(boundLons[sj, si, :])))
+    first = getNodes(slice(0, nj), slice(0, w))
+    last = getNodes(slice(0, nj), slice(ni - w, ni))
+    top = getNodes(slice(nj - h, nj), slice(0, ni))
+    return _detectTopology(first, last, top, tol, requireDuplicate)
+
+
+# bounded grid, no seam and no fold
+NO_TOPOLOGY = {'seamNodes': None, 'foldRows': None, 'foldShift': None}
+
+
+def getPeriodicCellDims(topology, nodeDims):
+    """
+    Get the number of cells of a grid once the duplicated seam columns and
+    fold rows are removed. In the periodic direction there are as many cells
+    as distinct nodes
+    @param topology dictionary returned by getTopology
+    @param nodeDims number of nodes (nj, ni) of the original grid
+    @return number of distinct cells (nj, ni)
+    """
+    nj, ni = nodeDims[0] - 1, nodeDims[1] - 1
+    if topology['seamNodes'] is not None:
+        ni = nodeDims[1] - topology['seamNodes']
+    if topology['foldRows'] is not None:
+        nj -= topology['foldRows']
+    return nj, ni
+
+
+def fillPeriodic(data, topology, cells=False):
+    """
+    Copy the values of the distinct points of a periodic grid into the
+    duplicated seam columns and fold rows, which are left out of the ESMF grids
+    @param data array of shape (..., nj, ni) on the whole original grid (or on
+                its top rows, from at least 2*foldRows + 2 rows below the top),
+                modified in place
+    @param topology dictionary returned by getTopology
+    @param cells True for cell data, False for node data
+    """
+    if topology['seamNodes'] is None:
+        return
+    nj, ni = data.shape[-2:]
+    # number of distinct columns
+    n = ni + (1 if cells else 0) - topology['seamNodes']
+    if topology['foldRows']:
+        # node row k + d mirrors node row k - 2 - d, where k is the number of
+        # distinct rows; cell row k + d spans the nodes mirrored by cell row k - 1 - d
+        k = nj - topology['foldRows']
+        cols = numpy.arange(n)
+        if cells:
+            srcCols, srcRow = (topology['foldShift'] - 1 - cols) % n, k - 1
+        else:
+            srcCols, srcRow = (topology['foldShift'] - cols) % n, k - 2
+        for d in range(topology['foldRows']):
+            data[..., k + d, :n] = data[..., srcRow - d, :][..., srcCols]
+    data[..., n:] = data[..., :ni - n]
@@ -0,0 +1,134 @@
+from __future__ import print_function, division
+import os
+import sys
+import argparse
+import subprocess
+import multiprocessing
+import numpy
+
+
+def getNumberOfNodeRanks(comm=None):
+    """
+    Get the number of ranks running on this node
+    @param comm MPI communicator (None for serial)
+    @return number of ranks sharing the node with this one (including this one)
+    """
+    if comm is None or comm.Get_size() == 1:
+        return 1
+    from mpi4py import MPI
+    nodeComm = comm.Split_type(MPI.COMM_TYPE_SHARED)
+    res = nodeComm.Get_size()
+    nodeComm.Free()
+    return res
+
+
+def getNumThreads(numThreads, comm=None):
+    """
+    Get the number of threads each rank should use
+    @param numThreads requested number of threads, 0 to share the cores of the
+                      node evenly between the ranks running on it
+    @param comm MPI communicator (None for serial)
+    @return number of threads, at least 1
+    """
+    if numThreads > 0:
+        return numThreads
+    return max(1, multiprocessing.cpu_count() // getNumberOfNodeRanks(comm))
+
+
+def getRowBlocks(numRows, numThreads, numBlocksPerThread=4):
+    """
+    Split the leading axis into blocks
+    @param numRows number of rows
+    @param numThreads number of threads
+    @param numBlocksPerThread number of blocks per thread (load balancing)
+    @return list of slices
+    """
+    bounds = numpy.unique(numpy.linspace(0, numRows, numThreads*numBlocksPerThread + 1).astype(numpy.int64))
+    return [slice(int(b), int(e)) for b, e in zip(bounds[:-1], bounds[1:])]
+
+
+def mapBlocks(func, blocks, numThreads):
+    """
+    Apply a function to blocks with a pool of threads. The numpy kernels
+    release the GIL, so threads run concurrently when func is dominated by
+    array operations
+    @param func function taking a block
+    @param blocks list of blocks
+    @param numThreads number of threads (1 to run in the calling thread)
+    @return list of results, in the order of the blocks
+    """
+    if numThreads <= 1 or len(blocks) <= 1:
+        return [func(b) for b in blocks]
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(min(numThreads, len(blocks)))
+    try:
+        return pool.map(func, blocks)
+    finally:
+        pool.close()
+
+
+def copyRows(dst, src, numThreads):
+    """
+    Copy an array into another one (e.g. into ESMF field data), threads
+    copying blocks of rows
+    @param dst destination array
+    @param src source array, same shape as dst
+    @param numThreads number of threads
+    """
+    def copy(sl):
+        dst[sl] = src[sl]
+    if numpy.ndim(dst) == 0:
+        dst[...] = src
+        return
+    mapBlocks(copy, getRowBlocks(dst.shape[0], numThreads), numThreads)
+
+
+def main():
+    from pyterp import timing
+
+    parser = argparse.ArgumentParser(description='Compare rank x thread splits of the cores of a node')
+    parser.add_argument('--driver', type=str, dest='driver', default='stats/esmf_conserve.py',
+                        help='MPI driver script supporting --num_threads and --timing_file')
+    parser.add_argument('--splits', type=str, dest='splits', default='36x1,18x2,12x3,6x6,4x9,2x18,1x36',
+                        help='Comma separated list of <ranks>x<threads>')
+    parser.add_argument('--mpiexec', type=str, dest='mpiexec', default='mpiexec',
+                        help='MPI launcher')
+    parser.add_argument('--csv', type=str, dest='csv', default='hybrid.csv',
+                        help='Output CSV file name')
+    parser.add_argument('driver_args', nargs=argparse.REMAINDER,
+                        help='Extra arguments passed to the driver (after --)')
+
+    args = parser.parse_args()
+    driverArgs = [a for a in args.driver_args if a != '--']
+
+    results = []
+    for split in args.splits.split(','):
+        numRanks, numThreads = [int(n) for n in split.split('x')]
+        timingFile = 'hybrid_{}x{}.csv'.format(numRanks, numThreads)
+        env = dict(os.environ)
+        # threads used by ESMF and the numerical libraries
+        env['OMP_NUM_THREADS'] = str(numThreads)
+        cmd = [args.mpiexec, '-n', str(numRanks), sys.executable, args.driver,
+               '--num_threads', str(numThreads), '--timing_file', timingFile] + driverArgs
+        print(' '.join(cmd))
+        subprocess.check_call(cmd, env=env)
+
+        table = timing.readReport(timingFile)
+        # the run time is set by the slowest rank of every phase
+        elapsed = sum(timing.getPhaseMaxima(table).values())
+        # all the ranks run on the node
+        memory = sum([row['peak_memory_bytes'] for row in table])
+        results.append((numRanks, numThreads, elapsed, memory))
+
+    print('{0:>6} {1:>8} {2:>12} {3:>16}'.format('ranks', 'threads', 'time sec', 'node memory GB'))
+    for numRanks, numThreads, elapsed, memory in results:
+        print('{0:>6} {1:>8} {2:>12.3g} {3:>16.3g}'.format(numRanks, numThreads, elapsed, memory/1.e9))
+
+    with open(args.csv, 'w') as f:
+        f.write('ranks,threads,time_sec,node_memory_bytes\n')
+        for numRanks, numThreads, elapsed, memory in results:
+            f.write('{},{},{:.6g},{:d}\n'.format(numRanks, numThreads, elapsed, int(memory)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+from __future__ import print_function, division
+import os
+import time
+import numpy
+
+PERCENTILES = (50., 90., 99., 99.9, 100.)
+
+
+def getPercentiles(numIters, percentiles=PERCENTILES):
+    """
+    Get percentiles of the number of iterations
+    @param numIters number of iterations of each point
+    @param percentiles percentiles to compute
+    @return array of values, one per percentile
+    """
+    return numpy.percentile(numpy.ravel(numIters), percentiles)
+
+
+def _getBlocks(values, shape, blockShape):
+    # pad with nans so that the blocks divide the grid
+    values = numpy.reshape(values, shape).astype(numpy.float64)
+    nj, ni = shape
+    bj, bi = blockShape
+    mj, mi = (nj + bj - 1)//bj, (ni + bi - 1)//bi
+    padded = numpy.full((mj*bj, mi*bi), numpy.nan)
+    padded[:nj, :ni] = values
+    return padded.reshape((mj, bj, mi, bi))
+
+
+def getHotSpotMap(numIters, shape, blockShape=(16, 16)):
+    """
+    Coarsen the iteration counts of a grid into blocks, to show where the
+    searches are expensive
+    @param numIters number of iterations of each destination point
+    @param shape destination grid dimensions (2D)
+    @param blockShape number of destination rows and columns per block
+    @return mean and max number of iterations of each block
+    """
+    blocks = _getBlocks(numIters, shape, blockShape)
+    return numpy.nanmean(blocks, axis=(1, 3)), numpy.nanmax(blocks, axis=(1, 3))
+
+
+def getBlockCentres(lats, lons, shape, blockShape=(16, 16)):
+    """
+    Get the centres of the hot spot blocks, the last blocks may be narrower
+    @param lats destination latitudes
+    @param lons destination longitudes
+    @param shape destination grid dimensions (2D)
+    @param blockShape number of destination rows and columns per block
+    @return mean latitude and longitude of each block
+    """
+    lats = _getBlocks(lats, shape, blockShape)
+    # circular mean, blocks across the dateline are not averaged to 0
+    lons = numpy.radians(_getBlocks(lons, shape, blockShape))
+    return numpy.nanmean(lats, axis=(1, 3)), numpy.degrees(numpy.arctan2(numpy.nanmean(numpy.sin(lons), axis=(1, 3)),
+                                                                         numpy.nanmean(numpy.cos(lons), axis=(1, 3))))
+
+
+def writeResults(resultsDir, runName, numIters, shape, nitermax, lats=None, lons=None,
+                 blockShape=(16, 16), plot=False):
+    """
+    Save the iteration analytics of a run: histogram, percentiles and hot
+    spot map, as CSV files (and optionally a PNG map), without any display
+    @param resultsDir directory holding the results
+    @param runName prefix of the file names
+    @param numIters number of iterations of each destination point
+    @param shape destination grid dimensions (2D)
+    @param nitermax max number of iterations of the run
+    @param lats destination latitudes (optional, block centres are saved)
+    @param lons destination longitudes (optional)
+    @param blockShape number of destination rows and columns per hot spot block
+    @param plot save a PNG of the hot spot map
+    @return list of file names
+    """
+    from pyterp import bilinear
+
+    prefix = os.path.join(resultsDir, runName)
+    filenames = []
+
+    edges, counts = bilinear.getIterationHistogram(numpy.ravel(numIters), nitermax)
+    filename = prefix + '_niters_hist.csv'
+    with open(filename, 'w') as f:
+        f.write('iter_min,iter_max,count\n')
+        for beg, end, count in zip(edges[:-1], edges[1:], counts):
+            f.write('{},{},{}\n'.format(beg, end - 1, count))
+    filenames.append(filename)
+
+    filename = prefix + '_niters_percentiles.csv'
+    with open(filename, 'w') as f:
+        f.write('percentile,iterations\n')
+        for p, v in zip(PERCENTILES, getPercentiles(numIters)):
+            f.write('{:g},{:.6g}\n'.format(p, v))
+        f.write('mean,{:.6g}\n'.format(numpy.mean(numIters)))
+    filenames.append(filename)
+
+    means, maxima = getHotSpotMap(numIters, shape, blockShape)
+    filename = prefix + '_niters_hotspots.csv'
+    with open(filename, 'w') as f:
+        cols = ['block_j', 'block_i', 'mean_iterations', 'max_iterations']
+        if lats is not None:
+            cols += ['lat', 'lon']
+            centres = getBlockCentres(lats, lons, shape, blockShape)
+        f.write(','.join(cols) + '\n')
+        for j in range(means.shape[0]):
+            for i in range(means.shape[1]):
+                values = [str(j), str(i), '{:.6g}'.format(means[j, i]), '{:.6g}'.format(maxima[j, i])]
+                if lats is not None:
+                    values += ['{:.6g}'.format(centres[0][j, i]), '{:.6g}'.format(centres[1][j, i])]
+                f.write(','.join(values) + '\n')
+    filenames.append(filename)
+
+    if plot:
+        import matplotlib
+        matplotlib.use('Agg')
+        from matplotlib import pylab
+        pylab.figure()
+        p = pylab.pcolor(maxima)
+        pylab.colorbar(p)
+        pylab.title('{} max number of iterations'.format(runName))
+        filename = prefix + '_niters_hotspots.png'
+        pylab.savefig(filename)
+        pylab.close()
+        filenames.append(filename)
+    return filenames
+
+
+def getBilinearSolver(srcLats, srcLons, dstLats, dstLons, stride=4, srcData=None, index=None):
+    """
+    Get a solver running the numpy bilinear locator on a subsampled
+    destination grid, for tune
+    @param srcLats source node latitudes (2D)
+    @param srcLons source node longitudes (2D)
+    @param dstLats destination latitudes (2D)
+    @param dstLons destination longitudes (2D)
+    @param stride subsampling of the destination rows and columns
+    @param srcData source field used to measure the accuracy (the latitudes
+                   if None)
+    @param index spatial_index.SpatialIndex of the source nodes (built if None)
+    @return function of (tolpos, nitermax) returning the interpolated
+            values, the valid mask and the number of iterations (flat arrays)
+    """
+    from pyterp import bilinear, spatial_index
+
+    if index is None:
+        index = spatial_index.SpatialIndex(srcLats, srcLons)
+    subLats = numpy.asarray(dstLats)[::stride, ::stride]
+    subLons = numpy.asarray(dstLons)[::stride, ::stride]
+    srcData = srcLats if srcData is None else srcData
+
+    def solve(tolpos, nitermax):
+        pj, pi, valid, numIters = bilinear.locate(srcLats, srcLons, subLats, subLons, nitermax=nitermax,
+                                                  tolpos=tolpos, index=index)
+        wgts = bilinear.getWeights(numpy.shape(srcLats), subLats.shape, pj, pi, valid)
+        return wgts.apply(srcData).ravel(), valid, numIters
+
+    return solve
+
+
+def tune(solve, tolposValues, nitermaxValues, maxError=numpy.inf, maxInvalidFraction=0.):
+    """
+    Pick the cheapest tolpos/nitermax settings meeting an accuracy and an
+    invalid point budget. The accuracy is measured against the tightest
+    settings (smallest tolpos, largest nitermax)
+    @param solve function of (tolpos, nitermax) returning the interpolated
+                 values, the valid mask and the number of iterations of
+                 each point, typically on a subsampled destination grid
+                 (see getBilinearSolver)
+    @param tolposValues tolpos values to try
+    @param nitermaxValues nitermax values to try
+    @param maxError max mean absolute difference with the reference values
+    @param maxInvalidFraction max fraction of the points not found, on top of
+                              those the reference does not find
+    @return best (tolpos, nitermax) pair (the reference if no other setting
+            meets the budget), and a list of (tolpos, nitermax, cost, time,
+            invalid fraction, error) tuples. The cost is the total number of
+            iterations, which does not depend on the machine load
+    """
+    refTolpos, refNitermax = min(tolposValues), max(nitermaxValues)
+    refValues, refValid, refIters = solve(refTolpos, refNitermax)
+    refValues, refValid = numpy.ravel(refValues), numpy.ravel(refValid)
+
+    results = []
+    best = (refTolpos, refNitermax)
+    bestCost = numpy.sum(refIters)
+    for tolpos in tolposValues:
+        for nitermax in nitermaxValues:
+            tic = time.time()
+            values, valid, numIters = solve(tolpos, nitermax)
+            elapsed = time.time() - tic
+            values, valid = numpy.ravel(values), numpy.ravel(valid)
+            cost = numpy.sum(numIters)
+            both = valid & refValid
+            error = numpy.abs(values[both] - refValues[both]).mean() if both.any() else 0.
+            invalid = numpy.count_nonzero(refValid & ~valid) / float(valid.size)
+            results.append((tolpos, nitermax, cost, elapsed, invalid, error))
+            if error <= maxError and invalid <= maxInvalidFraction and cost < bestCost:
+                best, bestCost = (tolpos, nitermax), cost
+    return best, results
+
+
+def printTuning(best, results):
+    """
+    Print the settings tried by tune
+    @param best selected (tolpos, nitermax) pair
+    @param results list returned by tune
+    """
+    print('{0:>10} {1:>10} {2:>12} {3:>10} {4:>10} {5:>10}'.format('tolpos', 'nitermax', 'iterations',
+                                                                    'sec', 'invalid', 'error'))
+    for tolpos, nitermax, cost, elapsed, invalid, error in results:
+        print('{0:>10.3g} {1:>10} {2:>12} {3:>10.3g} {4:>10.3g} {5:>10.3g}{6}'.format(
+              tolpos, nitermax, cost, elapsed, invalid, error, ' *' if (tolpos, nitermax) == best else ''))
+
+
+def writeTuning(resultsDir, runName, best, results):
+    """
+    Save the settings tried by tune as a CSV file
+    @param resultsDir directory holding the results
+    @param runName prefix of the file name
+    @param best selected (tolpos, nitermax) pair
+    @param results list returned by tune
+    @return file name
+    """
+    filename = os.path.join(resultsDir, runName + '_tuning.csv')
+    with open(filename, 'w') as f:
+        f.write('tolpos,nitermax,iterations,sec,invalid_fraction,error,selected\n')
+        for tolpos, nitermax, cost, elapsed, invalid, error in results:
+            f.write('{:g},{},{},{:.6g},{:.6g},{:.6g},{}\n'.format(tolpos, nitermax, cost, elapsed, invalid, error,
+                                                                 int((tolpos, nitermax) == best)))
+    return filename
+
+
+def parseValues(text, dtype):
+    """
+    Parse a comma separated list of values
+    @param text string, e.g. '1.e-8,1.e-6'
+    @param dtype type of the values, e.g. float
+    @return list of values
+    """
+    return [dtype(v) for v in text.split(',') if v.strip()]
@@ -0,0 +1,122 @@
+from __future__ import print_function, division
+from ctypes import byref, c_int, c_double, c_char_p, POINTER
+import numpy
+
+
+def _toBytes(s):
+    return s.encode('utf-8') if not isinstance(s, bytes) else s
+
+
+class LibcfData(object):
+
+    def __init__(self, lats, lons, data, prefix, fieldname, standardName='', units='',
+                 fillValue=None, validMask=None, levels=None):
+        """
+        Constructor, create libcf coordinates, grid and data objects that use
+        the numpy buffers directly (save = 0). The arrays are kept alive
+        until the libcf objects are freed, and the data array is the one
+        libcf reads from (source) or writes to (destination)
+        @param lats 2D latitudes of the grid nodes
+        @param lons 2D longitudes of the grid nodes
+        @param data nodal data, masked values are replaced by fillValue
+        @param prefix prefix of the grid name, e.g. 'src'
+        @param fieldname name of the data
+        @param standardName CF standard name of the data
+        @param units units of the data
+        @param fillValue fill value (libcf's default if None)
+        @param validMask array, 1 where the source grid nodes are valid (optional)
+        @param levels 1D depths of a layered grid (optional), the grid is then
+                      3D with dimensions (level, y, x) and so is the data
+        """
+        import pycf
+        self._nccf = pycf.nccf
+        self._noErr = pycf.NC_NOERR
+        self.coordIds = []
+        self.gridId = None
+        self.dataId = None
+
+        # no copy if the arrays are already contiguous doubles
+        self.lats = numpy.ascontiguousarray(lats, numpy.float64)
+        self.lons = numpy.ascontiguousarray(lons, numpy.float64)
+        self.depths = None
+        if levels is not None:
+            # libcf coordinates span all the grid dimensions
+            shape = (len(levels),) + self.lats.shape
+            self.lats = numpy.ascontiguousarray(numpy.broadcast_to(self.lats, shape))
+            self.lons = numpy.ascontiguousarray(numpy.broadcast_to(self.lons, shape))
+            self.depths = numpy.ascontiguousarray(numpy.broadcast_to(
+                numpy.asarray(levels, numpy.float64)[:, None, None], shape))
+        fillValue = pycf.NC_FILL_DOUBLE if fillValue is None else fillValue
+        if numpy.ma.is_masked(data):
+            data = numpy.ma.filled(data, fillValue)
+        self.data = numpy.ascontiguousarray(numpy.ma.getdata(data), numpy.float64)
+        self.validMask = None
+        if validMask is not None:
+            self.validMask = numpy.ascontiguousarray(validMask, numpy.int32)
+
+        # libcf keeps pointers to the numpy buffers
+        save = 0
+        ndims = self.lats.ndim
+        dims = (c_int * ndims)(*self.lats.shape)
+        self._dimNames = (c_char_p * ndims)(*(b'z', b'y', b'x')[-ndims:])
+        if self.depths is not None:
+            coordId = c_int()
+            self._check(self._nccf.nccf_def_coord(ndims, dims, self._dimNames,
+                                                  self.depths.ctypes.data_as(POINTER(c_double)), save,
+                                                  b'depth', b'depth', b'm', byref(coordId)), 'nccf_def_coord')
+            self.coordIds.append(coordId.value)
+        for name, coords in ('lat', self.lats), ('lon', self.lons):
+            coordId = c_int()
+            func = getattr(self._nccf, 'nccf_def_{}_coord'.format(name))
+            self._check(func(ndims, dims, self._dimNames, coords.ctypes.data_as(POINTER(c_double)),
+                             save, byref(coordId)), 'nccf_def_{}_coord'.format(name))
+            self.coordIds.append(coordId.value)
+
+        gridId = c_int()
+        coordIds = (c_int * ndims)(*self.coordIds)
+        self._check(self._nccf.nccf_def_grid(coordIds, _toBytes(prefix) + b'grid', byref(gridId)),
+                    'nccf_def_grid')
+        self.gridId = gridId
+
+        dataId = c_int()
+        self._check(self._nccf.nccf_def_data(gridId, _toBytes(fieldname), _toBytes(standardName),
+                                             _toBytes(units), None, byref(dataId)), 'nccf_def_data')
+        self.dataId = dataId
+        self._check(self._nccf.nccf_set_data_double(dataId, self.data.ctypes.data_as(POINTER(c_double)),
+                                                    save, c_double(fillValue)), 'nccf_set_data_double')
+
+        if self.validMask is not None:
+            self._check(self._nccf.nccf_set_grid_validmask(gridId, self.validMask.ctypes.data_as(POINTER(c_int))),
+                        'nccf_set_grid_validmask')
+
+    def _check(self, ier, funcName):
+        if ier != self._noErr:
+            self.free()
+            raise RuntimeError('{} failed with error {}'.format(funcName, ier))
+
+    def free(self):
+        """
+        Free the libcf objects, can be called more than once
+        """
+        if self.dataId is not None:
+            self._nccf.nccf_free_data(self.dataId)
+            self.dataId = None
+        if self.gridId is not None:
+            self._nccf.nccf_free_grid(self.gridId)
+            self.gridId = None
+        for coordId in self.coordIds:
+            self._nccf.nccf_free_coord(coordId)
+        self.coordIds = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.free()
+
+    def __del__(self):
+        # the libcf module may already be gone at interpreter exit
+        try:
+            self.free()
+        except Exception:
+            pass
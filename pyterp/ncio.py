@@ -0,0 +1,391 @@
+from __future__ import print_function, division
+import os
+import argparse
+import numpy
+
+
+def getSlabIndices(var, gridRank=2):
+    """
+    Get the index tuples of all the horizontal slabs of a variable
+    @param var netCDF variable (or array) of shape (..., grid dims)
+    @param gridRank number of trailing grid dimensions
+    @return list of index tuples into the leading (time, level, ...) dimensions
+    """
+    return list(numpy.ndindex(*var.shape[:len(var.shape) - gridRank]))
+
+
+def getFillValue(var, default=None):
+    """
+    Get the fill value of a netCDF variable
+    @param var netCDF variable
+    @param default value returned if no fill/missing value is set
+    @return fill value
+    """
+    for name in '_FillValue', 'missing_value':
+        if name in var.ncattrs():
+            return var.getncattr(name)
+    return default
+
+
+def createOutputVariable(ncOut, srcVar, dstShape, name=None, dimNames=None,
+                         dtype=None, fillValue=None):
+    """
+    Create a variable that has the leading dimensions and attributes of a
+    source variable but lives on the destination grid
+    @param ncOut netCDF dataset open for writing
+    @param srcVar source netCDF variable
+    @param dstShape destination grid shape
+    @param name output variable name (defaults to the source name)
+    @param dimNames names of the destination grid dimensions
+    @param dtype output type (defaults to the source type)
+    @param fillValue output fill value (defaults to the source fill value)
+    @return netCDF variable
+    """
+    gridRank = len(dstShape)
+    if name is None:
+        name = srcVar.name
+    if dimNames is None:
+        dimNames = ['dst_n{}'.format(i) for i in range(gridRank)]
+    if dtype is None:
+        dtype = srcVar.dtype
+    if fillValue is None:
+        fillValue = getFillValue(srcVar)
+
+    srcDims = srcVar.get_dims() if hasattr(srcVar, 'get_dims') else \
+              [srcVar.group().dimensions[d] for d in srcVar.dimensions]
+    leadDims = srcDims[:len(srcDims) - gridRank]
+    for d in leadDims:
+        if d.name not in ncOut.dimensions:
+            ncOut.createDimension(d.name, None if d.isunlimited() else len(d))
+    for dimName, n in zip(dimNames, dstShape):
+        if dimName not in ncOut.dimensions:
+            ncOut.createDimension(dimName, n)
+
+    dims = tuple([d.name for d in leadDims] + list(dimNames))
+    var = ncOut.createVariable(name, dtype, dims, fill_value=fillValue)
+    for attName in srcVar.ncattrs():
+        if attName not in ('_FillValue', 'missing_value'):
+            var.setncattr(attName, srcVar.getncattr(attName))
+    if fillValue is not None and 'missing_value' in srcVar.ncattrs():
+        var.setncattr('missing_value', numpy.array(fillValue, var.dtype))
+    return var
+
+
+def getComm(comm=None):
+    """
+    Get the communicator of the parallel reads and writes
+    @param comm MPI communicator, or None
+    @return comm if given, otherwise MPI.COMM_WORLD when mpi4py is available
+            and None if it is not (serial)
+    """
+    if comm is None:
+        try:
+            from mpi4py import MPI
+            comm = MPI.COMM_WORLD
+        except ImportError:
+            pass
+    return comm
+
+
+def _hasParallelSupport():
+    import netCDF4
+    return getattr(netCDF4, '__has_parallel4_support__', False) or \
+           getattr(netCDF4, '__has_pnetcdf_support__', False)
+
+
+def openDataset(filename, comm=None):
+    """
+    Open a netCDF file for reading. When netCDF4 was built with parallel
+    support and more than one MPI rank is running, the file is opened with
+    MPI-IO and all its variables are set to collective access, so every rank
+    must then read the same variables in the same order
+    @param filename file name (str or bytes)
+    @param comm MPI communicator (defaults to MPI.COMM_WORLD when mpi4py is available)
+    @return netCDF4.Dataset instance
+    """
+    import netCDF4
+    if isinstance(filename, bytes):
+        filename = filename.decode('UTF-8')
+    comm = getComm(comm)
+    if _hasParallelSupport() and comm is not None and comm.Get_size() > 1:
+        try:
+            nc = netCDF4.Dataset(filename, 'r', parallel=True, comm=comm)
+            for var in nc.variables.values():
+                var.set_collective(True)
+            return nc
+        except (IOError, OSError, RuntimeError, ValueError):
+            # e.g. netCDF-3 file without PnetCDF, each rank reads independently
+            pass
+    return netCDF4.Dataset(filename, 'r')
+
+
+def readSlab(var, index, slices):
+    """
+    Read the hyperslab of a variable on a local grid window
+    @param var netCDF variable of shape (..., grid dims)
+    @param index index tuple into the leading (time, level, ...) dimensions,
+                 truncated or padded with zeros to the number of leading dimensions
+    @param slices tuple of slices, one per grid dimension
+    @return array (masked if the variable has missing values)
+    """
+    numLead = var.ndim - len(slices)
+    index = (tuple(index) + (0,)*numLead)[:numLead]
+    return var[index + tuple(slices)]
+
+
+def _getOutputVariableNames(nc, var):
+    names = [var.name]
+    for n in getattr(var, 'coordinates', '').split() + list(var.dimensions):
+        if n in nc.variables and n not in names:
+            names.append(n)
+            bounds = getattr(nc.variables[n], 'bounds', None)
+            if bounds in nc.variables and bounds not in names:
+                names.append(bounds)
+    return names
+
+
+def writeField(filename, templateFile, name, data, slices=None, comm=None, index=None):
+    """
+    Write a field into a new file, copying the dimensions, attributes and
+    coordinate variables of the variable with the same name in a template
+    file. Under MPI each rank writes its own window of the grid, collectively
+    into the shared file when netCDF4 has parallel support, otherwise into a
+    tile file <root>_<rank><ext> (see gatherTiles)
+    @param filename output file name
+    @param templateFile file holding the variable on the same grid (str or bytes)
+    @param name variable name
+    @param data local array, masked values are written as fill values
+    @param slices local window, one slice per grid (trailing) dimension
+                  (defaults to the whole grid)
+    @param comm MPI communicator (defaults to MPI.COMM_WORLD when mpi4py is available)
+    @param index index tuple into the leading (time, level, ...) dimensions
+                 of the single slab held by data, truncated or padded with
+                 zeros as in readSlab. The output keeps these dimensions with
+                 length one (defaults to data covering all the leading dimensions)
+    @return name of the file written by this rank
+    """
+    import netCDF4
+    comm = getComm(comm)
+    numProcs = comm.Get_size() if comm is not None else 1
+
+    ncIn = openDataset(templateFile, comm)
+    var = ncIn.variables[name]
+    leadWindow = {}
+    if index is not None:
+        numLead = var.ndim - numpy.ndim(data)
+        index = (tuple(index) + (0,)*numLead)[:numLead]
+        leadWindow = dict(zip(var.dimensions[:numLead], [slice(i, i + 1) for i in index]))
+        data = data.reshape((1,)*numLead + data.shape)
+    if slices is None:
+        slices = ()
+    gridDims = var.dimensions[var.ndim - len(slices):]
+    window = dict(zip(gridDims, slices))
+
+    ncOut = None
+    isParallel, isTile = False, False
+    if numProcs > 1 and _hasParallelSupport():
+        try:
+            ncOut = netCDF4.Dataset(filename, 'w', parallel=True, comm=comm, format='NETCDF4')
+            isParallel = True
+        except (IOError, OSError, RuntimeError, ValueError):
+            ncOut = None
+    if ncOut is None and numProcs > 1:
+        filename = getTileFileName(filename, comm.Get_rank())
+        isTile = True
+    if ncOut is None:
+        ncOut = netCDF4.Dataset(filename, 'w')
+
+    if isTile:
+        ncOut.tile_dimensions = ' '.join(gridDims)
+        ncOut.tile_offsets = numpy.array([window[d].indices(len(ncIn.dimensions[d]))[0]
+                                          for d in gridDims], numpy.int64)
+        ncOut.tile_global_sizes = numpy.array([len(ncIn.dimensions[d]) for d in gridDims], numpy.int64)
+
+    for n in _getOutputVariableNames(ncIn, var):
+        v = ncIn.variables[n]
+        # the slab of the leading dimensions is read from the template and
+        # written at the start of the output dimensions of length one
+        readIndex = tuple(window.get(d, leadWindow.get(d, slice(None))) for d in v.dimensions)
+        writeIndex = tuple(slice(0, 1) if d in leadWindow else window.get(d, slice(None))
+                           for d in v.dimensions)
+        for d, sl in zip(v.dimensions, writeIndex):
+            if d not in ncOut.dimensions:
+                dim = ncIn.dimensions[d]
+                size = len(dim)
+                if d in leadWindow:
+                    size = 1
+                elif isTile and d in window:
+                    size = len(range(*sl.indices(size)))
+                ncOut.createDimension(d, None if dim.isunlimited() else size)
+        fillValue = getFillValue(v)
+        if n == name and fillValue is None and numpy.ma.isMaskedArray(data):
+            # the same on all the ranks, whatever their local mask
+            fillValue = netCDF4.default_fillvals[v.dtype.str[1:]]
+        out = ncOut.createVariable(n, v.dtype, v.dimensions, fill_value=fillValue)
+        for attName in v.ncattrs():
+            if attName != '_FillValue':
+                out.setncattr(attName, v.getncattr(attName))
+        if isParallel:
+            out.set_collective(True)
+        values = data if n == name else v[readIndex]
+        if isTile:
+            out[:] = values
+        else:
+            out[writeIndex] = values
+    ncOut.close()
+    ncIn.close()
+    return filename
+
+
+def fillPeriodic(filename, writtenFile, name, topology, cells=False, comm=None):
+    """
+    Fill the duplicated seam columns and fold rows of a field written by
+    writeField from the distinct points they duplicate, which are generally
+    written by other ranks. Collective, call it after gatherTiles. When the
+    tiles were left to be stitched later, the topology is only recorded in
+    each tile and stitchTiles fills the assembled file
+    @param filename output file name given to writeField
+    @param writtenFile file name returned by gatherTiles
+    @param name variable name
+    @param topology dictionary returned by grids.getTopology
+    @param cells True for cell data, False for node data
+    @param comm MPI communicator (defaults to MPI.COMM_WORLD when mpi4py is available)
+    """
+    import netCDF4
+    if topology['seamNodes'] is None:
+        return
+    if writtenFile != filename:
+        nc = netCDF4.Dataset(writtenFile, 'a')
+        nc.periodic_variable = name
+        nc.periodic_cells = int(cells)
+        nc.periodic_seam_nodes = topology['seamNodes']
+        if topology['foldRows'] is not None:
+            nc.periodic_fold_rows = topology['foldRows']
+            nc.periodic_fold_shift = topology['foldShift']
+        nc.close()
+        return
+    comm = getComm(comm)
+    if comm is not None:
+        comm.Barrier()
+    if comm is None or comm.Get_rank() == 0:
+        _fillPeriodicFile(filename, name, topology, cells)
+    if comm is not None:
+        comm.Barrier()
+
+
+def _fillPeriodicFile(filename, name, topology, cells):
+    # only the fold rows and the seam columns are read and written
+    import netCDF4
+    from pyterp import grids
+    nc = netCDF4.Dataset(filename, 'a')
+    var = nc.variables[name]
+    nj, ni = var.shape[-2:]
+    if topology['foldRows']:
+        # the fold rows mirror the rows just below them
+        j0 = max(0, nj - 2*topology['foldRows'] - 2)
+        rows = var[..., j0:, :]
+        grids.fillPeriodic(rows, topology, cells)
+        var[..., j0:, :] = rows
+    numSeam = topology['seamNodes'] - (1 if cells else 0)
+    if numSeam > 0:
+        var[..., ni - numSeam:] = var[..., :numSeam]
+    nc.close()
+
+
+def getTileFileName(filename, rank):
+    """
+    Get the name of the tile file written by a rank
+    @param filename output file name
+    @param rank MPI rank
+    @return <root>_<rank><ext>
+    """
+    root, ext = os.path.splitext(filename)
+    return '{}_{}{}'.format(root, rank, ext or '.nc')
+
+
+def gatherTiles(filename, writtenFile, comm=None, stitch=False):
+    """
+    Wait for all the ranks to have written their tile files. With stitch, the
+    tiles are then assembled into the output file on rank 0 and removed,
+    otherwise they are left for stitchTiles (python -m pyterp.ncio), so that
+    no single rank reads and writes the whole field. Collective, nothing is
+    done when the ranks wrote the output file directly
+    @param filename output file name given to writeField
+    @param writtenFile file name returned by writeField
+    @param comm MPI communicator (defaults to MPI.COMM_WORLD when mpi4py is available)
+    @param stitch assemble the tiles on rank 0
+    @return output file name if it holds the whole field, otherwise the tile
+            file of this rank
+    """
+    if writtenFile == filename:
+        return filename
+    comm = getComm(comm)
+    comm.Barrier()
+    if not stitch:
+        return writtenFile
+    if comm.Get_rank() == 0:
+        tileFiles = [getTileFileName(filename, rank) for rank in range(comm.Get_size())]
+        stitchTiles(filename, tileFiles)
+        for tileFile in tileFiles:
+            os.remove(tileFile)
+    comm.Barrier()
+    return filename
+
+
+def stitchTiles(filename, tileFiles):
+    """
+    Assemble the tile files written by writeField into a single file, holding
+    one tile in memory at a time. The duplicated seam and fold points recorded
+    by fillPeriodic are then filled
+    @param filename output file name
+    @param tileFiles tile file names, in any order
+    """
+    import netCDF4
+    ncOut = None
+    periodic = None
+    for tileFile in tileFiles:
+        nc = netCDF4.Dataset(tileFile, 'r')
+        dimNames = nc.tile_dimensions.split()
+        offsets = dict(zip(dimNames, numpy.atleast_1d(nc.tile_offsets)))
+        if ncOut is None:
+            if 'periodic_variable' in nc.ncattrs():
+                topology = {'seamNodes': int(nc.periodic_seam_nodes),
+                            'foldRows': int(getattr(nc, 'periodic_fold_rows', -1)),
+                            'foldShift': int(getattr(nc, 'periodic_fold_shift', -1))}
+                if topology['foldRows'] < 0:
+                    topology['foldRows'] = topology['foldShift'] = None
+                periodic = (nc.periodic_variable, topology, bool(nc.periodic_cells))
+            sizes = dict(zip(dimNames, numpy.atleast_1d(nc.tile_global_sizes)))
+            ncOut = netCDF4.Dataset(filename, 'w')
+            for d in nc.dimensions.values():
+                ncOut.createDimension(d.name, None if d.isunlimited() else int(sizes.get(d.name, len(d))))
+            for v in nc.variables.values():
+                out = ncOut.createVariable(v.name, v.dtype, v.dimensions,
+                                           fill_value=getattr(v, '_FillValue', None))
+                for attName in v.ncattrs():
+                    if attName != '_FillValue':
+                        out.setncattr(attName, v.getncattr(attName))
+        for v in nc.variables.values():
+            index = tuple(slice(offsets[d], offsets[d] + len(nc.dimensions[d])) if d in offsets
+                          else slice(None) for d in v.dimensions)
+            ncOut.variables[v.name][index] = v[:]
+        nc.close()
+    if ncOut is not None:
+        ncOut.close()
+    if periodic is not None:
+        _fillPeriodicFile(filename, periodic[0], periodic[1], periodic[2])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Assemble the tile files written by ranks without parallel netCDF')
+    parser.add_argument('--out_file', type=str, dest='out_file', default='out.nc',
+                        help='Output file name')
+    parser.add_argument('tile_files', type=str, nargs='+',
+                        help='Tile file names, e.g. out_*.nc')
+
+    args = parser.parse_args()
+    stitchTiles(args.out_file, args.tile_files)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+from __future__ import print_function, division
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+
+def parseOutput(text):
+    """
+    Extract the weight computation time and the number of unmapped destination
+    points from the output of a driver
+    @param text driver standard output
+    @return weights time (sec), number of unmapped points (None if not found)
+    """
+    weights, unmapped = float('nan'), None
+    # first column of the phase report is the time of the slowest rank
+    m = re.search(r'^\s*weights\s+([\d\.eE\+\-]+)', text, re.MULTILINE)
+    if m:
+        weights = float(m.group(1))
+    m = re.search(r'dst: ntot: (\d+) valid: (\d+)', text)
+    if m:
+        unmapped = int(m.group(1)) - int(m.group(2))
+    return weights, unmapped
+
+
+def printTopology(filename, latName, lonName):
+    """
+    Print the topology detected from the node coordinates of a grid file
+    @param filename netCDF file name
+    @param latName name of the latitude variable
+    @param lonName name of the longitude variable
+    """
+    import netCDF4
+    from pyterp import grids
+
+    nc = netCDF4.Dataset(filename, 'r')
+    latVar, lonVar = nc.variables[latName], nc.variables[lonName]
+    topology = grids.getTopology(latVar, lonVar)
+    print('{}: nodes {} seam nodes {} fold rows {} cells {}'.format(
+          filename, latVar.shape, topology['seamNodes'], topology['foldRows'],
+          grids.getPeriodicCellDims(topology, latVar.shape)))
+    nc.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the ESMF drivers with and without the periodic grid setup')
+    parser.add_argument('--drivers', type=str, dest='drivers', default='big/esmf_interp.py,rotated_pole/esmf_interp.py',
+                        help='Comma separated list of driver scripts supporting --periodic, run from their directory')
+    parser.add_argument('--nprocs', type=int, dest='nprocs', default=1,
+                        help='Number of ranks (drivers run without mpiexec if 1)')
+    parser.add_argument('--mpiexec', type=str, dest='mpiexec', default='mpiexec',
+                        help='MPI launcher')
+    parser.add_argument('--grid', type=str, dest='grid', default='',
+                        help='Only print the topology detected in this grid file')
+    parser.add_argument('--lat', type=str, dest='lat', default='lat',
+                        help='Latitude node variable of --grid')
+    parser.add_argument('--lon', type=str, dest='lon', default='lon',
+                        help='Longitude node variable of --grid')
+    parser.add_argument('--csv', type=str, dest='csv', default='periodicity.csv',
+                        help='Output CSV file name')
+    parser.add_argument('driver_args', nargs=argparse.REMAINDER,
+                        help='Extra arguments passed to every driver (after --)')
+
+    args = parser.parse_args()
+    if args.grid:
+        printTopology(args.grid, args.lat, args.lon)
+        return
+    driverArgs = [a for a in args.driver_args if a != '--']
+
+    results = []
+    for driver in args.drivers.split(','):
+        workDir = os.path.dirname(os.path.abspath(driver))
+        for periodic in 'none', 'auto':
+            cmd = [sys.executable, os.path.basename(driver), '--periodic', periodic] + driverArgs
+            if args.nprocs > 1:
+                cmd = [args.mpiexec, '-n', str(args.nprocs)] + cmd
+            print(' '.join(cmd))
+            output = subprocess.check_output(cmd, cwd=workDir)
+            weights, unmapped = parseOutput(output.decode('utf-8', 'replace'))
+            results.append((driver, periodic, weights, unmapped))
+
+    print('{0:<32} {1:>8} {2:>12} {3:>10}'.format('driver', 'periodic', 'weights sec', 'unmapped'))
+    for driver, periodic, weights, unmapped in results:
+        print('{0:<32} {1:>8} {2:>12.3g} {3:>10}'.format(driver, periodic, weights, unmapped))
+
+    with open(args.csv, 'w') as f:
+        f.write('driver,periodic,weights_sec,unmapped\n')
+        for driver, periodic, weights, unmapped in results:
+            f.write('{},{},{:.6g},{}\n'.format(driver, periodic, weights, '' if unmapped is None else unmapped))
+
+
+if __name__ == '__main__':
+    main()
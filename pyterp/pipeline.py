@@ -0,0 +1,192 @@
+from __future__ import print_function, division
+import threading
+import time
+import sys
+import argparse
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue # python2
+
+# marks the end of the slab stream
+_END = None
+
+
+class Pipeline(object):
+
+    def __init__(self, weights, reader, writer, queueDepth=2, numThreads=1, fillValue=0.0):
+        """
+        Constructor
+        @param weights SparseWeights instance
+        @param reader function taking a slab index and returning the source slab
+        @param writer function taking a slab index and the destination slab
+        @param queueDepth max number of slabs waiting between two stages
+        @param numThreads number of threads applying the weights
+        @param fillValue value set on destination points that have no weights
+        """
+        self.weights = weights
+        self.reader = reader
+        self.writer = writer
+        self.queueDepth = queueDepth
+        self.numThreads = numThreads
+        self.fillValue = fillValue
+
+        self.busy = {'read': 0.0, 'apply': 0.0, 'write': 0.0}
+        self.workers = {'read': 1, 'apply': numThreads, 'write': 1}
+        self.wallTime = float('nan')
+        self.errors = []
+        self.lock = threading.Lock()
+
+    def _addBusy(self, stage, dt):
+        with self.lock:
+            self.busy[stage] += dt
+
+    def _read(self, slabIndices, inQueue):
+        try:
+            for index in slabIndices:
+                tic = time.time()
+                slab = self.reader(index)
+                self._addBusy('read', time.time() - tic)
+                inQueue.put((index, slab))
+        except Exception:
+            self.errors.append(sys.exc_info())
+        finally:
+            for i in range(self.numThreads):
+                inQueue.put(_END)
+
+    def _apply(self, inQueue, outQueue):
+        while True:
+            item = inQueue.get()
+            if item is _END:
+                outQueue.put(_END)
+                return
+            if self.errors:
+                # drain the queue so the reader can finish
+                continue
+            try:
+                index, slab = item
+                tic = time.time()
+                result = self.weights.apply(slab, fillValue=self.fillValue)
+                self._addBusy('apply', time.time() - tic)
+                outQueue.put((index, result))
+            except Exception:
+                self.errors.append(sys.exc_info())
+
+    def _write(self, outQueue):
+        numEnds = 0
+        while numEnds < self.numThreads:
+            item = outQueue.get()
+            if item is _END:
+                numEnds += 1
+                continue
+            if self.errors:
+                continue
+            try:
+                index, result = item
+                tic = time.time()
+                self.writer(index, result)
+                self._addBusy('write', time.time() - tic)
+            except Exception:
+                self.errors.append(sys.exc_info())
+
+    def run(self, slabIndices):
+        """
+        Read, regrid and write all the slabs, the three stages running concurrently
+        @param slabIndices list of slab indices passed to the reader and writer
+        """
+        inQueue = queue.Queue(maxsize=self.queueDepth)
+        outQueue = queue.Queue(maxsize=self.queueDepth)
+
+        threads = [threading.Thread(target=self._read, args=(slabIndices, inQueue))]
+        threads += [threading.Thread(target=self._apply, args=(inQueue, outQueue))
+                    for i in range(self.numThreads)]
+        threads.append(threading.Thread(target=self._write, args=(outQueue,)))
+
+        tic = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.wallTime = time.time() - tic
+
+        if self.errors:
+            excType, excValue, excTraceback = self.errors[0]
+            raise excValue
+
+    def getUtilization(self):
+        """
+        Get the fraction of the wall clock time each stage was busy, the stage
+        with the highest utilization is the one limiting the throughput
+        @return dictionary stage: utilization
+        """
+        return dict([(stage, self.busy[stage] / (self.workers[stage] * self.wallTime))
+                     for stage in self.busy])
+
+    def printStats(self):
+        """
+        Print the per stage busy times and utilization
+        """
+        utilization = self.getUtilization()
+        print('pipeline stats (queue depth {} apply threads {}):'.format(self.queueDepth,
+                                                                          self.numThreads))
+        for stage in 'read', 'apply', 'write':
+            print('\t{0:<32} {1:>.3g} sec {2:>6.1f}% busy'.format(stage, self.busy[stage],
+                                                                  100*utilization[stage]))
+        print('\t{0:<32} {1:>.3g} sec'.format('wall', self.wallTime))
+        bottleneck = max(utilization, key=utilization.get)
+        print('\tlimiting stage: {}'.format(bottleneck))
+
+
+def main():
+    import netCDF4
+    from pyterp import weights, ncio
+
+    parser = argparse.ArgumentParser(description='Regrid all the slabs of a field with cached weights')
+    parser.add_argument('--weights', type=str, dest='weights', default='weights.nc',
+                        help='Weights file name')
+    parser.add_argument('--src_file', type=str, dest='src_file', default='src.nc',
+                        help='Source data file name')
+    parser.add_argument('--src_field', type=str, dest='src_field', default='cellData',
+                        help='Source data field name')
+    parser.add_argument('--dst_file', type=str, dest='dst_file', default='regridded.nc',
+                        help='Output file name')
+    parser.add_argument('--queue_depth', type=int, dest='queue_depth', default=2,
+                        help='Max number of slabs waiting between two stages')
+    parser.add_argument('--num_threads', type=int, dest='num_threads', default=1,
+                        help='Number of threads applying the weights')
+
+    args = parser.parse_args()
+
+    tic = time.time()
+    wgts = weights.load(args.weights)
+    print('loading weights: {:.3g} sec'.format(time.time() - tic))
+
+    ncIn = netCDF4.Dataset(args.src_file, 'r')
+    ncOut = netCDF4.Dataset(args.dst_file, 'w')
+    srcVar = ncIn.variables[args.src_field]
+    fillValue = ncio.getFillValue(srcVar, default=0.0)
+    dstVar = ncio.createOutputVariable(ncOut, srcVar, wgts.dstShape, fillValue=fillValue)
+
+    # the netCDF library is not thread safe, reads and writes are serialized
+    ioLock = threading.Lock()
+
+    def reader(index):
+        with ioLock:
+            return srcVar[index]
+
+    def writer(index, result):
+        with ioLock:
+            dstVar[index] = result
+
+    pipeline = Pipeline(wgts, reader, writer, queueDepth=args.queue_depth,
+                        numThreads=args.num_threads, fillValue=fillValue)
+    pipeline.run(ncio.getSlabIndices(srcVar, gridRank=len(wgts.srcShape)))
+    pipeline.printStats()
+
+    ncOut.close()
+    ncIn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+from __future__ import print_function, division
+import os
+import sys
+import argparse
+import subprocess
+from collections import OrderedDict
+import numpy
+
+
+def getWeakDims(dims, nprocs):
+    """
+    Scale the node dimensions of a grid so that its number of cells grows
+    linearly with the number of procs
+    @param dims node dimensions (nj, ni) for one proc
+    @param nprocs number of procs
+    @return node dimensions
+    """
+    factor = numpy.sqrt(nprocs)
+    return tuple(int(round((n - 1)*factor)) + 1 for n in dims)
+
+
+def getScaling(nprocs, times, mode):
+    """
+    Compute the speedup and the parallel efficiency relative to the smallest run
+    @param nprocs numbers of procs
+    @param times corresponding run times
+    @param mode 'strong' (fixed problem size) or 'weak' (problem size proportional
+                to the number of procs)
+    @return speedups, efficiencies (arrays)
+    """
+    nprocs = numpy.asarray(nprocs, numpy.float64)
+    times = numpy.asarray(times, numpy.float64)
+    p0, t0 = nprocs[0], times[0]
+    if mode == 'strong':
+        speedups = t0 / times
+        efficiencies = speedups * p0 / nprocs
+    else:
+        # scaled speedup, the work grows with the number of procs
+        efficiencies = t0 / times
+        speedups = efficiencies * nprocs / p0
+    return speedups, efficiencies
+
+
+def summarize(nprocs, tables):
+    """
+    Summarize the per rank timing tables of a series of runs
+    @param nprocs numbers of procs
+    @param tables per rank tables as returned by timing.readReport, one per run
+    @return list of phase names, and for every run an ordered dictionary with
+            the time of every phase (slowest rank), the total time and the max
+            and summed peak memory of the ranks
+    """
+    from pyterp import timing
+
+    phases = []
+    rows = []
+    for p, table in zip(nprocs, tables):
+        maxima = timing.getPhaseMaxima(table)
+        phases += [name for name in maxima if name not in phases]
+        row = OrderedDict([('nprocs', p)])
+        row.update(maxima)
+        row['total'] = sum(maxima.values())
+        memory = [r['peak_memory_bytes'] for r in table]
+        row['max_rank_memory_bytes'] = max(memory)
+        row['total_memory_bytes'] = sum(memory)
+        rows.append(row)
+    return phases, rows
+
+
+def writeCsv(filename, phases, rows, speedups, efficiencies, dims=None):
+    """
+    Save the scaling results
+    @param filename CSV file name
+    @param phases phase names
+    @param rows per run summaries, see summarize
+    @param speedups speedup of each run
+    @param efficiencies parallel efficiency of each run
+    @param dims list of grid node dimensions (src and/or dst) of each run (optional)
+    """
+    cols = ['nprocs'] + phases + ['total', 'speedup', 'efficiency',
+                                  'max_rank_memory_bytes', 'total_memory_bytes']
+    if dims is not None:
+        cols.append('dims')
+    f = open(filename, 'w')
+    f.write(','.join(cols) + '\n')
+    for i, row in enumerate(rows):
+        values = [str(row['nprocs'])] + ['{:.6g}'.format(row.get(name, 0.0)) for name in phases + ['total']]
+        values += ['{:.4g}'.format(speedups[i]), '{:.4g}'.format(efficiencies[i]),
+                   str(int(row['max_rank_memory_bytes'])), str(int(row['total_memory_bytes']))]
+        if dims is not None:
+            values.append(' '.join(['x'.join([str(n) for n in d]) for d in dims[i]]))
+        f.write(','.join(values) + '\n')
+    f.close()
+
+
+def plot(filename, phases, rows, speedups, efficiencies, mode, title=''):
+    """
+    Plot the speedup, the efficiency, the phase times and the memory
+    @param filename image file name
+    @param phases phase names
+    @param rows per run summaries, see summarize
+    @param speedups speedup of each run
+    @param efficiencies parallel efficiency of each run
+    @param mode 'strong' or 'weak'
+    @param title plot title
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pylab
+
+    nprocs = [row['nprocs'] for row in rows]
+    pylab.figure(figsize=(10, 8))
+
+    pylab.subplot(2, 2, 1)
+    pylab.plot(nprocs, speedups, 'ko', nprocs, speedups, 'b-')
+    pylab.plot(nprocs, numpy.array(nprocs, numpy.float64)/nprocs[0], 'k--')
+    pylab.xlabel('number of procs')
+    pylab.ylabel('scaled speedup' if mode == 'weak' else 'speedup')
+
+    pylab.subplot(2, 2, 2)
+    pylab.plot(nprocs, efficiencies, 'ko', nprocs, efficiencies, 'b-')
+    pylab.plot(nprocs, numpy.ones(len(nprocs)), 'k--')
+    pylab.ylim(0., 1.1*max(1., max(efficiencies)))
+    pylab.xlabel('number of procs')
+    pylab.ylabel('efficiency')
+
+    pylab.subplot(2, 2, 3)
+    for name in phases:
+        pylab.loglog(nprocs, [max(row.get(name, 0.0), 1.e-6) for row in rows], 'o-')
+    pylab.legend(phases, loc='best', fontsize='small')
+    pylab.xlabel('number of procs')
+    pylab.ylabel('time [sec]')
+
+    pylab.subplot(2, 2, 4)
+    pylab.plot(nprocs, [row['max_rank_memory_bytes']/1.e9 for row in rows], 'ro-')
+    pylab.plot(nprocs, [row['total_memory_bytes']/1.e9 for row in rows], 'bs-')
+    pylab.legend(['max per rank', 'all ranks'], loc='best')
+    pylab.xlabel('number of procs')
+    pylab.ylabel('peak memory [GB]')
+
+    pylab.suptitle(title or '{} scaling'.format(mode))
+    pylab.savefig(filename)
+
+
+def main():
+    from pyterp import timing
+
+    parser = argparse.ArgumentParser(description='Strong and weak scaling of an MPI driver on the local machine')
+    parser.add_argument('--driver', type=str, dest='driver', default='rotated_pole/esmf_conserve.py',
+                        help='MPI driver script supporting --timing_file, run from its directory')
+    parser.add_argument('--nprocs', type=str, dest='nprocs', default='1,2,4,8',
+                        help='Comma separated list of numbers of procs')
+    parser.add_argument('--mode', type=str, dest='mode', default='strong', choices=['strong', 'weak'],
+                        help='Fixed grids (strong) or grids growing with the number of procs (weak)')
+    parser.add_argument('--generator', type=str, dest='generator', default='',
+                        help='Script generating the grids in the driver directory, e.g. rotated_pole/generate_field.py '
+                             '(the existing files are used if empty)')
+    parser.add_argument('--src_dims', type=str, dest='src_dims', default='',
+                        help='Source grid node dimensions nj,ni passed to the generator (per proc in weak mode)')
+    parser.add_argument('--dst_dims', type=str, dest='dst_dims', default='',
+                        help='Destination grid node dimensions nj,ni passed to the generator (per proc in weak mode)')
+    parser.add_argument('--mpiexec', type=str, dest='mpiexec', default='mpiexec',
+                        help='MPI launcher')
+    parser.add_argument('--csv', type=str, dest='csv', default='scaling.csv',
+                        help='Output CSV file name')
+    parser.add_argument('--plot', type=str, dest='plot', default='scaling.png',
+                        help='Output plot file name (no plot if empty)')
+    parser.add_argument('driver_args', nargs=argparse.REMAINDER,
+                        help='Extra arguments passed to the driver (after --)')
+
+    args = parser.parse_args()
+    driverArgs = [a for a in args.driver_args if a != '--']
+    if args.mode == 'weak' and not args.generator:
+        print('ERROR: weak scaling needs a grid generator')
+        parser.print_help()
+        sys.exit(1)
+
+    workDir = os.path.dirname(os.path.abspath(args.driver))
+    driver = os.path.basename(args.driver)
+    generator = os.path.abspath(args.generator) if args.generator else ''
+    srcDims = tuple(int(n) for n in args.src_dims.split(',')) if args.src_dims else None
+    dstDims = tuple(int(n) for n in args.dst_dims.split(',')) if args.dst_dims else None
+
+    def generate(p):
+        genArgs = []
+        dims = []
+        for prefix, d in ('src', srcDims), ('dst', dstDims):
+            if d is None:
+                continue
+            if args.mode == 'weak':
+                d = getWeakDims(d, p)
+            genArgs += ['--{}_nj'.format(prefix), str(d[0]), '--{}_ni'.format(prefix), str(d[1])]
+            dims.append(d)
+        cmd = [sys.executable, generator] + genArgs
+        print(' '.join(cmd))
+        subprocess.check_call(cmd, cwd=workDir)
+        return dims
+
+    nprocs = [int(n) for n in args.nprocs.split(',')]
+    tables = []
+    allDims = []
+    dims = []
+    if generator and args.mode == 'strong':
+        dims = generate(nprocs[0])
+    for p in nprocs:
+        if generator and args.mode == 'weak':
+            dims = generate(p)
+        allDims.append(dims)
+        timingFile = os.path.join(workDir, 'scaling_{}_{}.csv'.format(args.mode, p))
+        cmd = [args.mpiexec, '-n', str(p), sys.executable, driver, '--timing_file', timingFile] + driverArgs
+        print(' '.join(cmd))
+        subprocess.check_call(cmd, cwd=workDir)
+        tables.append(timing.readReport(timingFile))
+
+    phases, rows = summarize(nprocs, tables)
+    speedups, efficiencies = getScaling(nprocs, [row['total'] for row in rows], args.mode)
+
+    print('{0:>8} {1:>12} {2:>10} {3:>10} {4:>16}'.format('nprocs', 'total sec', 'speedup',
+                                                          'efficiency', 'max rank GB'))
+    for row, s, e in zip(rows, speedups, efficiencies):
+        print('{0:>8} {1:>12.3g} {2:>10.2f} {3:>10.2f} {4:>16.3g}'.format(row['nprocs'], row['total'], s, e,
+                                                                         row['max_rank_memory_bytes']/1.e9))
+
+    writeCsv(args.csv, phases, rows, speedups, efficiencies, dims=allDims if generator else None)
+    if args.plot:
+        plot(args.plot, phases, rows, speedups, efficiencies, args.mode,
+             title='{} {} scaling'.format(args.driver, args.mode))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+from __future__ import print_function, division
+import os
+import json
+import time
+import socket
+import argparse
+import threading
+from collections import OrderedDict
+import numpy
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver # python2
+
+
+class WeightsCache(object):
+
+    def __init__(self, weightsDir, maxEntries=8):
+        """
+        Constructor
+        @param weightsDir directory holding the <name>.nc weights files
+        @param maxEntries max number of weight sets kept in memory
+        """
+        self.weightsDir = weightsDir
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.numLoads = 0
+
+    def get(self, name):
+        """
+        Get a weight set, loading it if needed and evicting the least
+        recently used one if the cache is full
+        @param name weights name
+        @return SparseWeights instance
+        """
+        from pyterp import weights
+        with self.lock:
+            if name in self.entries:
+                wgts = self.entries.pop(name)
+            else:
+                if os.path.basename(name) != name:
+                    raise ValueError('invalid weights name {}'.format(name))
+                wgts = weights.load(os.path.join(self.weightsDir, name + '.nc'))
+                self.numLoads += 1
+                while len(self.entries) >= self.maxEntries:
+                    self.entries.popitem(last=False)
+            # most recently used last
+            self.entries[name] = wgts
+            return wgts
+
+
+class RegridService(object):
+
+    def __init__(self, cache):
+        """
+        Constructor
+        @param cache WeightsCache instance
+        """
+        self.cache = cache
+
+    def regrid(self, name, srcData):
+        """
+        Regrid a field. NaN values mark missing data, both in the input and
+        in the output
+        @param name weights name
+        @param srcData source array, trailing dimensions are the source grid
+        @return destination array
+        """
+        wgts = self.cache.get(name)
+        srcData = numpy.ma.masked_invalid(srcData)
+        return wgts.apply(srcData, fillValue=numpy.nan)
+
+
+def _sendMessage(wfile, header, array=None):
+    if array is not None:
+        array = numpy.ascontiguousarray(array)
+        header.update({'dtype': array.dtype.str, 'shape': list(array.shape), 'nbytes': array.nbytes})
+    wfile.write((json.dumps(header) + '\n').encode('utf-8'))
+    if array is not None:
+        wfile.write(array.tobytes())
+    wfile.flush()
+
+
+def _receiveMessage(rfile):
+    line = rfile.readline()
+    if not line:
+        return None, None
+    header = json.loads(line.decode('utf-8'))
+    array = None
+    if 'nbytes' in header:
+        buf = rfile.read(header['nbytes'])
+        array = numpy.frombuffer(buf, numpy.dtype(header['dtype'])).reshape(header['shape'])
+    return header, array
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        # several requests can be sent over one connection
+        while True:
+            header, srcData = _receiveMessage(self.rfile)
+            if header is None:
+                return
+            try:
+                dstData = self.server.service.regrid(header['weights'], srcData)
+                _sendMessage(self.wfile, {'status': 'ok'}, dstData)
+            except Exception as e:
+                _sendMessage(self.wfile, {'status': 'error', 'message': str(e)})
+
+
+class RegridServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, socketPath, service):
+        """
+        Constructor
+        @param socketPath Unix socket file name
+        @param service RegridService instance
+        """
+        if os.path.exists(socketPath):
+            os.remove(socketPath)
+        socketserver.UnixStreamServer.__init__(self, socketPath, _RequestHandler)
+        self.service = service
+
+
+class RegridClient(object):
+
+    def __init__(self, socketPath):
+        """
+        Constructor
+        @param socketPath Unix socket file name of a running server
+        """
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socketPath)
+        self.rfile = self.sock.makefile('rb')
+        self.wfile = self.sock.makefile('wb')
+
+    def regrid(self, name, srcData):
+        """
+        Regrid a field on the server
+        @param name weights name
+        @param srcData source array, NaN marks missing values
+        @return destination array
+        """
+        _sendMessage(self.wfile, {'weights': name}, srcData)
+        header, dstData = _receiveMessage(self.rfile)
+        if header['status'] != 'ok':
+            raise RuntimeError(header['message'])
+        return dstData
+
+    def close(self):
+        self.rfile.close()
+        self.wfile.close()
+        self.sock.close()
+
+
+class LocalClient(object):
+
+    def __init__(self, service):
+        """
+        Constructor, stand-in for RegridClient calling the service in process
+        @param service RegridService instance
+        """
+        self.service = service
+
+    def regrid(self, name, srcData):
+        return self.service.regrid(name, numpy.asarray(srcData))
+
+    def close(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Regrid server keeping the weights in memory')
+    parser.add_argument('--weights_dir', type=str, dest='weights_dir', default='.',
+                        help='Directory holding the <name>.nc weights files')
+    parser.add_argument('--socket', type=str, dest='socket', default='/tmp/pyterp.sock',
+                        help='Unix socket file name')
+    parser.add_argument('--max_entries', type=int, dest='max_entries', default=8,
+                        help='Max number of weight sets kept in memory')
+    parser.add_argument('--test', type=str, dest='test', default='',
+                        help='Send a random field to a running server using these weights and exit')
+
+    args = parser.parse_args()
+
+    if args.test:
+        from pyterp import weights
+        wgts = weights.load(os.path.join(args.weights_dir, args.test + '.nc'))
+        srcData = numpy.random.rand(*wgts.srcShape)
+        client = RegridClient(args.socket)
+        for i in range(3):
+            tic = time.time()
+            client.regrid(args.test, srcData)
+            print('request {}: {:.3g} sec'.format(i, time.time() - tic))
+        client.close()
+        return
+
+    server = RegridServer(args.socket, RegridService(WeightsCache(args.weights_dir, args.max_entries)))
+    print('serving on {}'.format(args.socket))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    main()
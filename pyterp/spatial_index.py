@@ -0,0 +1,186 @@
+from __future__ import print_function, division
+import os
+import hashlib
+import numpy
+
+
+def getBucketIds(xyz, numBins):
+    """
+    Get the buckets of points on the unit sphere. The sphere is split into the
+    six faces of a cube, each face into numBins x numBins buckets of about
+    equal area (equiangular projection)
+    @param xyz Cartesian coordinates, shape (3, n)
+    @param numBins number of buckets along each edge of a face
+    @return face, row and column bucket indices
+    """
+    absXyz = numpy.abs(xyz)
+    axis = numpy.argmax(absXyz, axis=0)
+    n = xyz.shape[1]
+    major = xyz[axis, numpy.arange(n)]
+    face = 2*axis + (major < 0)
+    # the two other coordinates, projected on the face
+    u = xyz[(axis + 1) % 3, numpy.arange(n)] / numpy.abs(major)
+    v = xyz[(axis + 2) % 3, numpy.arange(n)] / numpy.abs(major)
+    bu = numpy.clip(((numpy.arctan(u)*4./numpy.pi + 1.)*0.5*numBins).astype(numpy.int64), 0, numBins - 1)
+    bv = numpy.clip(((numpy.arctan(v)*4./numpy.pi + 1.)*0.5*numBins).astype(numpy.int64), 0, numBins - 1)
+    return face, bu, bv
+
+
+class SpatialIndex(object):
+
+    def __init__(self, lats, lons, pointsPerBucket=2, order=None, starts=None, numBins=None):
+        """
+        Constructor, bucket the points (e.g. grid nodes or cell centres)
+        @param lats point latitudes, degrees
+        @param lons point longitudes, degrees
+        @param pointsPerBucket target average number of points per bucket
+        @param order, starts, numBins saved buckets (see load), the buckets are
+                                      built if None
+        """
+        from pyterp import grids
+        self.shape = numpy.shape(lats)
+        self.xyz = grids._getXyz(numpy.ravel(lats), numpy.ravel(lons))
+        numPoints = self.xyz.shape[1]
+        if order is not None:
+            self.order, self.starts, self.numBins = order, starts, numBins
+            return
+
+        self.numBins = int(max(1, numpy.sqrt(numPoints / (6.*pointsPerBucket))))
+        ids = self._getFlatIds(*getBucketIds(self.xyz, self.numBins))
+        # points sorted by bucket, CSR like
+        self.order = numpy.argsort(ids, kind='mergesort').astype(numpy.int64)
+        counts = numpy.bincount(ids, minlength=6*self.numBins**2)
+        self.starts = numpy.concatenate(([0], numpy.cumsum(counts))).astype(numpy.int64)
+
+    def _getFlatIds(self, face, bu, bv):
+        return (face*self.numBins + bu)*self.numBins + bv
+
+    def query(self, lats, lons, maxPerBucket=8):
+        """
+        Find a nearby point for each target, the closest among the points of
+        the target's bucket and of its eight neighbours on the same face
+        @param lats target latitudes
+        @param lons target longitudes
+        @param maxPerBucket max number of points of a bucket that are compared
+        @return flat indices of the points, -1 where no point is nearby
+        """
+        from pyterp import grids
+        xyz = grids._getXyz(numpy.ravel(lats), numpy.ravel(lons))
+        face, bu, bv = getBucketIds(xyz, self.numBins)
+        n = xyz.shape[1]
+
+        best = numpy.full((n,), -1, numpy.int64)
+        bestDist = numpy.full((n,), numpy.inf)
+        for du in -1, 0, 1:
+            for dv in -1, 0, 1:
+                ids = self._getFlatIds(face, numpy.clip(bu + du, 0, self.numBins - 1),
+                                       numpy.clip(bv + dv, 0, self.numBins - 1))
+                beg, end = self.starts[ids], self.starts[ids + 1]
+                for k in range(maxPerBucket):
+                    has = numpy.nonzero(beg + k < end)[0]
+                    if len(has) == 0:
+                        break
+                    points = self.order[beg[has] + k]
+                    dist = ((self.xyz[:, points] - xyz[:, has])**2).sum(axis=0)
+                    closer = (dist < bestDist[has])
+                    best[has[closer]] = points[closer]
+                    bestDist[has[closer]] = dist[closer]
+        return best
+
+    def getCandidateCells(self, lats, lons):
+        """
+        Find a candidate cell for each target, the index must have been built
+        on the nodes of a 2D grid. Of the cells around the nearest node, the
+        one whose centre is closest to the target is chosen
+        @param lats target latitudes
+        @param lons target longitudes
+        @return row and column cell indices, -1 where no node is nearby
+        """
+        from pyterp import grids
+        nj, ni = self.shape
+        nodes = self.query(lats, lons)
+        found = (nodes >= 0)
+        nodes = numpy.maximum(nodes, 0)
+        xyz = grids._getXyz(numpy.ravel(lats), numpy.ravel(lons))
+        xyzNodes = self.xyz.reshape((3, nj, ni))
+
+        bestJ = numpy.zeros(nodes.shape, numpy.int64)
+        bestI = numpy.zeros(nodes.shape, numpy.int64)
+        bestDist = numpy.full(nodes.shape, numpy.inf)
+        for dj in -1, 0:
+            for di in -1, 0:
+                j = numpy.clip(nodes // ni + dj, 0, nj - 2)
+                i = numpy.clip(nodes % ni + di, 0, ni - 2)
+                centre = (xyzNodes[:, j, i] + xyzNodes[:, j + 1, i] +
+                          xyzNodes[:, j, i + 1] + xyzNodes[:, j + 1, i + 1])/4.
+                dist = ((centre - xyz)**2).sum(axis=0)
+                closer = (dist < bestDist)
+                bestJ[closer], bestI[closer], bestDist[closer] = j[closer], i[closer], dist[closer]
+        return numpy.where(found, bestJ, -1), numpy.where(found, bestI, -1)
+
+    def save(self, filename):
+        """
+        Save the buckets in a netCDF file
+        @param filename file name
+        """
+        import netCDF4
+        nc = netCDF4.Dataset(filename, 'w')
+        nc.createDimension('n_points', len(self.order))
+        nc.createDimension('n_buckets_plus_one', len(self.starts))
+        nc.createVariable('order', 'i8', ('n_points',))[:] = self.order
+        nc.createVariable('starts', 'i8', ('n_buckets_plus_one',))[:] = self.starts
+        nc.num_bins = self.numBins
+        nc.close()
+
+
+def load(filename, lats, lons):
+    """
+    Load the buckets saved by SpatialIndex.save
+    @param filename file name
+    @param lats point latitudes the index was built on
+    @param lons point longitudes the index was built on
+    @return SpatialIndex instance
+    """
+    import netCDF4
+    nc = netCDF4.Dataset(filename, 'r')
+    order = numpy.asarray(nc.variables['order'][:], numpy.int64)
+    starts = numpy.asarray(nc.variables['starts'][:], numpy.int64)
+    numBins = int(nc.num_bins)
+    nc.close()
+    if len(order) != numpy.size(lats):
+        raise ValueError('{} does not match the grid: {} points instead of {}'.format(filename, len(order),
+                                                                                       numpy.size(lats)))
+    return SpatialIndex(lats, lons, order=order, starts=starts, numBins=numBins)
+
+
+def getIndexFileName(cacheDir, lats, lons):
+    """
+    Get the name of the file caching the index of a grid, derived from a hash
+    of its coordinates
+    @param cacheDir directory holding the cached files (e.g. the weights)
+    @param lats point latitudes
+    @param lons point longitudes
+    @return file name
+    """
+    digest = hashlib.sha1()
+    for coords in lats, lons:
+        coords = numpy.ascontiguousarray(coords, numpy.float64)
+        digest.update(str(coords.shape).encode('utf-8'))
+        digest.update(coords.tobytes())
+    return os.path.join(cacheDir, 'index_{}.nc'.format(digest.hexdigest()[:16]))
+
+
+def loadOrBuild(cacheDir, lats, lons):
+    """
+    Load the index of a grid, building and saving it first if needed
+    @param cacheDir directory holding the cached files
+    @param lats point latitudes
+    @param lons point longitudes
+    @return SpatialIndex instance
+    """
+    filename = getIndexFileName(cacheDir, lats, lons)
+    if os.path.exists(filename):
+        return load(filename, lats, lons)
+    index = SpatialIndex(lats, lons)
+    index.save(filename)
+    return index
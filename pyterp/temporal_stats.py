@@ -0,0 +1,213 @@
+from __future__ import print_function, division
+import os
+import time
+import argparse
+import numpy
+
+
+class RunningStats(object):
+
+    def __init__(self, shape):
+        """
+        Constructor
+        @param shape shape of the (destination) grid
+        """
+        self.shape = tuple(shape)
+        self.numSlabs = 0
+        self.count = numpy.zeros(self.shape, numpy.int64)
+        self.mean = numpy.zeros(self.shape, numpy.float64)
+        self.m2 = numpy.zeros(self.shape, numpy.float64)
+        self.min = numpy.full(self.shape, numpy.inf)
+        self.max = numpy.full(self.shape, -numpy.inf)
+        # identifies the run the statistics belong to, see save
+        self.runInfo = {}
+
+    def update(self, data, valid=None):
+        """
+        Add one slab to the statistics (Welford's algorithm)
+        @param data array of size shape
+        @param valid optional boolean array, False where data should be ignored
+        """
+        data = numpy.asarray(data, numpy.float64)
+        if valid is None:
+            valid = numpy.isfinite(data)
+        self.count += valid
+        delta = numpy.where(valid, data - self.mean, 0.0)
+        self.mean += numpy.where(valid, delta / numpy.maximum(self.count, 1), 0.0)
+        self.m2 += numpy.where(valid, delta * (data - self.mean), 0.0)
+        numpy.fmin(self.min, numpy.where(valid, data, numpy.inf), out=self.min)
+        numpy.fmax(self.max, numpy.where(valid, data, -numpy.inf), out=self.max)
+        self.numSlabs += 1
+
+    def merge(self, other):
+        """
+        Combine with the statistics accumulated over another set of slabs
+        (Chan et al. pairwise update)
+        @param other RunningStats instance on the same grid
+        """
+        count = self.count + other.count
+        n = numpy.maximum(count, 1)
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / n
+        self.m2 += other.m2 + delta**2 * self.count * other.count / n
+        self.count = count
+        numpy.fmin(self.min, other.min, out=self.min)
+        numpy.fmax(self.max, other.max, out=self.max)
+        self.numSlabs += other.numSlabs
+
+    def getVariance(self, ddof=1):
+        """
+        Get the variance
+        @param ddof delta degrees of freedom (1 for the sample variance)
+        @return variance, NaN where there are not enough valid slabs
+        """
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            return numpy.where(self.count > ddof, self.m2 / (self.count - ddof), numpy.nan)
+
+    def save(self, filename):
+        """
+        Checkpoint the accumulators and runInfo (as global attributes). The
+        file is written aside and then renamed, so that a run killed while
+        saving leaves the previous checkpoint intact
+        @param filename netCDF file name
+        """
+        import netCDF4
+        tmpFilename = filename + '.tmp'
+        nc = netCDF4.Dataset(tmpFilename, 'w')
+        dimNames = ['n{}'.format(i) for i in range(len(self.shape))]
+        for dimName, n in zip(dimNames, self.shape):
+            nc.createDimension(dimName, n)
+        for name in 'count', 'mean', 'm2', 'min', 'max':
+            array = getattr(self, name)
+            nc.createVariable(name, array.dtype, dimNames)[:] = array
+        nc.setncatts(self.runInfo)
+        nc.numSlabs = self.numSlabs
+        nc.close()
+        os.rename(tmpFilename, filename)
+
+
+def load(filename):
+    """
+    Restart from a checkpoint
+    @param filename netCDF file name written by RunningStats.save
+    @return RunningStats instance
+    """
+    import netCDF4
+    nc = netCDF4.Dataset(filename, 'r')
+    stats = RunningStats(nc.variables['mean'].shape)
+    for name in 'count', 'mean', 'm2', 'min', 'max':
+        setattr(stats, name, numpy.asarray(nc.variables[name][:]))
+    stats.numSlabs = int(nc.numSlabs)
+    stats.runInfo = dict([(a, nc.getncattr(a)) for a in nc.ncattrs() if a != 'numSlabs'])
+    nc.close()
+    return stats
+
+
+def main():
+    import netCDF4
+    from pyterp import weights, ncio
+
+    parser = argparse.ArgumentParser(description='Time statistics of a regridded field, one slab at a time')
+    parser.add_argument('--weights', type=str, dest='weights', default='weights.nc',
+                        help='Weights file name')
+    parser.add_argument('--src_file', type=str, dest='src_file', default='src.nc',
+                        help='Source data file name')
+    parser.add_argument('--src_field', type=str, dest='src_field', default='cellData',
+                        help='Source data field name')
+    parser.add_argument('--dst_file', type=str, dest='dst_file', default='stats.nc',
+                        help='Output file name')
+    parser.add_argument('--checkpoint', type=str, dest='checkpoint', default='stats_checkpoint.nc',
+                        help='Checkpoint file name, the run resumes from it if it exists')
+    parser.add_argument('--checkpoint_every', type=int, dest='checkpoint_every', default=100,
+                        help='Number of slabs between checkpoints')
+
+    args = parser.parse_args()
+
+    timeStats = {
+        'read': 0.0,
+        'evaluation': 0.0,
+        'statistics': 0.0,
+        'checkpoint': 0.0,
+    }
+
+    wgts = weights.load(args.weights)
+    validRows = wgts.getValidRows().reshape(wgts.dstShape)
+
+    nc = netCDF4.Dataset(args.src_file, 'r')
+    srcVar = nc.variables[args.src_field]
+    slabIndices = ncio.getSlabIndices(srcVar, gridRank=len(wgts.srcShape))
+
+    # a checkpoint is only resumed by the run that wrote it
+    runInfo = {
+        'srcFile': os.path.abspath(args.src_file),
+        'srcField': args.src_field,
+        'weightsFile': os.path.abspath(args.weights),
+        'totalSlabs': len(slabIndices),
+    }
+    stats = None
+    if os.path.exists(args.checkpoint):
+        stats = load(args.checkpoint)
+        if stats.shape != wgts.dstShape or stats.runInfo != runInfo or stats.numSlabs > len(slabIndices):
+            print('ignoring checkpoint {}, it belongs to another run'.format(args.checkpoint))
+            stats = None
+        else:
+            print('resuming after {} slabs'.format(stats.numSlabs))
+    if stats is None:
+        stats = RunningStats(wgts.dstShape)
+        stats.runInfo = runInfo
+
+    dstData = numpy.empty(wgts.dstShape, numpy.float64)
+    for index in slabIndices[stats.numSlabs:]:
+        tic = time.time()
+        srcData = srcVar[index]
+        timeStats['read'] += time.time() - tic
+
+        tic = time.time()
+        wgts.apply(srcData, dstData, fillValue=numpy.nan)
+        timeStats['evaluation'] += time.time() - tic
+
+        tic = time.time()
+        stats.update(dstData, validRows & numpy.isfinite(dstData))
+        timeStats['statistics'] += time.time() - tic
+
+        if stats.numSlabs % args.checkpoint_every == 0:
+            tic = time.time()
+            stats.save(args.checkpoint)
+            timeStats['checkpoint'] += time.time() - tic
+    nc.close()
+
+    # write the results
+    ncOut = netCDF4.Dataset(args.dst_file, 'w')
+    dimNames = ['dst_n{}'.format(i) for i in range(len(wgts.dstShape))]
+    for dimName, n in zip(dimNames, wgts.dstShape):
+        ncOut.createDimension(dimName, n)
+    fillValue = netCDF4.default_fillvals['f8']
+    noData = stats.count == 0
+    results = {
+        'mean': stats.mean,
+        'variance': stats.getVariance(),
+        'min': stats.min,
+        'max': stats.max,
+    }
+    for name, array in results.items():
+        var = ncOut.createVariable('{}_{}'.format(args.src_field, name), 'f8', dimNames,
+                                   fill_value=fillValue)
+        var[:] = numpy.ma.masked_where(noData | ~numpy.isfinite(array), array)
+    ncOut.createVariable('{}_count'.format(args.src_field), 'i4', dimNames)[:] = stats.count
+    ncOut.numSlabs = stats.numSlabs
+    ncOut.close()
+    # the run is complete
+    if os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    print('number of slabs: {}'.format(stats.numSlabs))
+    totTime = 0.0
+    print('time stats:')
+    for k, v in timeStats.items():
+        print('\t{0:<32} {1:>.3g} sec'.format(k, v))
+        totTime += v
+    print('\t{0:<32} {1:>.3g} sec'.format('total', totTime))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+from __future__ import print_function, division
+import time
+import argparse
+import numpy
+
+
+def createBilinearLikeWeights(srcShape, dstShape):
+    """
+    Create weights with the sparsity of bilinear interpolation, each
+    destination point using the four nodes of a random source cell
+    @param srcShape source grid shape
+    @param dstShape destination grid shape
+    @return SparseWeights instance
+    """
+    from pyterp import weights
+    numDst = dstShape[0] * dstShape[1]
+    js = numpy.random.randint(0, srcShape[0] - 1, numDst)
+    iis = numpy.random.randint(0, srcShape[1] - 1, numDst)
+    corners = [(0, 0), (0, 1), (1, 1), (1, 0)]
+    rows = numpy.repeat(numpy.arange(numDst), 4)
+    cols = numpy.array([(js + dj)*srcShape[1] + iis + di for dj, di in corners]).T.ravel()
+    wgts = numpy.random.rand(numDst, 4)
+    wgts /= wgts.sum(axis=1)[:, numpy.newaxis]
+    return weights.SparseWeights(rows, cols, wgts.ravel(), srcShape, dstShape)
+
+
+def main():
+    from pyterp import weights
+
+    parser = argparse.ArgumentParser(description='Thread scaling of the weights application')
+    parser.add_argument('--weights', type=str, dest='weights', default='',
+                        help='Weights file name, synthetic bilinear weights are used if empty')
+    parser.add_argument('--src_dims', type=str, dest='src_dims', default='3606,4322',
+                        help='Synthetic source grid dimensions')
+    parser.add_argument('--dst_dims', type=str, dest='dst_dims', default='720,1440',
+                        help='Synthetic destination grid dimensions')
+    parser.add_argument('--num_threads', type=str, dest='num_threads', default='1,2,4,8',
+                        help='Comma separated list of thread counts')
+    parser.add_argument('--repeat', type=int, dest='repeat', default=5,
+                        help='Number of applications, the best time is kept')
+
+    args = parser.parse_args()
+
+    if args.weights:
+        wgts = weights.load(args.weights)
+    else:
+        srcShape = tuple(int(n) for n in args.src_dims.split(','))
+        dstShape = tuple(int(n) for n in args.dst_dims.split(','))
+        wgts = createBilinearLikeWeights(srcShape, dstShape)
+    print('src: {} dst: {} number of weights: {}'.format(wgts.srcShape, wgts.dstShape,
+                                                         wgts.getNumberOfEntries()))
+
+    srcData = numpy.random.rand(*wgts.srcShape)
+    dstData = numpy.empty(wgts.dstShape)
+    reference = None
+
+    print('{0:>8} {1:>12} {2:>8} {3:>10} {4:>10}'.format('threads', 'eval sec', 'speedup',
+                                                         'efficiency', 'identical'))
+    for numThreads in [int(n) for n in args.num_threads.split(',')]:
+        wgts.setNumThreads(numThreads)
+        times = []
+        for i in range(args.repeat):
+            tic = time.time()
+            wgts.apply(srcData, dstData)
+            times.append(time.time() - tic)
+        t = min(times)
+        if reference is None:
+            reference = dstData.copy()
+            t1 = t
+        identical = numpy.array_equal(dstData, reference)
+        print('{0:>8} {1:>12.3g} {2:>8.2f} {3:>10.2f} {4:>10}'.format(numThreads, t, t1/t,
+                                                                     t1/t/numThreads, str(identical)))
+    wgts.setNumThreads(1)
+
+
+if __name__ == '__main__':
+    main()
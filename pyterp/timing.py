@@ -0,0 +1,124 @@
+from __future__ import print_function, division
+import sys
+import csv
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy
+
+
+def getPeakMemory():
+    """
+    Get the peak resident memory of this process
+    @return number of bytes
+    """
+    import resource
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on Mac OS X, kilobytes on Linux
+    return maxrss if sys.platform == 'darwin' else 1024*maxrss
+
+
+class PhaseTimer(object):
+
+    def __init__(self, comm=None):
+        """
+        Constructor
+        @param comm MPI communicator (None for serial)
+        """
+        self.comm = comm
+        self.times = OrderedDict()
+
+    def add(self, name, seconds):
+        """
+        Add time to a phase
+        @param name phase name
+        @param seconds elapsed time
+        """
+        self.times[name] = self.times.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a block of code, times of the same phase are accumulated
+        @param name phase name
+        """
+        tic = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - tic)
+
+    def gather(self, root=0):
+        """
+        Collect the phase times and the peak memory of all the ranks
+        @param root rank receiving the table
+        @return list of (phase times, peak memory in bytes), one entry per
+                rank, on the root rank and None elsewhere
+        """
+        local = (dict(self.times), getPeakMemory())
+        if self.comm is None:
+            return [local]
+        return self.comm.gather(local, root=root)
+
+    def report(self, filename=''):
+        """
+        Print the max, mean and min time of every phase over the ranks, with
+        the load imbalance (max/mean), and optionally save the per rank table.
+        Must be called by all the ranks
+        @param filename CSV file name for the raw per rank table (not saved if empty)
+        @return per rank table on rank 0 (see gather), None on the other ranks
+        """
+        table = self.gather()
+        if table is None:
+            return None
+        phases = list(self.times.keys())
+        for times, mem in table:
+            phases += [name for name in times if name not in phases]
+
+        def printRow(name, values, unit):
+            mean = values.mean()
+            print('\t{0:<32} {1:>10.3g} {2:>10.3g} {3:>10.3g} {4:>10.2f} {5}'.format(
+                  name, values.max(), mean, values.min(), values.max()/mean if mean > 0 else 1.0, unit))
+
+        print('time stats over {} ranks:'.format(len(table)))
+        print('\t{0:<32} {1:>10} {2:>10} {3:>10} {4:>10}'.format('', 'max', 'mean', 'min', 'imbalance'))
+        totals = numpy.zeros((len(table),), numpy.float64)
+        for name in phases:
+            values = numpy.array([times.get(name, 0.0) for times, mem in table])
+            totals += values
+            printRow(name, values, 'sec')
+        printRow('total', totals, 'sec')
+        printRow('peak memory', numpy.array([mem for times, mem in table])/1.e9, 'GB')
+
+        if filename:
+            f = open(filename, 'w')
+            f.write(','.join(['rank'] + phases + ['peak_memory_bytes']) + '\n')
+            for rank, (times, mem) in enumerate(table):
+                f.write(','.join([str(rank)] + ['{:.6g}'.format(times.get(name, 0.0)) for name in phases] +
+                                 [str(mem)]) + '\n')
+            f.close()
+        return table
+
+
+def readReport(filename):
+    """
+    Read the per rank table saved by PhaseTimer.report
+    @param filename CSV file name
+    @return list of dictionaries (phase or column name: value), one per rank
+    """
+    with open(filename) as f:
+        reader = csv.DictReader(f)
+        return [OrderedDict((k, float(row[k])) for k in reader.fieldnames) for row in reader]
+
+
+def getPhaseMaxima(table):
+    """
+    Get the time of every phase over the ranks, i.e. the time of the slowest rank
+    @param table per rank table as returned by readReport
+    @return ordered dictionary phase: max time
+    """
+    res = OrderedDict()
+    for name in table[0].keys():
+        if name not in ('rank', 'peak_memory_bytes'):
+            res[name] = max([row[name] for row in table])
+    return res
@@ -0,0 +1,147 @@
+from __future__ import print_function, division
+import time
+import argparse
+import numpy
+
+
+def getLocalBasis(lats, lons):
+    """
+    Get the local east and north unit vectors in 3D Cartesian space
+    @param lats latitudes in degrees
+    @param lons longitudes in degrees
+    @return east, north arrays of shape (3,) + lats.shape
+    """
+    the = numpy.radians(lats)
+    lam = numpy.radians(lons)
+    cos_the, sin_the = numpy.cos(the), numpy.sin(the)
+    cos_lam, sin_lam = numpy.cos(lam), numpy.sin(lam)
+    east = numpy.array([-sin_lam, cos_lam, numpy.zeros_like(lam)])
+    north = numpy.array([-sin_the * cos_lam, -sin_the * sin_lam, cos_the])
+    return east, north
+
+
+def toCartesian(u, v, lats, lons):
+    """
+    Rotate eastward/northward components to 3D Cartesian components
+    @param u eastward component, trailing dimensions match lats
+    @param v northward component, trailing dimensions match lats
+    @param lats latitudes in degrees
+    @param lons longitudes in degrees
+    @return array of shape (3,) + u.shape
+    """
+    east, north = getLocalBasis(lats, lons)
+    ndim = numpy.ndim(u) - numpy.ndim(lats)
+    # insert the leading (time, level...) axes after the component axis
+    east = east.reshape((3,) + (1,)*ndim + east.shape[1:])
+    north = north.reshape((3,) + (1,)*ndim + north.shape[1:])
+    return u * east + v * north
+
+
+def fromCartesian(xyz, lats, lons):
+    """
+    Project 3D Cartesian components onto the local east/north directions
+    @param xyz array of shape (3, ...), trailing dimensions match lats
+    @param lats latitudes in degrees
+    @param lons longitudes in degrees
+    @return eastward, northward components
+    """
+    east, north = getLocalBasis(lats, lons)
+    ndim = xyz.ndim - 1 - numpy.ndim(lats)
+    east = east.reshape((3,) + (1,)*ndim + east.shape[1:])
+    north = north.reshape((3,) + (1,)*ndim + north.shape[1:])
+    return (xyz * east).sum(axis=0), (xyz * north).sum(axis=0)
+
+
+def regridVector(weights, u, v, srcLats, srcLons, dstLats, dstLons, fillValue=0.0):
+    """
+    Regrid a vector field. The three Cartesian components go through the
+    weights in one batched application
+    @param weights SparseWeights instance
+    @param u eastward component on the source grid
+    @param v northward component on the source grid
+    @param srcLats source latitudes in degrees, at the data locations
+    @param srcLons source longitudes in degrees, at the data locations
+    @param dstLats destination latitudes in degrees, at the data locations
+    @param dstLons destination longitudes in degrees, at the data locations
+    @param fillValue value set on destination points that have no weights, or
+                     whose valid (unmasked) source weights are too small
+    @return eastward, northward components on the destination grid
+    """
+    # points left without a value come out as NaN, whatever the reason
+    xyz = weights.apply(toCartesian(u, v, srcLats, srcLons), fillValue=numpy.nan)
+    # the interpolated vector is generally not tangent to the sphere, projecting
+    # onto east/north removes the radial part
+    uDst, vDst = fromCartesian(xyz, dstLats, dstLons)
+    invalid = ~(numpy.isfinite(uDst) & numpy.isfinite(vDst))
+    uDst[invalid] = fillValue
+    vDst[invalid] = fillValue
+    return uDst, vDst
+
+
+def main():
+    import netCDF4
+    from pyterp import weights, ncio
+
+    parser = argparse.ArgumentParser(description='Regrid a vector field through its 3D Cartesian components')
+    parser.add_argument('--weights', type=str, dest='weights', default='weights.nc',
+                        help='Weights file name')
+    parser.add_argument('--src_file', type=str, dest='src_file', default='src.nc',
+                        help='Source data file name')
+    parser.add_argument('--u_field', type=str, dest='u_field', default='u',
+                        help='Eastward component field name')
+    parser.add_argument('--v_field', type=str, dest='v_field', default='v',
+                        help='Northward component field name')
+    parser.add_argument('--src_lats', type=str, dest='src_lats', default='lat',
+                        help='Source latitudes at the data locations')
+    parser.add_argument('--src_lons', type=str, dest='src_lons', default='lon',
+                        help='Source longitudes at the data locations')
+    parser.add_argument('--dst_file', type=str, dest='dst_file', default='dst.nc',
+                        help='Destination grid file name')
+    parser.add_argument('--dst_lats', type=str, dest='dst_lats', default='lat',
+                        help='Destination latitudes at the data locations')
+    parser.add_argument('--dst_lons', type=str, dest='dst_lons', default='lon',
+                        help='Destination longitudes at the data locations')
+    parser.add_argument('--out_file', type=str, dest='out_file', default='regridded_vector.nc',
+                        help='Output file name')
+
+    args = parser.parse_args()
+
+    timeStats = {
+        'evaluation (vector)': float('nan'),
+        'evaluation (one scalar)': float('nan'),
+    }
+
+    wgts = weights.load(args.weights)
+
+    nc = netCDF4.Dataset(args.src_file, 'r')
+    uVar, vVar = nc.variables[args.u_field], nc.variables[args.v_field]
+    u, v = uVar[:], vVar[:]
+    srcLats, srcLons = nc.variables[args.src_lats][:], nc.variables[args.src_lons][:]
+    ncDst = netCDF4.Dataset(args.dst_file, 'r')
+    dstLats, dstLons = ncDst.variables[args.dst_lats][:], ncDst.variables[args.dst_lons][:]
+    ncDst.close()
+
+    fillValue = ncio.getFillValue(uVar, default=0.0)
+
+    tic = time.time()
+    uDst, vDst = regridVector(wgts, u, v, srcLats, srcLons, dstLats, dstLons, fillValue=fillValue)
+    timeStats['evaluation (vector)'] = time.time() - tic
+
+    # reference cost
+    tic = time.time()
+    wgts.apply(u, fillValue=fillValue)
+    timeStats['evaluation (one scalar)'] = time.time() - tic
+
+    ncOut = netCDF4.Dataset(args.out_file, 'w')
+    ncio.createOutputVariable(ncOut, uVar, wgts.dstShape, fillValue=fillValue)[:] = uDst
+    ncio.createOutputVariable(ncOut, vVar, wgts.dstShape, fillValue=fillValue)[:] = vDst
+    ncOut.close()
+    nc.close()
+
+    print('time stats:')
+    for k, v in timeStats.items():
+        print('\t{0:<32} {1:>.3g} sec'.format(k, v))
+
+
+if __name__ == '__main__':
+    main()
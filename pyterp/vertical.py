@@ -0,0 +1,188 @@
+from __future__ import print_function, division
+import time
+import argparse
+import numpy
+
+
+def getLevels(nc, var):
+    """
+    Get the vertical levels of a field, from the coordinate variable of its
+    first non horizontal dimension with a depth/height standard name or a Z
+    axis attribute
+    @param nc netCDF dataset
+    @param var netCDF variable, dimensions (..., level, y, x)
+    @return 1D array of levels, None if the field has no vertical dimension
+    """
+    for dimName in var.dimensions[:-2]:
+        coord = nc.variables.get(dimName)
+        if coord is None or coord.ndim != 1:
+            continue
+        attrs = coord.ncattrs()
+        if getattr(coord, 'standard_name', '') in ('depth', 'height', 'altitude') or \
+           getattr(coord, 'axis', '') == 'Z' or 'positive' in attrs:
+            return numpy.asarray(coord[:], numpy.float64)
+    return None
+
+
+def getLevelWeights(srcLevels, dstLevels):
+    """
+    Get the linear interpolation weights between the levels of layered grids.
+    The source levels may increase or decrease (e.g. pressure levels), k
+    indexes them in the given order so the data need not be reordered
+    @param srcLevels source levels, at least two, strictly monotonic
+    @param dstLevels destination levels
+    @return index of the level below (in srcLevels) of each destination level,
+            weight of the level above (k + 1) and valid flags (False outside
+            the source levels)
+    """
+    srcLevels = numpy.asarray(srcLevels, numpy.float64)
+    dstLevels = numpy.asarray(dstLevels, numpy.float64)
+    numLevels = len(srcLevels)
+    if numLevels < 2:
+        raise ValueError('cannot interpolate between {} source level(s), at least 2 are needed'.format(numLevels))
+    steps = numpy.diff(srcLevels)
+    decreasing = steps[0] < 0
+    if not (numpy.all(steps < 0) if decreasing else numpy.all(steps > 0)):
+        raise ValueError('the source levels are not strictly monotonic')
+    levels = srcLevels[::-1] if decreasing else srcLevels
+    valid = (dstLevels >= levels[0]) & (dstLevels <= levels[-1])
+    k = numpy.clip(numpy.searchsorted(levels, dstLevels, side='right') - 1, 0, numLevels - 2)
+    w = numpy.clip((dstLevels - levels[k]) / (levels[k + 1] - levels[k]), 0., 1.)
+    if decreasing:
+        # reversed level k + 1 is level numLevels - 2 - k, reversed level k the one above it
+        k, w = numLevels - 2 - k, 1. - w
+    return k, w, valid
+
+
+def interpolate(data, k, w, valid=None, fillValue=0.0):
+    """
+    Interpolate columns of data vertically, all the columns at once
+    @param data array of shape (numSrcLevels, ...), e.g. horizontally
+                interpolated levels
+    @param k index of the level below, see getLevelWeights
+    @param w weight of the level above
+    @param valid flags of the destination levels (optional)
+    @param fillValue value set on invalid levels
+    @return array of shape (len(k), ...)
+    """
+    w = numpy.reshape(w, (-1,) + (1,)*(numpy.ndim(data) - 1))
+    res = (1. - w)*data[k] + w*data[k + 1]
+    if valid is not None:
+        res[~numpy.asarray(valid, bool)] = fillValue
+    return res
+
+
+def getTrilinearWeights(horizWeights, k, w, valid, numSrcLevels):
+    """
+    Combine horizontal weights with vertical level weights into a single
+    weight matrix acting on whole 3D fields
+    @param horizWeights SparseWeights instance between the horizontal grids
+    @param k index of the level below, see getLevelWeights
+    @param w weight of the level above
+    @param valid flags of the destination levels
+    @param numSrcLevels number of source levels
+    @return SparseWeights instance, shape (numSrcLevels,) + srcShape to
+            (len(k),) + dstShape
+    """
+    from pyterp import weights
+
+    numSrc, numDst = horizWeights.numSrc, horizWeights.numDst
+    levels = numpy.nonzero(valid)[0]
+    rows, cols, wgts = [], [], []
+    # each horizontal entry appears twice per destination level, below and above
+    for kk, ww in (k[levels], 1. - w[levels]), (k[levels] + 1, w[levels]):
+        rows.append((levels[:, None]*numDst + horizWeights.rows).ravel())
+        cols.append((kk[:, None]*numSrc + horizWeights.cols).ravel())
+        wgts.append((ww[:, None]*horizWeights.weights).ravel())
+    return weights.SparseWeights(numpy.concatenate(rows), numpy.concatenate(cols), numpy.concatenate(wgts),
+                                 (numSrcLevels,) + horizWeights.srcShape, (len(k),) + horizWeights.dstShape)
+
+
+def main():
+    import netCDF4
+    from pyterp import grids, diagnostics, bilinear
+
+    parser = argparse.ArgumentParser(description='Compare 3D weights with 2D weights followed by a vertical '
+                                                 'interpolation, numpy backend')
+    parser.add_argument('--src_file', type=str, dest='src_file', default='src.nc',
+                        help='Source data file name')
+    parser.add_argument('--src_field', type=str, dest='src_field', default='pointData',
+                        help='Source data field name, dimensions (level, y, x)')
+    parser.add_argument('--dst_file', type=str, dest='dst_file', default='dst.nc',
+                        help='Destination data file name')
+    parser.add_argument('--dst_field', type=str, dest='dst_field', default='pointData',
+                        help='Destination (reference) field name')
+    parser.add_argument('--mode', type=str, dest='mode', default='both', choices=['3d', '2d', 'both'],
+                        help='3d: one weight matrix between the 3D grids, 2d: 2D weights applied to all the '
+                             'levels then vertical interpolation')
+    parser.add_argument('--tolpos', type=float, dest='tolpos', default=1.e-6,
+                        help='Tolerance in target space')
+    parser.add_argument('--nitermax', type=int, dest='nitermax', default=1000,
+                        help='Max number of iterations')
+    parser.add_argument('--num_threads', type=int, dest='num_threads', default=1,
+                        help='Number of threads applying the weights')
+
+    args = parser.parse_args()
+
+    nc = netCDF4.Dataset(args.src_file, 'r')
+    srcVar = nc.variables[args.src_field]
+    srcCoords = grids.getCoordinates(nc, srcVar)
+    srcLevels = getLevels(nc, srcVar)
+    srcData = srcVar[:]
+    nc.close()
+    nc = netCDF4.Dataset(args.dst_file, 'r')
+    dstVar = nc.variables[args.dst_field]
+    dstCoords = grids.getCoordinates(nc, dstVar)
+    dstLevels = getLevels(nc, dstVar)
+    dstDataRef = dstVar[:]
+    nc.close()
+
+    # the horizontal weights are needed by both paths
+    tic = time.time()
+    horizWeights = bilinear.computeWeights(srcCoords['lats'], srcCoords['lons'], dstCoords['lats'],
+                                           dstCoords['lons'], nitermax=args.nitermax, tolpos=args.tolpos,
+                                           numThreads=args.num_threads)
+    k, w, validLevels = getLevelWeights(srcLevels, dstLevels)
+    horizTime = time.time() - tic
+    valid = validLevels[:, None] & horizWeights.getValidRows()[None, :]
+
+    modes = ['3d', '2d'] if args.mode == 'both' else [args.mode]
+    for mode in modes:
+        timeStats = {
+            'weights': horizTime,
+            'evaluation': float('nan'),
+        }
+        if mode == '3d':
+            tic = time.time()
+            wgts = getTrilinearWeights(horizWeights, k, w, validLevels, len(srcLevels))
+            wgts.setNumThreads(args.num_threads)
+            timeStats['weights'] += time.time() - tic
+            tic = time.time()
+            dstData = wgts.apply(srcData)
+            timeStats['evaluation'] = time.time() - tic
+        else:
+            horizWeights.setNumThreads(args.num_threads)
+            tic = time.time()
+            # all the levels go through the 2D weights at once
+            levelData = horizWeights.apply(srcData)
+            timeStats['evaluation'] = time.time() - tic
+            tic = time.time()
+            dstData = interpolate(levelData, k, w, validLevels)
+            timeStats['vertical'] = time.time() - tic
+
+        stats = diagnostics.ErrorStats()
+        stats.addSource(srcData)
+        stats.update(dstData, dstDataRef, mask=~valid.reshape(dstData.shape))
+        stats.report('numpy {} interpolation:'.format(mode))
+        print('\t     # weights: {}'.format(wgts.getNumberOfEntries() if mode == '3d'
+                                           else horizWeights.getNumberOfEntries()))
+        print('time stats:')
+        totTime = 0.0
+        for key, v in timeStats.items():
+            print('\t{0:<32} {1:>.3g} sec'.format(key, v))
+            totTime += v
+        print('\t{0:<32} {1:>.3g} sec'.format('total', totTime))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+from __future__ import print_function, division
+import numpy
+from functools import reduce
+
+
+class SparseWeights(object):
+
+    def __init__(self, rows, cols, weights, srcShape, dstShape, **extras):
+        """
+        Constructor
+        @param rows zero based destination (flat) indices
+        @param cols zero based source (flat) indices
+        @param weights interpolation weights, one per (row, col) pair
+        @param srcShape shape of the source grid (numpy ordering)
+        @param dstShape shape of the destination grid (numpy ordering)
+        @param extras optional per cell arrays, e.g. frac_b, area_a, area_b
+        """
+        rows = numpy.asarray(rows, numpy.int64).ravel()
+        cols = numpy.asarray(cols, numpy.int64).ravel()
+        weights = numpy.asarray(weights, numpy.float64).ravel()
+
+        # sort by destination index so that every row is a contiguous segment. The
+        # sort is stable so the summation order within a row is the order given
+        perm = numpy.argsort(rows, kind='mergesort')
+        self.rows = rows[perm]
+        self.cols = cols[perm]
+        self.weights = weights[perm]
+
+        self.srcShape = tuple(srcShape)
+        self.dstShape = tuple(dstShape)
+        self.numSrc = reduce(lambda x, y: x*y, self.srcShape, 1)
+        self.numDst = reduce(lambda x, y: x*y, self.dstShape, 1)
+
+        # CSR row pointer
+        self.indptr = numpy.searchsorted(self.rows, numpy.arange(self.numDst + 1))
+
+        self.extras = extras
+        self._rowSums = None
+        self._pool = None
+        self._rowRanges = [(0, self.numDst)]
+
+    def getNumberOfEntries(self):
+        """
+        Get the number of non-zero weights
+        @return number
+        """
+        return len(self.weights)
+
+    def getValidRows(self):
+        """
+        Get the mask of destination points that receive at least one weight
+        @return boolean array of size numDst
+        """
+        return self.indptr[1:] > self.indptr[:-1]
+
+    def setNumThreads(self, numThreads, numChunksPerThread=4):
+        """
+        Apply the weights with a pool of threads, each thread working on ranges
+        of destination rows. Every row is summed in the same order whatever the
+        number of threads, so the results are bit for bit identical
+        @param numThreads number of threads
+        @param numChunksPerThread number of row ranges per thread (load balancing)
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        self._rowRanges = [(0, self.numDst)]
+        if numThreads <= 1:
+            return
+
+        from multiprocessing.pool import ThreadPool
+        self._pool = ThreadPool(numThreads)
+        # split the rows so that each range holds about the same number of weights
+        targets = numpy.linspace(0, self.getNumberOfEntries(), numThreads*numChunksPerThread + 1)
+        bounds = numpy.searchsorted(self.indptr, targets).clip(0, self.numDst)
+        # the first and last rows are always bounds, even with no weights
+        bounds = numpy.unique(numpy.concatenate(([0], bounds, [self.numDst])))
+        self._rowRanges = [(int(b), int(e)) for b, e in zip(bounds[:-1], bounds[1:]) if e > b]
+
+    def getRowSums(self):
+        """
+        Get the sum of the weights of each destination point
+        @return array of shape dstShape
+        """
+        if self._rowSums is None:
+            self._rowSums = self.apply(numpy.ones(self.srcShape), fillValue=0.0)
+        return self._rowSums
+
+    def apply(self, srcData, dstData=None, fillValue=0.0, minFraction=0.5):
+        """
+        Apply the weights to one or more source slabs
+        @param srcData array whose trailing dimensions are srcShape. If this is a
+                       masked array the weights are renormalized over the valid
+                       source points
+        @param dstData optional output array whose trailing dimensions are dstShape
+        @param fillValue value set on destination points that have no weights
+        @param minFraction destination points whose valid weights add up to less than
+                           this fraction of their total weight are set to fillValue
+        @return destination array
+        """
+        mask = numpy.ma.getmask(srcData)
+        if mask is not numpy.ma.nomask and mask.any():
+            return self._applyMasked(srcData, mask, dstData, fillValue, minFraction)
+
+        srcData = numpy.asarray(srcData)
+        lead = srcData.shape[:srcData.ndim - len(self.srcShape)]
+        src = srcData.reshape(lead + (self.numSrc,))
+        if dstData is None:
+            dtype = numpy.result_type(srcData.dtype, self.weights.dtype)
+            dstData = numpy.empty(lead + self.dstShape, dtype)
+        dst = dstData.reshape(lead + (self.numDst,))
+        if self._pool is None:
+            self.applyRows(src, dst, 0, self.numDst, fillValue=fillValue)
+        else:
+            # the GIL is released inside the numpy kernels
+            self._pool.map(lambda r: self.applyRows(src, dst, r[0], r[1], fillValue=fillValue),
+                           self._rowRanges)
+        return dstData
+
+    def _applyMasked(self, srcData, mask, dstData, fillValue, minFraction):
+        # the data and the valid point indicator go through the weights together
+        valid = ~numpy.broadcast_to(mask, srcData.shape)
+        stacked = numpy.array([numpy.ma.filled(srcData, 0.0), valid], numpy.float64)
+        numer, denom = self.apply(stacked, fillValue=0.0)
+        ok = denom > minFraction * self.getRowSums()
+        if dstData is None:
+            dstData = numpy.empty(numer.shape, numer.dtype)
+        dstData[...] = fillValue
+        dstData[ok] = numer[ok] / denom[ok]
+        return dstData
+
+    def applyRows(self, src, dst, rowBeg, rowEnd, fillValue=0.0):
+        """
+        Apply the weights to a range of destination rows
+        @param src flat source array, shape (..., numSrc)
+        @param dst flat destination array, shape (..., numDst), filled in place
+        @param rowBeg first destination row
+        @param rowEnd one past the last destination row
+        @param fillValue value set on destination points that have no weights
+        """
+        k0, k1 = self.indptr[rowBeg], self.indptr[rowEnd]
+        dst[..., rowBeg:rowEnd] = fillValue
+        if k1 == k0:
+            return
+        prod = src[..., self.cols[k0:k1]] * self.weights[k0:k1]
+        starts = self.indptr[rowBeg:rowEnd] - k0
+        nonEmpty = numpy.nonzero(self.indptr[rowBeg + 1:rowEnd + 1] > self.indptr[rowBeg:rowEnd])[0]
+        # empty rows are removed from the segment starts, each remaining segment
+        # then ends where the next non-empty row starts
+        dst[..., rowBeg + nonEmpty] = numpy.add.reduceat(prod, starts[nonEmpty], axis=-1)
+
+    def save(self, filename):
+        """
+        Save the weights in a netCDF file, following the ESMF/SCRIP conventions
+        (1-based row/col indices, fastest varying grid dimension first)
+        @param filename file name
+        """
+        import netCDF4
+
+        nc = netCDF4.Dataset(filename, 'w')
+        nc.createDimension('n_s', len(self.weights))
+        nc.createDimension('n_a', self.numSrc)
+        nc.createDimension('n_b', self.numDst)
+        nc.createDimension('src_grid_rank', len(self.srcShape))
+        nc.createDimension('dst_grid_rank', len(self.dstShape))
+
+        nc.createVariable('src_grid_dims', 'i4', ('src_grid_rank',))[:] = self.srcShape[::-1]
+        nc.createVariable('dst_grid_dims', 'i4', ('dst_grid_rank',))[:] = self.dstShape[::-1]
+        nc.createVariable('row', 'i4', ('n_s',))[:] = self.rows + 1
+        nc.createVariable('col', 'i4', ('n_s',))[:] = self.cols + 1
+        nc.createVariable('S', 'f8', ('n_s',))[:] = self.weights
+        # allows reading the weights of a range of destination points only
+        nc.row_sorted = 1
+
+        for name, array in self.extras.items():
+            dim = {'a': 'n_a', 'b': 'n_b'}[name[-1]]
+            nc.createVariable(name, 'f8', (dim,))[:] = numpy.asarray(array).ravel()
+
+        nc.close()
+
+
+def load(filename):
+    """
+    Load weights from a netCDF file, e.g. written by SparseWeights.save or by
+    ESMF_RegridWeightGen
+    @param filename file name
+    @return SparseWeights instance
+    """
+    import netCDF4
+
+    nc = netCDF4.Dataset(filename, 'r')
+    srcShape = tuple(int(n) for n in nc.variables['src_grid_dims'][:][::-1])
+    dstShape = tuple(int(n) for n in nc.variables['dst_grid_dims'][:][::-1])
+    rows = numpy.asarray(nc.variables['row'][:]) - 1
+    cols = numpy.asarray(nc.variables['col'][:]) - 1
+    weights = numpy.asarray(nc.variables['S'][:])
+    extras = {}
+    for name in 'frac_a', 'frac_b', 'area_a', 'area_b':
+        if name in nc.variables:
+            extras[name] = numpy.asarray(nc.variables[name][:])
+    nc.close()
+    return SparseWeights(rows, cols, weights, srcShape, dstShape, **extras)
+
+
+def merge(base, patch):
+    """
+    Merge weights computed for some destination points into a full set of
+    weights, e.g. after re-solving the points that could not be located
+    @param base SparseWeights instance
+    @param patch SparseWeights instance on the same grids, its rows replace
+                 those of base
+    @return SparseWeights instance
+    """
+    patchRows = numpy.unique(patch.rows)
+    keep = ~numpy.isin(base.rows, patchRows)
+    return SparseWeights(numpy.concatenate((base.rows[keep], patch.rows)),
+                         numpy.concatenate((base.cols[keep], patch.cols)),
+                         numpy.concatenate((base.weights[keep], patch.weights)),
+                         base.srcShape, base.dstShape, **base.extras)
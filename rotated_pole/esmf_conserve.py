@@ -1,12 +1,14 @@
 from __future__ import print_function
 import ESMF
-import iris
 import numpy
+import os
 import sys
 import argparse
 from functools import reduce
 import time
 from mpi4py import MPI
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import timing, ncio, grids, diagnostics, hybrid, esmf_weights
 
 # turn on logging
 esmpy = ESMF.Manager(debug=True)
@@ -17,6 +19,9 @@ pe = MPI.COMM_WORLD.Get_rank()
 # number of processes
 nprocs = MPI.COMM_WORLD.Get_size()
 
+# per rank phase times
+timer = timing.PhaseTimer(MPI.COMM_WORLD)
+
 LAT_INDEX, LON_INDEX = 1, 0
 
 parser = argparse.ArgumentParser(description='Conservatively interpolate using ESMF')
@@ -24,10 +29,24 @@ parser.add_argument('--src_file', type=str, dest='src_file', default='src.nc',
                     help='Source data file name')
 parser.add_argument('--dst_file', type=str, dest='dst_file', default='dst.nc',
                     help='Destination data file name')
+parser.add_argument('--out_file', type=str, dest='out_file', default='dst_regridded.nc',
+                    help='Destination file with regridded field')
+parser.add_argument('--stitch', dest='stitch', action='store_true',
+                    help='Without parallel netCDF, assemble the rank tiles into --out_file on rank 0 '
+                         '(by default they are left for python -m pyterp.ncio)')
+parser.add_argument('--num_threads', type=int, dest='num_threads', default=1,
+                    help='Number of threads per rank for the field fill and error computation (0: share the node cores)')
+parser.add_argument('--timing_file', type=str, dest='timing_file', default='',
+                    help='Save the per rank phase times to this CSV file')
+parser.add_argument('--periodic', type=str, dest='periodic', default='auto', choices=['auto', 'none'],
+                    help='Detect periodic longitude seams and north folds (auto) or treat the grids as bounded (none)')
 parser.add_argument('--plot', dest='plot', action='store_true', help='Plot')
 
 args = parser.parse_args()
 
+# threads per rank, for hybrid MPI + threads runs
+numThreads = hybrid.getNumThreads(args.num_threads, MPI.COMM_WORLD)
+
 if args.src_file is '':
     print('ERROR: must provide source data file name')
     parser.print_help()
@@ -43,60 +62,78 @@ dst_file = args.dst_file.encode('UTF-8') # python3
 ndims = 2
 
 def createData(filename, prefix):
-    # use iris to read in the data
-    # then pass the array to the ESMF API
-    cubes = iris.load(filename)
-    cubePoint = iris.load(filename, iris.Constraint(cube_func = lambda c: c.var_name == 'pointData'))[0]
-    cubeCell = iris.load(filename, iris.Constraint(cube_func = lambda c: c.var_name == 'cellData'))[0]
-
-    coordsPoint = cubePoint.coords()
-    latsPoint = coordsPoint[0].points
-    lonsPoint = coordsPoint[1].points
+    # read the netcdf header, then only the local hyperslab of the
+    # coordinates and data on this rank
+    tic = time.time()
+    nc = ncio.openDataset(filename)
+    varPoint = nc.variables['pointData']
+    varCell = nc.variables['cellData']
+    latVar, lonVar = grids.getLatLonVariables(nc, varPoint)
+    timer.add('read', time.time() - tic)
     
     # create the ESMF grid object
-    cellDims = numpy.array([latsPoint.shape[0] - 1, latsPoint.shape[1] - 1])
-    grid = ESMF.Grid(max_index=cellDims, coord_sys=ESMF.api.constants.CoordSys.SPH_DEG) #, num_peri_dims=1, periodic_dim=1)
+    tic = time.time()
+    # detect a periodic seam and a north fold, the duplicated nodes are left out
+    topology = grids.getTopology(latVar, lonVar, requireDuplicate=True) if args.periodic == 'auto' else grids.NO_TOPOLOGY
+    cellDims = numpy.array(grids.getPeriodicCellDims(topology, latVar.shape), numpy.int32)
+    grid = ESMF.Grid(max_index=cellDims, coord_sys=ESMF.api.constants.CoordSys.SPH_DEG,
+                     **esmf_weights.getPeriodicOptions(topology))
     grid.add_coords(staggerloc=ESMF.StaggerLoc.CORNER, coord_dim=LAT_INDEX)
     grid.add_coords(staggerloc=ESMF.StaggerLoc.CORNER, coord_dim=LON_INDEX)
 
     coordLatsPoint = grid.get_coords(coord_dim=LAT_INDEX, staggerloc=ESMF.StaggerLoc.CORNER)
     coordLonsPoint = grid.get_coords(coord_dim=LON_INDEX, staggerloc=ESMF.StaggerLoc.CORNER)
+    timer.add('grid', time.time() - tic)
 
-    # get the local start/end index sets and set the point coordinates
+    # get the local start/end index sets, the cells have their own index sets
     iBeg0 = grid.lower_bounds[ESMF.StaggerLoc.CORNER][LON_INDEX]
     iEnd0 = grid.upper_bounds[ESMF.StaggerLoc.CORNER][LON_INDEX]
     iBeg1 = grid.lower_bounds[ESMF.StaggerLoc.CORNER][LAT_INDEX]
     iEnd1 = grid.upper_bounds[ESMF.StaggerLoc.CORNER][LAT_INDEX]
+    cellSlices = tuple(slice(b, e) for b, e in zip(grid.lower_bounds[ESMF.StaggerLoc.CENTER],
+                                                   grid.upper_bounds[ESMF.StaggerLoc.CENTER]))
+
+    tic = time.time()
+    latsPoint = latVar[iBeg0:iEnd0, iBeg1:iEnd1]
+    lonsPoint = lonVar[iBeg0:iEnd0, iBeg1:iEnd1]
+    cellData = ncio.readSlab(varCell, (), cellSlices)
+    nc.close()
+    timer.add('read', time.time() - tic)
+
+    # set the point coordinates
     # NEED TO CHECK ORDERING!!!
-    coordLatsPoint[...] = latsPoint[iBeg0:iEnd0, iBeg1:iEnd1]
-    coordLonsPoint[...] = lonsPoint[iBeg0:iEnd0, iBeg1:iEnd1]
+    tic = time.time()
+    coordLatsPoint[...] = latsPoint
+    coordLonsPoint[...] = lonsPoint
+    timer.add('grid', time.time() - tic)
 
     # local sizes
     nodeDims = (iEnd0 - iBeg0, iEnd1 - iBeg1)
 
     # create and set the field
+    tic = time.time()
     field = ESMF.Field(grid, staggerloc=ESMF.StaggerLoc.CENTER)
-    field.data[...] = cubeCell.data[iBeg0:iEnd0, iBeg1:iEnd1]
-
-    return grid, field, nodeDims
+    hybrid.copyRows(field.data, cellData, numThreads)
+    timer.add('field', time.time() - tic)
 
-timeStats = {
-    'weights': float('nan'),
-    'evaluation': float('nan'),
-}
+    return grid, field, nodeDims, cellSlices, topology
 
-srcGrid, srcData, srcNodeDims = createData(src_file, b"src")
-dstGrid, dstData, dstNodeDims = createData(dst_file, b"dst")
+srcGrid, srcData, srcNodeDims, srcSlices, srcTopology = createData(src_file, b"src")
+dstGrid, dstData, dstNodeDims, dstSlices, dstTopology = createData(dst_file, b"dst")
 
 # save the reference (exact) field data
 dstDataRef = dstData.data.copy()
 dstData.data[...] = -1
 
+# fraction of each destination point covered by the source grid, 0 if unmapped
+dstFrac = ESMF.Field(dstGrid, staggerloc=ESMF.StaggerLoc.CENTER)
+
 # compute the interpolation weights
 tic = time.time()
 regrid = ESMF.Regrid(srcfield=srcData, dstfield=dstData,
                      regrid_method=ESMF.api.constants.RegridMethod.CONSERVE,
-                     unmapped_action=ESMF.api.constants.UnmappedAction.IGNORE)
+                     unmapped_action=ESMF.api.constants.UnmappedAction.IGNORE,
+                     dst_frac_field=dstFrac)
 """
 regrid = ESMF.api.regrid.Regrid(srcData, dstData,
                                 src_mask_values=None, dst_mask_values=None,
@@ -109,41 +146,36 @@ regrid = ESMF.api.regrid.Regrid(srcData, dstData,
                                 ignore_degenerate=True, # produce an error if two points are degenerate and if set to False
                                 src_frac_field=None, dst_frac_field=None)
 """
-timeStats['weights'] = time.time() - tic
+timer.add('weights', time.time() - tic)
 
 # interpolate
 tic = time.time()
 regrid(srcData, dstData)
-timeStats['evaluation'] = time.time() - tic
+timer.add('evaluation', time.time() - tic)
+
+# write the regridded field, each rank writes its own window
+tic = time.time()
+outFile = ncio.writeField(args.out_file, dst_file, 'cellData', dstData.data, slices=dstSlices)
+outFile = ncio.gatherTiles(args.out_file, outFile, stitch=args.stitch)
+# the duplicated seam and fold cells are not in the ESMF grid
+ncio.fillPeriodic(args.out_file, outFile, 'cellData', dstTopology, cells=True)
+timer.add('write', time.time() - tic)
 
 # compute error
-srcNtot = len(srcData.data.flat)
-dstNtot = len(dstData.data.flat)
-localSumError = numpy.sum(abs(dstData.data - dstDataRef))
-globalSumError = numpy.sum(MPI.COMM_WORLD.gather(localSumError, root=0))
-globalSrcNtot = numpy.sum(MPI.COMM_WORLD.gather(srcNtot, root=0))
-globalDstNtot = numpy.sum(MPI.COMM_WORLD.gather(dstNtot, root=0))
-
-globalTimeStats = {}
-for k, v in timeStats.items():
-    # max value
-    ts = MPI.COMM_WORLD.gather(v, root=0)
-    if ts is not None:
-        globalTimeStats[k] = max(ts)
-
-if pe == 0:
-    error = globalSumError / float(globalDstNtot)
-    print('esmf interpolation:')
-    print('\tsrc: ntot: {}'.format(globalSrcNtot))
-    print('\tdst: ntot: {}'.format(globalDstNtot))
-    print('interpolation error: {:.3g}'.format(error))
-
-    totTime = 0.0
-    print('time stats:')
-    for k, v in globalTimeStats.items():
-        print('\t{0:<32} {1:>.3g} sec'.format(k, v))
-        totTime += v
-    print('\t{0:<32} {1:>.3g} sec'.format('total', totTime))
+tic = time.time()
+srcAreas = ESMF.Field(srcGrid, staggerloc=ESMF.StaggerLoc.CENTER)
+dstAreas = ESMF.Field(dstGrid, staggerloc=ESMF.StaggerLoc.CENTER)
+srcAreas.get_area()
+dstAreas.get_area()
+stats = diagnostics.ErrorStats(MPI.COMM_WORLD, numThreads=numThreads)
+stats.addSource(srcData.data, areas=srcAreas.data)
+stats.update(dstData.data, dstDataRef, areas=dstAreas.data, mask=(dstFrac.data <= 0.))
+stats.reduce()
+timer.add('error', time.time() - tic)
+
+stats.report('esmf interpolation:')
+
+timer.report(args.timing_file)
 
 # plot
 if args.plot and nprocs == 1:
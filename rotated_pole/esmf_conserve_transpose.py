@@ -1,11 +1,13 @@
 from __future__ import print_function
 import ESMF
-import iris
 import numpy
+import os
 import sys
 import argparse
 from functools import reduce
 import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import ncio, grids, diagnostics
 
 # turn on logging
 esmpy = ESMF.Manager(debug=True)
@@ -17,6 +19,11 @@ parser.add_argument('--src_file', type=str, dest='src_file', default='src.nc',
                     help='Source data file name')
 parser.add_argument('--dst_file', type=str, dest='dst_file', default='dst.nc',
                     help='Destination data file name')
+parser.add_argument('--out_file', type=str, dest='out_file', default='dst_regridded.nc',
+                    help='Destination file with regridded field')
+parser.add_argument('--stitch', dest='stitch', action='store_true',
+                    help='Without parallel netCDF, assemble the rank tiles into --out_file on rank 0 '
+                         '(by default they are left for python -m pyterp.ncio)')
 parser.add_argument('--plot', dest='plot', action='store_true', help='Plot')
 
 args = parser.parse_args()
@@ -36,18 +43,15 @@ dst_file = args.dst_file.encode('UTF-8') # python3
 ndims = 2
 
 def createData(filename, prefix):
-    # use iris to read in the data
-    # then pass the array to the ESMF API
-    cubes = iris.load(filename)
-    cubePoint = iris.load(filename, iris.Constraint(cube_func = lambda c: c.var_name == 'pointData'))[0]
-    cubeCell = iris.load(filename, iris.Constraint(cube_func = lambda c: c.var_name == 'cellData'))[0]
-
-    coordsPoint = cubePoint.coords()
-    latsPoint = coordsPoint[0].points
-    lonsPoint = coordsPoint[1].points
+    # read the netcdf header, then only the local hyperslab of the
+    # coordinates and data on this rank
+    nc = ncio.openDataset(filename)
+    varPoint = nc.variables['pointData']
+    varCell = nc.variables['cellData']
+    latVar, lonVar = grids.getLatLonVariables(nc, varPoint)
     
     # create the ESMF grid object, reverse index order
-    cellDims = numpy.array([latsPoint.shape[1] - 1, latsPoint.shape[0] - 1])
+    cellDims = numpy.array([latVar.shape[1] - 1, latVar.shape[0] - 1])
     grid = ESMF.Grid(max_index=cellDims, coord_sys=ESMF.api.constants.CoordSys.SPH_DEG) #, num_peri_dims=1, periodic_dim=1)
     grid.add_coords(staggerloc=ESMF.StaggerLoc.CORNER, coord_dim=LAT_INDEX)
     grid.add_coords(staggerloc=ESMF.StaggerLoc.CORNER, coord_dim=LON_INDEX)
@@ -61,25 +65,29 @@ def createData(filename, prefix):
     iBeg1 = grid.lower_bounds[ESMF.StaggerLoc.CORNER][LAT_INDEX]
     iEnd1 = grid.upper_bounds[ESMF.StaggerLoc.CORNER][LAT_INDEX]
     # NEED TO CHECK ORDERING!!!
-    coordLatsPoint[...] = latsPoint.transpose()
-    coordLonsPoint[...] = lonsPoint.transpose()
+    coordLatsPoint[...] = latVar[iBeg1:iEnd1, iBeg0:iEnd0].transpose()
+    coordLonsPoint[...] = lonVar[iBeg1:iEnd1, iBeg0:iEnd0].transpose()
 
     # local sizes
     nodeDims = (iEnd0 - iBeg0, iEnd1 - iBeg1)
 
-    # create and set the field
+    # create and set the field, the cells have their own index sets
     field = ESMF.Field(grid, staggerloc=ESMF.StaggerLoc.CENTER)
-    field.data[...] = cubeCell.data[iBeg1:iEnd1, iBeg0:iEnd0].transpose()
+    cellSlices = tuple(slice(b, e) for b, e in zip(grid.lower_bounds[ESMF.StaggerLoc.CENTER],
+                                                   grid.upper_bounds[ESMF.StaggerLoc.CENTER]))
+    field.data[...] = ncio.readSlab(varCell, (), cellSlices[::-1]).transpose()
 
-    return grid, field, nodeDims
+    nc.close()
+    return grid, field, nodeDims, cellSlices[::-1]
 
 timeStats = {
     'weights': float('nan'),
     'evaluation': float('nan'),
+    'write': float('nan'),
 }
 
-srcGrid, srcData, srcNodeDims = createData(src_file, b"src")
-dstGrid, dstData, dstNodeDims = createData(dst_file, b"dst")
+srcGrid, srcData, srcNodeDims, srcSlices = createData(src_file, b"src")
+dstGrid, dstData, dstNodeDims, dstSlices = createData(dst_file, b"dst")
 
 # save the reference (exact) field data
 dstDataRef = dstData.data.copy()
@@ -109,16 +117,21 @@ tic = time.time()
 regrid(srcData, dstData)
 timeStats['evaluation'] = time.time() - tic
 
+# write the regridded field, each rank writes its own window
+tic = time.time()
+outFile = ncio.writeField(args.out_file, dst_file, 'cellData', dstData.data.transpose(), slices=dstSlices)
+outFile = ncio.gatherTiles(args.out_file, outFile, stitch=args.stitch)
+timeStats['write'] = time.time() - tic
+
 # compute error
-srcNtot = len(srcData.data.flat)
-dstNtot = len(dstData.data.flat)
-globalSumError = numpy.sum(abs(dstData.data - dstDataRef))
-
-error = globalSumError / float(dstNtot)
-print('esmf interpolation:')
-print('\tsrc: ntot: {}'.format(srcNtot))
-print('\tdst: ntot: {}'.format(dstNtot))
-print('interpolation error: {:.3g}'.format(error))
+srcAreas = ESMF.Field(srcGrid, staggerloc=ESMF.StaggerLoc.CENTER)
+dstAreas = ESMF.Field(dstGrid, staggerloc=ESMF.StaggerLoc.CENTER)
+srcAreas.get_area()
+dstAreas.get_area()
+stats = diagnostics.ErrorStats(ncio.getComm())
+stats.addSource(srcData.data, areas=srcAreas.data)
+stats.update(dstData.data, dstDataRef, areas=dstAreas.data)
+stats.report('esmf interpolation:')
 
 
 # plot
@@ -45,7 +45,9 @@ ndims = 2
 
 def createData(filename, prefix):
     # use iris to read in the data
-    # then pass the array to the ESMF API
+    # then pass the array to the ESMF API. regrid_conservative_via_esmpy 
+    # builds the ESMF grids from whole cubes, so unlike the ESMF drivers 
+    # every rank reads the whole file
     cubes = iris.load(filename)
     cubePoint = iris.load(filename, iris.Constraint(cube_func = lambda c: c.var_name == 'pointData'))[0]
     cubeCell = iris.load(filename, iris.Constraint(cube_func = lambda c: c.var_name == 'cellData'))[0]
@@ -3,10 +3,13 @@ import pycf
 import iris
 import numpy
 import sys
-from ctypes import byref, c_int, c_double, c_float, POINTER, c_char_p, c_void_p
+from ctypes import byref, c_int, c_double, c_float
 import argparse
 from functools import reduce
 import time
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import libcf, bilinear
 
 parser = argparse.ArgumentParser(description='Interpolate using libcf')
 parser.add_argument('--src_field', type=str, dest='src_field', default='pointData',
@@ -19,6 +22,8 @@ parser.add_argument('--tolpos', type=float, dest='tolpos', default=1.e-6,
                     help='Tolerance in target space')
 parser.add_argument('--nitermax', type=int, dest='nitermax', default=1000,
                     help='Max number of iterations')
+parser.add_argument('--recover', dest='recover', action='store_true',
+                    help='Re-solve the points libcf failed to locate with escalated nitermax/tolpos')
 parser.add_argument('--plot', dest='plot', action='store_true', help='Plot')
 
 args = parser.parse_args()
@@ -36,7 +41,6 @@ if args.dst_file is '':
 src_file = args.src_file.encode('UTF-8') # python3
 dst_file = args.dst_file.encode('UTF-8') # python3
 src_field = args.src_field.encode('UTF-8') # python3
-ndims = 2
 
 def createData(filename, prefix, fieldname):
     # use iris to read in the data
@@ -46,64 +50,12 @@ def createData(filename, prefix, fieldname):
     lats = coords[0].points
     lons = coords[1].points
     
-    # create coordinates
-    save = 1 # copy and save
-    latId, lonId = c_int(), c_int()
-    dims = (c_int * 2)(lats.shape[0], lats.shape[1])
-    dimNames = (c_char_p * 2)("y", "x")
-    ier = pycf.nccf.nccf_def_lat_coord(ndims, dims, dimNames, lats.ctypes.data_as(POINTER(c_double)), save, byref(latId))
-    assert(ier == pycf.NC_NOERR)
-    ier = pycf.nccf.nccf_def_lon_coord(ndims, dims, dimNames, lons.ctypes.data_as(POINTER(c_double)), save, byref(lonId))
-    assert(ier == pycf.NC_NOERR)
-
-    # create the grid
-    gridId = c_int()
-    coordIds = (c_int * 2)(latId.value, lonId.value)
-    gridname = prefix + 'grid'
-    ier = pycf.nccf.nccf_def_grid(coordIds, gridname, byref(gridId))
-    assert(ier == pycf.NC_NOERR)
-
-    # create the data
-    dataId = c_int()
-    dataname = fieldname
-    ier = pycf.nccf.nccf_def_data(gridId, dataname, 'temperature', 'K', None, byref(dataId))
-    assert(ier == pycf.NC_NOERR)
-    save = 1
-    fillValue = c_double(pycf.NC_FILL_DOUBLE)
-    ier = pycf.nccf.nccf_set_data_double(dataId, cube.data.ctypes.data_as(POINTER(c_double)),
-                                         save, fillValue)
-    assert(ier == pycf.NC_NOERR)
-
-    # get a pointer to the array
-    dataPtr = POINTER(c_double)()
-    xtype = c_int()
-    fillValuePtr = c_void_p()
-    ier = pycf.nccf.nccf_get_data_pointer(dataId, byref(xtype),
-                                          byref(dataPtr), byref(fillValuePtr))
-    assert(ier == pycf.NC_NOERR)
-
-    # create a numpy array from that pointer
-    array = numpy.ctypeslib.as_array(dataPtr, shape=cube.data.shape)
-
-
-    return {'gridId': gridId, 'dataId': dataId, 'dataArray': array, 'lats': lats, 'lons': lons}
-
-
-def destroyData(dataId):
-    gridId = c_int()
-    ier = pycf.nccf.nccf_inq_data_gridid(dataId, byref(gridId))
-    assert(ier == pycf.NC_NOERR)
-    coordIds = (c_int * ndims)()
-    ier = pycf.nccf.nccf_inq_grid_coordids(gridId, coordIds)
-    assert(ier == pycf.NC_NOERR)
-
-    ier = pycf.nccf.nccf_free_data(dataId)
-    assert(ier == pycf.NC_NOERR)
-    ier = pycf.nccf.nccf_free_grid(gridId)
-    assert(ier == pycf.NC_NOERR)
-    for i in range(ndims):
-        ier = pycf.nccf.nccf_free_coord(coordIds[i])
-        assert(ier == pycf.NC_NOERR)
+    # the libcf objects use the numpy arrays without copying them
+    data = libcf.LibcfData(lats, lons, cube.data, prefix, fieldname, standardName='temperature', units='K')
+
+    return {'gridId': data.gridId, 'dataId': data.dataId, 'dataArray': data.data, 'lats': lats, 'lons': lons,
+            'libcf': data}
+
 
 def printInvalidDataPoints(lats, lons, data, fillValue):
     badLats = lats[data == fillValue]
@@ -157,6 +109,24 @@ toc = time.time()
 assert(ier == pycf.NC_NOERR)
 timeStats['evaluation'] = toc - tic
 
+numRecovered = 0
+if args.recover:
+    # only the failed points are re-solved, with the numpy locator and new
+    # starting points
+    tic = time.time()
+    failed = (dst['dataArray'] == -2.0).ravel()
+    pj = numpy.zeros(failed.shape, numpy.float64)
+    pi = numpy.zeros(failed.shape, numpy.float64)
+    numIters = numpy.zeros(failed.shape, numpy.int64)
+    recovered = bilinear.recover(src['lats'], src['lons'], dst['lats'], dst['lons'], pj, pi, ~failed, numIters,
+                                 nitermax=args.nitermax, tolpos=args.tolpos)
+    numRecovered = numpy.count_nonzero(recovered)
+    if numRecovered > 0:
+        wgts = bilinear.getWeights(src['lats'].shape, dst['lats'].shape, pj, pi, recovered)
+        values = wgts.apply(src['dataArray']).ravel()
+        dst['dataArray'].ravel()[recovered] = values[recovered]
+    timeStats['recovery'] = time.time() - tic
+
 srcDims = src['dataArray'].shape
 srcNtot = srcDims[0] * srcDims[1]
 dstDims = dst['dataArray'].shape
@@ -167,9 +137,11 @@ error =  numpy.sum(abs(dst['dataArray'] - dstDataRef)) / float(dstNtot)
 print('libcf interpolation:')
 print('\tsrc: {} ntot: {}'.format(srcDims[:], srcNtot))
 print('\tdst: {} ntot: {}'.format(dstDims[:], dstNtot))
-ninvalid = dstNtot - nvalid.value
+ninvalid = dstNtot - nvalid.value - numRecovered
 print('\t     # invalid points: {} ({:.3f}%)'.format(ninvalid,
                                                100*ninvalid/float(dstNtot)))
+if args.recover:
+    print('\t     # recovered points: {}'.format(numRecovered))
 
 printInvalidDataPoints(dst['lats'], dst['lons'], dst['dataArray'], fillValue=-2.0)
 
@@ -186,5 +158,5 @@ if args.plot:
     plotData(dst['lats'], dst['lons'], dst['dataArray'])
 
 # clean up
-destroyData(src['dataId'])
-destroyData(dst['dataId'])
+src['libcf'].free()
+dst['libcf'].free()
@@ -3,11 +3,13 @@ import pycf
 import iris
 import numpy
 import sys
-from ctypes import byref, c_int, c_double, c_float, POINTER, c_char_p, c_void_p
+from ctypes import byref, c_int, c_double, c_float, POINTER
 import argparse
 from functools import reduce
 import time
-import vtk
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import libcf, iterations
 import math
 
 parser = argparse.ArgumentParser(description='Interpolate using libcf')
@@ -22,6 +24,22 @@ parser.add_argument('--tolpos', type=float, dest='tolpos', default=1.e-6,
 parser.add_argument('--nitermax', type=int, dest='nitermax', default=1000,
                     help='Max number of iterations')
 parser.add_argument('--plot', dest='plot', action='store_true', help='Plot')
+parser.add_argument('--results_dir', type=str, dest='results_dir', default='',
+                    help='Directory where the iteration analytics are saved (not saved if empty)')
+parser.add_argument('--run_name', type=str, dest='run_name', default='libcf',
+                    help='Prefix of the files saved in --results_dir')
+parser.add_argument('--tune', dest='tune', action='store_true',
+                    help='Pick tolpos and nitermax on a subsampled destination grid before the full run')
+parser.add_argument('--tune_tolpos', type=str, dest='tune_tolpos', default='1.e-8,1.e-6,1.e-4',
+                    help='Comma separated tolpos values tried by --tune')
+parser.add_argument('--tune_nitermax', type=str, dest='tune_nitermax', default='10,100,1000',
+                    help='Comma separated nitermax values tried by --tune')
+parser.add_argument('--tune_stride', type=int, dest='tune_stride', default=4,
+                    help='Destination grid subsampling used by --tune')
+parser.add_argument('--max_error', type=float, dest='max_error', default=1.e-6,
+                    help='Max mean absolute difference with the tightest settings accepted by --tune')
+parser.add_argument('--max_invalid', type=float, dest='max_invalid', default=0.,
+                    help='Max fraction of extra invalid points accepted by --tune')
 
 args = parser.parse_args()
 
@@ -38,9 +56,9 @@ if args.dst_file is '':
 src_file = args.src_file.encode('UTF-8') # python3
 dst_file = args.dst_file.encode('UTF-8') # python3
 src_field = args.src_field.encode('UTF-8') # python3
-ndims = 2
 
 def createPipeline(srcLats, srcLons, dstLats, dstLons, nitersData, radius=1.0):
+    import vtk
     # create the src grid pipeline
     srcN0, srcN1 = srcLats.shape
     srcNumPts = srcN0 * srcN1
@@ -137,6 +155,7 @@ def createPipeline(srcLats, srcLons, dstLats, dstLons, nitersData, radius=1.0):
     return {'actors': [ac, sb, ], 'stuff': (sg, pt, mp, ar, lu, srcSg, srcPt, srcEd, srcEt, srcEm, dstEd, dstEt, dstEm)}
 
 def render(actors):
+    import vtk
     # rendering stuff
     renderer = vtk.vtkRenderer()
     renderWindow = vtk.vtkRenderWindow()
@@ -159,64 +178,46 @@ def createData(filename, prefix, fieldname):
     lats = coords[0].points
     lons = coords[1].points
     
-    # create coordinates
-    save = 1 # copy and save
-    latId, lonId = c_int(), c_int()
-    dims = (c_int * 2)(lats.shape[0], lats.shape[1])
-    dimNames = (c_char_p * 2)("y", "x")
-    ier = pycf.nccf.nccf_def_lat_coord(ndims, dims, dimNames, lats.ctypes.data_as(POINTER(c_double)), save, byref(latId))
-    assert(ier == pycf.NC_NOERR)
-    ier = pycf.nccf.nccf_def_lon_coord(ndims, dims, dimNames, lons.ctypes.data_as(POINTER(c_double)), save, byref(lonId))
-    assert(ier == pycf.NC_NOERR)
-
-    # create the grid
-    gridId = c_int()
-    coordIds = (c_int * 2)(latId.value, lonId.value)
-    gridname = prefix + 'grid'
-    ier = pycf.nccf.nccf_def_grid(coordIds, gridname, byref(gridId))
-    assert(ier == pycf.NC_NOERR)
-
-    # create the data
-    dataId = c_int()
-    dataname = fieldname
-    ier = pycf.nccf.nccf_def_data(gridId, dataname, 'temperature', 'K', None, byref(dataId))
-    assert(ier == pycf.NC_NOERR)
-    save = 1
-    fillValue = c_double(pycf.NC_FILL_DOUBLE)
-    ier = pycf.nccf.nccf_set_data_double(dataId, cube.data.ctypes.data_as(POINTER(c_double)),
-                                         save, fillValue)
-    assert(ier == pycf.NC_NOERR)
-
-    # get a pointer to the array
-    dataPtr = POINTER(c_double)()
-    xtype = c_int()
-    fillValuePtr = c_void_p()
-    ier = pycf.nccf.nccf_get_data_pointer(dataId, byref(xtype),
-                                          byref(dataPtr), byref(fillValuePtr))
-    assert(ier == pycf.NC_NOERR)
-
-    # create a numpy array from that pointer
-    array = numpy.ctypeslib.as_array(dataPtr, shape=cube.data.shape)
-
-
-    return {'gridId': gridId, 'dataId': dataId, 'dataArray': array, 'lats': lats, 'lons': lons}
-
-
-def destroyData(dataId):
-    gridId = c_int()
-    ier = pycf.nccf.nccf_inq_data_gridid(dataId, byref(gridId))
-    assert(ier == pycf.NC_NOERR)
-    coordIds = (c_int * ndims)()
-    ier = pycf.nccf.nccf_inq_grid_coordids(gridId, coordIds)
-    assert(ier == pycf.NC_NOERR)
-
-    ier = pycf.nccf.nccf_free_data(dataId)
-    assert(ier == pycf.NC_NOERR)
-    ier = pycf.nccf.nccf_free_grid(gridId)
-    assert(ier == pycf.NC_NOERR)
-    for i in range(ndims):
-        ier = pycf.nccf.nccf_free_coord(coordIds[i])
-        assert(ier == pycf.NC_NOERR)
+    # the libcf objects use the numpy arrays without copying them
+    data = libcf.LibcfData(lats, lons, cube.data, prefix, fieldname, standardName='temperature', units='K')
+
+    return {'gridId': data.gridId, 'dataId': data.dataId, 'dataArray': data.data, 'lats': lats, 'lons': lons,
+            'libcf': data}
+
+
+def getLibcfSolver(src, dst, stride):
+    """
+    Get a solver running libcf on a subsampled destination grid, for
+    iterations.tune
+    @param src source data, see createData
+    @param dst destination data, see createData
+    @param stride subsampling of the destination rows and columns
+    @return function of (tolpos, nitermax) returning the interpolated
+            values, the valid mask and the number of iterations
+    """
+    subLats = dst['lats'][::stride, ::stride]
+    subLons = dst['lons'][::stride, ::stride]
+
+    def solve(tolpos, nitermax):
+        with libcf.LibcfData(subLats, subLons, numpy.full(subLats.shape, -2.0), b"sub",
+                             args.src_field) as sub:
+            regridId = c_int()
+            ier = pycf.nccf.nccf_def_regrid(src['gridId'], sub.gridId, byref(regridId))
+            assert(ier == pycf.NC_NOERR)
+            ier = pycf.nccf.nccf_compute_regrid_weights(regridId, c_int(nitermax), c_double(tolpos))
+            assert(ier == pycf.NC_NOERR)
+            nitersp = POINTER(c_int)()
+            ier = pycf.nccf.nccf_get_regrid_niters_pointer(regridId, byref(nitersp))
+            assert(ier == pycf.NC_NOERR)
+            numIters = numpy.ctypeslib.as_array(nitersp, shape=subLats.shape).copy()
+            ier = pycf.nccf.nccf_apply_regrid(regridId, src['dataId'], sub.dataId)
+            assert(ier == pycf.NC_NOERR)
+            values = sub.data.copy()
+            pycf.nccf.nccf_free_regrid(regridId)
+        return values, values != -2.0, numIters
+
+    return solve
+
 
 def printInvalidDataPoints(lats, lons, data, fillValue):
     badLats = lats[data == fillValue]
@@ -240,6 +241,19 @@ timeStats = {
 src = createData(src_file, b"src", args.src_field)
 dst = createData(dst_file, b"dst", args.src_field)
 
+if args.tune:
+    tic = time.time()
+    best, results = iterations.tune(getLibcfSolver(src, dst, args.tune_stride),
+                                    iterations.parseValues(args.tune_tolpos, float),
+                                    iterations.parseValues(args.tune_nitermax, int),
+                                    maxError=args.max_error, maxInvalidFraction=args.max_invalid)
+    timeStats['tuning'] = time.time() - tic
+    iterations.printTuning(best, results)
+    if args.results_dir:
+        iterations.writeTuning(args.results_dir, args.run_name, best, results)
+    args.tolpos, args.nitermax = best
+    print('tuned settings: tolpos {:g} nitermax {}'.format(args.tolpos, args.nitermax))
+
 # compute the interpolation weights
 regridId = c_int()
 ier = pycf.nccf.nccf_def_regrid(src['gridId'], dst['gridId'], byref(regridId))
@@ -306,6 +320,11 @@ for k, v in timeStats.items():
     totTime += v
 print('\t{0:<32} {1:>.3g} sec'.format('total', totTime))
 
+if args.results_dir:
+    # headless analytics, no display needed
+    iterations.writeResults(args.results_dir, args.run_name, niters, dst['lats'].shape, args.nitermax,
+                            lats=dst['lats'], lons=dst['lons'])
+
 if args.plot:
     #plotData(dst['lats'], dst['lons'], niters)
     pipeline = createPipeline(src['lats'], src['lons'], dst['lats'], dst['lons'], niters, radius=1.0)
@@ -313,5 +332,5 @@ if args.plot:
 
 
 # clean up
-destroyData(src['dataId'])
-destroyData(dst['dataId'])
+src['libcf'].free()
+dst['libcf'].free()
@@ -1,5 +1,7 @@
 from subprocess import call
+import os
 import re
+import sys
 import argparse
 
 parser = argparse.ArgumentParser(description='Exercise regridding')
@@ -39,6 +41,10 @@ src_celldims = [(10, 20),
                 #(5120, 10240)]
 
 
+# the pyterp package is in the parent directory
+env = dict(os.environ)
+env['PYTHONPATH'] = os.pathsep.join([os.path.abspath('..'), env.get('PYTHONPATH', '')])
+
 ns = []
 libcf_interp_eval = []
 libcf_interp_weights = []
@@ -50,6 +56,10 @@ esmf_interp_eval_par = []
 esmf_interp_weights_par = []
 esmf_conserve_eval_par = []
 esmf_conserve_weights_par = []
+sigrid_conserve_eval = []
+sigrid_conserve_weights = []
+numpy_conserve_eval = []
+numpy_conserve_weights = []
 
 for srcDims in src_celldims:
 	# generate the grids
@@ -99,6 +109,22 @@ for srcDims in src_celldims:
 	esmf_conserve_eval.append(getEvaluationTime('log.txt'))
 	esmf_conserve_weights.append(getWeightsTime('log.txt'))
 
+	# run sigrid conserve
+	err = open('log.err', 'w')
+	out = open('log.txt', 'w')
+	call(['python', 'sigrid_conserve.py'], stdout=out, stderr=err)
+	out.close()
+	sigrid_conserve_eval.append(getEvaluationTime('log.txt'))
+	sigrid_conserve_weights.append(getWeightsTime('log.txt'))
+
+	# run the numpy polygon clipping conserve backend
+	err = open('log.err', 'w')
+	out = open('log.txt', 'w')
+	call([sys.executable, '-m', 'pyterp.conserve'], stdout=out, stderr=err, env=env)
+	out.close()
+	numpy_conserve_eval.append(getEvaluationTime('log.txt'))
+	numpy_conserve_weights.append(getWeightsTime('log.txt'))
+
 	# run libcf (bilinear)
 	err = open('log.err', 'w')
 	out = open('log.txt', 'w')
@@ -121,14 +147,19 @@ for srcDims in src_celldims:
 	print('esmf_conserve_weights {}p = {}'.format(args.nprocs, esmf_conserve_weights_par))
 	print('libcf_interp_eval = {}'.format(libcf_interp_eval))
 	print('libcf_interp_weights = {}'.format(libcf_interp_weights))
+	print('sigrid_conserve_eval = {}'.format(sigrid_conserve_eval))
+	print('sigrid_conserve_weights = {}'.format(sigrid_conserve_weights))
+	print('numpy_conserve_eval = {}'.format(numpy_conserve_eval))
+	print('numpy_conserve_weights = {}'.format(numpy_conserve_weights))
 
 # write to file
 import re, time
 ta = re.sub(' ', '_', time.asctime())
 f = open('run_node_interp-{}.csv'.format(ta), 'w')
-f.write('src_num_cells*dst_num_cells,esmf_interp_eval,esmf_interp_weights,esmf_conserve_eval,esmf_conserve_weights,libcf_interp_eval,libcf_interp_weights\n')
+f.write('src_num_cells*dst_num_cells,esmf_interp_eval,esmf_interp_weights,esmf_conserve_eval,esmf_conserve_weights,libcf_interp_eval,libcf_interp_weights,sigrid_conserve_eval,sigrid_conserve_weights,numpy_conserve_eval,numpy_conserve_weights\n')
 for i in range(len(ns)):
-	f.write('{},{},{},{},{},{},{}\n'.format(ns[i], esmf_interp_eval[i], esmf_interp_weights[i], libcf_interp_eval[i], libcf_interp_weights[i], esmf_conserve_eval[i], esmf_conserve_weights[i]))
+	f.write('{},{},{},{},{},{},{},{},{},{},{}\n'.format(ns[i], esmf_interp_eval[i], esmf_interp_weights[i], esmf_conserve_eval[i], esmf_conserve_weights[i], libcf_interp_eval[i], libcf_interp_weights[i],
+	                                                sigrid_conserve_eval[i], sigrid_conserve_weights[i], numpy_conserve_eval[i], numpy_conserve_weights[i]))
 f.close()
 
 from matplotlib import pylab
@@ -148,6 +179,14 @@ legs.append('esmf con eval')
 pylab.loglog(ns, esmf_conserve_eval, 'm-')
 legs.append('esmf con wgts')
 pylab.loglog(ns, esmf_conserve_weights, 'm--')
+legs.append('sigrid con eval')
+pylab.loglog(ns, sigrid_conserve_eval, 'c-')
+legs.append('sigrid con wgts')
+pylab.loglog(ns, sigrid_conserve_weights, 'c--')
+legs.append('numpy con eval')
+pylab.loglog(ns, numpy_conserve_eval, 'g-')
+legs.append('numpy con wgts')
+pylab.loglog(ns, numpy_conserve_weights, 'g--')
 if args.nprocs > 1:
 	legs.append('esmf lin eval {}p'.format(args.nprocs))
 	pylab.loglog(ns, esmf_interp_eval_par, 'r-', linewidth=2)
@@ -0,0 +1,104 @@
+from subprocess import call
+import os
+import re
+import sys
+import argparse
+
+parser = argparse.ArgumentParser(description='Compare cold and warm (snake order) starts of the numpy bilinear locator')
+parser.add_argument('--nitermax', type=int, dest='nitermax', default=1000,
+                    help='Max number of iterations')
+parser.add_argument('--chain_length', type=int, dest='chain_length', default=64,
+                    help='Number of consecutive snake ordered points walked by one chain')
+parser.add_argument('--warm_nitermax', type=int, dest='warm_nitermax', default=8,
+                    help='Max number of iterations of a warm search')
+
+args = parser.parse_args()
+
+def getWeightsTime(filename):
+	m = re.search(r'weights\s+([\d\.e\-\+]+)', open(filename, 'r').read())
+	if m:
+		return float(m.group(1))
+	return None
+
+def getMeanIterations(filename):
+	m = re.search(r'# iterations: mean\s+([\d\.e\-\+]+)', open(filename, 'r').read())
+	if m:
+		return float(m.group(1))
+	return None
+
+def getIterationCounts(filename):
+	return [(int(b), int(e), int(c)) for b, e, c in
+	        re.findall(r'iterations\s+(\d+)-(\d+)\s+(\d+)', open(filename, 'r').read())]
+
+
+src_celldims = [(10, 20),
+                (20, 40),
+                (40, 80),
+                (80, 160),
+                (160, 320),
+                (320, 640),
+                (640, 1280),
+                (1280, 2560),]
+
+# the pyterp package is in the parent directory
+env = dict(os.environ)
+env['PYTHONPATH'] = os.pathsep.join([os.path.abspath('..'), env.get('PYTHONPATH', '')])
+
+ns = []
+cold_weights = []
+warm_weights = []
+cold_iters = []
+warm_iters = []
+
+for srcDims in src_celldims:
+	# generate the grids
+	dstDims = (srcDims[0]//2, srcDims[1]//2)
+	call(['python', 'generate_field.py', \
+		'--src_nj', '{}'.format(srcDims[0] + 1), \
+		'--src_ni', '{}'.format(srcDims[1] + 1), \
+		'--dst_nj', '{}'.format(dstDims[0] + 1), \
+		'--dst_ni', '{}'.format(dstDims[1] + 1), \
+		])
+
+	srcN = srcDims[0] * srcDims[1]
+	dstN = dstDims[0] * dstDims[1]
+	ns.append(srcN * dstN)
+	print('number of src * dst cells is {}'.format(srcN * dstN))
+
+	for warm, weights, iters in (False, cold_weights, cold_iters), (True, warm_weights, warm_iters):
+		err = open('log.err', 'w')
+		out = open('log.txt', 'w')
+		cmd = [sys.executable, '-m', 'pyterp.bilinear', '--src_file', 'src.nc', '--src_field', 'pointData', \
+		       '--dst_file', 'dst.nc', '--nitermax', str(args.nitermax), '--chain_length', str(args.chain_length), \
+		       '--warm_nitermax', str(args.warm_nitermax)]
+		if warm:
+			cmd.append('--warm_start')
+		call(cmd, stdout=out, stderr=err, env=env)
+		out.close()
+		weights.append(getWeightsTime('log.txt'))
+		iters.append(getMeanIterations('log.txt'))
+		print('{} start iteration counts: {}'.format('warm' if warm else 'cold', getIterationCounts('log.txt')))
+
+	print('ns = {}'.format(ns))
+	print('cold_weights = {}'.format(cold_weights))
+	print('warm_weights = {}'.format(warm_weights))
+	print('cold_iters = {}'.format(cold_iters))
+	print('warm_iters = {}'.format(warm_iters))
+
+# write to file
+import time
+ta = re.sub(' ', '_', time.asctime())
+f = open('run_snake-{}.csv'.format(ta), 'w')
+f.write('src_num_cells*dst_num_cells,cold_weights,warm_weights,cold_mean_iters,warm_mean_iters\n')
+for i in range(len(ns)):
+	f.write('{},{},{},{},{}\n'.format(ns[i], cold_weights[i], warm_weights[i], cold_iters[i], warm_iters[i]))
+f.close()
+
+from matplotlib import pylab
+
+pylab.loglog(ns, cold_weights, 'b--', ns, warm_weights, 'r--')
+pylab.legend(['cold start wgts', 'snake warm start wgts'], loc=2)
+pylab.xlabel('num src cells * num dst cells')
+pylab.ylabel('time [sec]')
+pylab.title('numpy bilinear locator, rotated pole to rectilinear')
+pylab.savefig('run_snake.png')
@@ -0,0 +1,35 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import weights, grids
+
+
+def createAveragingWeights(srcShape):
+    """
+    Create weights averaging 2x2 blocks of source cells
+    @param srcShape source grid shape, both dimensions even
+    @return SparseWeights instance
+    """
+    dstShape = (srcShape[0]//2, srcShape[1]//2)
+    rows, cols = [], []
+    for j in range(srcShape[0]):
+        for i in range(srcShape[1]):
+            rows.append((j//2)*dstShape[1] + i//2)
+            cols.append(j*srcShape[1] + i)
+    return weights.SparseWeights(rows, cols, 0.25*numpy.ones(len(rows)), srcShape, dstShape)
+
+
+def createRotatedNodes(nj=31, ni=61, deltaLat=30., deltaLon=60.):
+    """
+    Create the nodes of a rotated pole grid
+    @param nj number of rows
+    @param ni number of columns
+    @param deltaLat half extent of the rotated latitudes
+    @param deltaLon half extent of the rotated longitudes
+    @return geographic latitudes and longitudes (2D)
+    """
+    rlats, rlons = numpy.meshgrid(numpy.linspace(-deltaLat, deltaLat, nj),
+                                  numpy.linspace(-deltaLon, deltaLon, ni), indexing='ij')
+    return grids.rotatedToGeographic(rlats, rlons, 40., -160.)
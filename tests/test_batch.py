@@ -0,0 +1,85 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import batch, grids
+
+
+def test_weights_file_name():
+    lats, lons = numpy.meshgrid(numpy.linspace(-90., 90., 5), numpy.linspace(0., 360., 9), indexing='ij')
+    coords = {'lats': lats, 'lons': lons}
+    key = (('lat', 'lon'), '', '')
+    filename = batch.getWeightsFileName('weights', key, coords, coords, 'dst', 'bilinear')
+    assert filename == batch.getWeightsFileName('weights', key, dict(coords), coords, 'dst', 'bilinear')
+    assert os.path.dirname(filename) == 'weights'
+    # same dimensions, other coordinates or grid mapping
+    others = [batch.getWeightsFileName('weights', (('lat', 'lon'), 'lat1 lon1', ''), coords, coords, 'dst', 'bilinear'),
+              batch.getWeightsFileName('weights', (('lat', 'lon'), '', 'rotated_pole'), coords, coords, 'dst',
+                                       'bilinear'),
+              batch.getWeightsFileName('weights', key, {'lats': lats, 'lons': lons + 1.}, coords, 'dst', 'bilinear'),
+              batch.getWeightsFileName('weights', key, coords, coords, 'dst', 'conserve')]
+    assert len(set(others + [filename])) == 5
+
+
+def createLatLonFile(filename, lats, lons):
+    import netCDF4
+    nc = netCDF4.Dataset(filename, 'w')
+    nc.createDimension('t', 2)
+    for name, standardName, values in ('lat', 'latitude', lats), ('lon', 'longitude', lons):
+        nc.createDimension(name, len(values))
+        var = nc.createVariable(name, 'f8', (name,))
+        var.standard_name = standardName
+        var[:] = values
+    return nc
+
+
+def test_main(tmpdir, monkeypatch):
+    import netCDF4
+    from helpers import createAveragingWeights
+    monkeypatch.chdir(str(tmpdir))
+
+    nc = createLatLonFile('src.nc', numpy.linspace(-60., 60., 4), numpy.linspace(0., 300., 6))
+    temp = numpy.random.rand(2, 4, 6)
+    nc.createVariable('temp', 'f4', ('t', 'lat', 'lon'))[:] = temp
+    soil = numpy.ma.array([[1, 1, 2, 2, 5, 5],
+                           [1, 2, 2, 2, 5, 5],
+                           [3, 3, 1, 1, 5, 5],
+                           [3, 3, 1, 1, 5, 5]], mask=False)
+    soil[2:, 4:] = numpy.ma.masked
+    nc.createVariable('soil', 'i4', ('lat', 'lon'), fill_value=-99)[:] = soil
+    # the second time step is land only, all masked
+    ice = numpy.ma.masked_all((2, 4, 6), numpy.int16)
+    ice[0] = 1
+    nc.createVariable('ice', 'i2', ('t', 'lat', 'lon'), fill_value=-1)[:] = ice
+    # time bounds that no bounds attribute points to, not a horizontal field
+    nc.createDimension('nv', 2)
+    nc.createVariable('time_bnds', 'f8', ('t', 'nv'))[:] = [[0., 1.], [1., 2.]]
+    nc.close()
+    nc = createLatLonFile('dst.nc', numpy.linspace(-40., 40., 2), numpy.linspace(20., 280., 3))
+    nc.createVariable('pointData', 'f8', ('lat', 'lon'))
+    nc.close()
+
+    # the cached weights of the single group
+    ncIn, ncDst = netCDF4.Dataset('src.nc'), netCDF4.Dataset('dst.nc')
+    (key, varNames), = batch.groupVariables(ncIn).items()
+    assert sorted(varNames) == ['ice', 'soil', 'temp']
+    filename = batch.getWeightsFileName('.', key, grids.getCoordinates(ncIn, ncIn.variables['temp']),
+                                        grids.getCoordinates(ncDst, ncDst.variables['pointData']),
+                                        'dst', 'bilinear')
+    ncIn.close()
+    ncDst.close()
+    createAveragingWeights((4, 6)).save(filename)
+
+    monkeypatch.setattr(sys, 'argv', ['batch', '--src_file', 'src.nc', '--dst_file', 'dst.nc'])
+    batch.main()
+    nc = netCDF4.Dataset('regridded.nc', 'r')
+    assert numpy.allclose(nc.variables['temp'][:], temp.reshape(2, 2, 2, 3, 2).mean(axis=(2, 4)))
+    # the dominant class, not an interpolated value
+    soilOut = nc.variables['soil'][:]
+    assert nc.variables['soil'].dtype == numpy.int32
+    assert list(soilOut[0]) == [1, 2, 5]
+    assert list(soilOut[1, :2]) == [3, 1] and soilOut.mask[1, 2]
+    iceOut = nc.variables['ice'][:]
+    assert numpy.all(iceOut[0] == 1) and numpy.all(iceOut.mask[1])
+    nc.close()
@@ -0,0 +1,90 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import bilinear, weights
+from helpers import createRotatedNodes
+
+
+def test_regular():
+    lats, lons = numpy.meshgrid(numpy.linspace(-10., 10., 11), numpy.linspace(20., 40., 21), indexing='ij')
+    dstLats = numpy.array([0.25, -9.9, 5., 20., 0.])
+    dstLons = numpy.array([30.3, 21.1, 40., 30., 50.])
+    wgts = bilinear.computeWeights(lats, lons, dstLats, dstLons)
+    assert list(wgts.getValidRows()) == [True, True, True, False, False]
+    assert numpy.allclose(wgts.getRowSums()[:3], 1.0)
+    res = wgts.apply(lats + 2.*lons, fillValue=-1.)
+    assert numpy.allclose(res[:3], (dstLats + 2.*dstLons)[:3])
+    assert numpy.all(res[3:] == -1.)
+
+
+def test_rotated_pole():
+    srcLats, srcLons = createRotatedNodes()
+    # targets on a coarser grid inside the source domain
+    dstLats, dstLons = createRotatedNodes(7, 11, 25.3, 52.7)
+    pj, pi, valid, numIters = bilinear.locate(srcLats, srcLons, dstLats, dstLons, tolpos=1.e-10, batchSize=13)
+    assert valid.all()
+    assert numIters.max() < 20
+    wgts = bilinear.getWeights(srcLats.shape, dstLats.shape, pj, pi, valid)
+    # the Newton solve inverts the bilinear mapping of the coordinates
+    assert numpy.allclose(wgts.apply(srcLats), dstLats, atol=1.e-8)
+    assert numpy.allclose(bilinear._wrap(wgts.apply(srcLons) - dstLons), 0., atol=1.e-8)
+
+
+def test_threads():
+    srcLats, srcLons = createRotatedNodes()
+    dstLats = numpy.random.uniform(-20., 60., 1000)
+    dstLons = numpy.random.uniform(-180., 180., 1000)
+    res1 = bilinear.locate(srcLats, srcLons, dstLats, dstLons, batchSize=100)
+    res4 = bilinear.locate(srcLats, srcLons, dstLats, dstLons, batchSize=100, numThreads=4)
+    for a, b in zip(res1, res4):
+        assert numpy.array_equal(a, b)
+    assert res1[2].any() and not res1[2].all()
+
+
+def test_snake_order():
+    for shape in (3, 4), (3, 4, 5), (2, 3, 2), (7,):
+        order = bilinear.getSnakeOrder(shape)
+        assert sorted(order) == list(range(numpy.prod(shape)))
+        # consecutive points are neighbours
+        steps = numpy.abs(numpy.diff(numpy.array(numpy.unravel_index(order, shape)), axis=1)).sum(axis=0)
+        assert numpy.all(steps == 1)
+    assert list(bilinear.getSnakeOrder((3, 4))) == [0, 1, 2, 3, 7, 6, 5, 4, 8, 9, 10, 11]
+
+
+def test_warm_start():
+    srcLats, srcLons = createRotatedNodes(61, 121)
+    dstLats, dstLons = createRotatedNodes(40, 50, 35., 65.)
+    cold = bilinear.locate(srcLats, srcLons, dstLats, dstLons, nitermax=50, batchSize=256)
+    warm = bilinear.locate(srcLats, srcLons, dstLats, dstLons, nitermax=50, batchSize=256,
+                           warmStart=True, chainLength=16)
+    # same points found, same positions
+    assert numpy.array_equal(cold[2], warm[2])
+    assert cold[2].any() and not cold[2].all()
+    assert numpy.allclose(cold[0][cold[2]], warm[0][warm[2]], atol=1.e-6)
+    assert numpy.allclose(cold[1][cold[2]], warm[1][warm[2]], atol=1.e-6)
+    # the points outside are not searched again from the index
+    assert warm[3].sum() < cold[3].sum()
+    assert warm[3].max() <= 50 + 8
+    edges, counts = bilinear.getIterationHistogram(warm[3], 50)
+    assert counts.sum() == dstLats.size
+    assert edges[0] == 0 and edges[-1] > warm[3].max()
+
+
+def test_recover():
+    srcLats, srcLons = createRotatedNodes()
+    dstLats, dstLons = createRotatedNodes(7, 11, 25.3, 52.7)
+    pj, pi, valid, numIters = bilinear.locate(srcLats, srcLons, dstLats, dstLons, nitermax=1, tolpos=1.e-10)
+    assert not valid.all()
+    wgts = bilinear.getWeights(srcLats.shape, dstLats.shape, pj, pi, valid)
+    failed = ~valid
+
+    recovered = bilinear.recover(srcLats, srcLons, dstLats, dstLons, pj, pi, valid, numIters,
+                                 nitermax=1, tolpos=1.e-10, escalation=((4, 1.), (16, 1.)))
+    # only the failed points were solved again
+    assert numpy.array_equal(recovered, failed)
+    assert valid.all()
+    merged = weights.merge(wgts, bilinear.getWeights(srcLats.shape, dstLats.shape, pj, pi, recovered))
+    assert merged.getNumberOfEntries() == 4*dstLats.size
+    assert numpy.allclose(merged.apply(srcLats), dstLats, atol=1.e-8)
@@ -0,0 +1,60 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import box_index
+
+
+def createBoxes(n, size, lo=0., hi=10.):
+    corners = numpy.random.uniform(lo, hi, (n, 2))
+    return numpy.concatenate((corners, corners + numpy.random.uniform(0., size, (n, 2))), axis=1)
+
+
+def getAllPairs(srcBoxes, dstBoxes, shift=0.):
+    pairs = set()
+    for i, a in enumerate(srcBoxes):
+        for s in (-shift, 0., shift) if shift else (0.,):
+            overlap = (a[0] + s <= dstBoxes[:, 2]) & (dstBoxes[:, 0] <= a[2] + s) & \
+                      (a[1] <= dstBoxes[:, 3]) & (dstBoxes[:, 1] <= a[3])
+            pairs.update((i, j) for j in numpy.nonzero(overlap)[0])
+    return pairs
+
+
+def test_query():
+    srcBoxes, dstBoxes = createBoxes(300, 1.), createBoxes(200, 0.5)
+    srcCells, dstCells, shifts = box_index.BoxIndex(dstBoxes).query(srcBoxes)
+    pairs = list(zip(srcCells, dstCells))
+    # every overlapping pair, once
+    assert len(pairs) == len(set(pairs))
+    assert set(pairs) == getAllPairs(srcBoxes, dstBoxes)
+    assert not shifts.any()
+
+
+def test_query_periodic():
+    period = 2.*numpy.pi
+    srcBoxes = createBoxes(300, 0.3, -numpy.pi, numpy.pi)
+    dstBoxes = createBoxes(200, 0.2, -numpy.pi + 0.1, numpy.pi + 0.1)
+    srcCells, dstCells, shifts = box_index.BoxIndex(dstBoxes, period=period).query(srcBoxes)
+    pairs = list(zip(srcCells, dstCells))
+    assert len(pairs) == len(set(pairs))
+    assert set(pairs) == getAllPairs(srcBoxes, dstBoxes, period)
+    # the shifted source boxes overlap the destination boxes
+    assert numpy.all(srcBoxes[srcCells, 0] + shifts <= dstBoxes[dstCells, 2])
+    assert numpy.all(dstBoxes[dstCells, 0] <= srcBoxes[srcCells, 2] + shifts)
+    assert set(numpy.unique(shifts)) <= set([-period, 0., period])
+
+
+def test_cache(tmpdir):
+    boxes = createBoxes(100, 0.5)
+    filename = box_index.getIndexFileName(str(tmpdir), boxes, 10.)
+    index = box_index.loadOrBuild(str(tmpdir), boxes, 10.)
+    assert os.path.exists(filename)
+    assert filename != box_index.getIndexFileName(str(tmpdir), boxes)
+    loaded = box_index.loadOrBuild(str(tmpdir), boxes, 10.)
+    assert loaded.period == 10.
+    assert numpy.array_equal(loaded.order, index.order)
+    assert numpy.array_equal(loaded.starts, index.starts)
+    queryBoxes = createBoxes(50, 1.)
+    for a, b in zip(index.query(queryBoxes), loaded.query(queryBoxes)):
+        assert numpy.array_equal(a, b)
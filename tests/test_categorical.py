@@ -0,0 +1,42 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import categorical
+from helpers import createAveragingWeights
+
+
+def test_categories():
+    wgts = createAveragingWeights((4, 4))
+    src = numpy.ma.array([[3, 3, 7, 7],
+                          [3, 9, 7, 3],
+                          [9, 9, 7, 7],
+                          [9, 3, 7, 7]], mask=False)
+    src[3, 0] = numpy.ma.masked
+    classes, fractions, dominant = categorical.regridCategories(wgts, src)
+    assert list(classes) == [3, 7, 9]
+    assert fractions.shape == (3, 2, 2)
+    assert numpy.allclose(fractions.sum(axis=0), 1.0)
+    assert numpy.allclose(fractions[:, 0, 0], [0.75, 0., 0.25])
+    # the masked point is left out
+    assert numpy.allclose(fractions[:, 1, 0], [1./3., 0., 2./3.])
+    assert list(classes[dominant.ravel()]) == [3, 7, 9, 7]
+
+
+def test_categories_unsorted():
+    wgts = createAveragingWeights((2, 2))
+    src = numpy.array([[7, 3], [3, 3]])
+    classes, fractions, dominant = categorical.regridCategories(wgts, src, classes=[9, 7, 3])
+    assert list(classes) == [3, 7, 9]
+    assert numpy.allclose(fractions[:, 0, 0], [0.75, 0.25, 0.])
+    assert classes[dominant[0, 0]] == 3
+
+
+def test_categories_all_masked():
+    wgts = createAveragingWeights((2, 2))
+    src = numpy.ma.masked_all((2, 2), numpy.int32)
+    classes, fractions, dominant = categorical.regridCategories(wgts, src)
+    assert len(classes) == 0
+    assert fractions.shape == (0, 1, 1)
+    assert numpy.all(dominant == -1)
@@ -0,0 +1,23 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import weights, chunked
+
+
+def test_chunked(tmpdir):
+    srcShape, dstShape = (12, 10), (7, 9)
+    numEntries = 300
+    rows = numpy.random.randint(0, 7*9 - 9, numEntries) # last row gets no weights
+    cols = numpy.random.randint(0, 12*10, numEntries)
+    wgts = weights.SparseWeights(rows, cols, numpy.random.rand(numEntries), srcShape, dstShape)
+    filename = str(tmpdir.join('weights.nc'))
+    wgts.save(filename)
+
+    src = numpy.random.rand(2, 12, 10)
+    dst = numpy.zeros((2, 7, 9))
+    regridder = chunked.ChunkedRegridder(filename, blockRows=3)
+    regridder.run(src, dst, [(0,), (1,)], fillValue=-1.0)
+    regridder.close()
+    assert numpy.allclose(dst, wgts.apply(src, fillValue=-1.0))
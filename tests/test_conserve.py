@@ -0,0 +1,63 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import conserve
+
+
+def test_clip():
+    square = numpy.array([[0., 0.], [1., 0.], [1., 1.], [0., 1.]])
+    subjects = numpy.array([square + 0.5,                            # quarter overlap
+                            square + 2.,                             # no overlap
+                            0.5*square + 0.25,                       # inside
+                            [[0.5, -0.5], [1.5, 0.5], [0.5, 1.5], [-0.5, 0.5]]])  # diamond
+    poly, counts = conserve.clip(subjects, numpy.array([square]*4))
+    areas = numpy.where(counts >= 3, numpy.abs(conserve.getPolygonAreas(poly, counts)), 0.)
+    assert numpy.allclose(areas, [0.25, 0., 0.25, 1.])
+    assert list(counts) == [4, 0, 4, 8]
+
+
+def test_weights_cartesian():
+    srcX, srcY = numpy.meshgrid(numpy.linspace(0., 1., 21), numpy.linspace(0., 1., 11))
+    # a rotated destination grid inside the source grid
+    u, v = numpy.meshgrid(numpy.linspace(0.3, 0.7, 8), numpy.linspace(0.3, 0.7, 6))
+    c, s = numpy.cos(0.3), numpy.sin(0.3)
+    dstX, dstY = 0.5 + c*(u - 0.5) - s*(v - 0.5), 0.5 + s*(u - 0.5) + c*(v - 0.5)
+    wgts = conserve.computeWeights(srcX, srcY, dstX, dstY, batchSize=50)
+    assert wgts.srcShape == (10, 20) and wgts.dstShape == (5, 7)
+    assert numpy.allclose(wgts.getRowSums(), 1.)
+    assert numpy.allclose(wgts.extras['frac_b'], 1.)
+    # first order: linear fields are reproduced to within the source cell size
+    srcCentres = 0.25*(srcX[:-1, :-1] + srcX[1:, :-1] + srcX[:-1, 1:] + srcX[1:, 1:])
+    dstCentres = numpy.array([conserve.getCellCorners(dstX, dstY)[..., 0].mean(axis=1)]).reshape((5, 7))
+    assert numpy.allclose(wgts.apply(srcCentres), dstCentres, atol=0.025)
+    # conservation: the overlap areas add up to the destination areas
+    total = numpy.vdot(wgts.apply(numpy.ones((10, 20))).ravel(), wgts.extras['area_b'])
+    assert numpy.allclose(total, 0.16)
+    src = numpy.random.uniform(size=(10, 20))
+    assert numpy.allclose(numpy.vdot(wgts.apply(src).ravel(), wgts.extras['area_b']),
+                          numpy.vdot(src.ravel(), wgts.extras['area_a']*wgts.extras['frac_a']))
+
+
+def test_weights_lon_lat():
+    srcLons, srcLats = numpy.meshgrid(numpy.linspace(-180., 180., 37), numpy.linspace(-90., 90., 19))
+    dstLons, dstLats = numpy.meshgrid(numpy.linspace(-170., 170., 25), numpy.linspace(-80., 80., 13))
+    wgts = conserve.computeWeights(srcLons, srcLats, dstLons, dstLats, lonLat=True)
+    assert numpy.allclose(wgts.getRowSums(), 1.)
+    # spherical areas
+    assert numpy.allclose(wgts.extras['area_a'].sum(), 4.*numpy.pi)
+    src = numpy.random.uniform(size=wgts.srcShape)
+    dstIntegral = numpy.vdot(wgts.apply(src).ravel(), wgts.extras['area_b'])
+    srcIntegral = numpy.vdot(wgts.apply(numpy.ones(wgts.srcShape)).ravel(), wgts.extras['area_b'])
+    assert dstIntegral > 0. and numpy.allclose(srcIntegral, wgts.extras['area_b'].sum())
+
+
+def test_weights_longitude_wrap():
+    # the source cells cross the dateline of the destination grid
+    srcLons, srcLats = numpy.meshgrid(numpy.linspace(5., 365., 37), numpy.linspace(-90., 90., 19))
+    dstLons, dstLats = numpy.meshgrid(numpy.linspace(-180., 180., 25), numpy.linspace(-90., 90., 13))
+    wgts = conserve.computeWeights(srcLons, srcLats, dstLons, dstLats, lonLat=True)
+    assert numpy.allclose(wgts.getRowSums(), 1.)
+    assert numpy.allclose(wgts.extras['frac_a'], 1.)
+    assert numpy.allclose(wgts.extras['frac_b'], 1.)
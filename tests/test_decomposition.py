@@ -0,0 +1,86 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import decomposition
+
+
+def createBounds(lats, lons):
+    """
+    Create the vertex coordinates of the cells of a lat-lon grid
+    @param lats latitude axis of the corners
+    @param lons longitude axis of the corners
+    @return vertex latitudes and longitudes, arrays of shape (nj, ni, 4)
+    """
+    latCorners, lonCorners = numpy.meshgrid(lats, lons, indexing='ij')
+    def getVertices(a):
+        return numpy.array([a[:-1, :-1], a[:-1, 1:], a[1:, 1:], a[1:, :-1]]).transpose((1, 2, 0))
+    return getVertices(latCorners), getVertices(lonCorners)
+
+
+def test_plan_row_blocks():
+    rowCosts = numpy.ones((40,))
+    rowCosts[-4:] = 20.
+    equal = decomposition.getEqualRowBlocks(40, 4)
+    assert list(equal) == [0, 10, 20, 30, 40]
+    balanced = decomposition.planRowBlocks(rowCosts, 4)
+    assert balanced[0] == 0 and balanced[-1] == 40
+    assert numpy.all(numpy.diff(balanced) >= 1)
+    assert decomposition.getImbalance(decomposition.getLoads(rowCosts, balanced)) < \
+           decomposition.getImbalance(decomposition.getLoads(rowCosts, equal))
+
+
+def test_plan_grids():
+    # source refined towards the north, the destination is uniform
+    srcBounds = createBounds(90. - 180.*numpy.linspace(1., 0., 41)**2, numpy.linspace(0., 360., 37))
+    dstBounds = createBounds(numpy.linspace(-90., 90., 31), numpy.linspace(0., 360., 61))
+
+    # the longitudes of the first source column wrap around
+    boxes = decomposition.getCellBoxes(srcBounds[0] % 360., srcBounds[1] % 360.)
+    assert numpy.allclose(boxes[3], 10.)
+
+    readers = [lambda j0, j1, b=b: (b[0][j0:j1], b[1][j0:j1]) for b in (srcBounds, dstBounds)]
+    (srcBlocks, srcRowCosts), (dstBlocks, dstRowCosts) = decomposition.planGrids(readers, [40, 30])
+    assert list(srcBlocks) == [0, 40] and len(srcRowCosts) == 40
+    # the coarse southern rows overlap more destination cells
+    assert srcRowCosts[0] > srcRowCosts[-1]
+    assert list(decomposition.planRowBlocks(dstRowCosts, 3)) != list(decomposition.getEqualRowBlocks(30, 3))
+
+
+def test_mesh_rows():
+    numCols = 4
+    # more ranks than rows, some blocks are empty
+    planned = decomposition.planRowBlocks(numpy.ones((3,)), 5)
+    assert planned[0] == 0 and planned[-1] == 3 and numpy.any(numpy.diff(planned) == 0)
+    for rowBlocks in planned, numpy.array([0, 2, 3, 3, 3, 3]):
+        owners, cellIds = {}, []
+        for rank in range(5):
+            nodeIds, nodeOwners, cells, cellConn = decomposition.getMeshRows(rowBlocks, rank, numCols)
+            if rowBlocks[rank] == rowBlocks[rank + 1]:
+                assert len(nodeIds) == 0 and len(cells) == 0
+            assert cellConn.max(initial=-1) < len(nodeIds)
+            for nodeId, owner in zip(nodeIds, nodeOwners):
+                # every rank adding a node agrees on its owner
+                assert owners.setdefault(nodeId, owner) == owner
+            cellIds += list(cells)
+        assert sorted(owners.keys()) == list(range(1, 4*(numCols + 1) + 1))
+        assert sorted(cellIds) == list(range(1, 3*numCols + 1))
+        # the owners add the nodes they own
+        for rank in range(5):
+            nodeIds = decomposition.getMeshRows(rowBlocks, rank, numCols)[0]
+            assert set(nodeIds) >= set([n for n, o in owners.items() if o == rank])
+
+
+def test_mesh_rows_periodic():
+    numCols = 4
+    rowBlocks = numpy.array([0, 2, 3])
+    nodeIds, nodeOwners, cellIds, cellConn = decomposition.getMeshRows(rowBlocks, 0, numCols, periodic=True)
+    # no seam duplicate, the last column of cells closes onto the first nodes
+    assert list(nodeIds) == list(range(1, 3*numCols + 1))
+    assert list(nodeOwners[-numCols:]) == [1]*numCols
+    assert list(cellIds) == list(range(1, 2*numCols + 1))
+    assert list(cellConn[4*(numCols - 1):4*numCols]) == [numCols - 1, 0, numCols, 2*numCols - 1]
+    nodeIds, nodeOwners, cellIds, cellConn = decomposition.getMeshRows(rowBlocks, 1, numCols, periodic=True)
+    assert list(nodeIds) == list(range(2*numCols + 1, 4*numCols + 1))
+    assert list(cellIds) == list(range(2*numCols + 1, 3*numCols + 1))
@@ -0,0 +1,73 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import diagnostics
+
+
+def test_errors():
+    ref = numpy.random.rand(30, 20)
+    values = ref + 0.01*numpy.random.randn(30, 20)
+    areas = numpy.random.rand(30, 20)
+    stats = diagnostics.ErrorStats(blockSize=50)
+    stats.addSource(ref, areas=areas)
+    stats.update(values, ref, areas=areas)
+    res = stats.reduce()
+    err = abs(values - ref)
+    assert res['numSrc'] == 600 and res['numDst'] == 600 and res['numValid'] == 600
+    assert numpy.allclose(res['l1'], err.mean())
+    assert numpy.allclose(res['l2'], numpy.sqrt((err**2).mean()))
+    assert res['linf'] == err.max()
+    assert res['min'] == values.min() and res['max'] == values.max()
+    expected = (ref*areas).sum()
+    assert numpy.allclose(res['conservation'], ((values*areas).sum() - expected)/expected)
+
+
+def test_masked():
+    ref = numpy.ones((4, 5))
+    values = numpy.ma.masked_array(2*numpy.ones((4, 5)), mask=numpy.zeros((4, 5), bool))
+    values[0, :] = numpy.ma.masked
+    values[1, 1] = numpy.nan
+    stats = diagnostics.ErrorStats()
+    stats.update(values, ref, mask=(ref == 0))
+    res = stats.reduce()
+    assert res['numDst'] == 20 and res['numValid'] == 14
+    assert res['l1'] == 1.0 and res['linf'] == 1.0
+    assert numpy.isnan(res['conservation'])
+
+
+def test_combine():
+    # splitting the points over ranks gives the same errors
+    ref = numpy.random.rand(40, 10)
+    values = ref + numpy.random.randn(40, 10)
+    areas = numpy.random.rand(40, 10)
+    serial = diagnostics.ErrorStats()
+    serial.update(values, ref, areas=areas)
+    serial.reduce()
+
+    total = None
+    for rows in slice(0, 13), slice(13, 13), slice(13, 40):
+        stats = diagnostics.ErrorStats()
+        stats.update(values[rows], ref[rows], areas=areas[rows])
+        if total is None:
+            total = stats.local.copy()
+        else:
+            diagnostics.combine(stats.local, total)
+    stats.totals = total
+    for key, value in serial.getErrors().items():
+        assert numpy.allclose(stats.getErrors()[key], value)
+
+
+def test_threads():
+    ref = numpy.random.rand(50, 30)
+    values = ref + numpy.random.randn(50, 30)
+    areas = numpy.random.rand(50, 30)
+    results = []
+    for numThreads in 1, 4:
+        stats = diagnostics.ErrorStats(blockSize=90, numThreads=numThreads)
+        stats.addSource(ref, areas=areas)
+        stats.update(values, ref, areas=areas)
+        results.append(stats.reduce())
+    # blocks are combined in order, the results are bit for bit identical
+    assert results[0] == results[1]
@@ -0,0 +1,109 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import grids, ncio
+
+
+def createGlobalNodes(nj, ni, endpoint=True):
+    lats, lons = numpy.meshgrid(numpy.linspace(-80., 80., nj), numpy.linspace(0., 360., ni, endpoint=endpoint),
+                                indexing='ij')
+    return lats, lons
+
+
+def createFoldedNodes():
+    # 12 distinct columns plus two halo columns, the top row mirrors the row
+    # two below it about column 5 and the pivot row in between mirrors itself
+    lats, lons = createGlobalNodes(9, 12, endpoint=False)
+    lats = numpy.concatenate((lats, lats[:, :2]), axis=1)
+    lons = numpy.concatenate((lons, lons[:, :2]), axis=1)
+    n = 12
+    mirror = (5 - numpy.arange(n)) % n
+    lats[-1, :n], lons[-1, :n] = lats[-3, mirror], lons[-3, mirror]
+    half = numpy.array([0, 1, 2, 6, 7, 8])
+    lats[-2, mirror[half]], lons[-2, mirror[half]] = lats[-2, half], lons[-2, half]
+    lats[-2:, n:], lons[-2:, n:] = lats[-2:, :2], lons[-2:, :2]
+    return lats, lons
+
+
+def test_topology():
+    # regional grid
+    lats, lons = numpy.meshgrid(numpy.linspace(-30., 30., 7), numpy.linspace(0., 100., 11), indexing='ij')
+    assert grids.getTopology(lats, lons) == grids.NO_TOPOLOGY
+
+    # global grid, the last column duplicates the first one
+    lats, lons = createGlobalNodes(9, 13)
+    topo = grids.getTopology(lats, lons)
+    assert topo == {'seamNodes': 1, 'foldRows': None, 'foldShift': None}
+    assert grids.getPeriodicCellDims(topo, lats.shape) == (8, 12)
+
+    # global grid closing without duplicate (node data only)
+    lats, lons = createGlobalNodes(9, 12, endpoint=False)
+    assert grids.getTopology(lats, lons)['seamNodes'] == 0
+    assert grids.getTopology(lats, lons, requireDuplicate=True)['seamNodes'] is None
+
+    # two halo columns (ORCA like) and a north fold, the top row mirrors the
+    # row two below it
+    lats, lons = createFoldedNodes()
+    topo = grids.getTopology(lats, lons)
+    assert topo == {'seamNodes': 2, 'foldRows': 1, 'foldShift': 5}
+    assert grids.getPeriodicCellDims(topo, lats.shape) == (7, 12)
+
+
+def test_topology_from_bounds():
+    lats, lons = createGlobalNodes(9, 13)
+    boundLats = numpy.array([lats[:-1, :-1], lats[:-1, 1:], lats[1:, 1:], lats[1:, :-1]]).transpose((1, 2, 0))
+    boundLons = numpy.array([lons[:-1, :-1], lons[:-1, 1:], lons[1:, 1:], lons[1:, :-1]]).transpose((1, 2, 0))
+    topo = grids.getTopologyFromBounds(boundLats, boundLons)
+    assert topo == {'seamNodes': 1, 'foldRows': None, 'foldShift': None}
+    # all the cells are kept
+    assert grids.getPeriodicCellDims(topo, (9, 13)) == (8, 12)
+
+
+def test_fill_periodic():
+    lats, lons = createFoldedNodes()
+    topo = grids.getTopology(lats, lons)
+    xyz = grids._getXyz(lats, lons)
+    nodeData = xyz[0] + 2*xyz[1] + 3*xyz[2]**2
+    cellData = 0.25*(nodeData[:-1, :-1] + nodeData[:-1, 1:] + nodeData[1:, 1:] + nodeData[1:, :-1])
+    for data, cells in (nodeData, False), (cellData, True):
+        # only the distinct points are set, as by the ESMF drivers
+        nj, ni = grids.getPeriodicCellDims(topo, lats.shape)
+        filled = numpy.full(data.shape, -1.)
+        filled[:nj + (0 if cells else 1), :ni] = data[:nj + (0 if cells else 1), :ni]
+        grids.fillPeriodic(filled, topo, cells=cells)
+        assert numpy.allclose(filled, data)
+
+
+def test_write_periodic(tmpdir):
+    import netCDF4
+    srcFile = str(tmpdir.join('src.nc'))
+    outFile = str(tmpdir.join('out.nc'))
+    lats, lons = createFoldedNodes()
+    xyz = grids._getXyz(lats, lons)
+    data = xyz[0] + 2*xyz[1] + 3*xyz[2]**2
+    nc = netCDF4.Dataset(srcFile, 'w')
+    nc.createDimension('nj', lats.shape[0])
+    nc.createDimension('ni', lats.shape[1])
+    for name, standardName, values in ('lat', 'latitude', lats), ('lon', 'longitude', lons):
+        var = nc.createVariable(name, 'f8', ('nj', 'ni'))
+        var.standard_name = standardName
+        var[:] = values
+    var = nc.createVariable('pointData', 'f8', ('nj', 'ni'), fill_value=1.e20)
+    var.coordinates = 'lat lon'
+    var[:] = data
+    nc.close()
+
+    # the periodic ESMF grid leaves out the seam columns and the fold row
+    topo = grids.getTopology(lats, lons)
+    nj, ni = grids.getPeriodicCellDims(topo, lats.shape)
+    slices = (slice(0, nj + 1), slice(0, ni))
+    outData = numpy.ma.masked_array(data, numpy.zeros(data.shape, bool))
+    ncio.writeField(outFile, srcFile, 'pointData', outData[slices], slices=slices)
+    ncio.fillPeriodic(outFile, outFile, 'pointData', topo)
+    nc = netCDF4.Dataset(outFile, 'r')
+    written = nc.variables['pointData'][:]
+    nc.close()
+    assert not numpy.ma.is_masked(written)
+    assert numpy.allclose(written, data)
@@ -0,0 +1,27 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import hybrid
+
+
+def test_row_blocks():
+    blocks = hybrid.getRowBlocks(10, 3)
+    assert blocks[0].start == 0 and blocks[-1].stop == 10
+    assert all(b.stop > b.start for b in blocks)
+    assert sum(b.stop - b.start for b in blocks) == 10
+    assert len(hybrid.getRowBlocks(2, 4)) == 2
+
+
+def test_copy_rows():
+    src = numpy.random.rand(37, 5)
+    for numThreads in 1, 3:
+        dst = numpy.zeros((37, 5), order='F')
+        hybrid.copyRows(dst, src, numThreads)
+        assert numpy.array_equal(dst, src)
+
+
+def test_num_threads():
+    assert hybrid.getNumThreads(3) == 3
+    assert hybrid.getNumThreads(0) >= 1
@@ -0,0 +1,59 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import iterations
+from helpers import createRotatedNodes
+
+
+def test_hot_spots():
+    numIters = numpy.ones((5, 7), numpy.int32)
+    numIters[4, 6] = 100
+    means, maxima = iterations.getHotSpotMap(numIters, (5, 7), blockShape=(2, 3))
+    assert means.shape == (3, 3)
+    # the last block only holds one point
+    assert maxima[2, 2] == 100 and means[2, 2] == 100.
+    assert numpy.all(maxima[:2, :] == 1)
+    assert numpy.allclose(iterations.getPercentiles(numIters, (50., 100.)), [1., 100.])
+
+
+def test_write_results(tmpdir):
+    lats, lons = numpy.meshgrid(numpy.linspace(-10., 10., 20), numpy.linspace(0., 30., 30), indexing='ij')
+    numIters = numpy.arange(600).reshape((20, 30)) % 13
+    filenames = iterations.writeResults(str(tmpdir), 'run', numIters, (20, 30), 16, lats=lats, lons=lons)
+    assert [os.path.basename(f) for f in filenames] == ['run_niters_hist.csv', 'run_niters_percentiles.csv',
+                                                        'run_niters_hotspots.csv']
+    rows = open(filenames[0]).read().split()[1:]
+    assert sum([int(r.split(',')[-1]) for r in rows]) == 600
+    rows = [[float(v) for v in r.split(',')] for r in open(filenames[2]).read().split()[1:]]
+    assert len(rows) == 2*2
+    # the last blocks hold rows 16-19 and columns 16-29
+    assert numpy.allclose(rows[3][4:], [lats[16:, 16:].mean(), lons[16:, 16:].mean()])
+    assert numpy.allclose(rows[0][4:], [lats[:16, :16].mean(), lons[:16, :16].mean()])
+
+
+def test_block_centres():
+    # grid smaller than a block, across the dateline
+    lats, lons = numpy.meshgrid(numpy.linspace(-1., 1., 5), numpy.linspace(177., 183., 7), indexing='ij')
+    centreLats, centreLons = iterations.getBlockCentres(lats, lons, (5, 7))
+    assert centreLats.shape == (1, 1)
+    assert numpy.allclose([centreLats[0, 0], centreLons[0, 0] % 360.], [0., 180.])
+
+
+def test_tune():
+    srcLats, srcLons = createRotatedNodes()
+    dstLats, dstLons = createRotatedNodes(29, 53, 25.3, 52.7)
+    solve = iterations.getBilinearSolver(srcLats, srcLons, dstLats, dstLons, stride=4)
+    best, results = iterations.tune(solve, [1.e-10, 1.e-3], [2, 50], maxError=1.e-2)
+    assert len(results) == 4
+    costs = dict([((r[0], r[1]), r[2]) for r in results])
+    # looser settings that still find all the points are cheaper
+    assert best != (1.e-10, 50)
+    assert costs[best] < costs[(1.e-10, 50)]
+    for tolpos, nitermax, cost, elapsed, invalid, error in results:
+        if (tolpos, nitermax) == best:
+            assert invalid == 0. and error <= 1.e-2
+    # nothing but the reference meets a zero error budget with a tight tolpos
+    best, results = iterations.tune(solve, [1.e-10, 1.e-3], [2, 50], maxError=0.)
+    assert best == (1.e-10, 50)
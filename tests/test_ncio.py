@@ -0,0 +1,159 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import ncio, grids
+
+
+def createCurvilinearFile(filename, nj, ni, fillValue=1.e20):
+    import netCDF4
+    nc = netCDF4.Dataset(filename, 'w')
+    nc.createDimension('t', 3)
+    nc.createDimension('nj', nj)
+    nc.createDimension('ni', ni)
+    lats, lons = numpy.meshgrid(numpy.linspace(-80., 80., nj), numpy.linspace(0., 350., ni), indexing='ij')
+    for name, standardName, values in ('lat', 'latitude', lats), ('lon', 'longitude', lons):
+        var = nc.createVariable(name, 'f8', ('nj', 'ni'))
+        var.standard_name = standardName
+        var[:] = values
+    var = nc.createVariable('pointData', 'f8', ('t', 'nj', 'ni'), fill_value=fillValue)
+    var.coordinates = 'lat lon'
+    var[:] = numpy.arange(3*nj*ni).reshape(3, nj, ni)
+    nc.close()
+
+
+def test_read_slab(tmpdir):
+    filename = str(tmpdir.join('src.nc'))
+    createCurvilinearFile(filename, 5, 7)
+    nc = ncio.openDataset(filename.encode('UTF-8'))
+    var = nc.variables['pointData']
+    latVar, lonVar = grids.getLatLonVariables(nc, var)
+    assert latVar.name == 'lat' and lonVar.name == 'lon'
+
+    localSlices = (slice(1, 3), slice(2, 6))
+    slab = ncio.readSlab(var, (2, 0), localSlices)
+    assert slab.shape == (2, 4)
+    assert numpy.all(slab == numpy.arange(3*5*7).reshape(3, 5, 7)[2, 1:3, 2:6])
+    nc.close()
+
+
+def test_write_field(tmpdir):
+    srcFile = str(tmpdir.join('src.nc'))
+    outFile = str(tmpdir.join('out.nc'))
+    createCurvilinearFile(srcFile, 4, 6)
+    data = numpy.ma.masked_less(numpy.random.rand(3, 4, 6), 0.5)
+    ncio.writeField(outFile, srcFile, 'pointData', data)
+
+    nc = ncio.openDataset(outFile)
+    var = nc.variables['pointData']
+    assert var.coordinates == 'lat lon'
+    assert numpy.all(var[:].mask == data.mask)
+    assert numpy.allclose(var[:].compressed(), data.compressed())
+    assert nc.variables['lat'].shape == (4, 6)
+    nc.close()
+
+
+def test_write_field_slab(tmpdir):
+    import netCDF4
+    srcFile = str(tmpdir.join('src.nc'))
+    outFile = str(tmpdir.join('out.nc'))
+    nc = netCDF4.Dataset(srcFile, 'w')
+    for name, n in ('t', 3), ('z', 4), ('nj', 5), ('ni', 6):
+        nc.createDimension(name, n)
+    var = nc.createVariable('t', 'f8', ('t',))
+    var[:] = [10., 20., 30.]
+    var = nc.createVariable('pointData', 'f8', ('t', 'z', 'nj', 'ni'))
+    var[:] = 0.
+    nc.close()
+
+    # one regridded time/level slice of a 4D field
+    data = numpy.random.rand(5, 6)
+    ncio.writeField(outFile, srcFile, 'pointData', data, slices=(slice(0, 5), slice(0, 6)), index=(2, 1))
+    nc = ncio.openDataset(outFile)
+    var = nc.variables['pointData']
+    assert var.shape == (1, 1, 5, 6)
+    assert numpy.all(var[0, 0] == data)
+    assert numpy.all(nc.variables['t'][:] == [30.])
+    nc.close()
+
+
+def test_write_field_fill_value(tmpdir):
+    import netCDF4
+    srcFile = str(tmpdir.join('src.nc'))
+    outFile = str(tmpdir.join('out.nc'))
+    createCurvilinearFile(srcFile, 4, 6, fillValue=None)
+    # no point masked in this window, other ranks may have some
+    ncio.writeField(outFile, srcFile, 'pointData', numpy.ma.masked_array(numpy.ones((3, 4, 6))))
+    nc = ncio.openDataset(outFile)
+    assert nc.variables['pointData']._FillValue == netCDF4.default_fillvals['f8']
+    nc.close()
+
+
+class TwoRankComm(object):
+    """
+    Communicator stand-in for writing the tiles of two ranks from one process
+    """
+    def __init__(self, rank):
+        self.rank = rank
+
+    def Get_rank(self):
+        return self.rank
+
+    def Get_size(self):
+        return 2
+
+    def Barrier(self):
+        pass
+
+
+def test_write_tiles(tmpdir):
+    srcFile = str(tmpdir.join('src.nc'))
+    outFile = str(tmpdir.join('out.nc'))
+    createCurvilinearFile(srcFile, 5, 6)
+    data = numpy.random.rand(3, 5, 6)
+
+    tileFiles = []
+    for rank, slices in (0, (slice(0, 3), slice(0, 6))), (1, (slice(3, 5), slice(0, 6))):
+        tileFiles.append(ncio.writeField(outFile, srcFile, 'pointData', data[:, slices[0], slices[1]],
+                                         slices=slices, comm=TwoRankComm(rank)))
+    assert tileFiles == [str(tmpdir.join('out_0.nc')), str(tmpdir.join('out_1.nc'))]
+
+    # by default the tiles are left for a later stitch
+    assert ncio.gatherTiles(outFile, tileFiles[0], TwoRankComm(0)) == tileFiles[0]
+    assert not os.path.exists(outFile) and all([os.path.exists(f) for f in tileFiles])
+
+    # rank 1 leaves the tiles to rank 0
+    assert ncio.gatherTiles(outFile, tileFiles[1], TwoRankComm(1), stitch=True) == outFile
+    assert not os.path.exists(outFile)
+    ncio.gatherTiles(outFile, tileFiles[0], TwoRankComm(0), stitch=True)
+    assert not any([os.path.exists(f) for f in tileFiles])
+    nc = ncio.openDataset(outFile)
+    assert numpy.all(nc.variables['pointData'][:] == data)
+    assert numpy.all(nc.variables['lat'][:] == numpy.linspace(-80., 80., 5)[:, numpy.newaxis])
+    nc.close()
+
+
+def test_stitch_periodic(tmpdir):
+    srcFile = str(tmpdir.join('src.nc'))
+    outFile = str(tmpdir.join('out.nc'))
+    createCurvilinearFile(srcFile, 4, 6)
+    data = numpy.random.rand(3, 4, 6)
+    # the last column duplicates the first one and is written by no rank
+    topology = {'seamNodes': 1, 'foldRows': None, 'foldShift': None}
+    tileFiles = []
+    for rank, slices in (0, (slice(0, 2), slice(0, 5))), (1, (slice(2, 4), slice(0, 5))):
+        comm = TwoRankComm(rank)
+        tileFile = ncio.writeField(outFile, srcFile, 'pointData', data[:, slices[0], slices[1]],
+                                   slices=slices, comm=comm)
+        writtenFile = ncio.gatherTiles(outFile, tileFile, comm)
+        ncio.fillPeriodic(outFile, writtenFile, 'pointData', topology, comm=comm)
+        tileFiles.append(writtenFile)
+
+    # lazy stitch, as with python -m pyterp.ncio
+    ncio.stitchTiles(outFile, tileFiles)
+    nc = ncio.openDataset(outFile)
+    written = nc.variables['pointData'][:]
+    nc.close()
+    assert numpy.all(written[..., :5] == data[..., :5])
+    assert numpy.all(written[..., 5] == data[..., 0])
@@ -0,0 +1,28 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import periodicity
+
+
+def test_parse_phase_report():
+    text = 'esmf interpolation:\n\tsrc: ntot: 100\n\tdst: ntot: 50 valid: 47\n' + \
+           'time stats over 2 ranks:\n' + \
+           '\t{0:<32} {1:>10.3g} {2:>10.3g} {3:>10.3g} {4:>10.2f} sec\n'.format('weights', 1.5, 1.25, 1.0, 1.2)
+    weights, unmapped = periodicity.parseOutput(text)
+    assert abs(weights - 1.5) < 1.e-12
+    assert unmapped == 3
+
+
+def test_parse_serial_report():
+    text = '\tdst: ntot: 50 valid: 50\ntime stats:\n\t{0:<32} {1:>.3g} sec\n'.format('weights', 2.5e-3)
+    weights, unmapped = periodicity.parseOutput(text)
+    assert abs(weights - 2.5e-3) < 1.e-12
+    assert unmapped == 0
+
+
+def test_parse_missing():
+    weights, unmapped = periodicity.parseOutput('nothing here\n')
+    assert numpy.isnan(weights)
+    assert unmapped is None
@@ -0,0 +1,42 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import pipeline
+from helpers import createAveragingWeights
+
+
+def test_pipeline():
+    wgts = createAveragingWeights((8, 10))
+    slabs = [numpy.random.rand(8, 10) for i in range(7)]
+    results = {}
+
+    def writer(index, result):
+        results[index] = result
+
+    for numThreads in 1, 3:
+        pipe = pipeline.Pipeline(wgts, lambda i: slabs[i], writer,
+                                 queueDepth=2, numThreads=numThreads)
+        pipe.run(range(len(slabs)))
+        assert sorted(results.keys()) == list(range(len(slabs)))
+        for i in range(len(slabs)):
+            assert numpy.all(results[i] == wgts.apply(slabs[i]))
+        utilization = pipe.getUtilization()
+        assert set(utilization.keys()) == set(['read', 'apply', 'write'])
+
+
+def test_pipeline_error():
+    wgts = createAveragingWeights((4, 4))
+
+    def reader(index):
+        if index == 2:
+            raise ValueError('bad slab')
+        return numpy.zeros((4, 4))
+
+    pipe = pipeline.Pipeline(wgts, reader, lambda i, r: None)
+    try:
+        pipe.run(range(5))
+        assert False, 'expected an error'
+    except ValueError:
+        pass
@@ -0,0 +1,43 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import scaling
+
+
+def createTable(times, memory):
+    return [dict([('rank', rank), ('weights', t), ('evaluation', 0.1*t), ('peak_memory_bytes', memory)])
+            for rank, t in enumerate(times)]
+
+
+def test_weak_dims():
+    assert scaling.getWeakDims((101, 201), 1) == (101, 201)
+    assert scaling.getWeakDims((101, 201), 4) == (201, 401)
+
+
+def test_strong():
+    nprocs = [1, 2, 4]
+    tables = [createTable([8.0], 1000), createTable([4.0, 3.0], 600), createTable([2.5, 2.0, 2.0, 1.0], 400)]
+    phases, rows = scaling.summarize(nprocs, tables)
+    assert phases == ['weights', 'evaluation']
+    assert numpy.allclose([row['total'] for row in rows], [8.8, 4.4, 2.75])
+    assert rows[2]['total_memory_bytes'] == 1600 and rows[2]['max_rank_memory_bytes'] == 400
+    speedups, efficiencies = scaling.getScaling(nprocs, [row['total'] for row in rows], 'strong')
+    assert numpy.allclose(speedups, [1., 2., 3.2])
+    assert numpy.allclose(efficiencies, [1., 1., 0.8])
+
+
+def test_weak(tmpdir):
+    nprocs = [1, 4]
+    tables = [createTable([1.0], 100), createTable([1.25]*4, 100)]
+    phases, rows = scaling.summarize(nprocs, tables)
+    speedups, efficiencies = scaling.getScaling(nprocs, [row['total'] for row in rows], 'weak')
+    assert numpy.allclose(efficiencies, [1., 0.8])
+    assert numpy.allclose(speedups, [1., 3.2])
+
+    filename = str(tmpdir.join('scaling.csv'))
+    scaling.writeCsv(filename, phases, rows, speedups, efficiencies, dims=[[(11, 21)], [(21, 41)]])
+    lines = open(filename).read().split('\n')
+    assert lines[0] == 'nprocs,weights,evaluation,total,speedup,efficiency,max_rank_memory_bytes,total_memory_bytes,dims'
+    assert lines[2].split(',')[0] == '4' and lines[2].split(',')[-1] == '21x41'
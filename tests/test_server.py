@@ -0,0 +1,46 @@
+import os
+import sys
+import threading
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import server
+from helpers import createAveragingWeights
+
+
+def test_server(tmpdir):
+    for name, shape in ('a', (4, 6)), ('b', (8, 8)), ('c', (2, 2)):
+        createAveragingWeights(shape).save(str(tmpdir.join(name + '.nc')))
+    cache = server.WeightsCache(str(tmpdir), maxEntries=2)
+    service = server.RegridService(cache)
+
+    socketPath = str(tmpdir.join('regrid.sock'))
+    srv = server.RegridServer(socketPath, service)
+    thread = threading.Thread(target=srv.serve_forever)
+    thread.start()
+    try:
+        client = server.RegridClient(socketPath)
+        src = numpy.arange(24, dtype=numpy.float64).reshape(4, 6)
+        src[0, 0] = numpy.nan
+        dst = client.regrid('a', src)
+        assert dst.shape == (2, 3)
+        assert dst[0, 0] == (1. + 6. + 7.)/3.
+        assert dst[1, 2] == 0.25*(16. + 17. + 22. + 23.)
+        try:
+            client.regrid('missing', src)
+            assert False, 'expected an error'
+        except RuntimeError:
+            pass
+        client.close()
+    finally:
+        srv.shutdown()
+        srv.server_close()
+        thread.join()
+
+    # least recently used weights are evicted
+    local = server.LocalClient(service)
+    local.regrid('b', numpy.zeros((8, 8)))
+    local.regrid('a', numpy.zeros((4, 6)))
+    local.regrid('c', numpy.zeros((2, 2)))
+    assert list(cache.entries.keys()) == ['a', 'c']
+    assert cache.numLoads == 3
@@ -0,0 +1,46 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import spatial_index, grids
+
+
+def createGlobalNodes(nj=46, ni=91):
+    return numpy.meshgrid(numpy.linspace(-90., 90., nj), numpy.linspace(-180., 180., ni), indexing='ij')
+
+
+def test_query():
+    lats, lons = createGlobalNodes()
+    index = spatial_index.SpatialIndex(lats, lons)
+    dstLats = numpy.random.uniform(-89., 89., 500)
+    dstLons = numpy.random.uniform(-360., 360., 500)
+    nodes = index.query(dstLats, dstLons)
+    assert nodes.min() >= 0
+    # the nodes found are within a few grid spacings (4 deg) of the targets
+    xyz = grids._getXyz(dstLats, dstLons)
+    dist = grids._getDistance(xyz, grids._getXyz(lats.ravel()[nodes], lons.ravel()[nodes]))
+    assert dist.max() < numpy.radians(8.)
+
+
+def test_candidate_cells():
+    lats, lons = createGlobalNodes()
+    index = spatial_index.SpatialIndex(lats, lons)
+    dstLats = numpy.array([1., -43., 88.9])
+    dstLons = numpy.array([1., 100.5, -179.])
+    cj, ci = index.getCandidateCells(dstLats, dstLons)
+    assert list(cj) == [22, 11, 44]
+    assert list(ci) == [45, 70, 0]
+
+
+def test_cache(tmpdir):
+    lats, lons = createGlobalNodes()
+    filename = spatial_index.getIndexFileName(str(tmpdir), lats, lons)
+    assert not os.path.exists(filename)
+    index = spatial_index.loadOrBuild(str(tmpdir), lats, lons)
+    assert os.path.exists(filename)
+    assert filename != spatial_index.getIndexFileName(str(tmpdir), lats + 1., lons)
+    loaded = spatial_index.loadOrBuild(str(tmpdir), lats, lons)
+    assert loaded.numBins == index.numBins
+    assert numpy.array_equal(loaded.order, index.order)
+    assert numpy.array_equal(loaded.starts, index.starts)
@@ -0,0 +1,77 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import temporal_stats
+
+
+def test_running_stats(tmpdir):
+    data = numpy.random.rand(20, 3, 4)
+    data[5, 0, 0] = numpy.nan # missing value
+
+    stats = temporal_stats.RunningStats((3, 4))
+    for i in range(10):
+        stats.update(data[i])
+
+    # checkpoint and resume
+    filename = str(tmpdir.join('checkpoint.nc'))
+    stats.runInfo = {'srcFile': 'src.nc', 'totalSlabs': 20}
+    stats.save(filename)
+    assert not os.path.exists(filename + '.tmp')
+    stats = temporal_stats.load(filename)
+    assert stats.numSlabs == 10
+    assert stats.runInfo == {'srcFile': 'src.nc', 'totalSlabs': 20}
+    for i in range(10, 20):
+        stats.update(data[i])
+
+    assert stats.count[0, 0] == 19
+    assert numpy.allclose(stats.mean, numpy.nanmean(data, axis=0))
+    assert numpy.allclose(stats.getVariance(), numpy.nanvar(data, axis=0, ddof=1))
+    assert numpy.all(stats.min == numpy.nanmin(data, axis=0))
+    assert numpy.all(stats.max == numpy.nanmax(data, axis=0))
+
+
+def test_merge():
+    data = numpy.random.rand(9, 2, 2)
+    stats0 = temporal_stats.RunningStats((2, 2))
+    stats1 = temporal_stats.RunningStats((2, 2))
+    for i in range(4):
+        stats0.update(data[i])
+    for i in range(4, 9):
+        stats1.update(data[i])
+    stats0.merge(stats1)
+    assert stats0.numSlabs == 9
+    assert numpy.allclose(stats0.mean, data.mean(axis=0))
+    assert numpy.allclose(stats0.getVariance(ddof=0), data.var(axis=0))
+
+
+def test_main_checkpoint(tmpdir, monkeypatch):
+    import netCDF4
+    from pyterp import weights
+    # identity weights on a 2x3 grid
+    weights.SparseWeights(range(6), range(6), numpy.ones(6), (2, 3), (2, 3)).save(str(tmpdir.join('weights.nc')))
+    data = numpy.random.rand(5, 2, 3)
+    for name in 'src.nc', 'other.nc':
+        nc = netCDF4.Dataset(str(tmpdir.join(name)), 'w')
+        for dimName, n in zip(('t', 'y', 'x'), data.shape):
+            nc.createDimension(dimName, n)
+        nc.createVariable('cellData', 'f8', ('t', 'y', 'x'))[:] = data
+        nc.close()
+
+    # a checkpoint left by a run on another file
+    stats = temporal_stats.RunningStats((2, 3))
+    stats.update(numpy.full((2, 3), 100.))
+    monkeypatch.chdir(str(tmpdir))
+    stats.runInfo = {'srcFile': os.path.abspath('other.nc'), 'srcField': 'cellData',
+                     'weightsFile': os.path.abspath('weights.nc'), 'totalSlabs': 5}
+    stats.save('stats_checkpoint.nc')
+
+    monkeypatch.setattr(sys, 'argv', ['temporal_stats', '--weights', 'weights.nc', '--src_file', 'src.nc',
+                                      '--checkpoint_every', '2'])
+    temporal_stats.main()
+    nc = netCDF4.Dataset('stats.nc', 'r')
+    assert numpy.allclose(nc.variables['cellData_max'][:], data.max(axis=0))
+    assert nc.numSlabs == 5
+    nc.close()
+    assert not os.path.exists('stats_checkpoint.nc')
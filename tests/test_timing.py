@@ -0,0 +1,39 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import timing
+
+
+def test_phases():
+    timer = timing.PhaseTimer()
+    timer.add('read', 1.0)
+    with timer.phase('weights'):
+        time.sleep(0.01)
+    timer.add('read', 0.5)
+    assert list(timer.times.keys()) == ['read', 'weights']
+    assert timer.times['read'] == 1.5
+    assert timer.times['weights'] >= 0.01
+
+
+def test_report(tmpdir):
+    timer = timing.PhaseTimer()
+    timer.add('weights', 2.0)
+    timer.add('evaluation', 0.25)
+    filename = str(tmpdir.join('timing.csv'))
+    table = timer.report(filename)
+    assert len(table) == 1
+    lines = open(filename).read().split('\n')
+    assert lines[0] == 'rank,weights,evaluation,peak_memory_bytes'
+    fields = lines[1].split(',')
+    assert fields[:3] == ['0', '2', '0.25']
+    assert int(fields[3]) > 0
+
+
+def test_read_report(tmpdir):
+    filename = str(tmpdir.join('timing.csv'))
+    open(filename, 'w').write('rank,read,weights,peak_memory_bytes\n0,1,5,100\n1,2,3,200\n')
+    table = timing.readReport(filename)
+    assert len(table) == 2 and table[1]['peak_memory_bytes'] == 200
+    assert list(timing.getPhaseMaxima(table).items()) == [('read', 2.0), ('weights', 5.0)]
@@ -0,0 +1,45 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import weights, vector
+
+
+def test_round_trip():
+    lats, lons = numpy.meshgrid(numpy.linspace(-80., 80., 5), numpy.linspace(-180., 170., 8), indexing='ij')
+    u = numpy.random.rand(2, 5, 8)
+    v = numpy.random.rand(2, 5, 8)
+    xyz = vector.toCartesian(u, v, lats, lons)
+    assert xyz.shape == (3, 2, 5, 8)
+    u2, v2 = vector.fromCartesian(xyz, lats, lons)
+    assert numpy.allclose(u, u2)
+    assert numpy.allclose(v, v2)
+
+
+def test_regrid_vector():
+    # the destination points are a subset of the source points
+    lats, lons = numpy.meshgrid(numpy.linspace(-60., 60., 4), numpy.linspace(0., 300., 6), indexing='ij')
+    dstIndices = numpy.array([0, 7, 23])
+    wgts = weights.SparseWeights(numpy.arange(3), dstIndices, numpy.ones(3), (4, 6), (3, 1))
+    u, v = numpy.random.rand(4, 6), numpy.random.rand(4, 6)
+    uDst, vDst = vector.regridVector(wgts, u, v, lats, lons,
+                                     lats.flat[dstIndices].reshape(3, 1),
+                                     lons.flat[dstIndices].reshape(3, 1))
+    assert numpy.allclose(uDst.ravel(), u.flat[dstIndices])
+    assert numpy.allclose(vDst.ravel(), v.flat[dstIndices])
+
+
+def test_regrid_vector_masked():
+    lats, lons = numpy.meshgrid(numpy.linspace(-60., 60., 4), numpy.linspace(0., 300., 6), indexing='ij')
+    # destination 0 averages two valid points, 1 averages two masked points, 2 has no weights
+    wgts = weights.SparseWeights([0, 0, 1, 1], [0, 1, 6, 7], 0.5*numpy.ones(4), (4, 6), (3, 1))
+    u = numpy.ma.masked_array(numpy.ones((4, 6)), numpy.zeros((4, 6), bool))
+    v = numpy.ma.masked_array(numpy.zeros((4, 6)), numpy.zeros((4, 6), bool))
+    u[1, 0:2] = numpy.ma.masked
+    v[1, 0:2] = numpy.ma.masked
+    dstLats = numpy.zeros((3, 1))
+    dstLons = numpy.full((3, 1), 30.)
+    uDst, vDst = vector.regridVector(wgts, u, v, lats, lons, dstLats, dstLons, fillValue=-999.)
+    assert numpy.all(uDst[1:] == -999.) and numpy.all(vDst[1:] == -999.)
+    assert numpy.all(numpy.isfinite(uDst)) and abs(uDst[0, 0]) > 0.5
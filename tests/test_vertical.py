@@ -0,0 +1,79 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import vertical, bilinear
+from helpers import createRotatedNodes
+
+
+def test_level_weights():
+    srcLevels = numpy.array([0., 10., 30., 100.])
+    dstLevels = numpy.array([0., 5., 30., 65., 100., 150.])
+    k, w, valid = vertical.getLevelWeights(srcLevels, dstLevels)
+    assert list(valid) == [True, True, True, True, True, False]
+    assert numpy.allclose((1. - w)*srcLevels[k] + w*srcLevels[k + 1], numpy.minimum(dstLevels, 100.))
+    # linear profiles are reproduced on every column
+    data = 2.*srcLevels[:, None, None] + numpy.arange(6.).reshape((1, 2, 3))
+    res = vertical.interpolate(data, k, w, valid, fillValue=-1.)
+    assert res.shape == (6, 2, 3)
+    assert numpy.allclose(res[:5], 2.*dstLevels[:5, None, None] + numpy.arange(6.).reshape((1, 2, 3)))
+    assert numpy.all(res[5] == -1.)
+
+
+def test_level_weights_decreasing():
+    # pressure like levels, the data stay in the file order
+    srcLevels = numpy.array([1000., 850., 500., 250.])
+    dstLevels = numpy.array([925., 500., 300., 1000., 100., 1100.])
+    k, w, valid = vertical.getLevelWeights(srcLevels, dstLevels)
+    assert list(valid) == [True, True, True, True, False, False]
+    assert numpy.all((k >= 0) & (k <= 2))
+    data = 0.5*srcLevels[:, None] + numpy.arange(3.)[None, :]
+    res = vertical.interpolate(data, k, w, valid, fillValue=-1.)
+    assert numpy.allclose(res[:4], 0.5*dstLevels[:4, None] + numpy.arange(3.)[None, :])
+    assert numpy.all(res[4:] == -1.)
+    # same result as interpolating the increasing levels
+    kk, ww, vv = vertical.getLevelWeights(srcLevels[::-1], dstLevels)
+    assert numpy.allclose(res, vertical.interpolate(data[::-1], kk, ww, vv, fillValue=-1.))
+
+
+def test_level_weights_invalid():
+    for srcLevels in [], [10.], [0., 10., 5.], [0., 0., 10.]:
+        try:
+            vertical.getLevelWeights(srcLevels, [5.])
+        except ValueError:
+            pass
+        else:
+            assert False, srcLevels
+
+
+def test_trilinear():
+    srcLats, srcLons = createRotatedNodes()
+    dstLats, dstLons = createRotatedNodes(7, 11, 25.3, 52.7)
+    horiz = bilinear.computeWeights(srcLats, srcLons, dstLats, dstLons, tolpos=1.e-10)
+    srcLevels = numpy.array([0., 10., 25., 50., 100.])
+    dstLevels = numpy.array([5., 50., 75., 120.])
+    k, w, valid = vertical.getLevelWeights(srcLevels, dstLevels)
+    wgts = vertical.getTrilinearWeights(horiz, k, w, valid, len(srcLevels))
+    assert wgts.srcShape == (5,) + srcLats.shape and wgts.dstShape == (4,) + dstLats.shape
+    assert numpy.allclose(wgts.getRowSums()[:3], 1.)
+
+    srcData = numpy.random.uniform(size=(5,) + srcLats.shape)
+    res3d = wgts.apply(srcData, fillValue=-1.)
+    res2d = vertical.interpolate(horiz.apply(srcData), k, w, valid, fillValue=-1.)
+    assert numpy.allclose(res3d, res2d)
+    assert numpy.all(res3d[3] == -1.)
+
+
+def test_get_levels(tmpdir):
+    import netCDF4
+    filename = str(tmpdir.join('levels.nc'))
+    nc = netCDF4.Dataset(filename, 'w')
+    for name, n in ('time', 2), ('depth', 3), ('y', 4), ('x', 5):
+        nc.createDimension(name, n)
+        nc.createVariable(name, 'f8', (name,))[:] = numpy.arange(n)*10.
+    nc.variables['depth'].positive = 'down'
+    var = nc.createVariable('pointData', 'f8', ('time', 'depth', 'y', 'x'))
+    assert list(vertical.getLevels(nc, var)) == [0., 10., 20.]
+    assert vertical.getLevels(nc, nc.createVariable('surface', 'f8', ('time', 'y', 'x'))) is None
+    nc.close()
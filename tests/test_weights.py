@@ -0,0 +1,59 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import weights
+from helpers import createAveragingWeights
+
+
+def test_apply():
+    wgts = createAveragingWeights((4, 6))
+    src = numpy.arange(24, dtype=numpy.float64).reshape(4, 6)
+    dst = wgts.apply(src)
+    assert dst.shape == (2, 3)
+    assert numpy.allclose(dst, src.reshape(2, 2, 3, 2).mean(axis=(1, 3)))
+
+    # several slabs at once
+    dst2 = wgts.apply(numpy.array([src, 2*src]))
+    assert numpy.allclose(dst2[1], 2*dst)
+
+
+def test_apply_masked():
+    wgts = createAveragingWeights((4, 4))
+    src = numpy.ma.masked_array(numpy.ones((4, 4)), mask=numpy.zeros((4, 4), bool))
+    src[0, 0] = 5.0
+    src[0, 1] = numpy.ma.masked
+    src[2:, 2:] = numpy.ma.masked
+    dst = wgts.apply(src, fillValue=-1.0)
+    # the masked source points are left out of the average
+    assert dst[0, 0] == 7.0/3.0
+    assert dst[1, 1] == -1.0
+    assert numpy.all(dst[0, 1] == 1.0)
+
+
+def test_save_load(tmpdir):
+    wgts = createAveragingWeights((4, 6))
+    filename = str(tmpdir.join('weights.nc'))
+    wgts.save(filename)
+    wgts2 = weights.load(filename)
+    assert wgts2.srcShape == (4, 6)
+    assert wgts2.dstShape == (2, 3)
+    assert numpy.all(wgts2.cols == wgts.cols)
+
+
+def test_threads():
+    wgts = createAveragingWeights((40, 60))
+    src = numpy.random.rand(3, 40, 60)
+    reference = wgts.apply(src)
+    for numThreads in 2, 3, 7:
+        wgts.setNumThreads(numThreads)
+        assert numpy.array_equal(wgts.apply(src), reference)
+    wgts.setNumThreads(1)
+
+
+def test_threads_no_weights():
+    wgts = weights.SparseWeights([], [], [], (4, 5), (6, 7))
+    wgts.setNumThreads(4)
+    assert numpy.array_equal(wgts.apply(numpy.ones((4, 5)), fillValue=-1.), numpy.full((6, 7), -1.))
+    wgts.setNumThreads(1)
@@ -1,12 +1,14 @@
 from __future__ import print_function
 import ESMF
-import iris
 import numpy
+import os
 import sys
 from ctypes import byref, c_int, c_double, c_float, POINTER, c_char_p, c_void_p
 import argparse
 from functools import reduce
 import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyterp import ncio, grids, diagnostics
 
 LAT_INDEX, LON_INDEX = 1, 0
 
@@ -15,6 +17,11 @@ parser.add_argument('--src_file', type=str, dest='src_file', default='src.nc',
                     help='Source data file name')
 parser.add_argument('--dst_file', type=str, dest='dst_file', default='dst.nc',
                     help='Destination data file name')
+parser.add_argument('--out_file', type=str, dest='out_file', default='dst_regridded.nc',
+                    help='Destination file with regridded field')
+parser.add_argument('--stitch', dest='stitch', action='store_true',
+                    help='Without parallel netCDF, assemble the rank tiles into --out_file on rank 0 '
+                         '(by default they are left for python -m pyterp.ncio)')
 parser.add_argument('--plot', dest='plot', action='store_true', help='Plot')
 
 args = parser.parse_args()
@@ -34,19 +41,17 @@ dst_file = args.dst_file.encode('UTF-8') # python3
 ndims = 2
 
 def createData(filename, prefix):
-    # use iris to read in the data
-    # then pass the array to the ESMF API
-    pointCube = iris.load(filename, iris.Constraint(cube_func = lambda c: c.var_name == 'pointData'))[0]
-    cellCube = iris.load(filename, iris.Constraint(cube_func = lambda c: c.var_name == 'cellData'))[0]
-    coords = pointCube.coords()
-    lats = coords[0].points
-    lons = coords[1].points
+    # read the netcdf header, then only the local hyperslab of the
+    # coordinates and data on this rank
+    nc = ncio.openDataset(filename)
+    latVar, lonVar = grids.getLatLonVariables(nc, nc.variables['pointData'])
+    varCell = nc.variables['cellData']
     
     # NOTE fortran ordering here
 
     # create the ESMF grid object
 
-    cellDims = numpy.array([len(lons) - 1, len(lats) - 1])
+    cellDims = numpy.array([len(lonVar) - 1, len(latVar) - 1])
     grid = ESMF.Grid(max_index=cellDims)
 
     grid.add_coords(staggerloc=ESMF.StaggerLoc.CORNER, coord_dim=LAT_INDEX)
@@ -62,25 +67,31 @@ def createData(filename, prefix):
     iEndLon = grid.upper_bounds[ESMF.StaggerLoc.CORNER][LON_INDEX]
 
     # set the coordinates
-    coordLat[...] = numpy.outer(numpy.ones((iEndLon - iBegLon,), coordLon.dtype), lats[iBegLat:iEndLat])
-    coordLon[...] = numpy.outer(lons[iBegLon:iEndLon], numpy.ones((iEndLat - iBegLat,), coordLon.dtype))
+    coordLat[...] = numpy.outer(numpy.ones((iEndLon - iBegLon,), coordLon.dtype), latVar[iBegLat:iEndLat])
+    coordLon[...] = numpy.outer(lonVar[iBegLon:iEndLon], numpy.ones((iEndLat - iBegLat,), coordLon.dtype))
 
-    # create field
+    # create field, the cells have their own index sets
     field = ESMF.Field(grid, name="air_temperature", 
                    staggerloc=ESMF.StaggerLoc.CENTER)
-    field.data[...] = cellCube.data.transpose()
+    cellLower = grid.lower_bounds[ESMF.StaggerLoc.CENTER]
+    cellUpper = grid.upper_bounds[ESMF.StaggerLoc.CENTER]
+    cellSlices = (slice(cellLower[LAT_INDEX], cellUpper[LAT_INDEX]),
+                  slice(cellLower[LON_INDEX], cellUpper[LON_INDEX]))
+    field.data[...] = ncio.readSlab(varCell, (), cellSlices).transpose()
 
     nodeDims = (iEndLon - iBegLon, iEndLat - iBegLat)
 
-    return grid, field, nodeDims
+    nc.close()
+    return grid, field, nodeDims, cellSlices
 
 timeStats = {
     'weights': float('nan'),
     'evaluation': float('nan'),
+    'write': float('nan'),
 }
 
-srcGrid, srcData, srcNodeDims = createData(src_file, b"src")
-dstGrid, dstData, dstNodeDims = createData(dst_file, b"dst")
+srcGrid, srcData, srcNodeDims, srcSlices = createData(src_file, b"src")
+dstGrid, dstData, dstNodeDims, dstSlices = createData(dst_file, b"dst")
 
 # save the reference (exact) field data
 dstDataRef = dstData.data.copy()
@@ -101,14 +112,21 @@ tic = time.time()
 regrid(srcData, dstData)
 timeStats['evaluation'] = time.time() - tic
 
+# write the regridded field, each rank writes its own window
+tic = time.time()
+outFile = ncio.writeField(args.out_file, dst_file, 'cellData', dstData.data.transpose(), slices=dstSlices)
+outFile = ncio.gatherTiles(args.out_file, outFile, stitch=args.stitch)
+timeStats['write'] = time.time() - tic
+
 # compute error
-srcNtot = len(srcData.data.flat)
-dstNtot = len(dstData.data.flat)
-error =  numpy.sum(abs(dstData.data - dstDataRef)) / float(dstNtot)
-print('emsf conservative interpolation:')
-print('\tsrc: {} ntot: {}'.format(srcNodeDims, srcNtot))
-print('\tdst: {} ntot: {}'.format(dstNodeDims, dstNtot))
-print('interpolation error: {:.3g}'.format(error))
+srcAreas = ESMF.Field(srcGrid, staggerloc=ESMF.StaggerLoc.CENTER)
+dstAreas = ESMF.Field(dstGrid, staggerloc=ESMF.StaggerLoc.CENTER)
+srcAreas.get_area()
+dstAreas.get_area()
+stats = diagnostics.ErrorStats(ncio.getComm())
+stats.addSource(srcData.data, areas=srcAreas.data)
+stats.update(dstData.data, dstDataRef, areas=dstAreas.data)
+stats.report('emsf conservative interpolation:')
 totTime = 0.0
 print('time stats:')
 for k, v in timeStats.items():